@@ -0,0 +1,106 @@
+"""Measures how long checking the token of a request takes with many users.
+
+extract_token runs on every request made with a token. It now keeps the
+tokens it has decoded, see decode_token, and checks the session against a
+set of each user's session_ids rather than their list. The time it took when
+every token was decoded and the user found by going through every user is
+printed alongside, as is the time for users logged in with many sessions.
+
+The datastore is kept in a temporary directory for the run.
+
+    Typical usage example:
+
+    python3 -m benchmarks.auth_bench --users 50000
+"""
+import argparse
+import random
+import time
+
+import jwt
+
+from benchmarks.synthetic import make_store, temporary_datastore
+
+
+def decode_and_scan(store, secret, token):
+    """Check a token the way extract_token did before tokens were cached."""
+    token_data = jwt.decode(token, secret, algorithms=["HS256"])
+    for user in store["users"]:
+        if user["u_id"] == token_data["u_id"]:
+            if token_data["session_id"] not in user["session_ids"]:
+                raise ValueError("no matching session id for user")
+            return token_data
+    raise ValueError("no matching user id in database")
+
+
+def mean_time(func, tokens):
+    """Get the mean time func took to check each of tokens."""
+    start = time.perf_counter()
+    for token in tokens:
+        func(token)
+    return (time.perf_counter() - start) / len(tokens)
+
+
+def measure(users, requests, sessions, seed):
+    """Time checking tokens of random users, as the requests of that many
+    users logged in at once would.
+
+    Return Value:
+        Returns a list of (name, seconds per request)
+    """
+    # imported here so the datastore is opened in the temporary directory
+    # pylint: disable=import-outside-toplevel
+    from src import auth
+    from src.data_store import data_store
+
+    store = make_store(users=users, channels=0, dms=0, messages=0, seed=seed)
+    # the last user has logged in many times without logging out
+    store["users"][-1]["session_ids"] = list(range(1, sessions + 1))
+    data_store.set(store)
+    store = data_store.get()
+    rng = random.Random(seed)
+    secret = auth.JWT_SECRET
+    tokens = [
+        jwt.encode({"u_id": rng.randrange(users), "session_id": 1}, secret, algorithm="HS256")
+        for _ in range(requests)
+    ]
+    busy = [
+        jwt.encode({"u_id": users - 1, "session_id": session_id}, secret, algorithm="HS256")
+        for session_id in rng.choices(range(1, sessions + 1), k=requests)
+    ]
+
+    results = [
+        (
+            "decode and scan users",
+            mean_time(lambda token: decode_and_scan(store, secret, token), tokens),
+        ),
+    ]
+    auth.decoded_tokens.clear()
+    results.append(("extract_token, first use", mean_time(auth.extract_token, tokens)))
+    results.append(("extract_token, cached", mean_time(auth.extract_token, tokens)))
+    results.append((
+        f"decode and scan, {sessions} sessions",
+        mean_time(lambda token: decode_and_scan(store, secret, token), busy),
+    ))
+    mean_time(auth.extract_token, busy)
+    results.append((f"extract_token, {sessions} sessions", mean_time(auth.extract_token, busy)))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=50000)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--sessions", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with temporary_datastore():
+        results = measure(args.users, args.requests, args.sessions, args.seed)
+
+    print(f"{'check':<36}{'us per request':>16}")
+    for name, seconds in results:
+        print(f"{name:<36}{seconds * 1e6:>16.1f}")
+
+
+if __name__ == "__main__":
+    main()
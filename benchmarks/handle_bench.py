@@ -0,0 +1,103 @@
+"""Measures how long giving handles to many users with the same name takes.
+
+Registering a user whose handle is taken used to try each number after it
+in turn, recursing once per number, so the thousandth John Smith looked up a
+thousand handles and the next few hit the recursion limit. Handles are now
+given out by Datastore.new_handle, see src/handles.py, which remembers the
+next number to try. Both are timed registering users in bulk, each named
+after one of --names people, and the mean time per handle of the last
+--window users registered is printed, without hashing their passwords.
+
+The datastore is kept in a temporary directory for the run.
+
+    Typical usage example:
+
+    python3 -m benchmarks.handle_bench --users 1000 10000
+"""
+import argparse
+import sys
+import time
+
+from benchmarks.synthetic import make_user, temporary_datastore
+
+
+def create_handle(data_store, handle, base_length):
+    """Make a handle the way auth_register_v2 did before handles were
+    registered."""
+    if data_store.get_user_by_handle(handle):
+        counter = handle[base_length:]
+        counter = 0 if counter == "" else int(counter) + 1
+        return create_handle(data_store, handle[:base_length] + str(counter), base_length)
+    return handle
+
+
+def register(data_store, allocate, users, names, window):
+    """Register users named after names people, giving each a handle with
+    allocate.
+
+    Return Value:
+        Returns the mean seconds per handle of the last window users, or
+        None if allocate failed
+    """
+    store = data_store.get()
+    timestamp = 1630000000
+    started = None
+    for u_id in range(users):
+        if u_id == users - window:
+            started = time.perf_counter()
+        base = f"johnsmith{u_id % names}" if names > 1 else "johnsmith"
+        try:
+            handle = allocate(base)
+        except RecursionError:
+            return None
+        user = make_user(u_id, timestamp)
+        user["handle_str"] = handle
+        store["users"].append(user)
+    return (time.perf_counter() - started) / window
+
+
+def measure(sizes, names, window):
+    """Time both ways of giving out handles for each number of users.
+
+    Return Value:
+        Returns a list of (users, old seconds, new seconds)
+    """
+    # imported here so the datastore is opened in the temporary directory
+    # pylint: disable=import-outside-toplevel
+    from src.data_store import clear_v1, data_store
+
+    results = []
+    for users in sizes:
+        clear_v1()
+        old = register(
+            data_store,
+            lambda base: create_handle(data_store, base, len(base)),
+            users,
+            names,
+            window,
+        )
+        clear_v1()
+        new = register(data_store, data_store.new_handle, users, names, window)
+        results.append((users, old, new))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, nargs="+", default=[100, 1000, 5000])
+    parser.add_argument("--names", type=int, default=1)
+    parser.add_argument("--window", type=int, default=50)
+    args = parser.parse_args()
+
+    with temporary_datastore():
+        results = measure(args.users, args.names, args.window)
+
+    print(f"recursion limit {sys.getrecursionlimit()}")
+    print(f"{'users':>8}{'recursive us':>16}{'registry us':>16}")
+    for users, old, new in results:
+        old = "recursion" if old is None else f"{old * 1e6:.1f}"
+        print(f"{users:>8}{old:>16}{new * 1e6:>16.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Measures how fast users are registered one by one and imported in bulk.
+
+Registering many users, e.g. everyone in a new organisation, took one
+auth_register_v2 each, hashing one password at a time and changing the store
+several times per user. admin_users_import_v1 hashes the passwords of the
+whole import at once, in parallel with PASSWORD_WORKERS, and adds the users
+and their notifications to the store in one change each. Both are timed
+adding --users users to a store which already has --existing, and the users
+added per second are printed.
+
+Passwords are hashed at --scrypt-cost, lower than is stored by default, so
+the rest of registering is not lost in the hashing; set it to the server's
+cost to see the time it takes in full. Set STREAMS_PASSWORD_WORKERS to hash
+in parallel.
+
+The datastore is kept in a temporary directory for the run.
+
+    Typical usage example:
+
+    STREAMS_PASSWORD_WORKERS=4 python3 -m benchmarks.import_bench --users 1000
+"""
+import argparse
+import time
+
+from benchmarks.synthetic import make_store, temporary_datastore
+from src import passwords
+
+
+def make_rows(users):
+    """Make users to add, each with their own email and the same name as
+    every tenth other."""
+    return [
+        {
+            "email": f"imported{number}@example.com",
+            "password": f"password{number}",
+            "name_first": "John",
+            "name_last": f"Smith{number % 10}",
+        }
+        for number in range(users)
+    ]
+
+
+def measure(users, existing):
+    """Time registering users one by one and importing them.
+
+    Return Value:
+        Returns a list of (name, seconds)
+    """
+    # imported here so the datastore is opened in the temporary directory
+    # pylint: disable=import-outside-toplevel
+    from src.admin import admin_users_import_v1
+    from src.auth import auth_login_v2, auth_register_v2
+    from src.data_store import data_store
+
+    rows = make_rows(users)
+    results = []
+
+    data_store.set(make_store(users=existing, channels=0, dms=0, messages=0))
+    start = time.perf_counter()
+    for row in rows:
+        auth_register_v2(row["email"], row["password"], row["name_first"], row["name_last"])
+    results.append(("auth_register_v2 each", time.perf_counter() - start))
+
+    data_store.set(make_store(users=existing, channels=0, dms=0, messages=0))
+    # the synthetic users have sha256 hashes, user 0 being a global owner
+    token = auth_login_v2("user0@example.com", "password0")["token"]
+    start = time.perf_counter()
+    imported = admin_users_import_v1(token, rows)
+    results.append(("admin_users_import_v1", time.perf_counter() - start))
+    assert not imported["errors"], imported["errors"][:3]
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--existing", type=int, default=10000)
+    parser.add_argument("--scrypt-cost", type=int, default=10)
+    args = parser.parse_args()
+
+    passwords.PASSWORD_KDF = "scrypt"
+    passwords.SCRYPT_COST = args.scrypt_cost
+
+    with temporary_datastore():
+        results = measure(args.users, args.existing)
+
+    print(
+        f"{args.users} users added to {args.existing}, scrypt cost {args.scrypt_cost}, "
+        f"{passwords.PASSWORD_WORKERS} password workers"
+    )
+    print(f"{'':<24}{'seconds':>10}{'users/s':>12}")
+    for name, seconds in results:
+        print(f"{name:<24}{seconds:>10.2f}{args.users / seconds:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
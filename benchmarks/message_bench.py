@@ -0,0 +1,103 @@
+"""Measures how long the handlers which act on one message by its id take as
+the number of messages grows.
+
+Each handler finds its message with Datastore.get_message, which looks the
+message_id up rather than going through every message of every channel and
+dm. For comparison, the time that search through every message took at each
+size is printed too.
+
+The datastore is kept in a temporary directory for the run.
+
+    Typical usage example:
+
+    python3 -m benchmarks.message_bench --messages 10000 100000 1000000
+"""
+import argparse
+import random
+import time
+
+from benchmarks.synthetic import make_store, temporary_datastore
+
+
+def scan(store, message_id):
+    """Find a message the way get_message did before messages were indexed."""
+    for group in store["channels"] + store["dms"]:
+        for message in group["messages"]:
+            if message["message_id"] == message_id:
+                return message, group
+    return None
+
+
+def mean_time(calls):
+    """Get the mean time a list of calls took, each a (func, *args) tuple."""
+    start = time.perf_counter()
+    for func, *args in calls:
+        func(*args)
+    return (time.perf_counter() - start) / len(calls)
+
+
+def measure(messages, operations, seed):
+    """Time each handler on a store with a number of messages.
+
+    Return Value:
+        Returns a dictionary of handler name to mean seconds per call
+    """
+    # imported here so the datastore is opened in the temporary directory
+    # pylint: disable=import-outside-toplevel
+    from src import message
+    from src.data_store import data_store
+
+    data_store.set(make_store(users=1000, channels=50, messages=messages, seed=seed))
+    store = data_store.get()
+    u_id = store["global_owners"][0]
+    channels = [channel for channel in store["channels"] if u_id in channel["all_members"]]
+    # the global owner may act on any message of the channels they are in
+    history = [sent for channel in channels for sent in channel["messages"]]
+    chosen = random.Random(seed).sample(history, min(len(history), operations))
+    picked = [sent["message_id"] for sent in chosen]
+    unreacted = [sent["message_id"] for sent in chosen if u_id not in sent["reacts"][0]["u_ids"]]
+    unpinned = [sent["message_id"] for sent in chosen if not sent["is_pinned"]]
+    target = channels[0]["channel_id"]
+    calls = {
+        "scan (old lookup)": [(scan, store, message_id) for message_id in picked[:20]],
+        "get_message": [(data_store.get_message, message_id) for message_id in picked],
+        "message/edit": [
+            (message.message_edit_v1, u_id, message_id, "edited") for message_id in picked
+        ],
+        "message/react": [
+            (message.message_react_v1, u_id, message_id, 1) for message_id in unreacted
+        ],
+        "message/unreact": [
+            (message.message_unreact_v1, u_id, message_id, 1) for message_id in unreacted
+        ],
+        "message/pin": [(message.message_pin_v1, u_id, message_id) for message_id in unpinned],
+        "message/unpin": [(message.message_unpin_v1, u_id, message_id) for message_id in unpinned],
+        "message/share": [
+            (message.message_share_v1, u_id, message_id, "", target, -1) for message_id in picked
+        ],
+        "message/remove": [(message.message_remove_v1, u_id, message_id) for message_id in picked],
+    }
+    # in order, so each handler finds the messages as the one before left them
+    return {name: mean_time(handler_calls) for name, handler_calls in calls.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--operations", type=int, default=200)
+    args = parser.parse_args()
+
+    with temporary_datastore():
+        results = [
+            measure(messages, args.operations, seed)
+            for seed, messages in enumerate(args.messages)
+        ]
+
+    sizes = "".join(f"{messages:>12}" for messages in args.messages)
+    print(f"{'microseconds per call':<22}{sizes}")
+    for name in results[0]:
+        print(f"{name:<22}" + "".join(f"{times[name] * 1e6:>12.1f}" for times in results))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Measures how long reading a page of messages takes in a channel and a dm
+with many messages.
+
+channel_messages_v1 used to set is_this_user_reacted on every message of
+the channel before returning a page of them. The time that took is printed
+alongside the handlers as they are now, which only copy the page returned.
+
+The datastore is kept in a temporary directory for the run.
+
+    Typical usage example:
+
+    python3 -m benchmarks.page_bench --messages 100000
+"""
+import argparse
+
+from benchmarks.synthetic import best_of, make_store, temporary_datastore
+
+
+def flag_every_message(channel, u_id, start):
+    """Get a page the way channel_messages_v1 did before it only read the page."""
+    for message in channel["messages"]:
+        message["reacts"][0]["is_this_user_reacted"] = u_id in message["reacts"][0]["u_ids"]
+    return channel["messages"][start : start + 50]
+
+
+def measure(messages, repeats):
+    """Time reading pages from the start, middle and end of a channel and a
+    dm with about messages messages each.
+
+    Return Value:
+        Returns a list of (name, start, seconds)
+    """
+    # imported here so the datastore is opened in the temporary directory
+    # pylint: disable=import-outside-toplevel
+    from src.auth import auth_login_v2
+    from src.data_store import data_store
+    from src.dm import dm_messages_v1
+    from src.message import channel_messages_v1
+
+    data_store.set(make_store(users=100, channels=1, dms=1, messages=2 * messages))
+    channel = data_store.get_channel(0)
+    dm = data_store.get_dm(0)
+    u_id = dm["members"][0]
+    token = auth_login_v2(f"user{u_id}@example.com", f"password{u_id}")["token"]
+    reader = channel["all_members"][0]
+
+    reads = {
+        "channel/messages": lambda start: channel_messages_v1(reader, 0, start),
+        "dm/messages": lambda start: dm_messages_v1(token, 0, start),
+        "flag every message": lambda start: flag_every_message(channel, reader, start),
+    }
+    sizes = {"dm/messages": len(dm["messages"])}
+    results = []
+    for name, read in reads.items():
+        size = sizes.get(name, len(channel["messages"]))
+        for start in (0, size // 2, size - 50):
+            results.append((name, start, best_of(repeats, read, start)[0]))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=100000)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    with temporary_datastore():
+        results = measure(args.messages, args.repeats)
+
+    print(f"{'read':<22}{'start':>10}{'ms per page':>14}")
+    for name, start, seconds in results:
+        print(f"{name:<22}{start:>10}{seconds * 1000:>14.2f}")
+
+
+if __name__ == "__main__":
+    main()
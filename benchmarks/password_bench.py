@@ -0,0 +1,109 @@
+"""Picks the cost of hashing passwords for a target login time, see
+src/passwords.py.
+
+Hashes a password with scrypt at each cost from --min-scrypt-cost up and
+with pbkdf2 at doubling numbers of iterations, and prints the time each
+took along with the highest cost of each which stays within --target-ms,
+as the environment variables to set for the server. Login times with many
+users are printed too, as a user who logs in for the first time since
+passwords were salted, once hashed again and once remembered, next to the
+time login took when every user was compared with the password's sha256.
+
+The datastore is kept in a temporary directory for the run.
+
+    Typical usage example:
+
+    python3 -m benchmarks.password_bench --target-ms 100
+"""
+import argparse
+import hashlib
+
+from benchmarks.synthetic import best_of, make_store, temporary_datastore
+from src import passwords
+
+
+def calibrate(target, repeats, min_scrypt_cost):
+    """Time hashing at increasing costs until past target seconds.
+
+    Return Value:
+        Returns (timings, chosen) where timings is a list of (kdf, cost,
+        seconds) and chosen the highest cost of each kdf within target
+    """
+    timings = []
+    chosen = {}
+    for kdf, costs in (
+        ("scrypt", (cost for cost in range(min_scrypt_cost, 24))),
+        ("pbkdf2", (10000 * 2**step for step in range(16))),
+    ):
+        for cost in costs:
+            seconds = best_of(repeats, passwords.hash_password, "password", kdf, cost)[0]
+            timings.append((kdf, cost, seconds))
+            if seconds > target:
+                break
+            chosen[kdf] = cost
+    return timings, chosen
+
+
+def scan_login(store, email, password):
+    """Log in the way auth_login_v2 did before passwords were salted."""
+    hashed = hashlib.sha256(password.encode()).hexdigest()
+    for user in store["users"]:
+        if user["email"] == email and user["password"] == hashed:
+            return user
+    return None
+
+
+def measure_logins(users, repeats):
+    """Time logging in as the last of a number of users.
+
+    Return Value:
+        Returns a list of (name, seconds)
+    """
+    # imported here so the datastore is opened in the temporary directory
+    # pylint: disable=import-outside-toplevel
+    from src.auth import auth_login_v2
+    from src.data_store import data_store
+
+    data_store.set(make_store(users=users, channels=0, dms=0, messages=0))
+    store = data_store.get()
+    u_id = users - 1
+    email, password = f"user{u_id}@example.com", f"password{u_id}"
+    results = [("scan users, sha256", best_of(repeats, scan_login, store, email, password)[0])]
+    # the synthetic users have sha256 hashes, hashed again on the first login
+    results.append(("index, first login", best_of(1, auth_login_v2, email, password)[0]))
+    passwords.checked.clear()
+    results.append(("index, kdf", best_of(1, auth_login_v2, email, password)[0]))
+    results.append(("index, remembered", best_of(repeats, auth_login_v2, email, password)[0]))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--target-ms", type=float, default=50)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--min-scrypt-cost", type=int, default=10)
+    parser.add_argument("--users", type=int, default=50000)
+    args = parser.parse_args()
+
+    timings, chosen = calibrate(args.target_ms / 1000, args.repeats, args.min_scrypt_cost)
+    print(f"{'kdf':<10}{'cost':>10}{'ms per hash':>14}")
+    for kdf, cost, seconds in timings:
+        print(f"{kdf:<10}{cost:>10}{seconds * 1000:>14.1f}")
+    print()
+    print(f"within {args.target_ms:g} ms:")
+    if "scrypt" in chosen:
+        print(f"    STREAMS_PASSWORD_KDF=scrypt STREAMS_SCRYPT_COST={chosen['scrypt']}")
+    if "pbkdf2" in chosen:
+        print(f"    STREAMS_PASSWORD_KDF=pbkdf2 STREAMS_PBKDF2_ITERATIONS={chosen['pbkdf2']}")
+    print()
+
+    with temporary_datastore():
+        results = measure_logins(args.users, args.repeats)
+
+    print(f"{'login, ' + str(args.users) + ' users':<28}{'ms':>10}")
+    for name, seconds in results:
+        print(f"{name:<28}{seconds * 1000:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Compares searching messages by scanning every message a user can see with
+searching the index of trigrams in src/message_index.py.
+
+Messages are written with a made up vocabulary in which a few words are very
+common and most are rare, like real text, and queries range from the most
+common word to ones which are not found at all. The messages the index finds
+are tested by looking them up by id, as the datastore does, and queries it
+cannot narrow down are scanned, as search_v1 does.
+
+    Typical usage example:
+
+    python3 -m benchmarks.search_bench --messages 1000000
+"""
+import argparse
+import time
+
+from benchmarks.synthetic import best_of, make_store, make_words
+from src.message_index import build
+
+
+def user_groups(store, u_id):
+    """Get (kind, group_id) of the channels and dms a user is in, in the
+    order search_v1 returns their messages."""
+    return [
+        ("channels", channel["channel_id"])
+        for channel in store["channels"]
+        if u_id in channel["all_members"]
+    ] + [("dms", dm["dm_id"]) for dm in store["dms"] if u_id in dm["members"]]
+
+
+def scan(store, u_id, query):
+    """Search the way search_v1 did before messages were indexed."""
+    found = []
+    for channel in store["channels"]:
+        if u_id in channel["all_members"]:
+            found += [m["message_id"] for m in channel["messages"] if query in m["message"]]
+    for dm in store["dms"]:
+        if u_id in dm["members"]:
+            found += [m["message_id"] for m in dm["messages"] if query in m["message"]]
+    return found
+
+
+def search(index, messages, groups, u_id, store, query):
+    """Search the way search_v1 does once messages are indexed."""
+    found = index.search([query], groups)
+    if found is None:
+        return scan(store, u_id, query)
+    return [message_id for message_id in found if query in messages[message_id]["message"]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--channels", type=int, default=50)
+    parser.add_argument("--messages", type=int, default=1000000)
+    parser.add_argument("--vocabulary", type=int, default=30000)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    words, _ = vocabulary = make_words(args.vocabulary)
+    store = make_store(args.users, args.channels, messages=args.messages, words=vocabulary)
+    start = time.perf_counter()
+    index = build(store)
+    built = time.perf_counter() - start
+    postings = sum(len(found) for found in index.postings.values())
+    print(f"{args.messages} messages indexed in {built:.1f}s, "
+          f"{len(index.postings)} trigrams, {postings} postings")
+
+    messages = {
+        message["message_id"]: message
+        for kind in ("channels", "dms")
+        for group in store[kind]
+        for message in group["messages"]
+    }
+    u_id = 0
+    groups = user_groups(store, u_id)
+    # from the most common word to rare ones, whatever the vocabulary size
+    last = len(words) - 1
+    queries = [
+        words[0],
+        words[min(9, last)],
+        words[min(99, last)],
+        words[last // 3],
+        f"{words[min(50, last)]} {words[min(60, last)]}",
+        words[0][:2],
+        "not in any message",
+    ]
+    print(f"{'query':<24}{'found':>8}{'scan (ms)':>12}{'index (ms)':>12}{'speedup':>10}")
+    for query in queries:
+        scanned, expected = best_of(args.repeats, scan, store, u_id, query)
+        searched, found = best_of(args.repeats, search, index, messages, groups, u_id, store, query)
+        assert found == expected
+        print(f"{query!r:<24}{len(found):>8}{scanned * 1000:>12.1f}"
+              f"{searched * 1000:>12.1f}{scanned / searched:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Compares scanning messages for a query in one thread with scanning them
+across pools of threads and processes, see src/search_pool.py.
+
+The same messages are scanned from memory, from segment files as the json
+backend keeps them and from an sqlite database, at several corpus sizes.
+
+    Typical usage example:
+
+    python3 -m benchmarks.search_pool_bench --messages 100000 1000000 --workers 2 4
+"""
+import argparse
+import os
+import tempfile
+
+from benchmarks.synthetic import best_of, make_store, make_words
+from src import search_pool
+from src.segments import encode_segment
+from src.sqlite_backend import SqliteBackend
+
+
+def make_sources(store, directory):
+    """Write the messages of every channel and dm to segment files and an
+    sqlite database in directory.
+
+    Return Value:
+        Returns the sources of each kind and the number of messages of each
+        channel or dm
+    """
+    groups = [("channels", channel["channel_id"], channel["messages"]) for channel in store["channels"]]
+    groups += [("dms", dm["dm_id"], dm["messages"]) for dm in store["dms"]]
+    segments = []
+    for kind, group_id, messages in groups:
+        path = os.path.join(directory, f"{kind}-{group_id}.seg")
+        with open(path, "wb") as file:
+            file.write(encode_segment(messages))
+        segments.append(("segment", path))
+    path = os.path.join(directory, "bench.db")
+    backend = SqliteBackend(path)
+    backend.load()
+    backend.replace(store)
+    backend.close()
+    sources = {
+        "memory": [
+            ("texts", [(message["message_id"], message["message"]) for message in messages])
+            for _, _, messages in groups
+        ],
+        "segment": segments,
+        "sqlite": [("sqlite", path, kind, group_id) for kind, group_id, _ in groups],
+    }
+    return sources, [len(messages) for _, _, messages in groups]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, nargs="+", default=[100000, 300000, 1000000])
+    parser.add_argument("--workers", type=int, nargs="+", default=[2, 4])
+    parser.add_argument("--channels", type=int, default=50)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    vocabulary = make_words(30000)
+    query = vocabulary[0][999]
+    print(f"{os.cpu_count()} cores, query {query!r}")
+    print(f"{'messages':<10}{'source':<10}{'pool':<10}{'workers':>8}{'scan (s)':>10}{'speedup':>9}")
+    for messages in args.messages:
+        store = make_store(channels=args.channels, messages=messages, words=vocabulary)
+        with tempfile.TemporaryDirectory() as directory:
+            sources, sizes = make_sources(store, directory)
+            for name, kind_sources in sources.items():
+                single, expected = best_of(args.repeats, search_pool.scan, kind_sources, sizes, query, 1)
+                print(f"{messages:<10}{name:<10}{'-':<10}{1:>8}{single:>10.3f}{1:>9.2f}")
+                for pool in ("thread", "process"):
+                    for workers in args.workers:
+                        took, found = best_of(
+                            args.repeats, search_pool.scan, kind_sources, sizes, query, workers, pool
+                        )
+                        assert found == expected
+                        print(f"{messages:<10}{name:<10}{pool:<10}{workers:>8}"
+                              f"{took:>10.3f}{single / took:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""Compares saving and loading snapshots as json and in the columnar format.
+
+    Typical usage example:
+
+    python3 -m benchmarks.snapshot_bench --messages 200000
+"""
+import argparse
+import json
+
+from benchmarks.synthetic import best_of, make_store
+from src import columnar
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--channels", type=int, default=50)
+    parser.add_argument("--messages", type=int, default=200000)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    snapshot = {
+        "seq": 1,
+        "store": make_store(args.users, args.channels, messages=args.messages),
+    }
+    formats = {
+        "json": (lambda value: json.dumps(value).encode(), json.loads),
+        "columnar": (columnar.encode, columnar.decode),
+    }
+    print(f"{'format':<10}{'size (MB)':>12}{'save (s)':>12}{'load (s)':>12}")
+    for name, (encode, decode) in formats.items():
+        save, data = best_of(args.repeats, encode, snapshot)
+        load, loaded = best_of(args.repeats, decode, data)
+        assert loaded == snapshot
+        print(f"{name:<10}{len(data) / 2 ** 20:>12.1f}{save:>12.3f}{load:>12.3f}")
+
+
+if __name__ == "__main__":
+    main()
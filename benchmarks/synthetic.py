@@ -0,0 +1,208 @@
+"""Builds plain Streams datastores of any size for benchmarks to work on.
+
+The stores follow the structure described in src/data_store.py, with every
+message sent recorded in its sender's and the workspace's stats the way the
+real handlers do it.
+
+    Typical usage example:
+
+    from benchmarks.synthetic import make_store
+
+    store = make_store(users=1000, channels=50, messages=100000)
+
+It also holds what the benchmarks share for timing and for keeping the
+datastore they open out of the way of the real one.
+"""
+import hashlib
+import os
+import random
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+WORDS = (
+    "hello there general kenobi meeting today tomorrow lunch deadline "
+    "project review merge branch deploy server client bug fix test"
+).split()
+
+
+def make_words(count, seed=0):
+    """Make a vocabulary of made up words, to give messages a realistic
+    spread of words where WORDS is too small.
+
+    Return Value:
+        Returns (words, cum_weights) to draw words with, some of them far
+        more often than others as in real text
+    """
+    rng = random.Random(seed)
+    letters = "etaoinshrdlcumwfgypbvkjxqz"
+    words = []
+    for _ in range(count):
+        length = max(1, min(12, int(rng.expovariate(1 / 5)) + 1))
+        words.append("".join(rng.choices(letters, weights=range(26, 0, -1), k=length)))
+    cum_weights = []
+    total = 0
+    for rank in range(1, count + 1):
+        total += 1 / rank
+        cum_weights.append(total)
+    return words, cum_weights
+
+
+def make_user(u_id, timestamp):
+    return {
+        "u_id": u_id,
+        "email": f"user{u_id}@example.com",
+        "password": hashlib.sha256(f"password{u_id}".encode()).hexdigest(),
+        "name_first": f"first{u_id}",
+        "name_last": f"last{u_id}",
+        "handle_str": f"first{u_id}last{u_id}",
+        "user_stats": {
+            "channels_joined": [{"num_channels_joined": 0, "time_stamp": timestamp}],
+            "dms_joined": [{"num_dms_joined": 0, "time_stamp": timestamp}],
+            "messages_sent": [{"num_messages_sent": 0, "time_stamp": timestamp}],
+        },
+        "session_ids": [1],
+        "reset_codes": [],
+        "profile_img_url": "http://localhost:8080/imgfolder/DEFAULT_IMG.jpg",
+    }
+
+
+def make_message(message_id, u_id, timestamp, rng, words=None):
+    if words is None:
+        text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 20)))
+    else:
+        vocabulary, cum_weights = words
+        text = " ".join(rng.choices(vocabulary, cum_weights=cum_weights, k=rng.randint(3, 20)))
+    reacted = rng.sample(range(u_id, u_id + 5), rng.randint(0, 2))
+    return {
+        "message": text,
+        "message_id": message_id,
+        "time_created": timestamp,
+        "u_id": u_id,
+        "reacts": [{"react_id": 1, "u_ids": reacted}],
+        "is_pinned": rng.random() < 0.01,
+    }
+
+
+def make_store(users=1000, channels=50, dms=100, messages=100000, seed=0, words=None):
+    """Make a plain datastore.
+
+    Arguments:
+        users (int) - number of registered users
+        channels (int) - number of channels, every user joins a few
+        dms (int) - number of dms between pairs of users
+        messages (int) - number of messages spread over channels and dms
+        words (tuple) - vocabulary made by make_words to write messages
+            with, WORDS if None
+
+    Return Value:
+        Returns the store as a dictionary of lists
+    """
+    rng = random.Random(seed)
+    timestamp = 1630000000
+    store = {
+        "users": [make_user(u_id, timestamp) for u_id in range(users)],
+        "channels": [],
+        "global_owners": [0],
+        "removed_users": [],
+        "dms": [],
+        "standups": [],
+        "workspace_stats": {
+            "channels_exist": [{"num_channels_exist": 0, "time_stamp": timestamp}],
+            "dms_exist": [{"num_dms_exist": 0, "time_stamp": timestamp}],
+            "messages_exist": [{"num_messages_exist": 0, "time_stamp": timestamp}],
+        },
+        "max_ids": {"dm": dms - 1, "message": -1, "channel": channels - 1,
+                    "user": users - 1, "reset_id": -1},
+        "all_notifications": [
+            {"u_id": u_id, "notifications": []} for u_id in range(users)
+        ],
+    }
+    workspace = store["workspace_stats"]
+    for channel_id in range(channels):
+        members = sorted(rng.sample(range(users), min(users, max(2, users // 5))))
+        store["channels"].append({
+            "channel_id": channel_id,
+            "name": f"channel{channel_id}",
+            "owner_members": members[:1],
+            "all_members": members,
+            "is_public": rng.random() < 0.8,
+            "messages": [],
+        })
+        workspace["channels_exist"].append(
+            {"num_channels_exist": channel_id + 1, "time_stamp": timestamp}
+        )
+    for dm_id in range(dms):
+        members = sorted(rng.sample(range(users), min(users, 2)))
+        store["dms"].append({
+            "name": ", ".join(f"first{u_id}last{u_id}" for u_id in members),
+            "dm_id": dm_id,
+            "members": members,
+            "messages": [],
+            "owner": members[0],
+        })
+        workspace["dms_exist"].append({"num_dms_exist": dm_id + 1, "time_stamp": timestamp})
+    groups = [(group, group.get("all_members") or group["members"])
+              for group in store["channels"] + store["dms"]]
+    for message_id in range(messages):
+        group, members = rng.choice(groups)
+        u_id = rng.choice(members)
+        time_created = timestamp + message_id
+        group["messages"].insert(0, make_message(message_id, u_id, time_created, rng, words))
+        sent = store["users"][u_id]["user_stats"]["messages_sent"]
+        sent.append({"num_messages_sent": len(sent), "time_stamp": time_created})
+        workspace["messages_exist"].append(
+            {"num_messages_exist": message_id + 1, "time_stamp": time_created}
+        )
+        if rng.random() < 0.05:
+            tagged = store["all_notifications"][rng.choice(members)]["notifications"]
+            tagged.insert(0, {
+                "channel_id": group.get("channel_id", -1),
+                "dm_id": group.get("dm_id", -1),
+                "notification_message": f"first{u_id}last{u_id} tagged you",
+            })
+            del tagged[20:]
+    store["max_ids"]["message"] = messages - 1
+    return store
+
+
+def best_of(repeats, func, *args):
+    """Get the fastest of several runs of func and what it returned."""
+    best, result = float("inf"), None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+@contextmanager
+def temporary_datastore(chdir=True):
+    """Make a temporary directory to keep a datastore in for a benchmark.
+
+    The default profile picture is copied into it, as the datastore would
+    download it otherwise. Modules which open the datastore when imported
+    need to be imported once inside it.
+
+    Arguments:
+        chdir (bool) - whether to work in the directory until done with it,
+            False for benchmarks which start servers in it instead
+
+    Return Value:
+        Yields the directory, which is deleted afterwards
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        image = os.path.join(ROOT, "imgfolder", "DEFAULT_IMG.jpg")
+        if os.path.isfile(image):
+            os.mkdir(os.path.join(directory, "imgfolder"))
+            shutil.copy(image, os.path.join(directory, "imgfolder"))
+        previous = os.getcwd()
+        if chdir:
+            os.chdir(directory)
+        try:
+            yield directory
+        finally:
+            os.chdir(previous)
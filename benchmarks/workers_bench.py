@@ -0,0 +1,135 @@
+"""Measures how request throughput scales with the number of server workers.
+
+Each run starts src/workers.py with a number of workers in a temporary
+directory, sets up users who all belong to one channel, then has client
+processes send a mix of requests, mostly reading messages and notifications
+with some sending messages, for a fixed time.
+
+    Typical usage example:
+
+    python3 -m benchmarks.workers_bench --workers 1 2 4 --duration 10
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+from multiprocessing import Pool
+
+import requests
+
+from benchmarks.synthetic import ROOT, temporary_datastore
+
+# share of requests which send a message, the rest read
+WRITE_SHARE = 0.2
+
+
+def wait_until_up(url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            requests.get(f"{url}users/all/v1", params={"token": ""}, timeout=1)
+            return
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    raise RuntimeError("server did not start")
+
+
+def set_up(url, users):
+    """Register users who all join one channel.
+
+    Return Value:
+        Returns (tokens, channel_id)
+    """
+    requests.delete(f"{url}clear/v1")
+    tokens = []
+    for u_id in range(users):
+        response = requests.post(f"{url}auth/register/v2", json={
+            "email": f"user{u_id}@example.com",
+            "password": "password",
+            "name_first": f"first{u_id}",
+            "name_last": f"last{u_id}",
+        })
+        tokens.append(response.json()["token"])
+    channel_id = requests.post(f"{url}channels/create/v2", json={
+        "token": tokens[0], "name": "bench", "is_public": True,
+    }).json()["channel_id"]
+    for token in tokens[1:]:
+        requests.post(f"{url}channel/join/v2", json={"token": token, "channel_id": channel_id})
+    return tokens, channel_id
+
+
+def client(args):
+    """Send requests until the deadline.
+
+    Return Value:
+        Returns the number of requests which succeeded
+    """
+    url, token, channel_id, deadline, seed = args
+    session = requests.Session()
+    done = 0
+    step = 0
+    while time.time() < deadline:
+        step += 1
+        if (step + seed) % round(1 / WRITE_SHARE) == 0:
+            response = session.post(f"{url}message/send/v1", json={
+                "token": token, "channel_id": channel_id, "message": f"hello {step}",
+            })
+        elif step % 2:
+            response = session.get(f"{url}channel/messages/v2", params={
+                "token": token, "channel_id": channel_id, "start": 0,
+            })
+        else:
+            response = session.get(f"{url}notifications/get/v1", params={"token": token})
+        done += response.status_code == 200
+    return done
+
+
+def measure(workers, clients, duration, port):
+    """Run the server with a number of workers and measure its throughput.
+
+    Return Value:
+        Returns requests handled per second
+    """
+    url = f"http://127.0.0.1:{port}/"
+    with temporary_datastore(chdir=False) as directory:
+        with subprocess.Popen(
+            [sys.executable, "-m", "src.workers", "--workers", str(workers), "--port", str(port)],
+            cwd=directory,
+            env=dict(os.environ, PYTHONPATH=ROOT),
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        ) as server:
+            try:
+                wait_until_up(url)
+                tokens, channel_id = set_up(url, clients)
+                deadline = time.time() + duration
+                with Pool(clients) as pool:
+                    done = pool.map(client, [
+                        (url, token, channel_id, deadline, seed)
+                        for seed, token in enumerate(tokens)
+                    ])
+            finally:
+                server.terminate()
+    return sum(done) / duration
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--port", type=int, default=8090)
+    args = parser.parse_args()
+
+    print(f"{os.cpu_count()} cores, {args.clients} clients")
+    print(f"{'workers':<10}{'requests/s':>12}{'speedup':>10}")
+    baseline = None
+    for workers in args.workers:
+        throughput = measure(workers, args.clients, args.duration, args.port)
+        baseline = baseline or throughput
+        print(f"{workers:<10}{throughput:>12.1f}{throughput / baseline:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,22 @@
+import csv
+import io
+import math
+import time
+
 from src.data_store import data_store
 from src.error import AccessError, InputError
-from src.auth import extract_token
+from src.auth import check_registration, extract_token, forget_tokens, handle_base, new_user
+from src.passwords import hash_passwords
+
+# Most users imported at once, which hashing the password of each keeps to
+# seconds on a few cores
+IMPORT_LIMIT = 1000
+IMPORT_FIELDS = ("email", "password", "name_first", "name_last")
 
 
-def is_valid_user(u_id, user_list):
-    """Check if a user_id belongs to a user in user_list."""
-    valid_user = False
-    for user in user_list:
-        if u_id == user["u_id"]:
-            valid_user = True
-    return valid_user
+def is_valid_user(u_id):
+    """Check if a user_id belongs to a registered user."""
+    return data_store.get_user(u_id) is not None
 
 
 def admin_user_remove_v1(token, u_id):
@@ -30,38 +37,41 @@ def admin_user_remove_v1(token, u_id):
         Returns {}
     """
     store = data_store.get()
-    user_list = store["users"]
     auth_user_id = extract_token(token)["u_id"]
-    if auth_user_id not in store["global_owners"]:
-        raise AccessError("the authorised user is not a global owner")
-    if not is_valid_user(u_id, user_list):
-        raise InputError("u_id does not refer to a valid user")
-    if u_id in store["global_owners"] and len(store["global_owners"]) == 1:
-        raise InputError("u_id refers to a user who is the only global owner")
-    for channels in store["channels"]:
-        for message in channels["messages"]:
-            if message["u_id"] == u_id:
-                message["message"] = "Removed user"
-        if u_id in channels["all_members"]:
-            channels["all_members"].remove(u_id)
-        if u_id in channels["owner_members"]:
-            channels["owner_members"].remove(u_id)
-    for users in store["users"]:
-        if users["u_id"] == u_id:
-            users["name_first"] = "Removed"
-            users["name_last"] = "user"
-            store["users"].remove(users)
-            store["removed_users"].append(users)
-    dms = store["dms"]
-    for dm in dms:
-        for message in dm["messages"]:
-            if message["u_id"] == u_id:
-                message["message"] = "Removed user"
-        if u_id == dm["owner"]:
-            dm["owner"] = -1
-        if u_id in dm["members"]:
-            dm["members"].remove(u_id)
-    data_store.set(store)
+    # the global owners are held throughout so the last one cannot be removed
+    with data_store.locked(("global_owners",)):
+        if auth_user_id not in store["global_owners"]:
+            raise AccessError("the authorised user is not a global owner")
+        if not is_valid_user(u_id):
+            raise InputError("u_id does not refer to a valid user")
+        if u_id in store["global_owners"] and len(store["global_owners"]) == 1:
+            raise InputError("u_id refers to a user who is the only global owner")
+        for channels in store["channels"]:
+            with data_store.locked(("channel", channels["channel_id"])):
+                for message in channels["messages"]:
+                    if message["u_id"] == u_id:
+                        message["message"] = "Removed user"
+                if data_store.is_member(channels, u_id):
+                    channels["all_members"].remove(u_id)
+                if data_store.is_member(channels, u_id, "owner_members"):
+                    channels["owner_members"].remove(u_id)
+        with data_store.locked(("user", u_id)):
+            removed_user = data_store.get_user(u_id)
+            removed_user["name_first"] = "Removed"
+            removed_user["name_last"] = "user"
+            store["users"].remove(removed_user)
+            store["removed_users"].append(removed_user)
+        forget_tokens(u_id)
+        dms = store["dms"]
+        for dm in dms:
+            with data_store.locked(("dm", dm["dm_id"])):
+                for message in dm["messages"]:
+                    if message["u_id"] == u_id:
+                        message["message"] = "Removed user"
+                if u_id == dm["owner"]:
+                    dm["owner"] = -1
+                if data_store.is_member(dm, u_id):
+                    dm["members"].remove(u_id)
     return {}
 
 
@@ -83,30 +93,149 @@ def admin_user_permission_change_v1(token, u_id, permission_id):
         Returns {}
     """
     store = data_store.get()
-    user_list = store["users"]
+    auth_user_id = extract_token(token)["u_id"]
+    with data_store.locked(("global_owners",)):
+        if auth_user_id not in store["global_owners"]:
+            raise AccessError("the authorised user is not a global owner")
+        if not is_valid_user(u_id):
+            raise InputError("u_id does not refer to a valid user")
+        if (
+            u_id in store["global_owners"]
+            and len(store["global_owners"]) == 1
+            and permission_id == 2
+        ):
+            raise InputError(
+                "u_id refers to a user who is the only global owner \
+                and they are being demoted to a user"
+            )
+        if permission_id != 1 and permission_id != 2:
+            raise InputError("permission_id is invalid")
+
+        user_global_owner = u_id in store["global_owners"]
+        if permission_id == 1:
+            if not user_global_owner:
+                store["global_owners"].append(u_id)
+        else:
+            if user_global_owner:
+                store["global_owners"].remove(u_id)
+    return {}
+
+
+def admin_users_import_v1(token, users):
+    """Register many users at once, e.g. everyone in a new organisation.
+
+    Each user is checked as auth_register_v2 would, and those which are
+    valid are registered together: their passwords are hashed at the same
+    time, see hash_passwords in src/passwords.py, and they and their notifications are added to the store in one change
+    each. Imported users are not logged in.
+
+    Arguments:
+        token (str) - jwt token of user making request
+        users (list) - dictionaries of the email, password, name_first and
+            name_last of each user, see rows_from_csv
+
+    Exceptions:
+        InputError when any of:
+            - users is not a list
+            - there are more than IMPORT_LIMIT users
+        AccessError when:
+            - the authorised user is not a global owner
+
+    Returns:
+        Returns {users, errors} where users holds the {row, auth_user_id,
+        handle_str} of each user registered and errors the {row, error} of
+        each which was not, row being where they are in users
+    """
+    store = data_store.get()
     auth_user_id = extract_token(token)["u_id"]
     if auth_user_id not in store["global_owners"]:
         raise AccessError("the authorised user is not a global owner")
-    if not is_valid_user(u_id, user_list):
-        raise InputError("u_id does not refer to a valid user")
-    if (
-        u_id in store["global_owners"]
-        and len(store["global_owners"]) == 1
-        and permission_id == 2
-    ):
-        raise InputError(
-            "u_id refers to a user who is the only global owner \
-            and they are being demoted to a user"
-        )
-    if permission_id != 1 and permission_id != 2:
-        raise InputError("permission_id is invalid")
-
-    user_global_owner = u_id in store["global_owners"]
-    if permission_id == 1:
-        if not user_global_owner:
-            store["global_owners"].append(u_id)
-    else:
-        if user_global_owner:
-            store["global_owners"].remove(u_id)
-    data_store.set(store)
-    return {}
+    if not isinstance(users, list):
+        raise InputError("users must be a list")
+    if len(users) > IMPORT_LIMIT:
+        raise InputError(f"no more than {IMPORT_LIMIT} users can be imported at once")
+
+    errors = []
+    valid = []
+    emails = set()
+    for row, user in enumerate(users):
+        try:
+            fields = import_fields(user)
+            check_registration(*fields)
+            if fields[0] in emails:
+                raise InputError(description="email appears earlier in the import")
+            if data_store.get_user_by_email(fields[0]):
+                raise InputError(description="email already belongs to a user")
+        except InputError as error:
+            errors.append({"row": row, "error": error.description})
+            continue
+        emails.add(fields[0])
+        valid.append((row, fields))
+
+    time_stamp = math.floor(time.time())
+    hashed = hash_passwords([fields[1] for _, fields in valid])
+
+    imported = []
+    records = []
+    handles = set()
+    with data_store.locked(("emails",), ("handles",)):
+        for (row, (email, _, name_first, name_last)), password in zip(valid, hashed):
+            # registered since it was checked
+            if data_store.get_user_by_email(email):
+                errors.append({"row": row, "error": "email already belongs to a user"})
+                continue
+            user_id = data_store.next_id("user")
+            handle = data_store.new_handle(handle_base(name_first, name_last), handles)
+            handles.add(handle)
+            records.append(
+                new_user(user_id, email, password, name_first, name_last, handle, time_stamp, [])
+            )
+            imported.append({"row": row, "auth_user_id": user_id, "handle_str": handle})
+        store["users"].extend(records)
+    store["all_notifications"].extend(
+        [{"u_id": user["auth_user_id"], "notifications": []} for user in imported]
+    )
+
+    errors.sort(key=lambda error: error["row"])
+    return {"users": imported, "errors": errors}
+
+
+def import_fields(user):
+    """Get the email, password, name_first and name_last of a user being
+    imported.
+
+    Exceptions:
+        InputError - Occurs when:
+            - user is not a dictionary
+            - any of them is missing or not a string
+    """
+    if not isinstance(user, dict):
+        raise InputError(description="user must be an object")
+    for field in IMPORT_FIELDS:
+        if not isinstance(user.get(field), str):
+            raise InputError(description=f"{field} must be a string")
+    return tuple(user[field] for field in IMPORT_FIELDS)
+
+
+def rows_from_csv(text):
+    """Read users to import from CSV with a header row naming the columns
+    email, password, name_first and name_last.
+
+    Arguments:
+        text (str) - the CSV
+
+    Exceptions:
+        InputError - Occurs when:
+            - text is not a string
+            - a column is missing from the header
+
+    Returns:
+        Returns a list of dictionaries, see admin_users_import_v1
+    """
+    if not isinstance(text, str):
+        raise InputError("csv must be a string")
+    reader = csv.DictReader(io.StringIO(text))
+    missing = [field for field in IMPORT_FIELDS if field not in (reader.fieldnames or ())]
+    if missing:
+        raise InputError(f"csv has no {', '.join(missing)} column")
+    return list(reader)
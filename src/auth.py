@@ -7,25 +7,37 @@ This contains the functions for registering and logging into a user's account.
     from src.auth import auth_register_v1
     auth_id = auth_register_v1("mark@gmail.com", "password123")
 """
+import os
 import re
 import jwt
-import hashlib
 import random
 import math
 import time
-import smtplib
 
+from collections import OrderedDict
 from string import printable
+from threading import Lock
 
 from src.data_store import data_store
 from src.error import InputError, AccessError
 
 from src import notifications
+from src.outbox import outbox
+from src.passwords import check_password, hash_password
 from src.config import url
 
-JWT_SECRET = "".join(random.choice(printable) for _ in range(50))
+# Server processes sharing a database must also share the secret their
+# tokens are signed with, see src/workers.py
+JWT_SECRET = os.environ.get("STREAMS_JWT_SECRET") or "".join(
+    random.choice(printable) for _ in range(50)
+)
 
-SERVER_EMAIL = "streamsbotbeagle@gmail.com"
+# Most tokens kept decoded, the least recently used are decoded again
+TOKEN_CACHE_SIZE = int(os.environ.get("STREAMS_TOKEN_CACHE_SIZE", "10000"))
+
+# token to what it decodes to, least recently used first
+decoded_tokens = OrderedDict()
+decoded_tokens_lock = Lock()
 
 """jwt structure
 {"u_id": int, "session_id": int}
@@ -47,31 +59,30 @@ def auth_login_v2(email, password):
     Return Value:
         Returns {auth_user_id} on successful login
     """
+    user = data_store.get_user_by_email(email)
+    if user is None:
+        raise InputError(description="email and or password was incorrect")
+    stored = user["password"]
+    matches, outdated = check_password(password, stored)
+    if not matches:
+        raise InputError(description="email and or password was incorrect")
+    # passwords hashed before the current function or cost are hashed again
+    # now the password is known, see src/passwords.py
+    rehashed = hash_password(password) if outdated else None
+
+    with data_store.locked(("user", user["u_id"])):
+        if rehashed is not None and user["password"] == stored:
+            user["password"] = rehashed
+        new_session_id = data_store.next_session_id(user)
+        user["session_ids"].append(new_session_id)
+
+    token_data = {
+        "u_id": user["u_id"],
+        "session_id": new_session_id,
+    }
+    token = jwt.encode(token_data, JWT_SECRET, algorithm="HS256")
 
-    store = data_store.get()
-    users = store["users"]
-
-    hashed_password = hashlib.sha256(password.encode()).hexdigest()
-
-    for user in users:
-        # check for correct email and password pair
-        if user["email"] == email and user["password"] == hashed_password:
-            # if correct user generate token
-            new_session_id = (
-                max(user["session_ids"]) + 1 if len(user["session_ids"]) > 0 else 0
-            )
-            user["session_ids"].append(new_session_id)
-            data_store.set(store)
-
-            token_data = {
-                "u_id": user["u_id"],
-                "session_id": new_session_id,
-            }
-            token = jwt.encode(token_data, JWT_SECRET, algorithm="HS256")
-
-            return {"auth_user_id": user["u_id"], "token": token}
-
-    raise InputError(description="email and or password was incorrect")
+    return {"auth_user_id": user["u_id"], "token": token}
 
 
 def auth_logout_v1(token):
@@ -83,13 +94,12 @@ def auth_logout_v1(token):
     # retreive token's data
     token_data = extract_token(token)
 
-    store = data_store.get()
-    users = store["users"]
-    for user in users:
-        # check for matching user_id
-        if user["u_id"] == token_data["u_id"]:
-            user["session_ids"].remove(token_data["session_id"])
-            data_store.set(store)
+    with data_store.locked(("user", token_data["u_id"])):
+        # the session may have ended while waiting for the lock
+        token_data = extract_token(token)
+        user = data_store.get_user(token_data["u_id"])
+        user["session_ids"].remove(token_data["session_id"])
+    forget_token(token)
     return {}
 
 
@@ -118,69 +128,34 @@ def auth_register_v2(email, password, name_first, name_last):
     Return Value:
         Returns { auth_user_id } on successful registration
     """
+    check_registration(email, password, name_first, name_last)
 
-    # password, email and name validity checks
-    if len(password) < 6:
-        raise InputError(description="password must be 6 or more characters long")
-    if len(name_first) < 1 or len(name_first) > 50:
-        raise InputError(description="first name must be between 1 and 50 characters")
-    if len(name_last) < 1 or len(name_last) > 50:
-        raise InputError(description="last name must be between 1 and 50 characters")
-    if not re.fullmatch(r"^[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}$", email):
-        raise InputError(description="invalid email")
+    # the user registered when asked to, not once the password is hashed
+    time_stamp = math.floor(time.time())
+    # hashed before the locks are taken, as it takes a while
+    password = hash_password(password)
 
     store = data_store.get()
     users = store["users"]
-    # check for existing email
-    for user in users:
-        if user["email"] == email:
+    # the email and handle stay unique while they are checked and taken
+    with data_store.locked(("emails",), ("handles",)):
+        # check for existing email
+        if data_store.get_user_by_email(email):
             raise InputError(description="email already belongs to a user")
 
-    # make new user id, maximum current id + 1
-    store["max_ids"]["user"] += 1
-    user_id = store["max_ids"]["user"]
-    data_store.set(store)
+        # make new user id, maximum current id + 1
+        user_id = data_store.next_id("user")
 
-    # create handle, concatenate, and check for multiples and add number
-    handle = f"{name_first.lower()}{name_last.lower()}"
-    handle = re.sub(r"\W+", "", handle)
-    handle = handle[:20]
-
-    handle = (
-        create_handle(handle, len(handle)) if len(handle) > 0 else create_handle("0", 0)
-    )
-
-    if len(users) == 0:
-        store["global_owners"].append(user_id)
-
-    password = hashlib.sha256(password.encode()).hexdigest()
+        # if the handle is taken add the lowest number free
+        handle = data_store.new_handle(handle_base(name_first, name_last))
 
-    # creating a timestamp for the user stats
-    time_stamp = math.floor(time.time())
+        if len(users) == 0:
+            store["global_owners"].append(user_id)
 
-    # add to user list
-    users.append(
-        {
-            "u_id": user_id,
-            "email": email,
-            "password": password,
-            "name_first": name_first,
-            "name_last": name_last,
-            "handle_str": handle,
-            "session_ids": [1],
-            "user_stats": {
-                "channels_joined": [
-                    {"num_channels_joined": 0, "time_stamp": time_stamp}
-                ],
-                "dms_joined": [{"num_dms_joined": 0, "time_stamp": time_stamp}],
-                "messages_sent": [{"num_messages_sent": 0, "time_stamp": time_stamp}],
-            },
-            "reset_codes": [],
-            "profile_img_url": f"{url}imgfolder/DEFAULT_IMG.jpg",
-        }
-    )
-
-    data_store.set(store)
+        # add to user list
+        users.append(
+            new_user(user_id, email, password, name_first, name_last, handle, time_stamp, [1])
+        )
 
     token_data = {"u_id": user_id, "session_id": 1}
     token = jwt.encode(token_data, JWT_SECRET, algorithm="HS256")
@@ -190,50 +165,83 @@ def auth_register_v2(email, password, name_first, name_last):
     return {"auth_user_id": user_id, "token": token}
 
 
-def auth_password_reset_request_v1(email):
-    """Given an email address, if the user is a registered user, sends them an email containing a specific secret code
-        - also logs user out of all sessions
+def check_registration(email, password, name_first, name_last):
+    """Check the details a user registers with.
 
     Arguments:
         email (str) - email of user
+        password (str) - password of user
+        name_first (str) - first name of user
+        name_last (str) - last name of user
+
+    Exceptions:
+        InputError - Occurs when:
+            - email does not match email regular expression
+            - length of password is less than 6 characters
+            - length of name_first is not between 1 and 50 characters inclusive
+            - length of name_last is not between 1 and 50 characters inclusive
     """
-    store = data_store.get()
-    users = store["users"]
+    if len(password) < 6:
+        raise InputError(description="password must be 6 or more characters long")
+    if len(name_first) < 1 or len(name_first) > 50:
+        raise InputError(description="first name must be between 1 and 50 characters")
+    if len(name_last) < 1 or len(name_last) > 50:
+        raise InputError(description="last name must be between 1 and 50 characters")
+    if not re.fullmatch(r"^[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}$", email):
+        raise InputError(description="invalid email")
+
 
-    for user in users:
-        if user["email"] == email:
-            user["session_ids"] = []
+def handle_base(name_first, name_last):
+    """Make the handle of a user from their name, before a number is added to
+    it if another user has it, see Datastore.new_handle."""
+    handle = f"{name_first.lower()}{name_last.lower()}"
+    handle = re.sub(r"\W+", "", handle)
+    return handle[:20]
+
+
+def new_user(user_id, email, password, name_first, name_last, handle, time_stamp, session_ids):
+    """Make the record of a new user, with password already hashed."""
+    return {
+        "u_id": user_id,
+        "email": email,
+        "password": password,
+        "name_first": name_first,
+        "name_last": name_last,
+        "handle_str": handle,
+        "session_ids": session_ids,
+        "user_stats": {
+            "channels_joined": [{"num_channels_joined": 0, "time_stamp": time_stamp}],
+            "dms_joined": [{"num_dms_joined": 0, "time_stamp": time_stamp}],
+            "messages_sent": [{"num_messages_sent": 0, "time_stamp": time_stamp}],
+        },
+        "reset_codes": [],
+        "profile_img_url": f"{url}imgfolder/DEFAULT_IMG.jpg",
+    }
 
-            reset_id = store["max_ids"]["reset_id"] + 1
-            store["max_ids"]["reset_id"] = reset_id
-            user["reset_codes"].append(reset_id)
 
-            code_data = {"u_id": user["u_id"], "reset_id": reset_id}
-            code = jwt.encode(code_data, JWT_SECRET, algorithm="HS256")
+def auth_password_reset_request_v1(email):
+    """Given an email address, if the user is a registered user, sends them an email containing a specific secret code
+        - also logs user out of all sessions
 
-            # send the email, code snippit from https://stackoverflow.com/questions/10147455/how-to-send-an-email-with-gmail-as-provider-using-python
+    The email is sent in the background, see src/outbox.py, so this returns
+    without waiting for the mail server.
 
-            FROM = SERVER_EMAIL
-            TO = email
-            SUBJECT = "Password Reset Code For Streams"
-            TEXT = f"Your reset code is: {code}"
+    Arguments:
+        email (str) - email of user
+    """
+    user = data_store.get_user_by_email(email)
+    if user is None:
+        return
 
-            # Prepare actual message
-            message = """From: %s\nTo: %s\nSubject: %s\n\n%s
-            """ % (
-                FROM,
-                TO,
-                SUBJECT,
-                TEXT,
-            )
-            server = smtplib.SMTP("smtp.gmail.com", 587)
-            server.ehlo()
-            server.starttls()
-            server.login(SERVER_EMAIL, "SyC$8jZsrm&W")
-            server.sendmail(FROM, TO, message)
-            server.close()
+    reset_id = data_store.next_id("reset_id")
+    with data_store.locked(("user", user["u_id"])):
+        user["session_ids"] = []
+        user["reset_codes"].append(reset_id)
+    forget_tokens(user["u_id"])
 
-    data_store.set(store)
+    code_data = {"u_id": user["u_id"], "reset_id": reset_id}
+    code = jwt.encode(code_data, JWT_SECRET, algorithm="HS256")
+    outbox.send(email, "Password Reset Code For Streams", f"Your reset code is: {code}")
 
 
 def auth_password_reset_v1(reset_code, new_password):
@@ -248,76 +256,98 @@ def auth_password_reset_v1(reset_code, new_password):
             - reset_code is not a valid reset code
             - password entered is less than 6 characters long
     """
-    store = data_store.get()
-    users = store["users"]
-
     try:
         code_data = jwt.decode(reset_code, JWT_SECRET, algorithms=["HS256"])
     except jwt.DecodeError:
         raise InputError(description="not a valid reset code") from Exception
 
-    for user in users:
-        if (
-            code_data["u_id"] == user["u_id"]
-            and code_data["reset_id"] in user["reset_codes"]
-        ):
+    with data_store.locked(("user", code_data["u_id"])):
+        user = data_store.get_user(code_data["u_id"])
+        if user and code_data["reset_id"] in user["reset_codes"]:
             if len(new_password) < 6:
                 raise InputError
-            user["password"] = hashlib.sha256(new_password.encode()).hexdigest()
+            user["password"] = hash_password(new_password)
             user["reset_codes"].remove(code_data["reset_id"])
 
-    data_store.set(store)
-
 
-def create_handle(handle, base_length):
-    """Creates a unique handle for a user.
+def extract_token(token):
+    """Verifies if the given token is valid
 
-    Checks if a handle already exists if so adds an increasing number to the
-    handle until a new handle is made.
+    Tokens are only decoded the first time they are seen, see decode_token,
+    but whether the user is still logged in with them is checked every time,
+    so logging out, resetting the password or being removed ends a session
+    straight away.
 
     Arguments:
-        handle (str) - handle to be checked
-        base_length (int) - length of non-counter part of handle
+        token (str) - An encoded JWT token
+
+    Exceptions:
+        InputError - Occurs when:
+            - invalid jwt token
+            - no matching session id for user
 
     Return Value:
-        Returns correct handle when no other similar handles found
+        Returns { u_id, token } on successful registration
     """
+    token_data = decode_token(token)
 
-    users = data_store.get()["users"]
+    user = data_store.get_user(token_data["u_id"])
+    if not user:
+        forget_token(token)
+        raise AccessError(description="no matching user id in database")
+    if not data_store.has_session(user, token_data["session_id"]):
+        forget_token(token)
+        raise AccessError(description="no matching session id for user")
+    return dict(token_data)
 
-    for user in users:
-        if user["handle_str"] == handle:
-            counter = handle[base_length:]
-            # set count to 0 if doesn't exist else increment counter
-            counter = 0 if counter == "" else int(counter) + 1
-            # check if new counter also exists
-            return create_handle(handle[:base_length] + str(counter), base_length)
-    return handle
 
+def decode_token(token):
+    """Decode a token, or get what it decoded to if it was decoded recently.
 
-def extract_token(token):
-    """Verifies if the given token is valid
+    Decoding checks the signature of the token, which takes far longer than
+    the rest of a request which only reads the store. What a token decodes
+    to never changes, so the latest TOKEN_CACHE_SIZE tokens used are kept
+    decoded.
 
     Arguments:
         token (str) - An encoded JWT token
 
     Exceptions:
-        InputError - Occurs when:
+        AccessError - Occurs when:
             - invalid jwt token
-            - no matching session id for user
 
     Return Value:
-        Returns { u_id, token } on successful registration
+        Returns { u_id, session_id }
     """
+    cacheable = isinstance(token, str)
+    if cacheable:
+        with decoded_tokens_lock:
+            token_data = decoded_tokens.get(token)
+            if token_data is not None:
+                decoded_tokens.move_to_end(token)
+                return token_data
     try:
         token_data = jwt.decode(token, JWT_SECRET, algorithms=["HS256"])
     except jwt.DecodeError:
         raise AccessError(description="invalid jwt token") from Exception
-
-    for user in data_store.get()["users"]:
-        if user["u_id"] == token_data["u_id"]:
-            if token_data["session_id"] in user["session_ids"]:
-                return token_data
-            else:
-                raise AccessError(description="no matching session id for user")
-    raise AccessError(description="no matching user id in database")
+    if cacheable and TOKEN_CACHE_SIZE > 0:
+        with decoded_tokens_lock:
+            decoded_tokens[token] = token_data
+            if len(decoded_tokens) > TOKEN_CACHE_SIZE:
+                decoded_tokens.popitem(last=False)
+    return token_data
+
+
+def forget_token(token):
+    """Stop keeping a token decoded, e.g. once its session has ended."""
+    if isinstance(token, str):
+        with decoded_tokens_lock:
+            decoded_tokens.pop(token, None)
+
+
+def forget_tokens(u_id):
+    """Stop keeping any token of a user decoded, e.g. once they are logged
+    out of every session."""
+    with decoded_tokens_lock:
+        for token in [token for token, data in decoded_tokens.items() if data["u_id"] == u_id]:
+            del decoded_tokens[token]
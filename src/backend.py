@@ -0,0 +1,178 @@
+"""Interface of the places the datastore keeps its data between restarts.
+
+Backends are chosen by STREAMS_BACKEND, see open_backend in
+src/data_store.py: the journal and snapshots of JsonBackend or the database
+of src/sqlite_backend.py.
+
+    Typical usage example:
+
+    class MemoryBackend(Backend):
+        def load(self):
+            return build_store(deepcopy(INITIAL_OBJECT))
+
+        def record(self, change, container=None, removed=()):
+            pass
+"""
+import math
+import os
+import time
+from contextlib import nullcontext
+
+from src.records import INDEXED_LISTS, build_store
+
+timestamp = math.floor(time.time())
+
+
+INITIAL_OBJECT = {
+    "users": [],
+    "channels": [],
+    "global_owners": [],
+    "removed_users": [],
+    "dms": [],
+    "standups": [],
+    "workspace_stats": {
+        "channels_exist": [{"num_channels_exist": 0, "time_stamp": timestamp}],
+        "dms_exist": [{"num_dms_exist": 0, "time_stamp": timestamp}],
+        "messages_exist": [{"num_messages_exist": 0, "time_stamp": timestamp}],
+    },
+    "max_ids": {"dm": -1, "message": -1, "channel": -1, "user": -1, "reset_id": -1},
+    "all_notifications": [],
+}
+
+
+class Backend:
+    """Somewhere the datastore keeps its data between restarts.
+
+    The datastore loads its store from a backend at startup and then passes
+    every change made to the store on to record as it happens.
+    """
+
+    # Called with (group, key, value) to make the container for the messages
+    # of a channel or dm, or None to keep every message in memory
+    history = None
+    # Whether other processes share what the backend keeps, see changes
+    shared = False
+
+    def load(self):
+        """Read the store back from where it is kept.
+
+        Return Value:
+            Returns the Store
+        """
+        raise NotImplementedError
+
+    def record(self, change, container=None, removed=()):
+        """Keep a change made to the store.
+
+        Arguments:
+            change (list) - change as it was reported by the store
+            container (Container) - container the change was made in
+            removed (any) - items a splice removed or the value a set replaced
+        """
+        raise NotImplementedError
+
+    def replace(self, store):
+        """Record that the whole store is being replaced and build the new one.
+
+        Arguments:
+            store (dict) - plain store replacing the current one
+
+        Return Value:
+            Returns the new Store
+        """
+        self.record(["reset", [], store])
+        return build_store(store, self.history)
+
+    def message_group(self, message_id):
+        """Get (kind, group_id) of the channel or dm a message which is not
+        indexed in memory was sent in, or None if the backend does not know."""
+        return None
+
+    def find_message(self, store, message_id):
+        """Get a message which is not indexed in memory.
+
+        Return Value:
+            Returns (message, group) or None if no message has that id
+        """
+        if not isinstance(message_id, int):
+            return None
+        # backends keeping messages out of memory override message_group
+        found = self.message_group(message_id)  # pylint: disable=assignment-from-none
+        if found is None:
+            return None
+        kind, group_id = found
+        group = store[kind].find(INDEXED_LISTS[kind][0], group_id)
+        message = group and group["messages"].find("message_id", message_id)
+        return None if message is None else (message, group)
+
+    def scan_source(self, history):
+        """Get where a search can read the messages of a channel or dm from
+        without going through the store, see src/search_pool.py, or None if
+        it has to go through the store."""
+        return None
+
+    def pinned(self, history):
+        """Keep the messages of a channel or dm in memory while a request
+        which may change them holds their lock, see Datastore.locked.
+
+        Return Value:
+            Returns a context manager keeping them there
+        """
+        return nullcontext()
+
+    def lock(self):
+        """Hold the lock other processes sharing the backend wait for before
+        they make changes.
+
+        Return Value:
+            Returns a context manager holding the lock
+        """
+        return nullcontext()
+
+    def changes(self):
+        """Get the changes other processes sharing the backend made since
+        they were last asked for.
+
+        Return Value:
+            Returns a list of (change, removed) in the order they were made,
+            where removed holds the message_ids of the messages the change
+            removed from a channel or dm, or is None if it removed none
+        """
+        return []
+
+    def sync(self):
+        """Wait until every change the calling thread recorded has reached
+        the disk, so a crash cannot lose them once it is answered."""
+
+    def snapshot(self, store):
+        """Make sure every change recorded so far has reached the disk."""
+
+    def compact(self, store):
+        """Tidy up what is kept on disk if it has grown enough to need it."""
+
+    def metrics(self):
+        """Get measurements of the backend's work, e.g. how long snapshots
+        take, as a dictionary."""
+        return {}
+
+
+def write_atomically(path, data):
+    """Replace the file at path with data, so it is left either as it was or
+    with all of data even if the process crashes part way through.
+
+    Arguments:
+        path (str) - file to replace
+        data (bytes) - new contents of the file
+    """
+    temporary = path + ".tmp"
+    with open(temporary, "wb") as file:
+        file.write(data)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary, path)
+    # the rename itself only survives a crash once the directory is synced
+    directory = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(directory)
+    finally:
+        os.close(directory)
@@ -20,7 +20,6 @@ import time
 
 from src.data_store import data_store
 from src.error import AccessError, InputError
-from src.other import first
 from src.auth import extract_token
 from src import notifications
 
@@ -59,51 +58,36 @@ def channel_invite_v1(auth_user_id, channel_id, u_id):
     Return Value:
         Returns {} if invite is successful
     """
-    store = data_store.get()
-    channel_list = store["channels"]
-    user_list = store["users"]
-
-    # loop through channels to verify the channel_id belongs to an actual
-    # channel if the channel is found, save it to variable channel
-    valid_channel = False
-    for each_channel in channel_list:
-        if each_channel["channel_id"] == channel_id:
-            valid_channel = True
-            channel = each_channel
-    if not valid_channel:
-        raise InputError("channel_id does not refer to a valid channel")
-
-    # loop through members of channel to make sure auth_user_id is actually
-    # a member of the channel, and also that u_id is not already in the channel
-    valid_member = False
-    uid_in_channel = False
-    for users in channel["all_members"]:
-        if users == auth_user_id:
-            valid_member = True
-        if users == u_id:
-            uid_in_channel = True
-    if not valid_member:
-        raise AccessError("the authorised user is not a member of the channel")
-    if uid_in_channel:
-        raise InputError("u_id refers to a user who is already a member of the channel")
-    # loop through user_list to check u_id corresponds to an actual user
-    valid_user = any(True for each_user in user_list if each_user["u_id"] == u_id)
-    if not valid_user:
-        raise InputError("u_id does not refer to a valid user")
-
-    # if no errors were raised, add u_id to the list of members of the channel
-    channel["all_members"].append(u_id)
-
-    # updating the user stats for the owner
-    timestamp = math.floor(time.time())
-    found_user = [user for user in user_list if user["u_id"] == u_id][0]
-    user_stats = found_user["user_stats"]
-    channels_joined_prev = user_stats["channels_joined"][-1]["num_channels_joined"]
-    user_stats["channels_joined"].append(
-        {"num_channels_joined": channels_joined_prev + 1, "time_stamp": timestamp}
-    )
+    with data_store.locked(("channel", channel_id), ("user", u_id)):
+        # verify the channel_id belongs to an actual channel
+        channel = data_store.get_channel(channel_id)
+        if not channel:
+            raise InputError("channel_id does not refer to a valid channel")
+
+        # make sure auth_user_id is actually a member of the channel, and also
+        # that u_id is not already in the channel
+        valid_member = data_store.is_member(channel, auth_user_id)
+        uid_in_channel = data_store.is_member(channel, u_id)
+        if not valid_member:
+            raise AccessError("the authorised user is not a member of the channel")
+        if uid_in_channel:
+            raise InputError("u_id refers to a user who is already a member of the channel")
+        # check u_id corresponds to an actual user
+        found_user = data_store.get_user(u_id)
+        if not found_user:
+            raise InputError("u_id does not refer to a valid user")
+
+        # if no errors were raised, add u_id to the list of members of the channel
+        channel["all_members"].append(u_id)
+
+        # updating the user stats for the owner
+        timestamp = math.floor(time.time())
+        user_stats = found_user["user_stats"]
+        channels_joined_prev = user_stats["channels_joined"][-1]["num_channels_joined"]
+        user_stats["channels_joined"].append(
+            {"num_channels_joined": channels_joined_prev + 1, "time_stamp": timestamp}
+        )
 
-    data_store.set(store)
     notifications.add_added_to_a_channel_or_dm_to_notif(
         auth_user_id, u_id, channel_id, -1
     )
@@ -128,33 +112,28 @@ def channel_details_v2(token, channel_id):
     Return Value:
         Returns {channel_name, is_public, owner_members, and all_members}
     """
-    store = data_store.get()
-    users = store["users"]
-    channels = store["channels"]
     u_information = extract_token(token)
     auth_user_id = int(u_information["u_id"])
     # Forces channel_id to be an integer
     channel_id = int(channel_id)
 
-    channel = first(lambda c: c["channel_id"] == channel_id, channels, {})
+    channel = data_store.get_channel(channel_id)
     if not channel:
         raise InputError(description="channel_id not found")
 
     # checks whether auth_user_id is a member of the channel
-    is_member = any(True for user in channel["all_members"] if user == auth_user_id)
+    is_member = data_store.is_member(channel, auth_user_id)
     if not is_member:
         raise AccessError(description="user is not a member of the channel")
 
     # loops through the tuple containing owner_members and all_members, finding
     # the user from the user_id and adding it to the corresponding list
-    channel_details = {
-        key: value
-        for key, value in deepcopy(channel).items()
-        if key not in EXCLUDE_LIST
-    }
+    channel_details = deepcopy(
+        {key: value for key, value in channel.items() if key not in EXCLUDE_LIST}
+    )
     for member_key in ("owner_members", "all_members"):
         for i, user_id in enumerate(channel[member_key]):
-            user_details = first(lambda u: u["u_id"] == user_id, users, {})
+            user_details = data_store.get_user(user_id) or {}
             channel_details[member_key][i] = {
                 key: value
                 for key, value in user_details.items()
@@ -184,37 +163,33 @@ def channel_join_v1(auth_user_id, channel_id):
         Returns {} if join is successful
     """
     store = data_store.get()
-    users = store["users"]
-
-    # find first channel matching channel_id if none found set to empty dict
-    channel = first(lambda c: c["channel_id"] == channel_id, store["channels"], {})
-    if not channel:
-        raise InputError("channel_id does not refer to a valid channel")
-
-    # checks if the user is already in the given channel
-    for member in channel["all_members"]:
-        if member == auth_user_id:
+    with data_store.locked(("channel", channel_id), ("user", auth_user_id)):
+        # find the channel matching channel_id
+        channel = data_store.get_channel(channel_id)
+        if not channel:
+            raise InputError("channel_id does not refer to a valid channel")
+
+        # checks if the user is already in the given channel
+        if data_store.is_member(channel, auth_user_id):
             raise InputError("user is already a member of the channel")
-    # makes sure the channel is not private
-    if not channel["is_public"] and auth_user_id not in store["global_owners"]:
-        raise AccessError(
-            "channel_id refers to a channel that is private and the \
-            authorised user is not a global owner"
+        # makes sure the channel is not private
+        if not channel["is_public"] and auth_user_id not in store["global_owners"]:
+            raise AccessError(
+                "channel_id refers to a channel that is private and the \
+                authorised user is not a global owner"
+            )
+
+        # adds the user to the channel members list
+        channel["all_members"].append(auth_user_id)
+
+        # updating the user stats for the owner
+        timestamp = math.floor(time.time())
+        found_user = data_store.get_user(auth_user_id)
+        user_stats = found_user["user_stats"]
+        channels_joined_prev = user_stats["channels_joined"][-1]["num_channels_joined"]
+        user_stats["channels_joined"].append(
+            {"num_channels_joined": channels_joined_prev + 1, "time_stamp": timestamp}
         )
-
-    # adds the user to the channel members list
-    channel["all_members"].append(auth_user_id)
-
-    # updating the user stats for the owner
-    timestamp = math.floor(time.time())
-    found_user = [user for user in users if user["u_id"] == auth_user_id][0]
-    user_stats = found_user["user_stats"]
-    channels_joined_prev = user_stats["channels_joined"][-1]["num_channels_joined"]
-    user_stats["channels_joined"].append(
-        {"num_channels_joined": channels_joined_prev + 1, "time_stamp": timestamp}
-    )
-
-    data_store.set(store)
     return {}
 
 
@@ -242,35 +217,28 @@ def channel_addowner_v1(token, channel_id, u_id):
     store = data_store.get()
     payload = extract_token(token)
 
-    is_global_owner = False
-    if payload["u_id"] in store["global_owners"]:
-        is_global_owner = True
-    all_u_ids = [users["u_id"] for users in store["users"]]
-    all_chan_ids = [chans["channel_id"] for chans in store["channels"]]
-    which_channel = None
-    # Check for access errs
-    for channels in store["channels"]:
-        if channel_id == channels["channel_id"]:
-            if (payload["u_id"] in channels["owner_members"]) or (
-                payload["u_id"] in channels["all_members"] and is_global_owner
+    with data_store.locked(("channel", channel_id)):
+        is_global_owner = False
+        if payload["u_id"] in store["global_owners"]:
+            is_global_owner = True
+        channel = data_store.get_channel(channel_id)
+        # Check for access errs
+        if channel:
+            if not data_store.is_member(channel, payload["u_id"], "owner_members") and not (
+                data_store.is_member(channel, payload["u_id"]) and is_global_owner
             ):
-                which_channel = channels["owner_members"]
-            else:
                 raise AccessError("does not have owner perms")
-    # Check for input errs
-    if u_id not in all_u_ids:
-        raise InputError("u_id not valid")
-    if channel_id not in all_chan_ids:
-        raise InputError("channel_id not valid")
-    for channel in store["channels"]:
-        if channel["channel_id"] == channel_id:
-            if u_id not in channel["all_members"]:
-                raise InputError("u_id not in channel")
-            if u_id in channel["owner_members"]:
-                raise InputError("u_id already owner")
-
-    which_channel.append(u_id)
-    data_store.set(store)
+        # Check for input errs
+        if not data_store.get_user(u_id):
+            raise InputError("u_id not valid")
+        if not channel:
+            raise InputError("channel_id not valid")
+        if not data_store.is_member(channel, u_id):
+            raise InputError("u_id not in channel")
+        if data_store.is_member(channel, u_id, "owner_members"):
+            raise InputError("u_id already owner")
+
+        channel["owner_members"].append(u_id)
     return {}
 
 
@@ -295,36 +263,30 @@ def channel_removeowner_v1(token, channel_id, u_id):
     """
     store = data_store.get()
     payload = extract_token(token)
-    is_global_owner = False
-    if payload["u_id"] in store["global_owners"]:
-        is_global_owner = True
-    all_u_ids = [users["u_id"] for users in store["users"]]
-    all_chan_ids = [chans["channel_id"] for chans in store["channels"]]
-    # Check for access errs
-    for channels in store["channels"]:
-        if channel_id == channels["channel_id"]:
-            if (payload["u_id"] in channels["owner_members"]) or (
-                payload["u_id"] in channels["all_members"] and is_global_owner
+    with data_store.locked(("channel", channel_id)):
+        is_global_owner = False
+        if payload["u_id"] in store["global_owners"]:
+            is_global_owner = True
+        channel = data_store.get_channel(channel_id)
+        # Check for access errs
+        if channel:
+            if not data_store.is_member(channel, payload["u_id"], "owner_members") and not (
+                data_store.is_member(channel, payload["u_id"]) and is_global_owner
             ):
-                which_channel = channels["owner_members"]
-            else:
                 raise AccessError("does not have owner perms")
-    # Check for input errs
-    if u_id not in all_u_ids:
-        raise InputError("u_id not valid")
-    if channel_id not in all_chan_ids:
-        raise InputError("channel_id not valid")
-    for channel in store["channels"]:
-        if channel["channel_id"] == channel_id:
-            if u_id not in channel["all_members"]:
-                raise InputError("u_id not in channel")
-            if u_id not in channel["owner_members"]:
-                raise InputError("u_id not an owner")
-            if len(channel["owner_members"]) == 1:
-                raise InputError("cannot remove only channel owner")
-
-    which_channel.remove(u_id)
-    data_store.set(store)
+        # Check for input errs
+        if not data_store.get_user(u_id):
+            raise InputError("u_id not valid")
+        if not channel:
+            raise InputError("channel_id not valid")
+        if not data_store.is_member(channel, u_id):
+            raise InputError("u_id not in channel")
+        if not data_store.is_member(channel, u_id, "owner_members"):
+            raise InputError("u_id not an owner")
+        if len(channel["owner_members"]) == 1:
+            raise InputError("cannot remove only channel owner")
+
+        channel["owner_members"].remove(u_id)
     return {}
 
 
@@ -344,32 +306,29 @@ def channel_leave_v1(token, channel_id):
     Return Value:
         Returns {}
     """
-    store = data_store.get()
     payload = extract_token(token)
-    # Check input err
-    all_chan_ids = [chans["channel_id"] for chans in store["channels"]]
-    if channel_id not in all_chan_ids:
-        raise InputError("channel_id not valid")
-    # Check access err and if all good, remove
-    for channels in store["channels"]:
-        if channel_id == channels["channel_id"]:
-            if payload["u_id"] not in channels["all_members"]:
-                raise AccessError("user not member in channel")
-            else:
-                channels["all_members"].remove(payload["u_id"])
-                try:
-                    channels["owner_members"].remove(payload["u_id"])
-                except ValueError:
-                    pass
-
-    # updating the user stats for the owner
-    timestamp = math.floor(time.time())
-    found_user = [user for user in store["users"] if user["u_id"] == payload["u_id"]][0]
-    user_stats = found_user["user_stats"]
-    channels_joined_prev = user_stats["channels_joined"][-1]["num_channels_joined"]
-    user_stats["channels_joined"].append(
-        {"num_channels_joined": channels_joined_prev - 1, "time_stamp": timestamp}
-    )
+    with data_store.locked(("channel", channel_id), ("user", payload["u_id"])):
+        # Check input err
+        channel = data_store.get_channel(channel_id)
+        if not channel:
+            raise InputError("channel_id not valid")
+        # Check access err and if all good, remove
+        if not data_store.is_member(channel, payload["u_id"]):
+            raise AccessError("user not member in channel")
+        channel["all_members"].remove(payload["u_id"])
+        try:
+            channel["owner_members"].remove(payload["u_id"])
+        except ValueError:
+            pass
+
+        # updating the user stats for the owner
+        timestamp = math.floor(time.time())
+        found_user = data_store.get_user(payload["u_id"])
+        user_stats = found_user["user_stats"]
+        channels_joined_prev = user_stats["channels_joined"][-1]["num_channels_joined"]
+        user_stats["channels_joined"].append(
+            {"num_channels_joined": channels_joined_prev - 1, "time_stamp": timestamp}
+        )
 
     return {}
 
@@ -26,15 +26,12 @@ def channels_list_v1(auth_user_id):
     Return Value:
         Returns {"channels": [{"channel_id": channel_id, "name": channel_name}]}
     """
-    store = data_store.get()
-    # iterate through channels if auth_user_id is a member of the channel add
-    # channel to the return value
+    # only the channels auth_user_id is a member of are looked at
     channels = []
-    for channel in store["channels"]:
-        chan_info = {"channel_id": channel["channel_id"], "name": channel["name"]}
-        for members in channel["all_members"]:
-            if members == auth_user_id:
-                channels.append(chan_info)
+    for kind, channel_id in data_store.get_user_groups(auth_user_id):
+        if kind == "channels":
+            channel = data_store.get_channel(channel_id)
+            channels.append({"channel_id": channel["channel_id"], "name": channel["name"]})
 
     return {"channels": channels}
 
@@ -92,9 +89,7 @@ def channels_create_v2(token, name, is_public):
         raise InputError(description="invalid Name")
 
     # sets channel_id as the next highest number in the channel list
-    store["max_ids"]["channel"] += 1
-    data_store.set(store)
-    channel_id = store["max_ids"]["channel"]
+    channel_id = data_store.next_id("channel")
 
     channels.append(
         {
@@ -113,8 +108,6 @@ def channels_create_v2(token, name, is_public):
     # Updating the user stats for the owner
     incremement_user_channels(auth_user_id)
 
-    # update data store with changes
-    data_store.set(store)
     return {
         "channel_id": channel_id,
     }
@@ -164,25 +157,24 @@ def increment_workspace_channels():
 
     # Creating a timestamp and incrementing the workspace stats
     timestamp = math.floor(time.time())
-    num_channels = workspace["channels_exist"][-1]["num_channels_exist"]
-    workspace["channels_exist"].append(
-        {"num_channels_exist": num_channels + 1, "time_stamp": timestamp}
-    )
+    with data_store.locked(("workspace",)):
+        num_channels = workspace["channels_exist"][-1]["num_channels_exist"]
+        workspace["channels_exist"].append(
+            {"num_channels_exist": num_channels + 1, "time_stamp": timestamp}
+        )
 
 
 def incremement_user_channels(auth_user_id):
-    # Fetching the data store
-    users = data_store.get()["users"]
-
     # Finding the given user in the data store
-    found_user = [user for user in users if user["u_id"] == auth_user_id][0]
+    found_user = data_store.get_user(auth_user_id)
     user_stats = found_user["user_stats"]
 
     # Creating a timestamp and saving the user stats
     timestamp = math.floor(time.time())
 
     # Incrementing channels_joined stat
-    channels_joined_prev = user_stats["channels_joined"][-1]["num_channels_joined"]
-    user_stats["channels_joined"].append(
-        {"num_channels_joined": channels_joined_prev + 1, "time_stamp": timestamp}
-    )
+    with data_store.locked(("user", auth_user_id)):
+        channels_joined_prev = user_stats["channels_joined"][-1]["num_channels_joined"]
+        user_stats["channels_joined"].append(
+            {"num_channels_joined": channels_joined_prev + 1, "time_stamp": timestamp}
+        )
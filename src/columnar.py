@@ -0,0 +1,335 @@
+"""Compact columnar binary encoding for snapshots of the Streams datastore.
+
+The datastore is made of long lists of records which all have the same
+fields, so instead of repeating every field name for every record the way
+json does, a list of records is stored as one column of values per field
+with each field name written once. Columns are then stored in the most
+compact way their values allow:
+
+    - integers as a packed array of the smallest size which fits them all
+    - strings as one utf-8 blob of the distinct strings, so repeated values
+      such as names are only written once, plus an array of which one each
+      value is
+    - lists as an array of their lengths plus a single column of every item
+      in every list, e.g. the u_ids of every react of every message
+    - records as a column per field, grouped by the fields they have
+    - anything else, or a mix of kinds, split into one column per kind
+
+Encoding and decoding work a column at a time using array and bytes
+operations rather than value by value, which is what makes loading faster
+than parsing json.
+
+    Typical usage example:
+
+    data = encode({"seq": 4, "store": store})
+    snapshot = decode(data)
+
+    python3 -m src.columnar to-columnar datastore.json datastore.columns
+    python3 -m src.columnar to-json datastore.columns datastore.json
+"""
+import argparse
+import gc
+import json
+from array import array
+from itertools import accumulate, repeat
+from operator import itemgetter
+
+MAGIC = b"STRMCOL1"
+
+# Kinds of column, each followed in the encoding by its own layout
+NONES = 0
+BOOLS = 1
+INTS = 2
+FLOATS = 3
+STRS = 4
+LISTS = 5
+RECORDS = 6
+MIXED = 7
+BIG_INTS = 8
+
+# Array typecodes from smallest to largest and the range of ints each holds
+INT_TYPECODES = [
+    (code, -(2 ** (8 * array(code).itemsize - 1)), 2 ** (8 * array(code).itemsize - 1))
+    for code in ("b", "h", "i", "q")
+]
+# Order kinds of value are split into when a column mixes them
+VALUE_KINDS = (type(None), bool, int, float, str, list, dict)
+
+
+class Writer:
+    """Builds up an encoding in a bytearray."""
+
+    def __init__(self):
+        self.data = bytearray()
+
+    def number(self, value):
+        """Write a non negative int as a varint."""
+        while value >= 0x80:
+            self.data.append(value & 0x7F | 0x80)
+            value >>= 7
+        self.data.append(value)
+
+    def blob(self, data):
+        """Write bytes prefixed with their length."""
+        self.number(len(data))
+        self.data += data
+
+    def ints(self, values):
+        """Write a list of ints as the smallest array which holds them."""
+        low, high = (min(values), max(values)) if values else (0, 0)
+        code = next(code for code, start, stop in INT_TYPECODES if start <= low and high < stop)
+        self.data.append(ord(code))
+        self.blob(array(code, values).tobytes())
+
+    def strs(self, values):
+        """Write a list of strings as one blob of lengths and characters."""
+        self.ints([len(value) for value in values])
+        self.blob("".join(values).encode("utf-8", "surrogatepass"))
+
+
+class Reader:
+    """Reads an encoding written by a Writer back from bytes."""
+
+    def __init__(self, data, position=0):
+        self.data = memoryview(data)
+        self.position = position
+
+    def number(self):
+        value = shift = 0
+        while True:
+            byte = self.data[self.position]
+            self.position += 1
+            value |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                return value
+            shift += 7
+
+    def blob(self):
+        size = self.number()
+        self.position += size
+        return self.data[self.position - size : self.position]
+
+    def ints(self):
+        code = chr(self.data[self.position])
+        self.position += 1
+        values = array(code)
+        values.frombytes(self.blob())
+        return values.tolist()
+
+    def strs(self):
+        offsets = [0, *accumulate(self.ints())]
+        text = str(self.blob(), "utf-8", "surrogatepass")
+        return [text[start:stop] for start, stop in zip(offsets, offsets[1:])]
+
+
+def kind_of(value_type):
+    """Get which of VALUE_KINDS values of a type are."""
+    for kind, kind_type in enumerate(VALUE_KINDS):
+        if issubclass(value_type, kind_type):
+            # bool is a subclass of int so is checked first
+            return kind
+    raise TypeError(f"cannot encode {value_type.__name__}")
+
+
+def encode_column(writer, values):
+    """Write a list of values as a column."""
+    # kinds are worked out once per type rather than once per value
+    types = {value_type: kind_of(value_type) for value_type in set(map(type, values))}
+    kinds = set(types.values())
+    if len(kinds) > 1:
+        kinds = list(map(types.__getitem__, map(type, values)))
+        writer.number(MIXED)
+        writer.ints(kinds)
+        present = sorted(set(kinds))
+        writer.number(len(present))
+        for kind in present:
+            writer.number(kind)
+            encode_column(writer, [value for value, of in zip(values, kinds) if of == kind])
+        return
+    kind = kinds.pop() if kinds else 0
+    value_type = VALUE_KINDS[kind]
+    if value_type is type(None):
+        writer.number(NONES)
+        writer.number(len(values))
+    elif value_type is bool:
+        writer.number(BOOLS)
+        writer.blob(bytes(values))
+    elif value_type is int:
+        low, high = min(values), max(values)
+        if INT_TYPECODES[-1][1] <= low and high < INT_TYPECODES[-1][2]:
+            writer.number(INTS)
+            writer.ints(values)
+        else:
+            writer.number(BIG_INTS)
+            writer.strs([str(value) for value in values])
+    elif value_type is float:
+        writer.number(FLOATS)
+        writer.blob(array("d", values).tobytes())
+    elif value_type is str:
+        encode_strs(writer, values)
+    elif value_type is list:
+        writer.number(LISTS)
+        writer.ints([len(value) for value in values])
+        encode_column(writer, [item for value in values for item in value])
+    else:
+        encode_records(writer, values)
+
+
+def encode_strs(writer, values):
+    distinct = {}
+    which = [distinct.setdefault(value, len(distinct)) for value in values]
+    writer.number(STRS)
+    writer.strs(list(distinct))
+    # when every string is different the order is implied and not written
+    if len(distinct) == len(values):
+        writer.number(0)
+    else:
+        writer.number(1)
+        writer.ints(which)
+
+
+def encode_records(writer, values):
+    shapes = {}
+    which = [shapes.setdefault(shape, len(shapes)) for shape in map(tuple, values)]
+    writer.number(RECORDS)
+    writer.number(len(shapes))
+    if len(shapes) > 1:
+        writer.ints(which)
+    for shape, index in shapes.items():
+        rows = values if len(shapes) == 1 else [
+            value for value, of in zip(values, which) if of == index
+        ]
+        writer.number(len(rows))
+        writer.strs(list(shape))
+        for field in shape:
+            encode_column(writer, list(map(itemgetter(field), rows)))
+
+
+def decode_column(reader):
+    """Read a column written by encode_column back as a list of values."""
+    kind = reader.number()
+    if kind == NONES:
+        return [None] * reader.number()
+    if kind == BOOLS:
+        return list(map(bool, reader.blob()))
+    if kind == INTS:
+        return reader.ints()
+    if kind == BIG_INTS:
+        return list(map(int, reader.strs()))
+    if kind == FLOATS:
+        values = array("d")
+        values.frombytes(reader.blob())
+        return values.tolist()
+    if kind == STRS:
+        distinct = reader.strs()
+        if not reader.number():
+            return distinct
+        return [distinct[index] for index in reader.ints()]
+    if kind == LISTS:
+        offsets = [0, *accumulate(reader.ints())]
+        items = decode_column(reader)
+        return [items[start:stop] for start, stop in zip(offsets, offsets[1:])]
+    if kind == RECORDS:
+        count = reader.number()
+        which = reader.ints() if count > 1 else None
+        groups = {}
+        for index in range(count):
+            size = reader.number()
+            shape = reader.strs()
+            columns = [decode_column(reader) for _ in shape]
+            if columns:
+                rows = list(map(dict, map(zip, repeat(shape), zip(*columns))))
+            else:
+                rows = [{} for _ in range(size)]
+            groups[index] = rows
+        if which is None:
+            return groups.get(0, [])
+        return merge(groups, which)
+    if kind == MIXED:
+        kinds = reader.ints()
+        groups = {}
+        for _ in range(reader.number()):
+            kind = reader.number()
+            groups[kind] = decode_column(reader)
+        return merge(groups, kinds)
+    raise ValueError(f"unknown column kind {kind}")
+
+
+def merge(groups, which):
+    """Put values which were split into groups back in their original order.
+
+    Arguments:
+        groups (dict) - list of values in each group
+        which (list) - group each value in turn came from
+    """
+    iterators = {index: iter(group) for index, group in groups.items()}
+    return [next(iterators[index]) for index in which]
+
+
+def encode(value):
+    """Encode a json compatible value.
+
+    Arguments:
+        value (any) - dicts, lists, strings, numbers, booleans and None
+
+    Exceptions:
+        TypeError - Occurs when:
+            - value contains anything else
+
+    Return Value:
+        Returns the encoding as bytes
+    """
+    writer = Writer()
+    writer.data += MAGIC
+    encode_column(writer, [value])
+    return bytes(writer.data)
+
+
+def decode(data):
+    """Decode a value encoded by encode.
+
+    Exceptions:
+        ValueError - Occurs when:
+            - data is not a columnar encoding
+
+    Return Value:
+        Returns the value
+    """
+    if not is_columnar(data):
+        raise ValueError("not a columnar encoding")
+    # nothing decoded can form a cycle, so collecting while millions of
+    # containers are created would only waste time
+    collecting = gc.isenabled()
+    gc.disable()
+    try:
+        return decode_column(Reader(data, len(MAGIC)))[0]
+    finally:
+        if collecting:
+            gc.enable()
+
+
+def is_columnar(data):
+    """Check whether the start of some bytes is a columnar encoding."""
+    return bytes(data[: len(MAGIC)]) == MAGIC
+
+
+def convert(source, destination, to_columnar):
+    """Convert a snapshot file between json and the columnar encoding."""
+    with open(source, "rb") as file:
+        data = file.read()
+    value = decode(data) if is_columnar(data) else json.loads(data)
+    with open(destination, "wb") as file:
+        file.write(encode(value) if to_columnar else json.dumps(value).encode())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("direction", choices=("to-columnar", "to-json"))
+    parser.add_argument("source")
+    parser.add_argument("destination")
+    args = parser.parse_args()
+    convert(args.source, args.destination, args.direction == "to-columnar")
+
+
+if __name__ == "__main__":
+    main()
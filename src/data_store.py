@@ -1,7 +1,11 @@
 """Responsible for storing all the data in the Streams databse.
 
 This contains a definition for the Datastore class which stores all the data
-for the Streams database. This database can be accessed using the data_store
+for the Streams database. Every change made to the data is passed to a
+backend as it happens. By default it is written to an append only journal
+(see src/journal.py) which is periodically compacted into a snapshot in
+DATA_STORE_FILE, or with STREAMS_BACKEND=sqlite it is kept in an SQLite
+database (see src/sqlite_backend.py). This database can be accessed using the data_store
 variable which is an instance of the Datastore class. It follows the following
 data structure:
 {
@@ -73,55 +77,328 @@ data structure:
     users.append(rob)
     data_store.set(users)
 
+    # records can also be found by id without scanning the lists
+    rob = data_store.get_user(23)
+    rob = data_store.get_user_by_handle("robscallon")
+
 """
 import time
 import math
 import os
 import urllib.request
+from contextlib import ExitStack, contextmanager
 from copy import deepcopy
-from json import dump, load
+from functools import partial
+from json import dumps, loads
 from pathlib import Path
-from threading import Event, Thread
-
-
-timestamp = math.floor(time.time())
-
-
-INITIAL_OBJECT = {
-    "users": [],
-    "channels": [],
-    "global_owners": [],
-    "removed_users": [],
-    "dms": [],
-    "standups": [],
-    "workspace_stats": {
-        "channels_exist": [{"num_channels_exist": 0, "time_stamp": timestamp}],
-        "dms_exist": [{"num_dms_exist": 0, "time_stamp": timestamp}],
-        "messages_exist": [{"num_messages_exist": 0, "time_stamp": timestamp}],
-    },
-    "max_ids": {"dm": -1, "message": -1, "channel": -1, "user": -1, "reset_id": -1},
-    "all_notifications": [],
-}
+from threading import Event, Lock, RLock, Thread
+
+from src import columnar
+from src.backend import INITIAL_OBJECT, Backend, write_atomically
+from src.handles import Handles
+from src.ids import ID_BLOCK, IdAllocator
+from src.journal import Journal
+from src.memberships import MEMBER_FIELDS, ID_KEYS, Memberships
+from src.message_index import MessageIndex
+from src.records import apply_change, build_store, changes_lock, end_capture, start_capture
+from src.sessions import Sessions
+from src.versions import Versions
+
 DATA_STORE_FILE = "datastore.json"
+COLUMNAR_FILE = "datastore.columns"
+# Format snapshots are written in, "json" for DATA_STORE_FILE or "columnar"
+# for COLUMNAR_FILE (see src/columnar.py). Either is read back at startup.
+SNAPSHOT_FORMAT = os.environ.get("STREAMS_SNAPSHOT_FORMAT", "json")
+JOURNAL_FILE = "datastore.journal"
+DATABASE_FILE = "datastore.db"
+# Where the datastore is kept, "json" for DATA_STORE_FILE and JOURNAL_FILE or
+# "sqlite" for DATABASE_FILE
+STORAGE_BACKEND = os.environ.get("STREAMS_BACKEND", "json")
+# Whether several server processes share DATABASE_FILE, see src/workers.py
+SHARED_STATE = os.environ.get("STREAMS_SHARED") == "1"
 WRITE_INTERVAL = 30
+# A snapshot is taken once the journal has grown past JOURNAL_COMPACT_SIZE
+# bytes, or SNAPSHOT_INTERVAL seconds after the last one if anything changed
+JOURNAL_COMPACT_SIZE = 4 * 1024 * 1024
+SNAPSHOT_INTERVAL = 300
 DEFAULT_IMG = "https://i.postimg.cc/8znq7rC2/default-profile-pic-150x150.jpg"
 IMAGE_FOLDER = "imgfolder"
 
 
-class Datastore:
-    """Datastore class used to store data for Streams."""
+# Kinds of entity which can be locked with Datastore.locked, in the order
+# their locks must be taken
+LOCK_ORDER = (
+    "global_owners",
+    "channel",
+    "dm",
+    "user",
+    "emails",
+    "handles",
+    "workspace",
+    "notifications",
+)
+def load_snapshot():
+    """Read the latest snapshot of the store from DATA_STORE_FILE or
+    COLUMNAR_FILE, whichever was written last.
+
+    Return Value:
+        Returns the snapshot as a dictionary holding
+            seq (int) - sequence number of the last journaled change it includes
+            store (dict) - plain store
+        and anything else the backend saved alongside them
+    """
+    empty = {"seq": 0, "store": deepcopy(INITIAL_OBJECT)}
+    paths = [path for path in (DATA_STORE_FILE, COLUMNAR_FILE) if Path(path).is_file()]
+    if not paths:
+        return empty
+    try:
+        with open(max(paths, key=os.path.getmtime), "rb") as file:
+            data = file.read()
+        data = columnar.decode(data) if columnar.is_columnar(data) else loads(data)
+    except (OSError, ValueError):
+        return empty
+    if "seq" in data and "store" in data:
+        return data
+    # snapshots written before the journal existed are just the store
+    return {"seq": 0, "store": data}
+
+
+def encode_snapshot(snapshot, snapshot_format=SNAPSHOT_FORMAT):
+    """Encode a snapshot in a format.
+
+    Arguments:
+        snapshot (dict) - {"seq": seq, "store": store}
+        snapshot_format (str) - "json" or "columnar"
+
+    Return Value:
+        Returns (path, data) where path is the file the format is kept in
+    """
+    if snapshot_format == "columnar":
+        return COLUMNAR_FILE, columnar.encode(snapshot)
+    return DATA_STORE_FILE, dumps(snapshot).encode()
+
+
+class JsonBackend(Backend):
+    """Keeps the store in memory, journaled to JOURNAL_FILE and snapshotted to
+    DATA_STORE_FILE, or COLUMNAR_FILE depending on SNAPSHOT_FORMAT.
+
+    The messages of each channel and dm are snapshotted to segment files of
+    their own instead and only read into memory when they are needed, see
+    src/segments.py. The journal is replayed on top of the latest snapshot at
+    startup.
+    """
 
     def __init__(self):
-        if Path(DATA_STORE_FILE).is_file():
+        from src.segments import Segments
+
+        self.__segments = Segments()
+        self.history = self.__segments.history
+        self.__journal = Journal(JOURNAL_FILE)
+        self.__snapshot_lock = Lock()
+        self.__snapshot_seq = 0
+        self.__snapshot_time = time.time()
+        self.__metrics = {
+            "snapshots": 0,
+            "snapshot_seq": 0,
+            "snapshot_pause": 0.0,
+            "snapshot_duration": 0.0,
+            "snapshot_size": 0,
+        }
+
+    def load(self):
+        snapshot = load_snapshot()
+        self.__snapshot_seq = snapshot["seq"]
+        store = build_store(snapshot["store"], self.history)
+        self.__segments.start(store, snapshot.get("message_groups"))
+        store.observer = self.__replayed
+        for change in self.__journal.replay(self.__snapshot_seq):
+            replaced = apply_change(store, change)
+            if replaced is not store:
+                store = replaced
+                self.__segments.start(store)
+                store.observer = self.__replayed
+        store.observer = None
+        self.__journal.open()
+        return store
+
+    def __replayed(self, change, container, removed):
+        self.__segments.note(change, container, removed, self.__journal.seq)
+
+    def record(self, change, container=None, removed=()):
+        seq = self.__journal.record(change)
+        self.__segments.note(change, container, removed, seq)
+
+    def sync(self):
+        self.__journal.sync()
+
+    def replace(self, store):
+        store = super().replace(store)
+        self.__segments.start(store)
+        return store
+
+    def message_group(self, message_id):
+        return self.__segments.directory.find(message_id)
+
+    def scan_source(self, history):
+        return self.__segments.source(history)
+
+    def pinned(self, history):
+        return self.__segments.pinned(history)
+
+    def snapshot(self, store):
+        """Write the whole store to a snapshot and compact the journal.
+
+        Changes are only held up while a capture of the store is started,
+        see Capture in src/records.py. The capture is then copied and serialised while
+        requests carry on, written to a temporary file and fsync'd, and
+        finally renamed over the old snapshot, so a crash at any point leaves
+        either the old snapshot or the new one. Messages of channels and dms
+        which changed since their segment was last written get new segment
+        files along the way. Journal segments and message segments the new
+        snapshot no longer needs are deleted afterwards.
+        """
+        with self.__snapshot_lock:
+            started = time.perf_counter()
+            with changes_lock:
+                seq = self.__journal.seq
+                capture = start_capture(seq)
+                directory = self.__segments.directory.copy()
+            pause = time.perf_counter() - started
             try:
-                self.__store = load(open(DATA_STORE_FILE))
-            except:
-                self.__store = deepcopy(INITIAL_OBJECT)
-        else:
-            self.__store = deepcopy(INITIAL_OBJECT)
-
-        if not Path(IMAGE_FOLDER).is_dir():
-            os.mkdir(IMAGE_FOLDER)
+                try:
+                    self.__journal.rotate()
+                    snapshot = {
+                        "seq": seq,
+                        "store": capture.copy(store),
+                        "message_groups": directory.plain(),
+                    }
+                finally:
+                    end_capture()
+                path, data = encode_snapshot(snapshot)
+                write_atomically(path, data)
+            except BaseException:
+                # segments written for a snapshot which was never saved
+                self.__segments.abort()
+                raise
+            self.__segments.commit()
+            # the other format's file would otherwise hold an older snapshot
+            for stale in {DATA_STORE_FILE, COLUMNAR_FILE} - {path}:
+                if Path(stale).is_file():
+                    os.remove(stale)
+            self.__journal.drop(seq)
+            self.__snapshot_seq = seq
+            self.__snapshot_time = time.time()
+            self.__metrics.update(
+                snapshots=self.__metrics["snapshots"] + 1,
+                snapshot_seq=seq,
+                snapshot_pause=pause,
+                snapshot_duration=time.perf_counter() - started,
+                snapshot_size=len(data),
+            )
+
+    def metrics(self):
+        return dict(
+            self.__metrics, journal_size=self.__journal.size, **self.__segments.metrics()
+        )
+
+    def compact(self, store):
+        """Take a snapshot if the journal has grown enough to need one, or if
+        messages kept in memory could be dropped once their segments have
+        been written, then drop the least recently used ones."""
+        changed = self.__journal.seq > self.__snapshot_seq
+        due = time.time() - self.__snapshot_time >= SNAPSHOT_INTERVAL
+        if (
+            self.__journal.size >= JOURNAL_COMPACT_SIZE
+            or (changed and due)
+            or self.__segments.needs_snapshot()
+        ):
+            self.snapshot(store)
+        self.__segments.evict()
+
+
+def open_backend(name=STORAGE_BACKEND, shared=SHARED_STATE):
+    """Create the backend called name, either "json" or "sqlite".
+
+    Exceptions:
+        ValueError - Occurs when:
+            - shared is True for a backend other processes cannot share
+    """
+    if name == "sqlite":
+        from src.sqlite_backend import SqliteBackend
+
+        return SqliteBackend(DATABASE_FILE, shared=shared)
+    if shared:
+        raise ValueError("only the sqlite backend can be shared between processes")
+    return JsonBackend()
+
+
+class EntityLocks:
+    """Lock for each user, channel, dm or other entity of the store.
+
+    An entity is named by a tuple starting with its kind from LOCK_ORDER,
+    e.g. ("channel", channel_id). Locks are created the first time they are
+    needed and are reentrant.
+    """
+
+    def __init__(self):
+        self.__guard = Lock()
+        self.__locks = {}
+
+    def get(self, entity):
+        """Get the lock of an entity."""
+        # ids come straight from requests and may not be hashable
+        key = repr(entity)
+        with self.__guard:
+            lock = self.__locks.get(key)
+            if lock is None:
+                lock = self.__locks[key] = RLock()
+            return lock
+
+    def hold(self, *entities):
+        """Acquire the locks of entities in LOCK_ORDER.
+
+        Return Value:
+            Returns a context manager which releases them on exit
+        """
+
+        def order(entity):
+            kind = entity[0]
+            rank = LOCK_ORDER.index(kind) if kind in LOCK_ORDER else len(LOCK_ORDER)
+            return rank, repr(entity)
+
+        stack = ExitStack()
+        with stack:
+            for entity in sorted(set(map(tuple, entities)), key=order):
+                stack.enter_context(self.get(entity))
+            return stack.pop_all()
+
+
+class Datastore:
+    """Datastore class used to store data for Streams.
+
+    Where the data is kept between restarts is up to the backend chosen by
+    STORAGE_BACKEND, see JsonBackend and src/sqlite_backend.py. Besides the
+    dictionary of lists returned by get, the datastore keeps indexes over
+    users, channels, dms and messages so they can be found by id without
+    scanning every list.
+    """
+
+    def __init__(self, backend=None):
+        self.__locks = EntityLocks()
+        self.__synchronising = RLock()
+        self.__backend = backend or open_backend()
+        # changes to a shared backend are already made one at a time across
+        # processes, leasing blocks of ids would only make them out of order
+        self.__ids = IdAllocator(self.__lease_ids, 1 if self.__backend.shared else ID_BLOCK)
+        self.__index = MessageIndex(self.get_message)
+        self.__memberships = Memberships(lambda: self.__store, changes_lock)
+        self.__versions = Versions(changes_lock)
+        self.__sessions = Sessions(changes_lock)
+        self.__handles = Handles(changes_lock)
+        self.__store = self.__backend.load()
+        self.__store.observer = self.__record
+
+        os.makedirs(IMAGE_FOLDER, exist_ok=True)
         if "DEFAULT_IMG.jpg" not in os.listdir(IMAGE_FOLDER):
             urllib.request.urlretrieve(DEFAULT_IMG, IMAGE_FOLDER + "/DEFAULT_IMG.jpg")
 
@@ -135,6 +412,10 @@ class Datastore:
     def set(self, store):
         """Get the dictionary of the data base.
 
+        Changes made to the current store are already recorded so setting it
+        again does nothing. Setting a different dictionary replaces the whole
+        store.
+
         Arguments:
             store (dictionary) - new data base dictionary
 
@@ -143,7 +424,373 @@ class Datastore:
                 - store is not a dictionary"""
         if not isinstance(store, dict):
             raise TypeError("store must be of type dictionary")
-        self.__store = store
+        if store is self.__store:
+            return
+        with changes_lock:
+            self.__store.observer = None
+            self.__store = self.__backend.replace(store)
+            self.__store.observer = self.__record
+            self.__ids.reset()
+            self.__index.reset()
+            self.__memberships.reset()
+            self.__versions.reset()
+            self.__sessions.reset()
+            self.__handles.reset()
+
+    def __record(self, change, container, removed):
+        """Record a change with the backend and follow it in the indexes of
+        messages, members, sessions and handles and the versions of
+        messages."""
+        self.__backend.record(change, container, removed)
+        self.__index.note(change, removed)
+        self.__memberships.note(change)
+        self.__sessions.note(change, removed)
+        self.__handles.note(change, removed)
+        self.__versions.note(change, container, removed)
+
+    def snapshot(self):
+        """Make sure every change made so far has reached the disk."""
+        self.__backend.snapshot(self.__store)
+
+    def compact(self):
+        """Let the backend tidy up what it keeps on disk if it needs to."""
+        with self.synchronised(writes=True):
+            self.__backend.compact(self.__store)
+
+    @contextmanager
+    def synchronised(self, writes=False):
+        """Bring the store up to date with changes other server processes
+        sharing the backend have made, see src/workers.py.
+
+        Every request needs to do this before it uses the store, and those
+        which change it need to hold off the other processes until they are
+        done, so each change is made to the latest store. Within one process
+        requests which change the store take turns, others carry on alongside
+        them. With a backend no other process shares there is nothing to
+        catch up with or hold off.
+
+        Whatever the backend, requests which change the store wait at the
+        end until their changes have reached the disk, see Backend.sync, so
+        they are not answered before a crash could lose them.
+
+            with data_store.synchronised(writes=True):
+                ...
+
+        Arguments:
+            writes (bool) - whether the store is going to be changed
+        """
+        try:
+            if not self.__backend.shared:
+                yield
+                return
+            with ExitStack() as stack:
+                stack.enter_context(self.__synchronising)
+                if writes:
+                    stack.enter_context(self.__backend.lock())
+                changes = self.__backend.changes()
+                if changes:
+                    self.__apply(changes)
+                if not writes:
+                    stack.close()
+                yield
+        finally:
+            if writes:
+                self.__backend.sync()
+
+    def __apply(self, changes):
+        """Make changes made by other processes to the store without
+        recording them again."""
+        with changes_lock:
+            store = self.__store
+            for change, removed_ids in changes:
+                # the versions need the records a change removes and the
+                # index the text an edit replaces, which only the store knows
+                # as it makes it
+                store.observer = partial(self.__applied, removed_ids=removed_ids)
+                replaced = apply_change(store, change)
+                if replaced is not store:
+                    store = self.__store = replaced
+                    self.__ids.reset()
+                    self.__index.reset()
+                    self.__memberships.reset()
+                    self.__versions.reset()
+                    self.__sessions.reset()
+                    self.__handles.reset()
+                else:
+                    self.__memberships.note(change)
+                    self.__sessions.note(change)
+                    self.__handles.note(change)
+            store.observer = self.__record
+
+    def __applied(self, change, container, removed, removed_ids=None):
+        """Follow a change made by another process in the index of messages
+        and the versions of messages as the store makes it."""
+        self.__versions.note_applied(change, container, removed, removed_ids)
+        self.__index.note(change, removed)
+
+    def metrics(self):
+        """Get measurements of the work done by the backend.
+
+        Return Value:
+            Returns a dictionary which for the json backend holds
+                snapshots (int) - number of snapshots taken since startup
+                snapshot_seq (int) - last change included in the latest one
+                snapshot_pause (float) - seconds it held up changes for
+                snapshot_duration (float) - seconds it took altogether
+                snapshot_size (int) - bytes it wrote to its snapshot file
+                journal_size (int) - bytes journaled since it was taken
+                resident_messages (int) - messages currently in memory
+                segment_loads (int) - message segments read since startup
+                segment_evictions (int) - times messages were dropped"""
+        return self.__backend.metrics()
+
+    def next_id(self, kind):
+        """Allocate a new id, never handed out before, even to a concurrent
+        request.
+
+        Arguments:
+            kind (str) - "user", "channel", "dm", "message" or "reset_id"
+
+        Return Value:
+            Returns the id
+        """
+        return self.__ids.next_id(kind)
+
+    def __lease_ids(self, kind, size):
+        """Mark a block of ids as used in the store, see src/ids.py."""
+        with changes_lock:
+            max_ids = self.__store["max_ids"]
+            start = max_ids[kind] + 1
+            max_ids[kind] += size
+            return start
+
+    def locked(self, *entities):
+        """Hold the locks of some entities of the store while using them.
+
+        Each change to the store is atomic by itself, this is for requests
+        which check the store and then change it based on what they found.
+        A request holding some locks may only take more whose kind comes
+        later in LOCK_ORDER, which keeps requests from deadlocking. The
+        messages of locked channels and dms are kept in memory until the
+        locks are released, see Backend.pinned, so messages read while
+        holding them can be changed.
+
+            with data_store.locked(("channel", channel_id), ("user", u_id)):
+                ...
+
+        Arguments:
+            entities (tuple) - entities named by (kind, id), or just (kind,)
+                for those of which there is only one, e.g. ("workspace",)
+
+        Return Value:
+            Returns a context manager which holds the locks
+        """
+        stack = self.__locks.hold(*entities)
+        with stack:
+            for entity in entities:
+                group = None
+                if entity[0] == "channel":
+                    group = self.get_channel(entity[1])
+                elif entity[0] == "dm":
+                    group = self.get_dm(entity[1])
+                if group is not None:
+                    stack.enter_context(self.__backend.pinned(group["messages"]))
+            return stack.pop_all()
+
+    def get_user(self, u_id):
+        """Get a registered user from their id.
+
+        Arguments:
+            u_id (int) - id of the user
+
+        Return Value:
+            Returns the user dictionary or None if no user has that id
+        """
+        return self.__store["users"].find("u_id", u_id)
+
+    def get_removed_user(self, u_id):
+        """Get a user who has been removed from Streams from their id."""
+        return self.__store["removed_users"].find("u_id", u_id)
+
+    def get_user_by_email(self, email):
+        """Get a registered user from their email or None if there is none."""
+        return self.__store["users"].find("email", email)
+
+    def get_user_by_handle(self, handle_str):
+        """Get a registered user from their handle or None if there is none."""
+        return self.__store["users"].find("handle_str", handle_str)
+
+    def new_handle(self, base, reserved=()):
+        """Get a handle no user has, made from base, see src/handles.py.
+
+        Arguments:
+            base (str) - handle made from the user's name
+            reserved (set) - handles given to users not added yet
+
+        Return Value:
+            Returns base or base followed by the lowest number free
+        """
+        if reserved:
+            return self.__handles.allocate(
+                base, lambda handle: handle in reserved or self.get_user_by_handle(handle)
+            )
+        return self.__handles.allocate(base, self.get_user_by_handle)
+
+    def get_channel(self, channel_id):
+        """Get a channel from its id or None if there is none."""
+        return self.__store["channels"].find("channel_id", channel_id)
+
+    def get_dm(self, dm_id):
+        """Get a dm from its id or None if there is none."""
+        return self.__store["dms"].find("dm_id", dm_id)
+
+    def get_user_groups(self, u_id):
+        """Get the channels and dms a user is a member of.
+
+        Arguments:
+            u_id (int) - id of the user
+
+        Return Value:
+            Returns a list of (kind, group_id), the channels first and each in
+            the order they were created
+        """
+        return self.__memberships.groups_of(u_id)
+
+    def is_member(self, group, u_id, field=None):
+        """Check whether a user is a member of a channel or dm without
+        searching its list of members.
+
+        Arguments:
+            group (dictionary) - the channel or dm
+            u_id (int) - id of the user
+            field (str) - member field to look in, "owner_members" of a
+                channel, every member of the channel or dm if None
+
+        Return Value:
+            Returns True if they are, otherwise False
+        """
+        kind = "dms" if "dm_id" in group else "channels"
+        field = field or MEMBER_FIELDS[kind][0]
+        return self.__memberships.is_member((kind, group[ID_KEYS[kind]]), field, u_id)
+
+    def has_session(self, user, session_id):
+        """Check whether a user is logged in with a session without searching
+        their list of session_ids.
+
+        Arguments:
+            user (dictionary) - the user
+            session_id (int) - id of the session
+
+        Return Value:
+            Returns True if they are, otherwise False
+        """
+        return self.__sessions.has_session(user, session_id)
+
+    def next_session_id(self, user):
+        """Get the session_id for a user's next login without searching their
+        list of session_ids. Call with the user's lock held.
+
+        Arguments:
+            user (dictionary) - the user
+
+        Return Value:
+            Returns the session_id
+        """
+        return self.__sessions.next_session_id(user)
+
+    def get_message_changes(self, group, version):
+        """Get the messages of a channel or dm which changed after a version,
+        see src/versions.py.
+
+        Arguments:
+            group (dictionary) - the channel or dm
+            version (int) - version the caller last saw
+
+        Return Value:
+            Returns (latest, changed, removed), see Versions.since
+        """
+        kind = "dms" if "dm_id" in group else "channels"
+        return self.__versions.since((kind, group[ID_KEYS[kind]]), version)
+
+    def get_message(self, message_id):
+        """Get a message and the channel or dm it was sent in.
+
+        Arguments:
+            message_id (int) - id of the message
+
+        Return Value:
+            Returns (message, group) or None if no message has that id
+        """
+        index = self.__store.shared.get("messages", {}).get("message_id", {})
+        try:
+            message = index.get(message_id)
+        except TypeError:
+            return None
+        if message is None:
+            return self.__backend.find_message(self.__store, message_id)
+        return message, message.owner.owner
+
+    def get_messages(self, message_ids):
+        """Get several messages found by a search, see match_messages.
+
+        Arguments:
+            message_ids (list) - ids of the messages
+
+        Return Value:
+            Returns a list of (message, group) in the same order, leaving out
+            messages which have been removed since
+        """
+        found = []
+        for message_id in message_ids:
+            result = self.get_message(message_id)
+            if result is None:
+                self.__index.forget(message_id)
+            else:
+                found.append(result)
+        return found
+
+    def match_messages(self, literals, groups, ordered=False):
+        """Find the messages in some channels and dms containing every one of
+        some strings, see src/message_index.py.
+
+        Arguments:
+            literals (list) - strings to find, e.g. just the query
+            groups (list) - (kind, group_id) of the channels and dms to search,
+                in the order their messages should be returned
+            ordered (bool) - whether to return the messages in the order of
+                groups, newest first within each, or in no particular order
+
+        Return Value:
+            Returns a list of (message_id, text, time_created), or None if the
+            index of messages is not ready yet or cannot narrow them down
+        """
+        return self.__index.find(literals, groups, self.__store, ordered)
+
+    def get_message_sources(self, groups):
+        """Get where a search can read the messages of some channels and dms
+        from, see src/search_pool.py.
+
+        Arguments:
+            groups (list) - (kind, group_id) of the channels and dms
+
+        Return Value:
+            Returns (sources, sizes), where sizes are the numbers of messages
+        """
+        sources, sizes = [], []
+        for kind, group_id in groups:
+            group = self.get_channel(group_id) if kind == "channels" else self.get_dm(group_id)
+            history = [] if group is None else group["messages"]
+            source = None if group is None else self.__backend.scan_source(history)
+            if source is None:
+                texts = [(message["message_id"], message["message"]) for message in history]
+                source = ("texts", texts)
+            sources.append(source)
+            sizes.append(len(history))
+        return sources, sizes
+
+    def get_notifications(self, u_id):
+        """Get the notifications entry of a user or None if there is none."""
+        return self.__store["all_notifications"].find("u_id", u_id)
 
 
 def clear_v1():
@@ -184,7 +831,7 @@ def every(interval):
 
 @every(WRITE_INTERVAL)
 def save_data_store():
-    dump(data_store.get(), open(DATA_STORE_FILE, "w"))
+    data_store.compact()
 
 
 data_store = Datastore()
@@ -3,6 +3,7 @@ import time
 from src.data_store import data_store
 from src.error import InputError, AccessError
 from src.auth import extract_token
+from src.message import message_view, messages_page, messages_since
 from src.notifications import add_added_to_a_channel_or_dm_to_notif
 
 OUTPUT_KEYS = ["name", "dm_id"]
@@ -31,7 +32,7 @@ def dm_create_v1(token, u_ids):
     token_data = extract_token(token)
     # check if users in list are valid
     for u_id in u_ids:
-        if not any([True for user in users if user["u_id"] == u_id]):
+        if not data_store.get_user(u_id):
             raise InputError(description="Not valid user to add to dm")
     # sort names to alphabetical order
     handle_list = sorted(
@@ -44,9 +45,7 @@ def dm_create_v1(token, u_ids):
     name = ", ".join(handle_list)
 
     # set new dm_id to 1 + max current id
-    store["max_ids"]["dm"] += 1
-    data_store.set(store)
-    dm_id = store["max_ids"]["dm"]
+    dm_id = data_store.next_id("dm")
 
     dms.append(
         {
@@ -66,7 +65,6 @@ def dm_create_v1(token, u_ids):
     # incrementing the workspace stats
     increment_workspace_dms()
 
-    data_store.set(store)
     for u_id in u_ids:
         add_added_to_a_channel_or_dm_to_notif(token_data["u_id"], u_id, -1, dm_id)
     return {"dm_id": dm_id}
@@ -82,16 +80,14 @@ def dm_list_v1(token):
     Return Value:
         Returns { dms } on success
     """
-    store = data_store.get()
-    dms = store["dms"]  # [{ dm_id, name },]
     token_data = extract_token(token)
 
-    # loop through dms and add to list if in
-    member_dms = [
-        {key: dm[key] for key in dm if key in OUTPUT_KEYS}
-        for dm in dms
-        if token_data["u_id"] in dm["members"]
-    ]
+    # only the dms the user is in are looked at
+    member_dms = []
+    for kind, dm_id in data_store.get_user_groups(token_data["u_id"]):
+        if kind == "dms":
+            dm = data_store.get_dm(dm_id)
+            member_dms.append({key: dm[key] for key in dm if key in OUTPUT_KEYS})
 
     return {"dms": member_dms}
 
@@ -115,30 +111,26 @@ def dm_remove_v1(token, dm_id):
     dms = store["dms"]  # [{ dm_id, name },]
     token_data = extract_token(token)
 
-    selected_dm = [dm for dm in dms if dm["dm_id"] == dm_id]
+    with data_store.locked(("dm", dm_id)):
+        selected_dm = data_store.get_dm(dm_id)
+        if not selected_dm:
+            raise InputError(description="Invalid dm_id")
 
-    if len(selected_dm) == 0:
-        raise InputError(description="Invalid dm_id")
-    selected_dm = selected_dm[0]
+        if not data_store.is_member(selected_dm, token_data["u_id"]):
+            raise AccessError(description="User not in DM")
 
-    if token_data["u_id"] not in selected_dm["members"]:
-        raise AccessError(description="User not in DM")
+        if token_data["u_id"] != selected_dm["owner"]:
+            raise AccessError(description="User is not DM owner")
 
-    if token_data["u_id"] != selected_dm["owner"]:
-        raise AccessError(description="User is not DM owner")
+        dms.remove(selected_dm)
 
-    store["dms"] = [dm for dm in dms if dm is not selected_dm]
+        # Decrementing user stats
+        members = selected_dm["members"]
+        for member in members:
+            decrement_user_dms(member)
 
-    # Decrementing user stats
-    found_dm = [dm for dm in dms if dm["dm_id"] == dm_id][0]
-    members = found_dm["members"]
-    for member in members:
-        decrement_user_dms(member)
-
-    # Decrement workspace stats
-    decrement_workspace_dms()
-
-    data_store.set(store)
+        # Decrement workspace stats
+        decrement_workspace_dms()
 
     return {}
 
@@ -160,23 +152,18 @@ def dm_details_v1(token, dm_id):
     Return Value:
         Returns { name, members } on success
     """
-    store = data_store.get()
-    users = store["users"]
-    dms = store["dms"]  # [{ dm_id, name },]
     token_data = extract_token(token)
 
-    selected_dm = [dm for dm in dms if dm["dm_id"] == dm_id]
-
-    if len(selected_dm) == 0:
+    selected_dm = data_store.get_dm(dm_id)
+    if not selected_dm:
         raise InputError(description="Invalid dm_id")
-    selected_dm = selected_dm[0]
 
-    if token_data["u_id"] not in selected_dm["members"]:
+    if not data_store.is_member(selected_dm, token_data["u_id"]):
         raise AccessError(description="User not in DM")
+    # users are stored in order of u_id so sorting keeps the same order
+    members = (data_store.get_user(u_id) for u_id in sorted(selected_dm["members"]))
     members_detail = [
-        {key: user[key] for key in user if key in USER_KEYS}
-        for user in users
-        if user["u_id"] in selected_dm["members"]
+        {key: user[key] for key in user if key in USER_KEYS} for user in members if user
     ]
 
     return {"name": selected_dm["name"], "members": members_detail}
@@ -200,26 +187,23 @@ def dm_leave_v1(token, dm_id):
     dms = store["dms"]  # [{ dm_id, name },]
     token_data = extract_token(token)
 
-    selected_dm = [dm for dm in dms if dm["dm_id"] == dm_id]
+    with data_store.locked(("dm", dm_id)):
+        selected_dm = data_store.get_dm(dm_id)
+        if not selected_dm:
+            raise InputError(description="Invalid dm_id")
 
-    if len(selected_dm) == 0:
-        raise InputError(description="Invalid dm_id")
-    selected_dm = selected_dm[0]
+        if not data_store.is_member(selected_dm, token_data["u_id"]):
+            raise AccessError(description="User not in DM")
+        selected_dm["members"].remove(token_data["u_id"])
 
-    if token_data["u_id"] not in selected_dm["members"]:
-        raise AccessError(description="User not in DM")
-    selected_dm["members"].remove(token_data["u_id"])
+        # Updating the user stats
+        decrement_user_dms(token_data["u_id"])
 
-    # Updating the user stats
-    decrement_user_dms(token_data["u_id"])
-
-    # if no members left in dm delete dm
-    if len(selected_dm["members"]) == 0:
-        store["dms"] = [dm for dm in dms if dm is not selected_dm]
-        # Updating workspace stats
-        decrement_workspace_dms()
-
-    data_store.set(store)
+        # if no members left in dm delete dm
+        if len(selected_dm["members"]) == 0:
+            dms.remove(selected_dm)
+            # Updating workspace stats
+            decrement_workspace_dms()
 
     return {}
 
@@ -243,30 +227,90 @@ def dm_messages_v1(token, dm_id, start):
     Return Value:
         Returns { messsages, start, end } on successful dm creation
     """
-    store = data_store.get()
-    dms = store["dms"]  # [{ dm_id, name },]
     token_data = extract_token(token)
 
-    selected_dm = [dm for dm in dms if dm["dm_id"] == dm_id]
-
-    if len(selected_dm) == 0:
+    selected_dm = data_store.get_dm(dm_id)
+    if not selected_dm:
         raise InputError(description="Invalid dm_id")
-    selected_dm = selected_dm[0]
 
-    if token_data["u_id"] not in selected_dm["members"]:
+    if not data_store.is_member(selected_dm, token_data["u_id"]):
         raise AccessError(description="User not in DM")
     messages = selected_dm["messages"]
 
     if start + 1 > len(messages) and start != 0:
         raise InputError(description="Start index larger than number of messages")
 
+    page = messages[start : start + 50]
     return {
-        "messages": messages[start : start + 50],
+        "messages": [message_view(message, token_data["u_id"]) for message in page],
         "start": start,
         "end": start + 50 if start + 50 < len(messages) else -1,
     }
 
 
+def dm_messages_v2(token, dm_id, before_id=None, after_id=None, limit=50):
+    """Given a DM with ID dm_id that the authorised user is a member of,
+    return up to limit messages next to a message, see messages_page.
+
+    Arguments:
+        token (str) - An encoded JWT token
+        dm_id (int) - the id a dm
+        before_id (int) - id of the message to get the messages sent before
+        after_id (int) - id of the message to get the messages sent after
+        limit (int) - most messages to return
+
+    Exceptions:
+        InputError - Occurs when:
+            - dm_id does not refer to a valid DM
+            - see messages_page
+        AccessError - Occurs when:
+            - dm_id is valid and the authorised user is not a member of the DM
+
+    Return Value:
+        Returns { messages, has_more }
+    """
+    token_data = extract_token(token)
+
+    selected_dm = data_store.get_dm(dm_id)
+    if not selected_dm:
+        raise InputError(description="Invalid dm_id")
+
+    if not data_store.is_member(selected_dm, token_data["u_id"]):
+        raise AccessError(description="User not in DM")
+
+    return messages_page(selected_dm, token_data["u_id"], before_id, after_id, limit)
+
+
+def dm_messages_sync_v1(token, dm_id, since=0):
+    """Given a DM with ID dm_id that the authorised user is a member of,
+    return the messages which changed after a version, see messages_since.
+
+    Arguments:
+        token (str) - An encoded JWT token
+        dm_id (int) - the id a dm
+        since (int) - version the user last saw
+
+    Exceptions:
+        InputError - Occurs when:
+            - dm_id does not refer to a valid DM
+        AccessError - Occurs when:
+            - dm_id is valid and the authorised user is not a member of the DM
+
+    Return Value:
+        Returns { version, messages, removed_ids, reset }
+    """
+    token_data = extract_token(token)
+
+    selected_dm = data_store.get_dm(dm_id)
+    if not selected_dm:
+        raise InputError(description="Invalid dm_id")
+
+    if not data_store.is_member(selected_dm, token_data["u_id"]):
+        raise AccessError(description="User not in DM")
+
+    return messages_since(selected_dm, token_data["u_id"], since)
+
+
 def increment_workspace_dms():
     # Fetching the data store
     store = data_store.get()
@@ -274,10 +318,11 @@ def increment_workspace_dms():
 
     # Creating a timestamp and incrementing the workspace stats
     timestamp = math.floor(time.time())
-    num_dms = workspace["dms_exist"][-1]["num_dms_exist"]
-    workspace["dms_exist"].append(
-        {"num_dms_exist": num_dms + 1, "time_stamp": timestamp}
-    )
+    with data_store.locked(("workspace",)):
+        num_dms = workspace["dms_exist"][-1]["num_dms_exist"]
+        workspace["dms_exist"].append(
+            {"num_dms_exist": num_dms + 1, "time_stamp": timestamp}
+        )
 
 
 def decrement_workspace_dms():
@@ -287,43 +332,40 @@ def decrement_workspace_dms():
 
     # Creating a timestamp and decrementing the workspace stats
     timestamp = math.floor(time.time())
-    num_dms = workspace["dms_exist"][-1]["num_dms_exist"]
-    workspace["dms_exist"].append(
-        {"num_dms_exist": num_dms - 1, "time_stamp": timestamp}
-    )
+    with data_store.locked(("workspace",)):
+        num_dms = workspace["dms_exist"][-1]["num_dms_exist"]
+        workspace["dms_exist"].append(
+            {"num_dms_exist": num_dms - 1, "time_stamp": timestamp}
+        )
 
 
 def increment_user_dms(u_id):
-    # Fetching the data store
-    users = data_store.get()["users"]
-
     # Creating a timestamp
     timestamp = math.floor(time.time())
 
     # Finding the required user to increment stats
-    found_user = [user for user in users if user["u_id"] == u_id][0]
+    found_user = data_store.get_user(u_id)
 
     # Increments the user stats
     user_stats = found_user["user_stats"]
-    dms_joined_prev = user_stats["dms_joined"][-1]["num_dms_joined"]
-    user_stats["dms_joined"].append(
-        {"num_dms_joined": dms_joined_prev + 1, "time_stamp": timestamp}
-    )
+    with data_store.locked(("user", u_id)):
+        dms_joined_prev = user_stats["dms_joined"][-1]["num_dms_joined"]
+        user_stats["dms_joined"].append(
+            {"num_dms_joined": dms_joined_prev + 1, "time_stamp": timestamp}
+        )
 
 
 def decrement_user_dms(u_id):
-    # Fetching the data store
-    users = data_store.get()["users"]
-
     # Creating a timestamp
     timestamp = math.floor(time.time())
 
     # Finding the required user to decrement stats
-    found_user = [user for user in users if user["u_id"] == u_id][0]
+    found_user = data_store.get_user(u_id)
 
     # Decrements the user stats
     user_stats = found_user["user_stats"]
-    dms_joined_prev = user_stats["dms_joined"][-1]["num_dms_joined"]
-    user_stats["dms_joined"].append(
-        {"num_dms_joined": dms_joined_prev - 1, "time_stamp": timestamp}
-    )
+    with data_store.locked(("user", u_id)):
+        dms_joined_prev = user_stats["dms_joined"][-1]["num_dms_joined"]
+        user_stats["dms_joined"].append(
+            {"num_dms_joined": dms_joined_prev - 1, "time_stamp": timestamp}
+        )
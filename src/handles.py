@@ -0,0 +1,112 @@
+"""Registry of the numbers handles made from the same name are given.
+
+A new user's handle is made from their name, and when another user already
+has it a number is added, the lowest not yet taken: johnsmith, johnsmith0,
+johnsmith1 and so on. Trying each number in turn means registering the
+thousandth John Smith looks up a thousand handles. This remembers for each
+handle made that way the lowest number which may still be free, every one
+below it being taken, so the next is found in about one look up.
+
+Like Memberships it follows the changes made to the store, see Datastore.
+Users registering only take numbers, so what it remembers stays true. Users
+changing their handle or being removed free the handle they had, and the
+number it ends in becomes the lowest which may be free for the handle in
+front of it again. Only changes made by another server process, which the
+freed handle is not known for, make it forget everything. Which
+handles are taken is always read from the index of users by handle, so two
+server processes sharing the store never give out the same handle.
+
+    Typical usage example:
+
+    handles = Handles(changes_lock)
+    handle = handles.allocate("johnsmith", lambda handle: handle in taken)
+"""
+
+
+class Handles:
+    """Lowest number which may be free for each handle, see the module
+    docstring."""
+
+    def __init__(self, lock):
+        """
+        Arguments:
+            lock (RLock) - lock held while the store is changed, which
+                changes are followed under
+        """
+        self.__lock = lock
+        # handle to the lowest number which may be free after it
+        self.__next = {}
+
+    def note(self, change, removed=None):
+        """Follow a change made to the store.
+
+        Arguments:
+            change (list) - change as it was reported by the store, after it
+                was made
+            removed (any) - what the change took out of the store, None if
+                not known, e.g. for changes made by another process
+        """
+        operation, path, *args = change
+        with self.__lock:
+            if operation == "reset" or not path:
+                if operation == "reset" or args[0] == "users":
+                    self.reset()
+                return
+            if path[0] != "users":
+                return
+            if len(path) == 1:
+                if operation == "splice" and args[1] > args[0]:
+                    # a user was removed or replaced
+                    if removed is None:
+                        self.reset()
+                        return
+                    for user in removed:
+                        self.__free(user.get("handle_str"))
+            elif len(path) == 2 and args[0] == "handle_str":
+                if removed is None:
+                    self.reset()
+                    return
+                self.__free(removed)
+
+    def reset(self):
+        """Forget every number, to be learnt again when next used."""
+        with self.__lock:
+            self.__next = {}
+
+    def allocate(self, base, taken):
+        """Get the first free handle made from base, base itself or base
+        followed by the lowest number not taken.
+
+        The handle is not taken until a user has it, so the caller needs to
+        hold the lock of handles until then, see Datastore.locked.
+
+        Arguments:
+            base (str) - handle made from the user's name, numbers alone if
+                empty
+            taken (function) - returns whether a handle is taken
+
+        Return Value:
+            Returns the handle
+        """
+        if base and not taken(base):
+            return base
+        with self.__lock:
+            number = self.__next.get(base, 0)
+            while taken(f"{base}{number}"):
+                number += 1
+            # not past it, the handle may not end up taken
+            self.__next[base] = number
+        return f"{base}{number}"
+
+    def __free(self, handle):
+        """Go back to the number a handle no user has any more ends in, for
+        every handle it may have been made from."""
+        if not isinstance(handle, str):
+            return
+        split = len(handle)
+        while split > 0 and handle[split - 1].isdigit():
+            split -= 1
+            base, digits = handle[:split], handle[split:]
+            # numbers are added without leading zeros
+            if base in self.__next and digits == str(int(digits)):
+                self.__next[base] = min(self.__next[base], int(digits))
@@ -0,0 +1,74 @@
+"""Hands out new ids for users, channels, dms, messages and reset codes.
+
+The highest id of each kind handed out is kept in the store under "max_ids",
+so it is journaled and snapshotted with everything else and ids are never
+reused after a restart. Rather than changing it for every id, ids are leased
+from the store in blocks of ID_BLOCK and handed out from the current block by
+an itertools.count, which needs no lock as next() on a count is atomic. Only
+taking a new block locks anything. Ids left over in a block when the server
+stops are simply never used.
+
+    Typical usage example:
+
+    ids = IdAllocator(lease)
+    message_id = ids.next_id("message")
+"""
+import os
+from itertools import count
+from threading import Lock
+
+# Number of ids of a kind leased from the store at a time
+ID_BLOCK = int(os.environ.get("STREAMS_ID_BLOCK", 64))
+
+
+class IdAllocator:
+    """Ids of each kind handed out from blocks leased from the store."""
+
+    def __init__(self, lease, block=ID_BLOCK):
+        """
+        Arguments:
+            lease (function) - called with a kind and a number of ids, marks
+                that many ids of the kind as used and returns the first one
+            block (int) - number of ids to lease at a time
+        """
+        self.__lease = lease
+        self.__block = block
+        self.__lock = Lock()
+        # (count of ids, first id after the block) for each kind
+        self.__blocks = {}
+
+    def next_id(self, kind):
+        """Get a new id which has never been handed out before.
+
+        Arguments:
+            kind (str) - "user", "channel", "dm", "message" or "reset_id"
+
+        Return Value:
+            Returns the id
+        """
+        new_id = self.__take(kind)
+        if new_id is not None:
+            return new_id
+        with self.__lock:
+            # another request may have leased a block while this one waited
+            new_id = self.__take(kind)
+            if new_id is not None:
+                return new_id
+            start = self.__lease(kind, self.__block)
+            ids = count(start)
+            self.__blocks[kind] = (ids, start + self.__block)
+            return next(ids)
+
+    def reset(self):
+        """Forget the leased blocks, for when the store is replaced."""
+        with self.__lock:
+            self.__blocks = {}
+
+    def __take(self, kind):
+        """Get the next id of the current block or None if it is used up."""
+        block = self.__blocks.get(kind)
+        if block is None:
+            return None
+        ids, stop = block
+        new_id = next(ids)
+        return new_id if new_id < stop else None
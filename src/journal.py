@@ -0,0 +1,203 @@
+"""Append only journal of the changes made to the Streams datastore.
+
+Every change to the datastore is written to the journal as one line holding
+a sequence number and the change encoded as json. Lines are buffered and
+written to disk together, then fsync'd. A request waits with sync until the
+changes it made are on disk before it is answered, so a crash never loses a
+change which was acknowledged. Requests waiting at the same time share one
+write and fsync, the first of them writing every line buffered so far, and
+the rest find their changes already on disk. Changes nobody waits for are
+written every FLUSH_INTERVAL seconds.
+
+When a snapshot of the whole datastore is taken the current journal file is
+rotated into a segment named after the last sequence number it contains.
+Segments which are covered by a snapshot that has safely reached the disk
+are then deleted, so the journal only ever holds the changes made since the
+latest snapshot.
+
+    Typical usage example:
+
+    journal = Journal("datastore.journal")
+    for change in journal.replay(snapshot_seq):
+        apply_change(store, change)
+    journal.open()
+    journal.record(["set", ["max_ids"], "message", 4])
+    journal.sync()
+"""
+import atexit
+import json
+import os
+from glob import glob
+from threading import Event, Lock, Thread, local
+
+FLUSH_INTERVAL = 0.05
+
+
+class Journal:
+    """Journal of datastore changes kept in a file on disk."""
+
+    def __init__(self, path, flush_interval=FLUSH_INTERVAL):
+        self.path = path
+        self.seq = 0
+        # sequence number of the last change known to be on disk
+        self.durable = 0
+        self.size = 0
+        self.flush_interval = flush_interval
+        self.__pending = []
+        self.__pending_lock = Lock()
+        self.__io_lock = Lock()
+        self.__file = None
+        self.__stopped = Event()
+        # sequence number of the last change each thread recorded
+        self.__recorded = local()
+
+    def segments(self):
+        """List rotated journal segments, oldest first, as (last_seq, path)."""
+        found = []
+        for path in glob(f"{self.path}.*"):
+            suffix = path[len(self.path) + 1 :]
+            if suffix.isdigit():
+                found.append((int(suffix), path))
+        return sorted(found)
+
+    def replay(self, since):
+        """Read back the changes in the journal made after a snapshot.
+
+        A partly written last line, left behind by a crash, is cut off so
+        new changes are appended after the last complete one.
+
+        Arguments:
+            since (int) - sequence number of the latest snapshot
+
+        Return Value:
+            Yields each change with a sequence number greater than since
+        """
+        self.seq = since
+        paths = [path for last, path in self.segments() if last > since]
+        for path in (*paths, self.path):
+            if not os.path.isfile(path):
+                continue
+            with open(path, "rb+") as file:
+                good = 0
+                for line in file:
+                    try:
+                        seq, change = line.split(b" ", 1)
+                        seq, change = int(seq), json.loads(change)
+                    except ValueError:
+                        break
+                    good += len(line)
+                    if seq > self.seq:
+                        self.seq = seq
+                        yield change
+                if path == self.path:
+                    file.truncate(good)
+                    self.size = good
+
+    def open(self):
+        """Start appending to the journal file and flushing in the background."""
+        self.__file = self.__open_file()
+        self.size = self.__file.tell()
+        self.durable = self.seq
+        thread = Thread(target=self.__flush_loop)
+        thread.daemon = True
+        thread.start()
+        atexit.register(self.close)
+
+    def record(self, change):
+        """Add a change to the journal.
+
+        Arguments:
+            change (list) - json encodable description of the change
+
+        Return Value:
+            Returns the sequence number given to the change
+        """
+        # containers which only behave like lists, such as a channel's
+        # message history, are journaled as the lists they stand in for
+        encoded = json.dumps(change, separators=(",", ":"), default=list)
+        with self.__pending_lock:
+            self.seq += 1
+            self.__pending.append(f"{self.seq} {encoded}\n")
+            self.__recorded.seq = self.seq
+            return self.seq
+
+    def sync(self):
+        """Wait until every change the calling thread recorded is on disk.
+
+        Changes other threads recorded in the meantime are written and
+        fsync'd along with them, see the module docstring.
+        """
+        seq = getattr(self.__recorded, "seq", 0)
+        if seq <= self.durable:
+            return
+        with self.__io_lock:
+            if seq > self.durable:
+                self.__write_pending()
+
+    def flush(self):
+        """Write every pending change to disk and fsync the journal file."""
+        with self.__io_lock:
+            self.__write_pending()
+
+    def rotate(self):
+        """Move the changes recorded so far into their own segment file.
+
+        Changes recorded afterwards go into a fresh journal file.
+
+        Return Value:
+            Returns the sequence number of the last change in the segment
+        """
+        with self.__io_lock:
+            with self.__pending_lock:
+                seq = self.seq
+            self.__write_pending()
+            if self.__file is not None:
+                self.__file.close()
+            if os.path.isfile(self.path):
+                os.replace(self.path, f"{self.path}.{seq}")
+            self.__file = self.__open_file()
+            self.size = 0
+            return seq
+
+    def drop(self, seq):
+        """Delete segments whose changes are all included in a snapshot.
+
+        Arguments:
+            seq (int) - sequence number the snapshot was taken at
+        """
+        for last, path in self.segments():
+            if last <= seq:
+                os.remove(path)
+
+    def close(self):
+        """Flush outstanding changes, stop the background flusher and close
+        the journal file."""
+        self.__stopped.set()
+        with self.__io_lock:
+            self.__write_pending()
+            if self.__file is not None:
+                self.__file.close()
+                self.__file = None
+
+    def __open_file(self):
+        # kept open between records and closed by rotate or close
+        return open(self.path, "ab")  # pylint: disable=consider-using-with
+
+    def __write_pending(self):
+        if self.__file is None:
+            return
+        with self.__pending_lock:
+            pending, self.__pending = self.__pending, []
+            seq = self.seq
+        if not pending:
+            return
+        data = "".join(pending).encode()
+        self.__file.write(data)
+        self.__file.flush()
+        os.fsync(self.__file.fileno())
+        self.size += len(data)
+        self.durable = seq
+
+    def __flush_loop(self):
+        while not self.__stopped.wait(self.flush_interval):
+            self.flush()
@@ -0,0 +1,158 @@
+"""Index of who is a member of which channels and dms.
+
+Members of channels and dms are kept in lists, so checking whether a user is
+a member of one means searching its list, and finding the channels and dms
+of a user means searching the list of every one of them. This keeps a set
+of the users under each member field of each channel and dm alongside the
+lists, and the set of channels and dms each user is a member of.
+
+Like MessageIndex it follows the changes made to the store, see Datastore,
+so joining, leaving, inviting, creating and removing channels and dms and
+removing users from Streams all keep it up to date without the handlers
+knowing about it. It is built from the store the first time it is used and
+again whenever the whole store is replaced.
+
+    Typical usage example:
+
+    memberships = Memberships(lambda: data_store.get(), changes_lock)
+    memberships.is_member(("channels", 0), "all_members", u_id)
+"""
+from itertools import count
+
+# Member fields of each kind of group, the first is every member
+MEMBER_FIELDS = {
+    "channels": ("all_members", "owner_members"),
+    "dms": ("members",),
+}
+ID_KEYS = {"channels": "channel_id", "dms": "dm_id"}
+
+
+class Memberships:
+    """Sets of the members of each channel and dm and of the channels and
+    dms of each user, see the module docstring."""
+
+    def __init__(self, get_store, lock):
+        """
+        Arguments:
+            get_store (function) - returns the current store
+            lock (RLock) - lock held while the store is changed, which
+                changes are followed under
+        """
+        self.__get_store = get_store
+        self.__lock = lock
+        self.__built = False
+        # (kind, group_id, field) to the set of u_ids in it
+        self.__members = {}
+        # u_id to the set of (kind, group_id) they are a member of
+        self.__groups = {}
+        # (kind, group_id) to when it was added, to keep the order of the store
+        self.__order = {}
+        self.__counter = count()
+
+    def note(self, change):
+        """Follow a change made to the store.
+
+        Arguments:
+            change (list) - change as it was reported by the store, after it
+                was made
+        """
+        operation, path, *args = change
+        with self.__lock:
+            if not self.__built:
+                return
+            if operation == "reset" or not path:
+                if operation == "reset" or args[0] in MEMBER_FIELDS:
+                    self.reset()
+                return
+            kind = path[0]
+            if kind not in MEMBER_FIELDS:
+                return
+            if len(path) == 1:
+                if operation == "splice":
+                    start, stop, items = args
+                    if stop > start:
+                        # a channel or dm was removed or replaced
+                        self.reset()
+                        return
+                    for group in items:
+                        self.__refresh(kind, group.get(ID_KEYS[kind]))
+            elif len(path) == 2:
+                if args[0] in MEMBER_FIELDS[kind]:
+                    self.__refresh(kind, path[1])
+            elif path[2] in MEMBER_FIELDS[kind]:
+                self.__refresh(kind, path[1])
+
+    def reset(self):
+        """Forget everything, to be built again from the store when next used."""
+        with self.__lock:
+            self.__built = False
+            self.__members = {}
+            self.__groups = {}
+            self.__order = {}
+
+    def is_member(self, group, field, u_id):
+        """Check whether a user is in a member field of a channel or dm.
+
+        Arguments:
+            group (tuple) - (kind, group_id) of the channel or dm
+            field (str) - member field, e.g. "owner_members"
+            u_id (int) - id of the user
+
+        Return Value:
+            Returns True if they are, otherwise False
+        """
+        with self.__lock:
+            self.__build()
+            try:
+                return u_id in self.__members.get((*group, field), ())
+            except TypeError:
+                return False
+
+    def groups_of(self, u_id):
+        """Get the channels and dms a user is a member of.
+
+        Arguments:
+            u_id (int) - id of the user
+
+        Return Value:
+            Returns a list of (kind, group_id), channels before dms and each
+            in the order they are in the store
+        """
+        with self.__lock:
+            self.__build()
+            try:
+                groups = self.__groups.get(u_id, ())
+            except TypeError:
+                return []
+            kinds = list(MEMBER_FIELDS)
+            return sorted(groups, key=lambda group: (kinds.index(group[0]), self.__order[group]))
+
+    def __build(self):
+        if self.__built:
+            return
+        self.__built = True
+        store = self.__get_store()
+        for kind, id_key in ID_KEYS.items():
+            for group in store[kind]:
+                self.__refresh(kind, group[id_key], group)
+
+    def __refresh(self, kind, group_id, group=None):
+        """Bring the sets of a channel or dm up to date with its lists."""
+        if group is None:
+            store = self.__get_store()
+            group = store[kind].find(ID_KEYS[kind], group_id)
+        key = (kind, group_id)
+        if group is None:
+            self.reset()
+            return
+        self.__order.setdefault(key, next(self.__counter))
+        for field in MEMBER_FIELDS[kind]:
+            members = set(group.get(field, ()))
+            old = self.__members.get((kind, group_id, field), set())
+            self.__members[(kind, group_id, field)] = members
+            if field != MEMBER_FIELDS[kind][0]:
+                continue
+            for u_id in old - members:
+                self.__groups[u_id].discard(key)
+            for u_id in members - old:
+                self.__groups.setdefault(u_id, set()).add(key)
@@ -1,15 +1,17 @@
 import math
 import time
+from contextlib import contextmanager
 from threading import Timer
 
 from src.data_store import data_store
 from src.error import AccessError, InputError
-from src.other import first
 from src.notifications import add_tagged_to_notif
 from src.notifications import add_reacted_msg_to_notif
 
 
 VALID_REACT_ID = 1
+# Most messages a page found from a cursor returns at a time
+MAX_LIMIT = 100
 
 
 def create_message(message_text, message_id, user_id):
@@ -25,13 +27,46 @@ def create_message(message_text, message_id, user_id):
 
 def get_message(message_id):
     """Get a message from a message id"""
-    data = data_store.get()
-    for group in (*data["channels"], *data["dms"]):
-        for message in group["messages"]:
-            if message["message_id"] == message_id:
-                return message, group
+    found = data_store.get_message(message_id)
+    if found is None:
+        raise InputError("no message with message id was found")
+    return found
+
+
+def group_entity(group):
+    """Get the entity a channel or dm is locked by, see Datastore.locked"""
+    if "dm_id" in group:
+        return ("dm", group["dm_id"])
+    return ("channel", group["channel_id"])
 
-    raise InputError("no message with message id was found")
+
+@contextmanager
+def locked_message(message_id):
+    """Get a message and its group while holding the lock of the group"""
+    _, group = get_message(message_id)
+    with data_store.locked(group_entity(group)):
+        # the message may have been removed while waiting for the lock
+        yield get_message(message_id)
+
+
+def message_view(message, user_id):
+    """Copy a message as it is returned to a user, with is_this_user_reacted
+    set for them on each react.
+
+    The stored message is left as it is, so readers of the same message do
+    not overwrite each other's is_this_user_reacted. Stored u_ids are
+    MemberLists, see src/records.py, so checking for the user is a lookup.
+    """
+    view = dict(message)
+    view["reacts"] = [
+        {
+            "react_id": react["react_id"],
+            "u_ids": list(react["u_ids"]),
+            "is_this_user_reacted": user_id in react["u_ids"],
+        }
+        for react in message.get("reacts", [])
+    ]
+    return view
 
 
 def owner_perms(user_id, group):
@@ -40,16 +75,17 @@ def owner_perms(user_id, group):
     if "dm_id" in group:
         authorised = user_id == group["owner"]
     else:
-        authorised = user_id in group["owner_members"] or global_owner
+        authorised = data_store.is_member(group, user_id, "owner_members") or global_owner
 
     return authorised
 
 
 def is_member(user_id, group):
     if "dm_id" in group:
-        return user_id == group["owner"] or user_id in group["members"]
+        return user_id == group["owner"] or data_store.is_member(group, user_id)
     else:
-        return user_id in group["owner_members"] or user_id in group["all_members"]
+        owner = data_store.is_member(group, user_id, "owner_members")
+        return owner or data_store.is_member(group, user_id)
 
 
 def channel_messages_v1(auth_user_id, channel_id, start):
@@ -74,30 +110,180 @@ def channel_messages_v1(auth_user_id, channel_id, start):
     """
     # channel is set to the channel that matches the given channel_id if none
     # match then it is set to an empty dictionary
-    channels = data_store.get()["channels"]
-    channel = first(lambda c: c["channel_id"] == channel_id, channels, {})
+    channel = data_store.get_channel(channel_id)
     if not channel:
         raise InputError("no channel matching channel id")
-    if not auth_user_id in channel["all_members"]:
+    if not data_store.is_member(channel, auth_user_id):
         raise AccessError("user is not a member of this channel")
     messages = len(channel["messages"])
     if start > messages:
         raise InputError("start message id is greater than latest message id")
 
-    # add is_this_user_reacted key to reactions
-    for message in channel["messages"]:
-        message["reacts"][0]["is_this_user_reacted"] = (
-            auth_user_id in message["reacts"][0]["u_ids"]
-        )
+    # only the page being returned is read, and copied for the user
+    page = channel["messages"][start : start + 50]
 
     # end is set to -1 if the most recent message has been returned
     return {
-        "messages": channel["messages"][start : start + 50],
+        "messages": [message_view(message, auth_user_id) for message in page],
         "start": start,
         "end": start + 50 if start + 50 < messages else -1,
     }
 
 
+def channel_messages_v3(auth_user_id, channel_id, before_id=None, after_id=None, limit=50):
+    """Get a page of the messages of a channel next to a message, see
+    messages_page.
+
+    Arguments:
+        auth_user_id (int) - id of user requesting messages
+        channel_id (int) - id of channel to get messages from
+        before_id (int) - id of the message to get the messages sent before
+        after_id (int) - id of the message to get the messages sent after
+        limit (int) - most messages to return
+
+    Exceptions:
+        AccessError - Occurs when:
+            - channel_id is valid and the authorised user is not a member of
+            the channel
+        InputError - Occurs when:
+            - channel_id does not refer to a valid channel
+            - see messages_page
+
+    Returns:
+        Returns {messages, has_more}
+    """
+    channel = data_store.get_channel(channel_id)
+    if not channel:
+        raise InputError("no channel matching channel id")
+    if not data_store.is_member(channel, auth_user_id):
+        raise AccessError("user is not a member of this channel")
+    return messages_page(channel, auth_user_id, before_id, after_id, limit)
+
+
+def messages_page(group, user_id, before_id=None, after_id=None, limit=50):
+    """Get a page of the messages of a channel or dm next to a message.
+
+    Unlike a page at an offset, the page does not shift when messages are
+    sent, so a client can page back through the history with before_id and
+    ask for only the messages sent since the newest it has with after_id.
+    The messages next to the one given are read through next_to of the
+    messages, see ListMethods.next_to, rather than by going through them.
+
+    Arguments:
+        group (dictionary) - the channel or dm
+        user_id (int) - id of the user the messages are returned to
+        before_id (int) - id of the message to get the messages sent before
+        after_id (int) - id of the message to get the messages sent after
+        limit (int) - most messages to return
+
+    Exceptions:
+        InputError - Occurs when:
+            - limit is less than 1 or greater than MAX_LIMIT
+            - both before_id and after_id are given
+            - before_id or after_id is not a message of the channel or dm
+
+    Returns:
+        Returns {messages, has_more}, the messages newest first, nearest to
+        the message given, or the newest if neither is given. has_more is
+        whether there are more messages past the page.
+    """
+    if not 1 <= limit <= MAX_LIMIT:
+        raise InputError("limit not valid")
+    if before_id is not None and after_id is not None:
+        raise InputError("only one of before_id and after_id can be given")
+
+    history = group["messages"]
+    # messages sent while the page is read would move it along
+    with data_store.locked(group_entity(group)):
+        if before_id is None and after_id is None:
+            page = history[0:limit]
+            has_more = len(history) > limit
+        else:
+            message_id = after_id if before_id is None else before_id
+            message = history.find("message_id", message_id)
+            if message is None:
+                raise InputError("message id is not a message of the channel or dm")
+            # the messages sent before a message come after it, newest first
+            page, has_more = history.next_to(message, limit, after=before_id is not None)
+
+    return {
+        "messages": [message_view(message, user_id) for message in page],
+        "has_more": has_more,
+    }
+
+
+def channel_messages_sync_v1(auth_user_id, channel_id, since=0):
+    """Get the messages of a channel which changed after a version, see
+    messages_since.
+
+    Arguments:
+        auth_user_id (int) - id of user requesting messages
+        channel_id (int) - id of channel to get messages from
+        since (int) - version the user last saw
+
+    Exceptions:
+        AccessError - Occurs when:
+            - channel_id is valid and the authorised user is not a member of
+            the channel
+        InputError - Occurs when:
+            - channel_id does not refer to a valid channel
+
+    Returns:
+        Returns {version, messages, removed_ids, reset}
+    """
+    channel = data_store.get_channel(channel_id)
+    if not channel:
+        raise InputError("no channel matching channel id")
+    if not data_store.is_member(channel, auth_user_id):
+        raise AccessError("user is not a member of this channel")
+    return messages_since(channel, auth_user_id, since)
+
+
+def messages_since(group, user_id, since=0):
+    """Get the messages of a channel or dm which changed after a version.
+
+    A client polling for new messages passes the version returned by its last
+    call and is given only the messages sent, shared, edited, reacted to or
+    pinned since, and the ids of those removed since, without the messages
+    which did not change being read at all, see src/versions.py. When the
+    changes since are no longer known, e.g. since is 0 or the server has
+    restarted, reset is True and messages holds the newest page of messages,
+    in which case the client should drop the messages it has and page back
+    through them again, see messages_page. Messages the client already has
+    may be sent again, e.g. by another server process which followed their
+    changes later, see src/workers.py.
+
+    Arguments:
+        group (dictionary) - the channel or dm
+        user_id (int) - id of the user the messages are returned to
+        since (int) - version the user last saw
+
+    Returns:
+        Returns {version, messages, removed_ids, reset} with the messages
+        newest first, as they are now. version is what to pass as since the
+        next time.
+    """
+    # read before the messages so those changed meanwhile are sent again
+    # rather than missed
+    latest, changed, removed = data_store.get_message_changes(group, since)
+    # a version from another server process may be ahead of this one
+    version = max(latest, since)
+    if changed is None:
+        page = messages_page(group, user_id)
+        return {"version": version, "messages": page["messages"], "removed_ids": [], "reset": True}
+    if not changed:
+        return {"version": version, "messages": [], "removed_ids": removed, "reset": False}
+
+    history = group["messages"]
+    with data_store.locked(group_entity(group)):
+        found = (history.find("message_id", message_id) for message_id in changed)
+        messages = sorted(
+            (message for message in found if message is not None), key=history.index
+        )
+        views = [message_view(message, user_id) for message in messages]
+    return {"version": version, "messages": views, "removed_ids": removed, "reset": False}
+
+
 def message_send_v1(user_id, channel_id, message_text):
     """Send a message from use to a channel.
 
@@ -116,29 +302,26 @@ def message_send_v1(user_id, channel_id, message_text):
     Returns:
         Returns {message_id}
     """
-    data = data_store.get()
-
-    channel = first(lambda c: c["channel_id"] == channel_id, data["channels"], {})
+    with data_store.locked(("channel", channel_id)):
+        channel = data_store.get_channel(channel_id)
 
-    if not channel:
-        raise InputError("no channel matching channel id")
-    if not user_id in channel["all_members"]:
-        raise AccessError("user is not a member of this channel")
-    if not 1 <= len(message_text) <= 1000:
-        raise InputError("message must be between 1 and 1000 characters")
+        if not channel:
+            raise InputError("no channel matching channel id")
+        if not data_store.is_member(channel, user_id):
+            raise AccessError("user is not a member of this channel")
+        if not 1 <= len(message_text) <= 1000:
+            raise InputError("message must be between 1 and 1000 characters")
 
-    message_id = data["max_ids"]["message"] + 1
-    data["max_ids"]["message"] += 1
-    message = create_message(message_text, message_id, user_id)
-    channel["messages"].insert(0, message)
+        message_id = data_store.next_id("message")
+        message = create_message(message_text, message_id, user_id)
+        channel["messages"].insert(0, message)
 
-    # Incrementing user stats
-    increment_user_messages(user_id)
+        # Incrementing user stats
+        increment_user_messages(user_id)
 
-    # Incrementing workspace stats
-    increment_workspace_messages()
+        # Incrementing workspace stats
+        increment_workspace_messages()
 
-    data_store.set(data)
     add_tagged_to_notif(user_id, channel_id, -1, message_text)
 
     return {"message_id": message_id}
@@ -168,17 +351,17 @@ def message_edit_v1(user_id, message_id, edited_message):
     Returns:
         Returns {}
     """
-    message, group = get_message(message_id)
-    authorised = owner_perms(user_id, group)
-
-    if message["u_id"] != user_id and not authorised:
-        raise AccessError("user not authorised to edit message")
-    if len(edited_message) > 1000:
-        raise InputError("message longer than 1000 characters")
-    if edited_message == "":
-        message_remove_v1(user_id, message_id)
-    else:
-        message["message"] = edited_message
+    with locked_message(message_id) as (message, group):
+        authorised = owner_perms(user_id, group)
+
+        if message["u_id"] != user_id and not authorised:
+            raise AccessError("user not authorised to edit message")
+        if len(edited_message) > 1000:
+            raise InputError("message longer than 1000 characters")
+        if edited_message == "":
+            message_remove_v1(user_id, message_id)
+        else:
+            message["message"] = edited_message
     return {}
 
 
@@ -203,18 +386,18 @@ def message_remove_v1(user_id, message_id):
     Returns:
         Returns {}
     """
-    message, group = get_message(message_id)
-    authorised = owner_perms(user_id, group)
+    with locked_message(message_id) as (message, group):
+        authorised = owner_perms(user_id, group)
 
-    if message["u_id"] != user_id and not authorised:
-        raise AccessError("user not authorised to edit message")
-    group["messages"].remove(message)
+        if message["u_id"] != user_id and not authorised:
+            raise AccessError("user not authorised to edit message")
+        group["messages"].remove(message)
 
-    # Decrementing user stats
-    decrement_user_messages(user_id)
+        # Decrementing user stats
+        decrement_user_messages(user_id)
 
-    # Decrementing workspace stats
-    decrement_workspace_messages()
+        # Decrementing workspace stats
+        decrement_workspace_messages()
 
     return {}
 
@@ -241,28 +424,26 @@ def message_senddm_v1(user_id, dm_id, message_text):
     Returns:
         Returns {}
     """
-    data = data_store.get()
-    for dm in data["dms"]:
-        if dm["dm_id"] == dm_id:
-            if user_id not in dm["members"]:
-                raise AccessError("user not a member of dm")
-            if not 1 <= len(message_text) <= 1000:
-                raise InputError("message must be between 1 and 1000 characters")
-            data["max_ids"]["message"] += 1
-            message_id = data["max_ids"]["message"]
-            data_store.set(data)
-            message = create_message(message_text, message_id, user_id)
-            dm["messages"].insert(0, message)
-
-            # Incrementing user stats
-            increment_user_messages(user_id)
+    with data_store.locked(("dm", dm_id)):
+        dm = data_store.get_dm(dm_id)
+        if not dm:
+            raise InputError(description="no dm matching dm id")
+        if not data_store.is_member(dm, user_id):
+            raise AccessError("user not a member of dm")
+        if not 1 <= len(message_text) <= 1000:
+            raise InputError("message must be between 1 and 1000 characters")
+        message_id = data_store.next_id("message")
+        message = create_message(message_text, message_id, user_id)
+        dm["messages"].insert(0, message)
+
+        # Incrementing user stats
+        increment_user_messages(user_id)
+
+        # Incrementing workspace stats
+        increment_workspace_messages()
+    add_tagged_to_notif(user_id, -1, dm_id, message_text)
 
-            # Incrementing workspace stats
-            increment_workspace_messages()
-            add_tagged_to_notif(user_id, -1, dm_id, message_text)
-
-            return {"message_id": message_id}
-    raise InputError(description="no dm matching dm id")
+    return {"message_id": message_id}
 
 
 def increment_workspace_messages():
@@ -271,10 +452,11 @@ def increment_workspace_messages():
     workspace = store["workspace_stats"]
     # Creating a timestamp and incrementing the workspace stats
     timestamp = math.floor(time.time())
-    num_messages = workspace["messages_exist"][-1]["num_messages_exist"]
-    workspace["messages_exist"].append(
-        {"num_messages_exist": num_messages + 1, "time_stamp": timestamp}
-    )
+    with data_store.locked(("workspace",)):
+        num_messages = workspace["messages_exist"][-1]["num_messages_exist"]
+        workspace["messages_exist"].append(
+            {"num_messages_exist": num_messages + 1, "time_stamp": timestamp}
+        )
 
 
 def decrement_workspace_messages():
@@ -283,64 +465,58 @@ def decrement_workspace_messages():
     workspace = store["workspace_stats"]
     # Creating a timestamp and decrementing the workspace stats
     timestamp = math.floor(time.time())
-    num_messages = workspace["messages_exist"][-1]["num_messages_exist"]
-    workspace["messages_exist"].append(
-        {"num_messages_exist": num_messages - 1, "time_stamp": timestamp}
-    )
+    with data_store.locked(("workspace",)):
+        num_messages = workspace["messages_exist"][-1]["num_messages_exist"]
+        workspace["messages_exist"].append(
+            {"num_messages_exist": num_messages - 1, "time_stamp": timestamp}
+        )
 
 
 def increment_user_messages(u_id):
-    # Fetching the data store
-    users = data_store.get()["users"]
-
-    # Finding the given user in the data store
-    try:
-        found_user = [user for user in users if user["u_id"] == u_id][0]
-    except:
-        # Occurs when user has been removed before stats is called
-        removed_users = data_store.get()["removed_users"]
-        found_user = [user for user in removed_users if user["u_id"] == u_id][0]
+    # Finding the given user in the data store, falling back to removed users
+    # which occurs when user has been removed before stats is called
+    found_user = data_store.get_user(u_id) or data_store.get_removed_user(u_id)
     user_stats = found_user["user_stats"]
 
     # Creating a timestamp and saving the user stats
     timestamp = math.floor(time.time())
 
     # Incrementing messages_sent stat
-    messages_sent_prev = user_stats["messages_sent"][-1]["num_messages_sent"]
-    user_stats["messages_sent"].append(
-        {"num_messages_sent": messages_sent_prev + 1, "time_stamp": timestamp}
-    )
+    with data_store.locked(("user", u_id)):
+        messages_sent_prev = user_stats["messages_sent"][-1]["num_messages_sent"]
+        user_stats["messages_sent"].append(
+            {"num_messages_sent": messages_sent_prev + 1, "time_stamp": timestamp}
+        )
 
 
 def decrement_user_messages(u_id):
-    # Fetching the data store
-    users = data_store.get()["users"]
-
     # Finding the given user in the data store
-    found_user = [user for user in users if user["u_id"] == u_id][0]
+    found_user = data_store.get_user(u_id)
     user_stats = found_user["user_stats"]
 
     # Creating a timestamp and saving the user stats
     timestamp = math.floor(time.time())
 
     # Decrementing messages_sent stat
-    messages_sent_prev = user_stats["messages_sent"][-1]["num_messages_sent"]
-    user_stats["messages_sent"].append(
-        {"num_messages_sent": messages_sent_prev - 1, "time_stamp": timestamp}
-    )
+    with data_store.locked(("user", u_id)):
+        messages_sent_prev = user_stats["messages_sent"][-1]["num_messages_sent"]
+        user_stats["messages_sent"].append(
+            {"num_messages_sent": messages_sent_prev - 1, "time_stamp": timestamp}
+        )
 
 
 def message_react_v1(auth_user_id, message_id, react_id):
-    message, group = get_message(message_id)
-    member = is_member(auth_user_id, group)
-
-    if not member:
-        raise InputError("user not a member of group")
-    if react_id != VALID_REACT_ID:
-        raise InputError("invalid react_id")
-    if auth_user_id in message["reacts"][0]["u_ids"]:
-        raise InputError("message already contains reaction from user")
-    message["reacts"][0]["u_ids"].append(auth_user_id)
+    with locked_message(message_id) as (message, group):
+        member = is_member(auth_user_id, group)
+
+        if not member:
+            raise InputError("user not a member of group")
+        if react_id != VALID_REACT_ID:
+            raise InputError("invalid react_id")
+        # a MemberList lookup rather than a search, see message_view
+        if auth_user_id in message["reacts"][0]["u_ids"]:
+            raise InputError("message already contains reaction from user")
+        message["reacts"][0]["u_ids"].append(auth_user_id)
     channel_id = -1 if "channel_id" not in group else group["channel_id"]
     dm_id = -1 if "dm_id" not in group else group["dm_id"]
     add_reacted_msg_to_notif(auth_user_id, message["u_id"], channel_id, dm_id)
@@ -349,53 +525,52 @@ def message_react_v1(auth_user_id, message_id, react_id):
 
 
 def message_unreact_v1(auth_user_id, message_id, react_id):
-    message, group = get_message(message_id)
-    member = is_member(auth_user_id, group)
+    with locked_message(message_id) as (message, group):
+        member = is_member(auth_user_id, group)
 
-    if not member:
-        raise InputError("user not a member of group")
-    if react_id != VALID_REACT_ID:
-        raise InputError("invalid react_id")
-    if auth_user_id not in message["reacts"][0]["u_ids"]:
-        raise InputError("message does not contain a reaction")
+        if not member:
+            raise InputError("user not a member of group")
+        if react_id != VALID_REACT_ID:
+            raise InputError("invalid react_id")
+        if auth_user_id not in message["reacts"][0]["u_ids"]:
+            raise InputError("message does not contain a reaction")
 
-    message["reacts"][0]["u_ids"].remove(auth_user_id)
+        message["reacts"][0]["u_ids"].remove(auth_user_id)
 
     return {}
 
 
 def message_pin_v1(auth_user_id, message_id):
-    message, group = get_message(message_id)
-    authorised = owner_perms(auth_user_id, group)
+    with locked_message(message_id) as (message, group):
+        authorised = owner_perms(auth_user_id, group)
 
-    if not authorised:
-        raise AccessError("user does not have owner permissions in group")
-    if message["is_pinned"]:
-        raise InputError("message already pinned")
+        if not authorised:
+            raise AccessError("user does not have owner permissions in group")
+        if message["is_pinned"]:
+            raise InputError("message already pinned")
 
-    message["is_pinned"] = True
+        message["is_pinned"] = True
 
     return {}
 
 
 def message_unpin_v1(auth_user_id, message_id):
-    message, group = get_message(message_id)
-    authorised = owner_perms(auth_user_id, group)
+    with locked_message(message_id) as (message, group):
+        authorised = owner_perms(auth_user_id, group)
 
-    if not authorised:
-        raise AccessError("user does not have owner permissions in group")
-    if not message["is_pinned"]:
-        raise InputError("message already unpinned")
+        if not authorised:
+            raise AccessError("user does not have owner permissions in group")
+        if not message["is_pinned"]:
+            raise InputError("message already unpinned")
 
-    message["is_pinned"] = False
+        message["is_pinned"] = False
 
     return {}
 
 
 def message_share_v1(user_id, og_message_id, message, channel_id, dm_id):
-    data = data_store.get()
-    channel = first(lambda c: c["channel_id"] == channel_id, data["channels"], {})
-    dm = first(lambda c: c["dm_id"] == dm_id, data["dms"], {})
+    channel = data_store.get_channel(channel_id)
+    dm = data_store.get_dm(dm_id)
     og_message, message_group = get_message(og_message_id)
 
     if not dm and not channel:
@@ -415,10 +590,7 @@ def message_share_v1(user_id, og_message_id, message, channel_id, dm_id):
     if len(message) > 0:
         message_text += f", {message}"
 
-    message_id = data["max_ids"]["message"] + 1
-    data["max_ids"]["message"] += 1
-
-    data_store.set(data)
+    message_id = data_store.next_id("message")
 
     add_tagged_to_notif(user_id, channel_id, dm_id, message_text)
     if channel:
@@ -430,12 +602,11 @@ def message_share_v1(user_id, og_message_id, message, channel_id, dm_id):
 
 
 def message_sendlater(user_id, channel_id, message, time_sent):
-    data = data_store.get()
-    channel = first(lambda c: c["channel_id"] == channel_id, data["channels"], {})
+    channel = data_store.get_channel(channel_id)
 
     if not channel:
         raise InputError("no channel matching channel id")
-    if not user_id in channel["all_members"]:
+    if not data_store.is_member(channel, user_id):
         raise AccessError("user is not a member of this channel")
     if not 1 <= len(message) <= 1000:
         raise InputError("message must be between 1 and 1000 characters")
@@ -443,9 +614,7 @@ def message_sendlater(user_id, channel_id, message, time_sent):
     if time_sent < now:
         raise InputError("time_sent is in the past")
 
-    message_id = data["max_ids"]["message"] + 1
-    data["max_ids"]["message"] += 1
-    data_store.set(data)
+    message_id = data_store.next_id("message")
 
     t = Timer(
         time_sent - now,
@@ -458,12 +627,11 @@ def message_sendlater(user_id, channel_id, message, time_sent):
 
 
 def message_sendlater_dm(user_id, dm_id, message, time_sent):
-    data = data_store.get()
-    dm = first(lambda c: c["dm_id"] == dm_id, data["dms"], {})
+    dm = data_store.get_dm(dm_id)
 
     if not dm:
         raise InputError("no dm matching dm id")
-    if not user_id in dm["members"]:
+    if not data_store.is_member(dm, user_id):
         raise AccessError("user is not a member of this channel")
     if not 1 <= len(message) <= 1000:
         raise InputError("message must be between 1 and 1000 characters")
@@ -471,9 +639,7 @@ def message_sendlater_dm(user_id, dm_id, message, time_sent):
     if time_sent < now:
         raise InputError("time_sent is in the past")
 
-    message_id = data["max_ids"]["message"] + 1
-    data["max_ids"]["message"] += 1
-    data_store.set(data)
+    message_id = data_store.next_id("message")
 
     t = Timer(
         time_sent - now,
@@ -486,29 +652,32 @@ def message_sendlater_dm(user_id, dm_id, message, time_sent):
 
 
 def send_channel_message(channel_id, message, message_id, user_id):
-    data = data_store.get()
-    # Increment stats
-    increment_workspace_messages()
-    increment_user_messages(user_id)
+    # runs on a timer rather than in a request, see Datastore.synchronised
+    with data_store.synchronised(writes=True), data_store.locked(("channel", channel_id)):
+        channel = data_store.get_channel(channel_id)
+        if channel is None:
+            return
+        # Increment stats
+        increment_workspace_messages()
+        increment_user_messages(user_id)
 
-    removed = first(lambda u: u["u_id"] == user_id, data["removed_users"], {})
-    if removed:
-        message = "Removed user"
-    channel = first(lambda c: c["channel_id"] == channel_id, data["channels"], {})
-    message = create_message(message, message_id, user_id)
-    channel["messages"].insert(0, message)
-    data_store.set(data)
+        if data_store.get_removed_user(user_id):
+            message = "Removed user"
+        message = create_message(message, message_id, user_id)
+        channel["messages"].insert(0, message)
 
 
 def send_dm_message(dm_id, message, message_id, user_id):
-    data = data_store.get()
-    # Increment stats
-    increment_workspace_messages()
-    increment_user_messages(user_id)
-    removed = first(lambda u: u["u_id"] == user_id, data["removed_users"], {})
-    if removed:
-        message = "Removed user"
-    dm = first(lambda d: d["dm_id"] == dm_id, data["dms"], {})
-    message = create_message(message, message_id, user_id)
-    dm["messages"].insert(0, message)
-    data_store.set(data)
+    # runs on a timer rather than in a request, see Datastore.synchronised
+    with data_store.synchronised(writes=True), data_store.locked(("dm", dm_id)):
+        # the dm may have been removed since the message was scheduled
+        dm = data_store.get_dm(dm_id)
+        if dm is None:
+            return
+        # Increment stats
+        increment_workspace_messages()
+        increment_user_messages(user_id)
+        if data_store.get_removed_user(user_id):
+            message = "Removed user"
+        message = create_message(message, message_id, user_id)
+        dm["messages"].insert(0, message)
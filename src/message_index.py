@@ -0,0 +1,404 @@
+"""Index of the text of every message, for finding those containing a string.
+
+search_v1 finds the messages which contain a query anywhere in their text.
+Instead of testing every message in every channel and dm the caller is in,
+each run of GRAM_SIZE characters found in a message, a trigram, is indexed to
+the message_ids of the messages it is found in. A message containing the
+query has to contain every trigram of the query too, so only the messages
+listed under all of them, starting with the rarest, are tested, by looking
+them up in the store, which with the json backend reads them from their
+segments, see src/segments.py. When even the rarest trigram is in more
+messages than the caller can see, and for queries shorter than a trigram,
+the index cannot help and the messages of the caller's channels and dms are
+scanned instead, see src/search_pool.py.
+
+Which channel or dm each message is in and the order it was sent in are kept
+in arrays indexed by message_id, like MessageDirectory. The texts themselves
+are not kept, so the index does not hold a second copy of every message. The
+index follows the changes made to the store, see Datastore, so every handler
+which sends, shares, edits or removes a message keeps it up to date. Removed
+messages are only dropped from it once a search finds them missing from the
+store.
+
+Building the index means reading every message, so it is only built the
+first time a search needs it, in the background. Until it is ready searches
+go through the store as they did before.
+
+    Typical usage example:
+
+    index = MessageIndex(data_store.get_message)
+    found = index.find(["hello"], [("channels", 0), ("dms", 3)], store)
+"""
+from array import array
+from contextlib import contextmanager
+from threading import Condition, Thread
+
+GRAM_SIZE = 3
+# Once this few candidates are left they are tested rather than narrowed
+# down further by the longer lists of messages of the other trigrams
+FEW_CANDIDATES = 64
+
+
+def grams(text):
+    """Get the set of trigrams in some text."""
+    return {text[start : start + GRAM_SIZE] for start in range(len(text) - GRAM_SIZE + 1)}
+
+
+def contains(text, literals):
+    """Check whether some text contains every one of some strings."""
+    return isinstance(text, str) and all(literal in text for literal in literals)
+
+
+class TrigramIndex:
+    """Trigrams of the text of each message, see the module docstring."""
+
+    def __init__(self):
+        # number of the group each message is in, -1 for none, and which
+        # message was sent later than which
+        self.slots = array("i")
+        self.stamps = array("q")
+        self.groups = []
+        self.numbers = {}
+        # message_ids sent in each group, oldest first
+        self.members = []
+        self.postings = {}
+        self.stamp = 0
+
+    def add(self, message_id, text, group):
+        """Index a message which has just been sent, the newest in its group.
+
+        Arguments:
+            message_id (int) - id of the message
+            text (str) - its text
+            group (tuple) - (kind, group_id) of the channel or dm it was sent in
+        """
+        if not isinstance(message_id, int) or message_id < 0 or not isinstance(text, str):
+            return
+        number = self.numbers.get(group)
+        if number is None:
+            number = self.numbers[group] = len(self.groups)
+            self.groups.append(group)
+            self.members.append(array("i"))
+        if message_id >= len(self.slots):
+            missing = message_id + 1 - len(self.slots)
+            self.slots.extend(array("i", [-1]) * missing)
+            self.stamps.extend(array("q", [0]) * missing)
+        elif self.slots[message_id] == number:
+            # sent while the index was being built and found by both
+            return
+        self.members[number].append(message_id)
+        self.stamp += 1
+        self.slots[message_id] = number
+        self.stamps[message_id] = self.stamp
+        postings = self.postings
+        for gram in grams(text):
+            found = postings.get(gram)
+            if found is None:
+                found = postings[gram] = array("i")
+            found.append(message_id)
+
+    def edit(self, message_id, text, old=None):
+        """Index the new text of a message.
+
+        Arguments:
+            message_id (int) - id of the message
+            text (str) - its new text
+            old (str) - its text before, None if it is not known, whose
+                trigrams the message is taken out of unless text has them too
+        """
+        if not isinstance(message_id, int) or not 0 <= message_id < len(self.slots):
+            return
+        if not isinstance(text, str):
+            return
+        postings = self.postings
+        new = grams(text)
+        if isinstance(old, str):
+            for gram in grams(old) - new:
+                found = postings.get(gram)
+                while found:
+                    try:
+                        found.remove(message_id)
+                    except ValueError:
+                        break
+                if found is not None and not found:
+                    del postings[gram]
+        # every trigram of the text is looked for, not only those old did not
+        # have, as a message caught up with from a shared backend may have
+        # held a later text than the index has seen, see apply_change in
+        # src/records.py
+        for gram in new:
+            found = postings.get(gram)
+            if found is None:
+                found = postings[gram] = array("i")
+            if message_id not in found:
+                found.append(message_id)
+
+    def forget(self, message_id):
+        """Stop finding a message which is no longer in the store."""
+        if isinstance(message_id, int) and 0 <= message_id < len(self.slots):
+            self.slots[message_id] = -1
+
+    def search(self, literals, groups):
+        """Find the messages in some groups which may contain every one of
+        some strings, see matches.
+
+        Arguments:
+            literals (list) - strings to find, e.g. just the query
+            groups (list) - (kind, group_id) of the channels and dms to search
+
+        Return Value:
+            Returns the message_ids in the order of groups, newest first
+            within each group, or None if the index cannot narrow them down
+        """
+        found = self.matches(literals, groups)
+        if found is None:
+            return None
+        ranks = self.__ranks(groups)
+        slots, stamps = self.slots, self.stamps
+        found.sort(key=lambda message_id: (ranks[slots[message_id]], -stamps[message_id]))
+        return found
+
+    def matches(self, literals, groups):
+        """Find the messages in some groups which may contain every one of
+        some strings, in no particular order.
+
+        They contain every trigram of the strings, so the messages which
+        contain the strings are among them, but each has to be tested.
+
+        Arguments:
+            literals (list) - strings to find, e.g. just the query
+            groups (list) - (kind, group_id) of the channels and dms to search
+
+        Return Value:
+            Returns the message_ids, or None if the index cannot narrow them
+            down to fewer than are in the groups
+        """
+        ranks = self.__ranks(groups)
+        if not ranks:
+            return []
+        slots = self.slots
+        postings = sorted(
+            (
+                self.postings.get(gram, ())
+                for literal in literals
+                if len(literal) >= GRAM_SIZE
+                for gram in grams(literal)
+            ),
+            key=len,
+        )
+        # scanning every message in the groups is quicker than testing more
+        # candidates than that
+        visible = sum(len(self.members[number]) for number in ranks)
+        if not postings or len(postings[0]) >= visible:
+            return None
+        candidates = set(postings[0])
+        for found in postings[1:]:
+            if len(candidates) <= FEW_CANDIDATES:
+                break
+            candidates.intersection_update(found)
+        return [message_id for message_id in candidates if slots[message_id] in ranks]
+
+    def __ranks(self, groups):
+        """Get the position in groups of the number of each group indexed."""
+        ranks = {}
+        for rank, group in enumerate(groups):
+            number = self.numbers.get(tuple(group))
+            if number is not None:
+                ranks.setdefault(number, rank)
+        return ranks
+
+
+class SharedLock:
+    """Lock held by any number of readers at once or by one writer.
+
+    A writer waiting for the readers to finish keeps new ones from starting,
+    so a steady stream of searches cannot hold off the changes to follow.
+    """
+
+    def __init__(self):
+        self.__condition = Condition()
+        self.__readers = 0
+        self.__writing = False
+        self.__writers_waiting = 0
+
+    @contextmanager
+    def read(self):
+        """Hold the lock shared with other readers."""
+        with self.__condition:
+            self.__condition.wait_for(
+                lambda: not self.__writing and not self.__writers_waiting
+            )
+            self.__readers += 1
+        try:
+            yield
+        finally:
+            with self.__condition:
+                self.__readers -= 1
+                if not self.__readers:
+                    self.__condition.notify_all()
+
+    @contextmanager
+    def write(self):
+        """Hold the lock alone."""
+        with self.__condition:
+            self.__writers_waiting += 1
+            self.__condition.wait_for(lambda: not self.__writing and not self.__readers)
+            self.__writers_waiting -= 1
+            self.__writing = True
+        try:
+            yield
+        finally:
+            with self.__condition:
+                self.__writing = False
+                self.__condition.notify_all()
+
+
+class MessageIndex:
+    """TrigramIndex of the messages in the store, kept up to date with it.
+
+    Searches share the index with each other and only wait for the changes
+    being followed, which are quick, not for other searches.
+    """
+
+    def __init__(self, lookup):
+        """
+        Arguments:
+            lookup (function) - called with a message_id to get (message,
+                group) from the store, or None if it is not there, see
+                Datastore.get_message
+        """
+        self.__lookup = lookup
+        self.__lock = SharedLock()
+        self.__index = None
+        # changes made while the index is being built, None when it is not
+        self.__pending = None
+        self.__generation = 0
+
+    def note(self, change, removed=None):
+        """Follow a change made to the store.
+
+        Arguments:
+            change (list) - change as it was reported by the store
+            removed (any) - value a set replaced, if known
+        """
+        path = change[1]
+        if len(path) < 3 or path[0] not in ("channels", "dms") or path[2] != "messages":
+            return
+        with self.__lock.write():
+            if self.__pending is not None:
+                self.__pending.append((change, removed))
+            elif self.__index is not None:
+                follow(self.__index, change, removed)
+
+    def reset(self):
+        """Drop the index, for when the whole store is replaced."""
+        with self.__lock.write():
+            self.__generation += 1
+            self.__index = None
+            self.__pending = None
+
+    def find(self, literals, groups, store, ordered=True):
+        """Find the messages in some groups whose text contains every one of
+        some strings, see TrigramIndex.search, starting to build the index if
+        it is not built.
+
+        The messages the index finds are looked up in the store to test
+        them, after letting go of the index, as the store may have to read
+        them from disk.
+
+        Arguments:
+            literals (list) - strings to find, e.g. just the query
+            groups (list) - (kind, group_id) of the channels and dms to search
+            store (Store) - store to build the index from
+            ordered (bool) - whether to order the messages as search_v1 does
+
+        Return Value:
+            Returns a list of (message_id, text, time_created), or None if the
+            index is not ready yet or cannot narrow the messages down
+        """
+        message_ids = None
+        with self.__lock.read():
+            index = self.__index
+            if index is not None:
+                if ordered:
+                    message_ids = index.search(literals, groups)
+                else:
+                    message_ids = index.matches(literals, groups)
+        if index is None:
+            with self.__lock.write():
+                if self.__index is None:
+                    self.__start(store)
+            return None
+        if message_ids is None:
+            return None
+        messages = []
+        for message_id in message_ids:
+            found = self.__lookup(message_id)
+            if found is None:
+                self.forget(message_id)
+                continue
+            message = found[0]
+            if contains(message.get("message"), literals):
+                messages.append((message_id, message["message"], message.get("time_created", 0)))
+        return messages
+
+    def forget(self, message_id):
+        """Stop finding a message which is no longer in the store."""
+        with self.__lock.write():
+            if self.__index is not None:
+                self.__index.forget(message_id)
+
+    def __start(self, store):
+        """Start building the index in the background unless it already is."""
+        if self.__pending is None:
+            self.__pending = []
+            thread = Thread(target=self.__build, args=(store, self.__generation))
+            thread.daemon = True
+            thread.start()
+
+    def __build(self, store, generation):
+        index = build(store)
+        with self.__lock.write():
+            if generation != self.__generation:
+                return
+            for change, removed in self.__pending:
+                follow(index, change, removed)
+            self.__pending = None
+            self.__index = index
+
+
+def build(store):
+    """Index every message in a store.
+
+    Arguments:
+        store (dictionary) - store to index
+
+    Return Value:
+        Returns the TrigramIndex
+    """
+    index = TrigramIndex()
+    for kind in ("channels", "dms"):
+        id_key = "channel_id" if kind == "channels" else "dm_id"
+        for group in list(store[kind]):
+            # oldest first so later messages are stamped as sent later
+            for message in reversed(group["messages"][:]):
+                index.add(message["message_id"], message["message"], (kind, group[id_key]))
+    return index
+
+
+def follow(index, change, removed=None):
+    """Make the change a change to the store makes to the index.
+
+    Arguments:
+        index (TrigramIndex) - index to change
+        change (list) - change as it was reported by the store
+        removed (any) - value a set replaced, if known
+    """
+    operation, path, *args = change
+    if operation == "splice" and len(path) == 3:
+        start, _, items = args
+        if start == 0:
+            for message in reversed(items):
+                index.add(message.get("message_id"), message.get("message"), (path[0], path[1]))
+    elif operation == "set" and len(path) == 4 and args[0] == "message":
+        index.edit(path[3], args[1], removed)
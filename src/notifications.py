@@ -114,10 +114,9 @@ def get_u_id_from_handle(handle):
     Return Value:
         Returns return user["u_id"] or None
     """
-    store = data_store.get()
-    for user in store["users"]:
-        if user["handle_str"] == handle:
-            return user["u_id"]
+    user = data_store.get_user_by_handle(handle)
+    if user:
+        return user["u_id"]
 
 
 def get_handle_and_name(u_id, ch_id, dm_id):
@@ -134,23 +133,15 @@ def get_handle_and_name(u_id, ch_id, dm_id):
     Return Value:
         Returns {"handle": handle, "name": name}
     """
-    store = data_store.get()
-    all_users = store["users"]
-    handle = None
-    for user in all_users:
-        if user["u_id"] == u_id:
-            handle = user["handle_str"]
+    user = data_store.get_user(u_id)
+    handle = user["handle_str"] if user else None
     name = None
-    all_channels = store["channels"]
-    for channel in all_channels:
-        if channel["channel_id"] == ch_id:
-            name = channel["name"]
-            break
-    all_dms = store["dms"]
-    for dm in all_dms:
-        if dm["dm_id"] == dm_id:
-            name = dm["name"]
-            break
+    channel = data_store.get_channel(ch_id)
+    if channel:
+        name = channel["name"]
+    dm = data_store.get_dm(dm_id)
+    if dm:
+        name = dm["name"]
     return {"handle": handle, "name": name}
 
 
@@ -167,16 +158,13 @@ def add_to_notif(u_id, to_add):
     Return Value:
         None
     """
-    store = data_store.get()
-    notifs = store["all_notifications"]
-    for notif in notifs:
-        if notif["u_id"] == u_id:
+    notif = data_store.get_notifications(u_id)
+    if notif:
+        with data_store.locked(("notifications", u_id)):
             if len(notif["notifications"]) >= 20:
                 notif["notifications"].pop(0)
             notif["notifications"].append(to_add)
 
-    data_store.set(store)
-
 
 def notifications_get_v1(u_id):
     """Gets the last 20 notifications of a user
@@ -190,10 +178,6 @@ def notifications_get_v1(u_id):
     Return Value:
         Returns {"notifications": [{messages}]}
     """
-    store = data_store.get()
-    notifs = store["all_notifications"]
-    ret_msg = []
-    for notif in notifs:
-        if notif["u_id"] == u_id:
-            ret_msg = notif["notifications"][::-1]
+    notif = data_store.get_notifications(u_id)
+    ret_msg = notif["notifications"][::-1] if notif else []
     return {"notifications": ret_msg}
@@ -0,0 +1,305 @@
+"""Sends the emails of Streams, e.g. password reset codes, in the background.
+
+Connecting to the mail server, starting TLS and logging in takes seconds, too
+long to do while a request waits. Emails are put in a queue of at most
+OUTBOX_SIZE instead, and a thread sends them over one connection it keeps
+open between them, taking up to BATCH_SIZE queued emails at a time. An email
+which cannot be sent is put aside and the rest are sent on without it; it is
+tried again after RETRY_DELAY seconds, twice as long each time after that,
+until it has been tried MAX_ATTEMPTS times. When the server stops it waits
+up to DRAIN_TIMEOUT seconds for the emails still queued to be sent, and
+those left after that are lost.
+
+Where emails go depends on MAIL_TRANSPORT:
+
+    "smtp" - the SMTP server at SMTP_HOST, see SmtpTransport
+    "file" - appended to the mbox file MAIL_FILE instead of sent, e.g. for
+        tests, see FileTransport
+
+Any object with send(message) and close() methods can be given to an Outbox
+too, e.g. one which sends to a local SMTP server with SmtpTransport.
+
+    Typical usage example:
+
+    outbox.send("rob@gmail.com", "Password Reset Code For Streams", text)
+"""
+import atexit
+import heapq
+import mailbox
+import os
+import queue
+import smtplib
+import sys
+import time
+from email.message import EmailMessage
+from itertools import count
+from threading import Condition, Lock, Thread
+
+# "smtp" or "file"
+MAIL_TRANSPORT = os.environ.get("STREAMS_MAIL_TRANSPORT", "smtp")
+MAIL_FILE = os.environ.get("STREAMS_MAIL_FILE", "outbox.mbox")
+SERVER_EMAIL = "streamsbotbeagle@gmail.com"
+SMTP_HOST = os.environ.get("STREAMS_SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT = int(os.environ.get("STREAMS_SMTP_PORT", 587))
+SMTP_USER = os.environ.get("STREAMS_SMTP_USER", SERVER_EMAIL)
+SMTP_PASSWORD = os.environ.get("STREAMS_SMTP_PASSWORD", "SyC$8jZsrm&W")
+# Whether to start TLS after connecting, which local test servers lack
+SMTP_STARTTLS = os.environ.get("STREAMS_SMTP_STARTTLS", "1") == "1"
+# Most emails waiting to be sent, more are dropped
+OUTBOX_SIZE = 1000
+BATCH_SIZE = 50
+MAX_ATTEMPTS = 5
+RETRY_DELAY = 1
+MAX_RETRY_DELAY = 60
+# Seconds without emails after which the connection is closed
+IDLE_TIMEOUT = 30
+# Seconds the server waits for queued emails to be sent when it stops
+DRAIN_TIMEOUT = 10
+
+
+class SmtpTransport:
+    """Sends emails to an SMTP server over a connection kept open between
+    them."""
+
+    def __init__(
+        self,
+        host=SMTP_HOST,
+        port=SMTP_PORT,
+        user=SMTP_USER,
+        password=SMTP_PASSWORD,
+        starttls=SMTP_STARTTLS,
+    ):
+        """
+        Arguments:
+            host (str) - host of the SMTP server
+            port (int) - port of the SMTP server
+            user (str) - user to log in as, or None to send without logging in
+            password (str) - password of user
+            starttls (bool) - whether to start TLS after connecting
+        """
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.starttls = starttls
+        self.__server = None
+
+    def send(self, message):
+        """Send an email, connecting first if not connected.
+
+        A connection the server has closed since the last email, as servers
+        do with idle ones, is opened again once before giving up.
+        """
+        reused = self.__server is not None
+        try:
+            self.__connect().send_message(message)
+        except (smtplib.SMTPServerDisconnected, ConnectionError):
+            self.close()
+            if not reused:
+                raise
+            self.__connect().send_message(message)
+
+    def close(self):
+        """Close the connection, if open."""
+        server, self.__server = self.__server, None
+        if server is not None:
+            try:
+                server.quit()
+            except (OSError, smtplib.SMTPException):
+                server.close()
+
+    def __connect(self):
+        if self.__server is None:
+            server = smtplib.SMTP(self.host, self.port, timeout=30)
+            try:
+                server.ehlo()
+                if self.starttls:
+                    server.starttls()
+                    server.ehlo()
+                if self.user is not None:
+                    server.login(self.user, self.password)
+            except BaseException:
+                server.close()
+                raise
+            self.__server = server
+        return self.__server
+
+
+class FileTransport:
+    """Appends emails to an mbox file rather than sending them."""
+
+    def __init__(self, path=MAIL_FILE):
+        self.path = path
+
+    def send(self, message):
+        box = mailbox.mbox(self.path)
+        box.lock()
+        try:
+            box.add(message)
+            box.flush()
+        finally:
+            box.unlock()
+            box.close()
+
+    def close(self):
+        pass
+
+
+def open_transport():
+    """Get the transport chosen by MAIL_TRANSPORT."""
+    if MAIL_TRANSPORT == "file":
+        return FileTransport()
+    return SmtpTransport()
+
+
+class Outbox:
+    """Queue of emails sent in the background, see the module docstring."""
+
+    def __init__(self, transport=None, size=OUTBOX_SIZE):
+        """
+        Arguments:
+            transport (any) - what emails are sent with, MAIL_TRANSPORT's if
+                None
+            size (int) - most emails waiting to be sent
+        """
+        self.transport = transport or open_transport()
+        self.__queue = queue.Queue(size)
+        # (due, order, attempts, message) of emails to try again, soonest
+        # first, only used by the sending thread
+        self.__retries = []
+        self.__order = count()
+        # emails queued which are neither sent nor given up on
+        self.__unfinished = 0
+        self.__finished = Condition()
+        self.__thread = None
+        self.__thread_lock = Lock()
+        self.__closing = False
+
+    def send(self, to, subject, text):
+        """Queue an email to be sent.
+
+        Arguments:
+            to (str) - email address to send it to
+            subject (str) - subject of the email
+            text (str) - body of the email
+
+        Return Value:
+            Returns True if it was queued, False if the queue is full
+        """
+        message = EmailMessage()
+        message["From"] = SERVER_EMAIL
+        message["To"] = to
+        message["Subject"] = subject
+        message.set_content(text)
+        self.__start()
+        with self.__finished:
+            try:
+                self.__queue.put_nowait(message)
+            except queue.Full:
+                print(f"outbox full, dropping email to {to}", file=sys.stderr)
+                return False
+            self.__unfinished += 1
+        return True
+
+    def join(self, timeout=None):
+        """Wait for every email queued so far to be sent or given up on.
+
+        Arguments:
+            timeout (float) - most seconds to wait, None to wait for as long
+                as it takes
+
+        Return Value:
+            Returns the number of emails still waiting to be sent
+        """
+        with self.__finished:
+            self.__finished.wait_for(lambda: self.__unfinished == 0, timeout)
+            return self.__unfinished
+
+    def close(self, timeout=DRAIN_TIMEOUT):
+        """Wait up to timeout seconds for the emails still queued to be sent,
+        after which the transport is closed. Called when the server stops.
+
+        Return Value:
+            Returns the number of emails which were not sent in time
+        """
+        if self.__closing:
+            # closed already, the wait is not repeated at exit
+            return self.join(0)
+        self.__closing = True
+        left = self.join(timeout)
+        if left:
+            print(f"outbox closed with {left} emails unsent", file=sys.stderr)
+        return left
+
+    def __start(self):
+        # started when first needed, and again in a process forked since
+        with self.__thread_lock:
+            if self.__thread is None or not self.__thread.is_alive():
+                if self.__thread is None:
+                    atexit.register(self.close)
+                self.__thread = Thread(target=self.__send_loop, name="outbox")
+                self.__thread.daemon = True
+                self.__thread.start()
+
+    def __send_loop(self):
+        while True:
+            batch = self.__next_batch()
+            if not batch:
+                self.transport.close()
+                continue
+            for attempts, message in batch:
+                self.__try(attempts, message)
+            if self.__closing and not self.__retries and self.__queue.empty():
+                self.transport.close()
+
+    def __next_batch(self):
+        """Wait for emails to send, up to BATCH_SIZE of them, those due to be
+        tried again first.
+
+        Return Value:
+            Returns a list of (attempts so far, message), empty if there were
+            none for IDLE_TIMEOUT seconds
+        """
+        batch = []
+        now = time.monotonic()
+        while self.__retries and self.__retries[0][0] <= now and len(batch) < BATCH_SIZE:
+            _, _, attempts, message = heapq.heappop(self.__retries)
+            batch.append((attempts, message))
+        if not batch:
+            timeout = IDLE_TIMEOUT
+            if self.__retries:
+                timeout = min(timeout, self.__retries[0][0] - now)
+            try:
+                batch.append((0, self.__queue.get(timeout=timeout)))
+            except queue.Empty:
+                # only idle if no email is waiting to be tried again
+                return [] if not self.__retries else self.__next_batch()
+        while len(batch) < BATCH_SIZE:
+            try:
+                batch.append((0, self.__queue.get_nowait()))
+            except queue.Empty:
+                break
+        return batch
+
+    def __try(self, attempts, message):
+        """Send an email, putting it aside to be tried again if it fails and
+        has been tried fewer than MAX_ATTEMPTS times."""
+        try:
+            self.transport.send(message)
+        except Exception as error:  # pylint: disable=broad-except
+            self.transport.close()
+            attempts += 1
+            if attempts < MAX_ATTEMPTS:
+                delay = min(RETRY_DELAY * 2 ** (attempts - 1), MAX_RETRY_DELAY)
+                heapq.heappush(
+                    self.__retries,
+                    (time.monotonic() + delay, next(self.__order), attempts, message),
+                )
+                return
+            print(f"could not send email to {message['To']}: {error}", file=sys.stderr)
+        with self.__finished:
+            self.__unfinished -= 1
+            self.__finished.notify_all()
+
+
+outbox = Outbox()
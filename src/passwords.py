@@ -0,0 +1,200 @@
+"""Hashing and checking the passwords of users.
+
+Passwords are hashed with a salted key derivation function chosen by
+PASSWORD_KDF, scrypt or pbkdf2, costly enough that guessing them from a
+stolen store is slow. The cost is set with SCRYPT_COST or PBKDF2_ITERATIONS,
+which benchmarks/password_bench.py picks for a target login time on the
+machine it runs on. The function and cost are stored with each hash:
+
+    scrypt$<n>$<r>$<p>$<salt>$<hash>
+    pbkdf2_sha256$<iterations>$<salt>$<hash>
+
+with the salt and hash base64 encoded. Users registered before passwords
+were salted have a bare sha256 hex digest, which still checks, and like
+hashes made with another function or cost is reported as outdated so the
+caller can hash the password again now it knows it.
+
+The hashing holds up the thread doing it for tens of milliseconds. With
+PASSWORD_WORKERS set it is done by a pool of that many threads instead,
+which bounds how many logins hash at once so the other requests keep going.
+Many passwords hashed together, as for an import, are always spread over
+threads, up to BATCH_WORKERS of them without a pool, since hashlib lets
+other threads run while it hashes.
+Passwords which have checked recently are remembered, as an HMAC under a key
+of the process, for the PASSWORD_CACHE_SIZE latest, so logging in again
+does not hash the password again. 0 turns this off, which keeps anything
+cheaper to guess than the stored hashes out of memory.
+
+    Typical usage example:
+
+    user["password"] = hash_password(password)
+    matches, outdated = check_password(password, user["password"])
+"""
+import base64
+import hashlib
+import hmac
+import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
+# "scrypt" or "pbkdf2"
+PASSWORD_KDF = os.environ.get("STREAMS_PASSWORD_KDF", "scrypt")
+# scrypt's n, log 2
+SCRYPT_COST = int(os.environ.get("STREAMS_SCRYPT_COST", 14))
+SCRYPT_BLOCK_SIZE = 8
+SCRYPT_PARALLELISM = 1
+PBKDF2_ITERATIONS = int(os.environ.get("STREAMS_PBKDF2_ITERATIONS", 600000))
+# Threads hashing passwords, 0 hashes in the thread of the request
+PASSWORD_WORKERS = int(os.environ.get("STREAMS_PASSWORD_WORKERS", 0))
+# Threads hashing many passwords at once when there is no pool
+BATCH_WORKERS = os.cpu_count() or 1
+# Passwords remembered as having checked, 0 remembers none
+PASSWORD_CACHE_SIZE = int(os.environ.get("STREAMS_PASSWORD_CACHE_SIZE", 1000))
+SALT_SIZE = 16
+HASH_SIZE = 32
+
+pool = None
+pool_lock = Lock()
+# HMACs of the stored hash and password of those which checked, least
+# recently used first
+checked = OrderedDict()
+checked_lock = Lock()
+checked_key = os.urandom(32)
+
+
+def encode(data):
+    return base64.b64encode(data).decode()
+
+
+def scrypt(password, salt, cost, block_size, parallelism):
+    """Derive a hash with scrypt, n being 2 ** cost."""
+    n = 2**cost
+    return hashlib.scrypt(
+        password.encode(),
+        salt=salt,
+        n=n,
+        r=block_size,
+        p=parallelism,
+        # the default allows no more than n = 2 ** 14 with r = 8
+        maxmem=256 * n * block_size + 1024 * 1024,
+        dklen=HASH_SIZE,
+    )
+
+
+def pbkdf2(password, salt, iterations):
+    """Derive a hash with pbkdf2 over sha256."""
+    return hashlib.pbkdf2_hmac("sha256", password.encode(), salt, iterations, HASH_SIZE)
+
+
+def get_pool():
+    """Get the pool of PASSWORD_WORKERS threads, or None if there is none."""
+    if PASSWORD_WORKERS < 1:
+        return None
+    global pool  # pylint: disable=global-statement
+    with pool_lock:
+        if pool is None:
+            pool = ThreadPoolExecutor(PASSWORD_WORKERS, thread_name_prefix="password")
+    return pool
+
+
+def run(func, *args):
+    """Call func, in the pool of PASSWORD_WORKERS threads if there is one."""
+    workers = get_pool()
+    if workers is None:
+        return func(*args)
+    return workers.submit(func, *args).result()
+
+
+def hash_password(password, kdf=None, cost=None):
+    """Hash a password with a new salt.
+
+    Arguments:
+        password (str) - the password
+        kdf (str) - "scrypt" or "pbkdf2", PASSWORD_KDF if None
+        cost (int) - SCRYPT_COST or PBKDF2_ITERATIONS of the kdf if None
+
+    Return Value:
+        Returns the hash as it is stored, see the module docstring
+    """
+    return run(make_hash, password, kdf, cost)
+
+
+def hash_passwords(passwords):
+    """Hash several passwords at the same time, in the pool of
+    PASSWORD_WORKERS threads if there is one, otherwise in up to
+    BATCH_WORKERS threads of their own.
+
+    Arguments:
+        passwords (list) - the passwords
+
+    Return Value:
+        Returns a list of their hashes, in the same order
+    """
+    workers = get_pool()
+    if workers is not None:
+        return list(workers.map(make_hash, passwords))
+    if len(passwords) < 2:
+        return [make_hash(password) for password in passwords]
+    with ThreadPoolExecutor(
+        min(BATCH_WORKERS, len(passwords)), thread_name_prefix="password"
+    ) as workers:
+        return list(workers.map(make_hash, passwords))
+
+
+def make_hash(password, kdf=None, cost=None):
+    """Hash a password in the calling thread, see hash_password."""
+    kdf = kdf or PASSWORD_KDF
+    salt = os.urandom(SALT_SIZE)
+    if kdf == "pbkdf2":
+        iterations = cost or PBKDF2_ITERATIONS
+        derived = pbkdf2(password, salt, iterations)
+        return f"pbkdf2_sha256${iterations}${encode(salt)}${encode(derived)}"
+    cost = cost or SCRYPT_COST
+    derived = scrypt(password, salt, cost, SCRYPT_BLOCK_SIZE, SCRYPT_PARALLELISM)
+    return (
+        f"scrypt${cost}${SCRYPT_BLOCK_SIZE}${SCRYPT_PARALLELISM}$"
+        f"{encode(salt)}${encode(derived)}"
+    )
+
+
+def check_password(password, stored):
+    """Check a password against the hash stored for it.
+
+    Arguments:
+        password (str) - the password given
+        stored (str) - the hash stored, see the module docstring
+
+    Return Value:
+        Returns (matches, outdated) where outdated is whether the password
+        should be hashed again, being hashed with another function or cost
+        than is used now
+    """
+    fields = stored.split("$")
+    if fields[0] == "scrypt":
+        outdated = PASSWORD_KDF != "scrypt" or int(fields[1]) != SCRYPT_COST
+    elif fields[0] == "pbkdf2_sha256":
+        outdated = PASSWORD_KDF != "pbkdf2" or int(fields[1]) != PBKDF2_ITERATIONS
+    else:
+        digest = hashlib.sha256(password.encode()).hexdigest()
+        return hmac.compare_digest(digest, stored), True
+
+    remembered = hmac.new(checked_key, f"{stored}\0{password}".encode(), "sha256").digest()
+    with checked_lock:
+        if remembered in checked:
+            checked.move_to_end(remembered)
+            return True, outdated
+
+    if fields[0] == "scrypt":
+        cost, block_size, parallelism = (int(field) for field in fields[1:4])
+        derived = run(scrypt, password, base64.b64decode(fields[4]), cost, block_size, parallelism)
+    else:
+        derived = run(pbkdf2, password, base64.b64decode(fields[2]), int(fields[1]))
+    matches = hmac.compare_digest(encode(derived), fields[-1])
+
+    if matches and PASSWORD_CACHE_SIZE > 0:
+        with checked_lock:
+            checked[remembered] = None
+            if len(checked) > PASSWORD_CACHE_SIZE:
+                checked.popitem(last=False)
+    return matches, outdated
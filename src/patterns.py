@@ -0,0 +1,315 @@
+"""Regular expression and phrase queries for searching messages.
+
+Besides finding messages which contain a query as it is, search can find
+those matching a regular expression, or containing a phrase, the words of
+the query as whole words separated by any whitespace, which is searched for
+as a regular expression too.
+
+Running a regular expression over every message would be slow, so the
+strings every match has to contain are read off the pattern itself, e.g.
+"TICKET-" and "-open" from r"TICKET-\\d+-open". Only the messages the
+index of messages finds containing all of them, see src/message_index.py,
+are then matched against the whole pattern. A pattern without any such
+strings, e.g. r"\\d{5}", has to be matched against every message.
+
+Some patterns take exponentially long to fail to match, e.g. r"(a+)+b",
+and Python cannot interrupt a match once it has started. Matching is
+therefore done by worker processes, started when first needed and kept for
+the searches after, one of which is killed if it takes longer than
+SEARCH_TIME_LIMIT seconds.
+
+    Typical usage example:
+
+    literals, pattern = compile_query(r"ERR-\\d{3}", "regex")
+    found = run_with_time_limit(SEARCH_TIME_LIMIT, pattern_matches, pattern, texts)
+"""
+import atexit
+import os
+import pickle
+import re
+import select
+import subprocess
+import sys
+import threading
+
+from src.error import InputError
+
+MODES = ("substring", "phrase", "regex")
+# Most seconds a search may spend matching a pattern against messages
+SEARCH_TIME_LIMIT = float(os.environ.get("STREAMS_SEARCH_TIME_LIMIT", 2))
+# Most worker processes kept waiting for the next search
+IDLE_WORKERS = 4
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# A {m,n} repeat, a pattern with any other { is matched against every message
+REPEAT = re.compile(r"\{(\d*)(?:,\d*)?\}")
+
+idle_workers = []
+idle_lock = threading.Lock()
+
+
+def compile_query(query_str, mode):
+    """Work out how to search for a query.
+
+    Arguments:
+        query_str (str) - query as it was given
+        mode (str) - "substring", "phrase" or "regex", see the module docstring
+
+    Exceptions:
+        InputError - Occurs when:
+            - mode is not one of MODES
+            - query_str is not a valid regular expression in regex mode
+            - query_str has no words in phrase mode
+
+    Return Value:
+        Returns (literals, pattern) where literals are the strings every
+        matching message contains and pattern is the compiled pattern they
+        must match, or None if containing the literals is enough
+    """
+    if mode not in MODES:
+        raise InputError("mode not valid")
+    if mode == "substring":
+        return [query_str], None
+    if mode == "phrase":
+        words = query_str.split()
+        if not words:
+            raise InputError("query_str has no words")
+        query_str = r"(?<!\w)" + r"\s+".join(map(re.escape, words)) + r"(?!\w)"
+    try:
+        pattern = re.compile(query_str)
+    except (re.error, RecursionError, OverflowError) as error:
+        raise InputError(f"query_str is not a valid regular expression: {error}") from error
+    return required_literals(pattern), pattern
+
+
+def required_literals(pattern):
+    """Get strings every match of a compiled pattern contains.
+
+    Only runs of plain characters outside of groups and character classes
+    are found, and nothing at all when the pattern has alternatives outside
+    of groups or anything else not understood here, in which case every
+    message is matched against the pattern.
+
+    Arguments:
+        pattern (re.Pattern) - pattern of str
+
+    Return Value:
+        Returns a list of strings
+    """
+    if pattern.flags & (re.IGNORECASE | re.VERBOSE) or not isinstance(pattern.pattern, str):
+        return []
+    text = pattern.pattern
+    literals = [""]
+    position = 0
+    while position < len(text):
+        char = text[position]
+        literal = None
+        if char == "\\":
+            escaped = text[position + 1 : position + 2]
+            # \d, \b, \1 and the like are not plain characters
+            literal = None if escaped.isalnum() or not escaped else escaped
+            position += 2
+        elif char == "[":
+            position = class_end(text, position)
+        elif char == "(":
+            position = group_end(text, position)
+        elif char == "|":
+            return []
+        elif char in "*?+{":
+            if char == "{":
+                repeat = REPEAT.match(text, position)
+                if repeat is None:
+                    return []
+                least = int(repeat.group(1) or 0)
+                position = repeat.end()
+            else:
+                least = int(char == "+")
+                position += 1
+            # a lazy or possessive repeat is still repeated as often
+            if text[position : position + 1] in ("?", "+"):
+                position += 1
+            if not least:
+                literals[-1] = literals[-1][:-1]
+            literals.append("")
+            continue
+        elif char in ".^$":
+            position += 1
+        else:
+            literal = char
+            position += 1
+        if literal is None:
+            literals.append("")
+        else:
+            literals[-1] += literal
+    return [literal for literal in literals if literal]
+
+
+def class_end(text, position):
+    """Get the position after the character class starting at position."""
+    position += 1
+    if text[position : position + 1] == "^":
+        position += 1
+    # a ] straight after the [ is one of the characters
+    if text[position : position + 1] == "]":
+        position += 1
+    while position < len(text) and text[position] != "]":
+        position += 2 if text[position] == "\\" else 1
+    return position + 1
+
+
+def group_end(text, position):
+    """Get the position after the group starting at position."""
+    depth = 0
+    while position < len(text):
+        char = text[position]
+        if char == "\\":
+            position += 2
+            continue
+        if char == "[":
+            position = class_end(text, position)
+            continue
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+            if not depth:
+                return position + 1
+        position += 1
+    return position
+
+
+def pattern_matches(pattern, texts, count=False):
+    """Find which texts a pattern matches.
+
+    Arguments:
+        pattern (re.Pattern) - compiled pattern
+        texts (list) - texts to match
+        count (bool) - whether to count the matches in each text
+
+    Return Value:
+        Returns a list of (position, matches) of the texts it matches, where
+        matches is 1 unless counted
+    """
+    found = []
+    for position, text in enumerate(texts):
+        if count:
+            matches = sum(1 for _ in pattern.finditer(text))
+            if matches:
+                found.append((position, matches))
+        elif pattern.search(text) is not None:
+            found.append((position, 1))
+    return found
+
+
+def run_with_time_limit(limit, func, *args):
+    """Call a function in a worker process, giving up after a time limit.
+
+    Arguments:
+        limit (float) - most seconds to wait for it
+        func (function) - function of a module to call, see PatternWorker
+        args (any) - arguments to call it with
+
+    Exceptions:
+        InputError - Occurs when:
+            - the function took longer than limit
+            - the function raised an exception
+
+    Return Value:
+        Returns what the function returned
+    """
+    with idle_lock:
+        worker = idle_workers.pop() if idle_workers else None
+    if worker is None:
+        worker = PatternWorker()
+    try:
+        failed, result = worker.call(limit, func, args)
+    except TimeoutError as error:
+        worker.close()
+        raise InputError("query_str took too long to search for") from error
+    except (OSError, EOFError, pickle.PickleError) as error:
+        worker.close()
+        raise InputError("query_str could not be searched for") from error
+    with idle_lock:
+        if len(idle_workers) < IDLE_WORKERS:
+            idle_workers.append(worker)
+            worker = None
+    if worker is not None:
+        worker.close()
+    if failed:
+        raise InputError(f"query_str could not be searched for: {result}")
+    return result
+
+
+def close_workers():
+    """Stop the worker processes waiting for a search."""
+    with idle_lock:
+        workers = idle_workers[:]
+        idle_workers.clear()
+    for worker in workers:
+        worker.close()
+
+
+class PatternWorker:
+    """Process which calls the functions run_with_time_limit is given.
+
+    The process is started afresh rather than forked, so it does not take
+    on the locks or the store of the server, and is given each call and
+    sends back its result pickled, see serve.
+    """
+
+    def __init__(self):
+        # kept for the searches after, until close
+        # pylint: disable-next=consider-using-with
+        self.process = subprocess.Popen(
+            [sys.executable, "-c", "from src.patterns import serve; serve()"],
+            cwd=ROOT,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+        )
+
+    def call(self, limit, func, args):
+        """Call a function in the process.
+
+        Exceptions:
+            TimeoutError - Occurs when the function took longer than limit
+            EOFError - Occurs when the process stopped
+
+        Return Value:
+            Returns (failed, result) where result is what the function
+            returned, or the message of the exception it raised if failed
+        """
+        pickle.dump((func, args), self.process.stdin)
+        self.process.stdin.flush()
+        ready, _, _ = select.select([self.process.stdout], [], [], limit)
+        if not ready:
+            raise TimeoutError
+        return pickle.load(self.process.stdout)
+
+    def close(self):
+        """Stop the process."""
+        self.process.kill()
+        self.process.wait()
+        self.process.stdin.close()
+        self.process.stdout.close()
+
+
+def serve():
+    """Answer the calls of a PatternWorker, until it stops sending them."""
+    calls = sys.stdin.buffer
+    # nothing the functions print gets in the way of the results
+    results = os.fdopen(os.dup(sys.stdout.fileno()), "wb")
+    sys.stdout = sys.stderr
+    while True:
+        try:
+            func, args = pickle.load(calls)
+        except EOFError:
+            return
+        try:
+            result = (False, func(*args))
+        except Exception as error:  # pylint: disable=broad-except
+            result = (True, str(error))
+        pickle.dump(result, results)
+        results.flush()
+
+
+atexit.register(close_workers)
@@ -0,0 +1,911 @@
+"""Containers of the datastore which report every change made to them.
+
+The store is made of Records and TrackedLists, which behave like the dicts
+and lists they replace but pass every change made to them on to the observer
+of the Store they belong to, see src/data_store.py. Lists of records are
+IndexedLists, which also index their records by the fields in INDEXED_LISTS,
+and the messages of a channel or dm are kept oldest first in a MessageList.
+Capture takes a copy on write view of the whole store for snapshots.
+
+These are kept apart from the Datastore so the backends, which build stores
+of their own, can use them without importing the datastore, which is opened
+as soon as src/data_store.py is imported.
+
+    Typical usage example:
+
+    store = build_store(plain_store)
+    store.observer = lambda change, container, removed: print(change)
+    store["users"].append(user)
+"""
+from copy import deepcopy
+from itertools import count
+from threading import RLock
+
+# Lists in the store that hold records, keyed by the name they are stored
+# under, and the fields each one is indexed by. The first field identifies a
+# record within its list.
+INDEXED_LISTS = {
+    "users": ("u_id", "email", "handle_str"),
+    "removed_users": ("u_id",),
+    "channels": ("channel_id",),
+    "dms": ("dm_id",),
+    "messages": ("message_id",),
+    "reacts": ("react_id",),
+    "standups": ("channel_id",),
+    "all_notifications": ("u_id",),
+}
+# Lists whose indexes are shared by every list stored under the same name so
+# that a message can be found from its id without knowing its channel or dm
+SHARED_INDEXES = ("messages",)
+# Lists of u_ids which are checked for a user far more often than changed,
+# e.g. the users who reacted with a react, see MemberList
+MEMBER_LISTS = ("u_ids",)
+
+# Held while the store is being changed so that changes reach the backend in
+# the order they were made
+changes_lock = RLock()
+# Capture of the store in progress, if a snapshot is being taken
+capturing = None
+
+
+def track(value, owner=None, key=None):
+    """Convert a value into containers which report every change made to them.
+
+    Dictionaries become Records and lists become TrackedLists, or IndexedLists
+    if they are stored under a name in INDEXED_LISTS, all the way down, with
+    MessageLists for messages. A tracked container which does not belong to
+    another container is adopted as it is, otherwise it is copied. The
+    messages of a channel or dm are kept by the backend instead if the store
+    has a history factory.
+
+    Arguments:
+        value (any) - value being put into the store
+        owner (Container) - container the value is put into
+        key (str) - field the value is stored under if owner is a Record
+
+    Return Value:
+        Returns the value as it should be stored
+    """
+    if isinstance(value, Container):
+        if value.owner is None:
+            value.owner, value.key = owner, key
+            attach_shared(value)
+            return value
+        if value.owner is owner and value.key == key:
+            return value
+        value = deepcopy(value)
+    if key == "messages" and isinstance(value, (dict, list)):
+        group_list = getattr(owner, "owner", None)
+        if getattr(group_list, "key", None) in ("channels", "dms"):
+            history = getattr(find_root(owner), "history", None)
+            if history is not None:
+                return history(owner, key, value)
+    if isinstance(value, dict):
+        record = Record()
+        record.owner, record.key = owner, key
+        for field, item in value.items():
+            dict.__setitem__(record, field, track(item, record, field))
+        return record
+    if isinstance(value, list):
+        if key == "messages":
+            return MessageList(owner, key, value)
+        if key in MEMBER_LISTS:
+            container = MemberList(owner, key)
+        elif key in INDEXED_LISTS:
+            container = IndexedList(owner, key)
+        else:
+            container = TrackedList(owner, key)
+        list.extend(container, [container.adopt(item) for item in value])
+        return container
+    return value
+
+
+def release(value):
+    """Detach a container which has been taken out of the store."""
+    if isinstance(value, Container):
+        value.owner = None
+        detach_shared(value)
+
+
+def shared_lists(container):
+    """Yield every IndexedList with shared indexes found inside container."""
+    if isinstance(container, Record):
+        for value in container.values():
+            # a history kept by the backend holds its messages, if they are
+            # in memory, in a list of its own
+            value = getattr(value, "loaded", value)
+            if isinstance(value, (Record, IndexMethods)):
+                yield from shared_lists(value)
+    elif isinstance(container, IndexMethods):
+        if container.key in SHARED_INDEXES:
+            yield container
+        for record in container:
+            yield from shared_lists(record)
+
+
+def attach_shared(container):
+    """Add the records of lists inside container to their shared indexes."""
+    for indexed in shared_lists(container):
+        indexed.indexes = indexed.new_indexes()
+        for record in indexed:
+            indexed.index_record(record)
+
+
+def detach_shared(container):
+    """Take the records of lists inside container out of shared indexes."""
+    for indexed in shared_lists(container):
+        for record in indexed:
+            indexed.unindex_record(record)
+        indexed.indexes = {field: {} for field in indexed.indexes}
+        for record in indexed:
+            indexed.index_record(record)
+
+
+def find_root(container):
+    """Get the outermost container which container is part of."""
+    while container.owner is not None:
+        container = container.owner
+    return container
+
+
+def outer(container, path, depth):
+    """Get the container depth segments along path from a changed container."""
+    for _ in range(len(path) - depth):
+        container = container.owner
+    return container
+
+
+def locate(container):
+    """Find the store a container belongs to and the path to it from there.
+
+    Records in a list with an id_key, such as an IndexedList, are found by
+    their id, everything else by the field or position it is stored at.
+
+    Return Value:
+        Returns (root, path) where root is the outermost container
+    """
+    path = []
+    while container.owner is not None:
+        owner = container.owner
+        id_key = getattr(owner, "id_key", None)
+        if id_key is not None:
+            path.append(container[id_key])
+        elif isinstance(owner, list):
+            path.append(next(i for i, item in enumerate(owner) if item is container))
+        else:
+            path.append(container.key)
+        container = owner
+    path.reverse()
+    return container, path
+
+
+def report(root, change, container, removed=()):
+    """Pass a change on to the observer of the store it was made in.
+
+    Arguments:
+        root (Container) - outermost container of the changed one
+        change (list) - json encodable description of the change
+        container (Container) - container the change was made in
+        removed (any) - items a splice removed or the value a set replaced
+    """
+    if isinstance(root, Store) and root.observer is not None:
+        root.observer(change, container, removed)
+
+
+def preserve(container):
+    """Save what a container holds for the capture in progress, if there is
+    one, before the container is changed for the first time since it began."""
+    capture = capturing
+    if capture is not None and container.epoch != capture.epoch:
+        capture.preserve(container)
+
+
+def current_epoch():
+    """Get the epoch of the capture in progress or 0 if there is none."""
+    capture = capturing
+    return 0 if capture is None else capture.epoch
+
+
+class Container:
+    """Base of the values in the store which know where they are kept."""
+
+    __slots__ = ()
+
+
+class Record(Container, dict):
+    """Dictionary inside the store which reports every change made to it.
+
+    A Record stored in an IndexedList also keeps that list's indexes up to
+    date when one of its indexed fields changes, e.g. a user's email.
+    """
+
+    __slots__ = ("owner", "key", "epoch")
+
+    def __init__(self):
+        super().__init__()
+        self.owner = None
+        self.key = None
+        self.epoch = current_epoch()
+
+    def __setitem__(self, field, value):
+        with changes_lock:
+            root, path = locate(self)
+            preserve(self)
+            value = track(value, self, field)
+            old = self.get(field)
+            owner = self.owner
+            reindex = isinstance(owner, IndexMethods) and field in owner.indexes
+            if reindex:
+                owner.unindex_record(self)
+            super().__setitem__(field, value)
+            if reindex:
+                owner.index_record(self)
+            if old is not value:
+                release(old)
+            report(root, ["set", path, field, value], self, old)
+
+    def __delitem__(self, field):
+        with changes_lock:
+            root, path = locate(self)
+            old = self[field]
+            preserve(self)
+            owner = self.owner
+            reindex = isinstance(owner, IndexMethods) and field in owner.indexes
+            if reindex:
+                owner.unindex_record(self)
+            super().__delitem__(field)
+            if reindex:
+                owner.index_record(self)
+            release(old)
+            report(root, ["del", path, field], self, old)
+
+    def pop(self, field, *default):
+        with changes_lock:
+            if field not in self:
+                return super().pop(field, *default)
+            value = self[field]
+            del self[field]
+            return value
+
+    def popitem(self):
+        with changes_lock:
+            field = next(reversed(self))
+            return field, self.pop(field)
+
+    def setdefault(self, field, default=None):
+        with changes_lock:
+            if field not in self:
+                self[field] = default
+            return self[field]
+
+    def update(self, *args, **kwargs):
+        for field, value in dict(*args, **kwargs).items():
+            self[field] = value
+
+    def clear(self):
+        for field in list(self):
+            del self[field]
+
+    def __deepcopy__(self, memo):
+        return {field: deepcopy(value, memo) for field, value in self.items()}
+
+    def __reduce__(self):
+        return dict, (dict(self),)
+
+
+class Store(Record):
+    """Outermost Record of the datastore which passes changes to an observer.
+
+    Also holds the indexes which are shared between lists, see SHARED_INDEXES,
+    and the backend's factory for message histories if it keeps them itself.
+    """
+
+    __slots__ = ("observer", "shared", "history")
+
+    def __init__(self):
+        super().__init__()
+        self.observer = None
+        self.shared = {}
+        self.history = None
+
+
+def build_store(value, history=None):
+    """Make a Store out of a plain dictionary of lists.
+
+    Arguments:
+        value (dict) - plain store
+        history (callable) - called with (group, key, value) to make the container
+            for the messages of a channel or dm, see Backend.history
+    """
+    store = Store()
+    store.history = history
+    for field, item in value.items():
+        dict.__setitem__(store, field, track(item, store, field))
+    return store
+
+
+class ListMethods(Container):
+    """List methods written in terms of splice, len, index and indexing.
+
+    Every way of changing the list is turned into a single splice, replacing
+    a range of items with new ones, which is what gets reported.
+    """
+
+    __slots__ = ()
+
+    # index comes from list or from the class the methods are used by
+    # pylint: disable=no-member
+
+    # Every method below works out positions from the list before splicing,
+    # so each holds changes_lock throughout to keep another thread's change
+    # from moving the items in between.
+
+    def splice(self, start, stop, items):
+        """Replace the items from start up to stop with items.
+
+        Arguments:
+            start (int) - position of the first item replaced
+            stop (int) - position after the last item replaced
+            items (list) - items put in their place
+        """
+        raise NotImplementedError
+
+    def _position(self, position):
+        if not -len(self) <= position < len(self):
+            raise IndexError("list index out of range")
+        return position % len(self)
+
+    def append(self, item):
+        with changes_lock:
+            self.splice(len(self), len(self), [item])
+
+    def extend(self, items):
+        items = list(items)
+        with changes_lock:
+            self.splice(len(self), len(self), items)
+
+    def __iadd__(self, items):
+        self.extend(items)
+        return self
+
+    def __imul__(self, times):
+        with changes_lock:
+            self.splice(0, len(self), list(self) * times)
+        return self
+
+    def insert(self, position, item):
+        with changes_lock:
+            if position < 0:
+                position = max(len(self) + position, 0)
+            position = min(position, len(self))
+            self.splice(position, position, [item])
+
+    def remove(self, item):
+        with changes_lock:
+            position = self.index(item)
+            self.splice(position, position + 1, [])
+
+    def pop(self, position=-1):
+        with changes_lock:
+            position = self._position(position)
+            item = self[position]
+            self.splice(position, position + 1, [])
+            return item
+
+    def clear(self):
+        with changes_lock:
+            self.splice(0, len(self), [])
+
+    def next_to(self, item, limit, after=True):
+        """Get up to limit items next to an item of the list.
+
+        Arguments:
+            item (dictionary) - item of the list the items are next to
+            limit (int) - most items to get
+            after (bool) - whether to get the items after item or before it
+
+        Exceptions:
+            ValueError - Occurs when item is not in the list
+
+        Return Value:
+            Returns (items, has_more), the items in the order of the list and
+            whether there are more past them
+        """
+        with changes_lock:
+            position = self.index(item)
+            if after:
+                stop = position + 1 + limit
+                return self[position + 1 : stop], len(self) > stop
+            start = max(position - limit, 0)
+            return self[start:position], start > 0
+
+    def __setitem__(self, position, value):
+        with changes_lock:
+            if not isinstance(position, slice):
+                position = self._position(position)
+                self.splice(position, position + 1, [value])
+                return
+            start, stop, step = position.indices(len(self))
+            if step == 1:
+                self.splice(start, max(start, stop), list(value))
+            else:
+                items = list(self)
+                items[position] = value
+                self.splice(0, len(self), items)
+
+    def __delitem__(self, position):
+        with changes_lock:
+            if not isinstance(position, slice):
+                position = self._position(position)
+                self.splice(position, position + 1, [])
+                return
+            start, stop, step = position.indices(len(self))
+            if step == 1:
+                self.splice(start, max(start, stop), [])
+            else:
+                items = list(self)
+                del items[position]
+                self.splice(0, len(self), items)
+
+    def sort(self, *, key=None, reverse=False):
+        with changes_lock:
+            self.splice(0, len(self), sorted(self, key=key, reverse=reverse))
+
+    def reverse(self):
+        with changes_lock:
+            self.splice(0, len(self), list(self)[::-1])
+
+    def __deepcopy__(self, memo):
+        return [deepcopy(item, memo) for item in self]
+
+    def __reduce__(self):
+        return list, (list(self),)
+
+
+class TrackedList(ListMethods, list):
+    """List inside the store which reports every change made to it."""
+
+    __slots__ = ("owner", "key", "epoch")
+
+    def __init__(self, owner=None, key=None):
+        super().__init__()
+        self.owner = owner
+        self.key = key
+        self.epoch = current_epoch()
+
+    def adopt(self, item):
+        """Prepare an item which is being put into the list."""
+        return track(item, self)
+
+    def release_item(self, item):
+        """Clean up after an item which has been taken out of the list."""
+        release(item)
+
+    def splice(self, start, stop, items):
+        with changes_lock:
+            root, path = locate(self)
+            preserve(self)
+            items = [self.adopt(item) for item in items]
+            removed = list.__getitem__(self, slice(start, stop))
+            list.__setitem__(self, slice(start, stop), items)
+            kept = {id(item) for item in items}
+            for item in removed:
+                if id(item) not in kept:
+                    self.release_item(item)
+            report(root, ["splice", path, start, stop, items], self, removed)
+
+
+class MemberList(TrackedList):
+    """TrackedList of u_ids which also counts how many times each is in it,
+    so checking whether a user is in it does not search the list."""
+
+    __slots__ = ("counts",)
+
+    def __init__(self, owner=None, key=None):
+        super().__init__(owner, key)
+        self.counts = {}
+
+    def adopt(self, item):
+        item = super().adopt(item)
+        try:
+            self.counts[item] = self.counts.get(item, 0) + 1
+        except TypeError:
+            pass
+        return item
+
+    def splice(self, start, stop, items):
+        with changes_lock:
+            removed = list.__getitem__(self, slice(start, stop))
+            super().splice(start, stop, items)
+            for item in removed:
+                try:
+                    left = self.counts.pop(item) - 1
+                except (KeyError, TypeError):
+                    continue
+                if left:
+                    self.counts[item] = left
+
+    def __contains__(self, item):
+        try:
+            return item in self.counts
+        except TypeError:
+            return list.__contains__(self, item)
+
+
+class IndexMethods:
+    """Methods keeping a dictionary per key field of a list of records to
+    each record, shared by IndexedList and MessageList.
+
+    The fields a list is indexed by depend on the name it is stored under, see
+    INDEXED_LISTS, so lookups by id are O(1) while callers keep treating it as
+    a plain list.
+    """
+
+    __slots__ = ()
+
+    # key and indexes belong to the lists the methods are used by
+    # pylint: disable=no-member
+
+    def new_indexes(self):
+        """Get the indexes this list should use, shared ones if it has them."""
+        fields = INDEXED_LISTS[self.key]
+        root = find_root(self)
+        if self.key in SHARED_INDEXES and isinstance(root, Store):
+            return root.shared.setdefault(self.key, {field: {} for field in fields})
+        return {field: {} for field in fields}
+
+    def find(self, field, value, default=None):
+        """Get the record whose field is equal to value.
+
+        Arguments:
+            field (str) - indexed field to search by
+            value (any) - value of the field
+            default (any) - value to return if no record matches
+
+        Return Value:
+            Returns the matching record or default
+        """
+        try:
+            return self.indexes[field].get(value, default)
+        except TypeError:
+            # unhashable values can never match a stored field
+            return default
+
+    def index_record(self, record):
+        """Add record to the indexes."""
+        for field, index in self.indexes.items():
+            if field in record:
+                index[record[field]] = record
+
+    def unindex_record(self, record):
+        """Remove record from the indexes."""
+        for field, index in self.indexes.items():
+            if field in record and index.get(record[field]) is record:
+                del index[record[field]]
+
+    def adopt(self, item):
+        record = track(item, self)
+        if isinstance(record, Record):
+            self.index_record(record)
+        return record
+
+    def release_item(self, item):
+        if isinstance(item, Record):
+            self.unindex_record(item)
+        release(item)
+
+
+class IndexedList(IndexMethods, TrackedList):
+    """List of records which keeps a dictionary per key field to each record,
+    see IndexMethods."""
+
+    __slots__ = ("indexes", "id_key")
+
+    def __init__(self, owner=None, key=None):
+        super().__init__(owner, key)
+        self.id_key = INDEXED_LISTS[key][0]
+        self.indexes = self.new_indexes()
+
+
+class MessageList(IndexMethods, ListMethods):
+    """Messages of a channel or dm, newest first, indexed like an IndexedList.
+
+    Messages are sent far more often than anything else changes the list, and
+    each one goes in front of the others, which would move every message of
+    a plain list along. The messages are kept oldest first instead, so that
+    sending one appends it. Removing a message leaves a gap rather than
+    moving the messages after it, and the list is closed up once there are
+    more gaps than messages.
+
+    While there are gaps, positions are found through a Fenwick tree of which
+    slots hold a message, so reading a message or page at a position and
+    finding the position of a message are O(log n) rather than O(n).
+    """
+
+    __slots__ = ("owner", "key", "epoch", "indexes", "id_key", "slots", "where", "live", "tree")
+
+    def __init__(self, owner=None, key=None, items=()):
+        self.owner = owner
+        self.key = key
+        self.epoch = current_epoch()
+        self.id_key = INDEXED_LISTS[key][0]
+        self.indexes = self.new_indexes()
+        self.__fill([self.adopt(item) for item in reversed(items)])
+
+    def __fill(self, slots):
+        """Hold some records, oldest first, and no gaps."""
+        # records, oldest first, with None where one was removed
+        self.slots = slots
+        # id_key of each record to its slot
+        self.where = {}
+        for slot, record in enumerate(slots):
+            self.__locate(record, slot)
+        self.live = len(slots)
+        # Fenwick tree over slots, None while there are no gaps
+        self.tree = None
+
+    def __locate(self, record, slot):
+        if isinstance(record, dict):
+            try:
+                self.where[record.get(self.id_key)] = slot
+            except TypeError:
+                pass
+
+    def __count_before(self, slot):
+        """Get the number of records in slots before slot."""
+        tree = self.tree
+        if tree is None:
+            return slot
+        total = 0
+        while slot > 0:
+            total += tree[slot - 1]
+            slot -= slot & -slot
+        return total
+
+    def __slot(self, rank):
+        """Get the slot of the record with rank records before it."""
+        tree = self.tree
+        if tree is None:
+            return rank
+        slot = 0
+        step = 1 << (len(tree).bit_length() - 1)
+        while step:
+            if slot + step <= len(tree) and tree[slot + step - 1] <= rank:
+                slot += step
+                rank -= tree[slot - 1]
+            step >>= 1
+        return slot
+
+    def __build_tree(self):
+        tree = [0 if record is None else 1 for record in self.slots]
+        for slot in range(1, len(tree) + 1):
+            parent = slot + (slot & -slot)
+            if parent <= len(tree):
+                tree[parent - 1] += tree[slot - 1]
+        self.tree = tree
+
+    def __append(self, record):
+        slot = len(self.slots)
+        self.slots.append(record)
+        self.__locate(record, slot)
+        self.live += 1
+        tree = self.tree
+        if tree is not None:
+            # slot + 1 covers the slots after slot + 1 - lowest bit
+            size = slot + 1
+            tree.append(1 + self.__count_before(slot) - self.__count_before(size - (size & -size)))
+
+    def __vacate(self, slot):
+        """Leave a gap where the record in slot was."""
+        record, self.slots[slot] = self.slots[slot], None
+        if isinstance(record, dict):
+            try:
+                if self.where.get(record.get(self.id_key)) == slot:
+                    del self.where[record.get(self.id_key)]
+            except TypeError:
+                pass
+        self.live -= 1
+        tree = self.tree
+        if tree is not None:
+            position = slot + 1
+            while position <= len(tree):
+                tree[position - 1] -= 1
+                position += position & -position
+        # the entries of a Fenwick tree only cover slots before them, so
+        # gaps at the end can be dropped from both
+        while self.slots and self.slots[-1] is None:
+            self.slots.pop()
+            if tree is not None:
+                tree.pop()
+        if self.live == len(self.slots):
+            self.tree = None
+        elif len(self.slots) - self.live > self.live:
+            self.__fill([record for record in self.slots if record is not None])
+        elif tree is None:
+            # only a gap left among the records needs the tree
+            self.__build_tree()
+
+    def _slot_at(self, position):
+        """Get the slot of the record at a position, newest first."""
+        return self.__slot(self.live - 1 - self._position(position))
+
+    def __len__(self):
+        return self.live
+
+    def __bool__(self):
+        return self.live > 0
+
+    def __getitem__(self, position):
+        if not isinstance(position, slice):
+            return self.slots[self._slot_at(position)]
+        start, stop, step = position.indices(self.live)
+        if step != 1:
+            return list(self)[position]
+        if start >= stop:
+            return []
+        if self.tree is None:
+            page = self.slots[self.live - stop : self.live - start]
+            page.reverse()
+            return page
+        page = self.slots[self._slot_at(stop - 1) : self._slot_at(start) + 1]
+        page.reverse()
+        return [record for record in page if record is not None]
+
+    def __iter__(self):
+        for record in reversed(self.slots):
+            if record is not None:
+                yield record
+
+    def __reversed__(self):
+        for record in list(self.slots):
+            if record is not None:
+                yield record
+
+    def __contains__(self, item):
+        try:
+            self.index(item)
+        except ValueError:
+            return False
+        return True
+
+    def index(self, item):
+        slot = None
+        if isinstance(item, dict):
+            try:
+                slot = self.where.get(item.get(self.id_key))
+            except TypeError:
+                slot = None
+        if slot is not None and (self.slots[slot] is item or self.slots[slot] == item):
+            return self.live - 1 - self.__count_before(slot)
+        for position, record in enumerate(self):
+            if record is item or record == item:
+                return position
+        raise ValueError("message is not in the list")
+
+    def copy(self):
+        return list(self)
+
+    def splice(self, start, stop, items):
+        with changes_lock:
+            root, path = locate(self)
+            preserve(self)
+            items = [self.adopt(item) for item in items]
+            removed = self[start:stop]
+            if start == stop == 0:
+                # newest messages, the way messages are sent
+                for record in reversed(items):
+                    self.__append(record)
+            elif stop == start + 1 and not items:
+                self.__vacate(self._slot_at(start))
+            else:
+                records = list(self)
+                records[start:stop] = items
+                records.reverse()
+                self.__fill(records)
+            kept = {id(item) for item in items}
+            for item in removed:
+                if id(item) not in kept:
+                    self.release_item(item)
+            report(root, ["splice", path, start, stop, items], self, removed)
+
+
+class Capture:
+    """Point in time view of the store, taken copy on write.
+
+    Starting a capture is cheap as nothing is copied straight away. Instead
+    the first change made to each container after the capture started saves a
+    shallow copy of what the container held beforehand, so the capture can
+    copy the store at its own pace while requests keep changing it.
+    """
+
+    __epochs = count(1)
+
+    def __init__(self, seq=0):
+        self.epoch = next(Capture.__epochs)
+        self.seq = seq
+        self.saved = {}
+
+    def preserve(self, container):
+        """Keep a shallow copy of a container which is about to change."""
+        container.epoch = self.epoch
+        self.saved[id(container)] = (container, shallow_copy(container))
+
+    def copy(self, value):
+        """Copy a value as it was when the capture started into plain dicts
+        and lists. Only holds changes_lock while copying each container."""
+        if not isinstance(value, Container):
+            return value
+        captured = getattr(value, "captured", None)
+        if captured is not None:
+            # containers which are not plain lists or dicts copy themselves
+            return captured(self)
+        with changes_lock:
+            if value.epoch == self.epoch and id(value) in self.saved:
+                _, items = self.saved.pop(id(value))
+            else:
+                value.epoch = self.epoch
+                items = shallow_copy(value)
+        if isinstance(items, dict):
+            return {field: self.copy(item) for field, item in items.items()}
+        return [self.copy(item) for item in items]
+
+
+def shallow_copy(container):
+    """Get a plain dict or list holding the same items as a container."""
+    if isinstance(container, dict):
+        return dict.copy(container)
+    if isinstance(container, list):
+        return list.copy(container)
+    return list(container)
+
+
+def start_capture(seq=0):
+    """Start capturing the store, see Capture. Call with changes_lock held.
+
+    Arguments:
+        seq (int) - sequence number of the last change the capture includes
+    """
+    global capturing
+    capturing = Capture(seq)
+    return capturing
+
+
+def end_capture():
+    """Stop saving copies of containers for the capture in progress."""
+    global capturing
+    capturing = None
+
+
+def apply_change(store, change):
+    """Make a change read back from the journal to the store.
+
+    Arguments:
+        store (Store) - store to change
+        change (list) - change as it was reported by the store
+
+    Changes to records which are no longer in the store are skipped, which
+    happens when catching up with changes to messages kept in a database
+    that is already ahead of them.
+
+    Return Value:
+        Returns the store, which is replaced by a "reset" change
+    """
+    operation, path, *args = change
+    if operation == "reset":
+        return build_store(args[0], store.history)
+    target = store
+    for segment in path:
+        if getattr(target, "id_key", None) is not None:
+            target = target.find(target.id_key, segment)
+        else:
+            target = target[segment]
+        if target is None:
+            return store
+    if operation == "set":
+        target[args[0]] = args[1]
+    elif operation == "del":
+        del target[args[0]]
+    elif operation == "splice":
+        start, stop, items = args
+        target[start:stop] = items
+    return store
@@ -1,18 +1,29 @@
+import heapq
+
+from src import patterns, search_pool
 from src.auth import extract_token
 from src.error import AccessError, InputError
 from src.data_store import data_store
+from src.message import message_view
+
+# Most results search_v2 returns at a time
+MAX_LIMIT = 100
+ORDERS = ("recent", "relevance")
 
 
-def search_v1(token, query_str):
+def search_v1(token, query_str, mode="substring"):
     """Searches for strings in channels and dms the user is part of
 
     Arguments:
         token (str) - token including the id of a user
         query string (str) - a string to search for
+        mode (str) - "substring", "phrase" or "regex", see src/patterns.py
 
     Exceptions:
         InputErr when query string is less than 1 character or greater
-            than 1000 characters
+            than 1000 characters, mode is not valid, query string is not a
+            valid regular expression in regex mode or took too long to search
+            for
 
     Return Value:
         Returns {"messages": [{messages}]}
@@ -22,21 +33,161 @@ def search_v1(token, query_str):
         raise InputError("query_str len not valid")
 
     u_id = extract_token(token)["u_id"]
-    messages_ret = []
-    store = data_store.get()
-    channel_list = store["channels"]
-    dms_list = store["dms"]
-
-    for channel in channel_list:
-        if u_id in channel["all_members"]:
-            for messages in channel["messages"]:
-                if query_str in messages["message"]:
-                    messages_ret.append(messages)
-
-    for dms in dms_list:
-        if u_id in dms["members"]:
-            for dm_msg in dms["messages"]:
-                if query_str in dm_msg["message"]:
-                    messages_ret.append(dm_msg)
-
-    return {"messages": messages_ret}
+    groups = data_store.get_user_groups(u_id)
+    found = find_messages(query_str, mode, groups, ordered=True)
+    messages = data_store.get_messages([message_id for message_id, *_ in found])
+    return {"messages": [message_view(message, u_id) for message, _ in messages]}
+
+
+def search_v2(token, query_str, limit=50, cursor="", order="recent", mode="substring"):
+    """Searches for strings in channels and dms the user is part of, a page
+    of the best results at a time
+
+    With order "recent" the newest messages come first, with "relevance"
+    those containing query_str the most times do, newest first among those
+    containing it as many times. Only the page asked for is picked out of
+    the matching messages, without sorting the rest.
+
+    Arguments:
+        token (str) - token including the id of a user
+        query_str (str) - a string to search for
+        limit (int) - most messages to return
+        cursor (str) - next_cursor of the previous page, "" for the first
+        order (str) - "recent" or "relevance"
+        mode (str) - "substring", "phrase" or "regex", see src/patterns.py
+
+    Exceptions:
+        InputError when any of:
+            - query string is less than 1 character or greater than 1000
+              characters
+            - limit is less than 1 or greater than MAX_LIMIT
+            - order is not "recent" or "relevance"
+            - cursor did not come from a search in the same order
+            - mode is not valid
+            - query string is not a valid regular expression in regex mode
+            - query string took too long to search for
+
+    Return Value:
+        Returns {"messages": [{messages}], "next_cursor": str}, next_cursor
+        is "" once the last page has been returned
+    """
+
+    if len(query_str) < 1 or len(query_str) > 1000:
+        raise InputError("query_str len not valid")
+    if limit < 1 or limit > MAX_LIMIT:
+        raise InputError("limit not valid")
+    if order not in ORDERS:
+        raise InputError("order not valid")
+
+    # results are ordered by the smallest key first, see rank
+    size = 2 if order == "recent" else 3
+    after = None
+    if cursor:
+        try:
+            after = tuple(-int(value) for value in cursor.split("."))
+        except ValueError:
+            after = None
+        if after is None or len(after) != size:
+            raise InputError("cursor not valid")
+
+    u_id = extract_token(token)["u_id"]
+    groups = data_store.get_user_groups(u_id)
+    found = find_messages(query_str, mode, groups, count=order == "relevance")
+
+    def rank(match):
+        message_id, _, time_created, hits = match
+        if order == "recent":
+            return -time_created, -message_id
+        return -hits, -time_created, -message_id
+
+    keys = (rank(match) for match in found)
+    if after is not None:
+        keys = (key for key in keys if key > after)
+    candidates = list(keys)
+    while True:
+        page = heapq.nsmallest(limit + 1, candidates)
+        messages = [data_store.get_message(-key[-1]) for key in page[:limit]]
+        if None not in messages:
+            break
+        # removed since the index last noticed
+        missing = {key for key, message in zip(page, messages) if message is None}
+        candidates = [key for key in candidates if key not in missing]
+
+    next_cursor = ""
+    if len(page) > limit:
+        next_cursor = ".".join(str(-value) for value in page[limit - 1])
+    return {
+        "messages": [message_view(message, u_id) for message, _ in messages],
+        "next_cursor": next_cursor,
+    }
+
+
+def find_messages(query_str, mode, groups, ordered=False, count=False):
+    """Find the messages of some channels and dms matching a query.
+
+    Arguments:
+        query_str (str) - query as it was given
+        mode (str) - "substring", "phrase" or "regex", see src/patterns.py
+        groups (list) - (kind, group_id) of the channels and dms to search
+        ordered (bool) - whether to return the messages in the order of
+            groups, newest first within each
+        count (bool) - whether to count how many times each message matches
+
+    Exceptions:
+        InputError when mode is not valid, query_str is not a valid regular
+            expression in regex mode or took too long to search for
+
+    Return Value:
+        Returns a list of (message_id, text, time_created, hits), where hits
+        is 1 unless counted
+    """
+    literals, pattern = patterns.compile_query(query_str, mode)
+    found = data_store.match_messages(literals, groups, ordered)
+    if found is None:
+        # the index of messages is still being built or cannot narrow them down
+        found = scan_messages(literals, groups)
+
+    if pattern is None:
+        return [
+            (message_id, text, time_created, text.count(query_str) if count else 1)
+            for message_id, text, time_created in found
+        ]
+    if not found:
+        return []
+    # only the candidates containing every literal are matched against it
+    matches = patterns.run_with_time_limit(
+        patterns.SEARCH_TIME_LIMIT,
+        patterns.pattern_matches,
+        pattern,
+        [text for _, text, _ in found],
+        count,
+    )
+    return [(*found[position], hits) for position, hits in matches]
+
+
+def scan_messages(literals, groups):
+    """Find the messages of some channels and dms containing every one of
+    some strings by testing every one of them, across a pool of workers, see
+    src/search_pool.py.
+
+    Return Value:
+        Returns a list of (message_id, text, time_created) in the order of
+        groups, newest first within each
+    """
+    # the pool looks for the longest, the rest are tested after
+    query = max(literals, key=len, default="")
+    sources, sizes = data_store.get_message_sources(groups)
+    messages = []
+    for (kind, group_id), message_ids in zip(groups, search_pool.scan(sources, sizes, query)):
+        if message_ids is None:
+            # its segment was replaced while it was being read, read it again
+            (source,), _ = data_store.get_message_sources([(kind, group_id)])
+            message_ids = search_pool.scan_source(source, query)
+        for message_id in message_ids:
+            found = data_store.get_message(message_id)
+            if found is None:
+                continue
+            message = found[0]
+            if all(literal in message["message"] for literal in literals):
+                messages.append((message_id, message["message"], message["time_created"]))
+    return messages
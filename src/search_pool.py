@@ -0,0 +1,181 @@
+"""Scans the messages of channels and dms for a query across a pool of workers.
+
+Searches which cannot use the index of messages, see src/message_index.py,
+test every message the caller can see. The channels and dms are split into
+shards of about the same number of messages which are scanned at the same
+time by a concurrent.futures pool of SEARCH_WORKERS threads or, with
+SEARCH_POOL set to "process", processes. Results come back in the order of
+the channels and dms however the shards finish.
+
+So that a shard is cheap to hand to a process, where the messages of a
+channel or dm come from is described by a source rather than passed along:
+
+    ("texts", [(message_id, text), ...]) - messages which are in memory
+    ("segment", path) - a segment file of the json backend, see src/segments.py
+    ("sqlite", path, kind, group_id) - messages in the sqlite database
+
+Segment files are read and decoded by the worker itself, and the database is
+searched with instr() on a connection of the worker's own, which lets threads
+search it at the same time too. Messages in memory are scanned by the
+calling thread when the pool is of processes.
+
+    Typical usage example:
+
+    message_ids = scan([("segment", path), ("texts", texts)], [120, 3], "hello")
+"""
+import os
+import sqlite3
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import get_context
+
+from src.segments import SegmentFile, decode_records
+
+# Number of workers scanning messages at once, 1 scans in the calling thread
+SEARCH_WORKERS = int(os.environ.get("STREAMS_SEARCH_WORKERS", 1))
+# "thread" or "process"
+SEARCH_POOL = os.environ.get("STREAMS_SEARCH_POOL", "thread")
+# Shards per worker, more than one so that a worker which finishes early
+# takes on another rather than waiting for the slowest
+SHARDS_PER_WORKER = 4
+
+pools = {}
+pools_lock = threading.Lock()
+connections = threading.local()
+
+
+def get_pool(kind, workers):
+    """Get the pool of a kind with a number of workers, starting it if needed."""
+    with pools_lock:
+        pool = pools.get((kind, workers))
+        if pool is None:
+            if kind == "process":
+                # forked so the workers start without loading the store again
+                pool = ProcessPoolExecutor(workers, mp_context=get_context("fork"))
+            else:
+                pool = ThreadPoolExecutor(workers, thread_name_prefix="search")
+            pools[(kind, workers)] = pool
+        return pool
+
+
+def connect(path):
+    """Get this thread's read only connection to a database."""
+    # a connection inherited from the parent of a forked worker is not usable
+    key = (os.getpid(), path)
+    opened = getattr(connections, "opened", None)
+    if opened is None:
+        opened = connections.opened = {}
+    db = opened.get(key)
+    if db is None:
+        db = opened[key] = sqlite3.connect(f"file:{path}?mode=ro", uri=True, timeout=30)
+    return db
+
+
+def scan_source(source, query):
+    """Find the messages from a source containing query.
+
+    Arguments:
+        source (tuple) - where the messages are, see the module docstring
+        query (str) - text to find
+
+    Return Value:
+        Returns the message_ids, newest first
+    """
+    kind = source[0]
+    if kind == "texts":
+        return [message_id for message_id, text in source[1] if query in text]
+    if kind == "segment":
+        segment = SegmentFile(source[1])
+        try:
+            messages = decode_records(segment.read(0, segment.count))
+        finally:
+            segment.close()
+        return [
+            message["message_id"]
+            for message in messages
+            if isinstance(message.get("message"), str) and query in message["message"]
+        ]
+    if kind == "sqlite":
+        rows = connect(source[1]).execute(
+            "SELECT message_id FROM messages WHERE kind = ? AND group_id = ? "
+            "AND instr(message, ?) > 0 ORDER BY position",
+            (source[2], source[3], query),
+        )
+        return [message_id for (message_id,) in rows]
+    raise ValueError(f"unknown source {kind}")
+
+
+def scan_shard(shard, query):
+    """Scan each source of a shard, see scan_source.
+
+    Return Value:
+        Returns a list of the message_ids found in each source, or of None
+        where a source could not be read
+    """
+    found = []
+    for source in shard:
+        try:
+            found.append(scan_source(source, query))
+        except (OSError, ValueError, sqlite3.Error):
+            # e.g. a segment file replaced by a newer one since
+            found.append(None)
+    return found
+
+
+def split(sizes, shards):
+    """Split positions 0 to len(sizes) into at most shards runs of about
+    equal total size.
+
+    Return Value:
+        Returns a list of (start, stop)
+    """
+    total = sum(sizes)
+    runs = []
+    start = taken = 0
+    for position, size in enumerate(sizes):
+        taken += size
+        if taken * shards >= total * (len(runs) + 1) or position == len(sizes) - 1:
+            runs.append((start, position + 1))
+            start = position + 1
+    return runs
+
+
+def scan(sources, sizes, query, workers=None, pool=None):
+    """Find the messages from several sources containing query.
+
+    Arguments:
+        sources (list) - where the messages of each channel or dm are
+        sizes (list) - number of messages of each
+        query (str) - text to find
+        workers (int) - number of workers, SEARCH_WORKERS if None
+        pool (str) - "thread" or "process", SEARCH_POOL if None
+
+    Return Value:
+        Returns a list of the message_ids found in each source, newest first,
+        or None for those which could not be read
+    """
+    workers = SEARCH_WORKERS if workers is None else workers
+    pool = SEARCH_POOL if pool is None else pool
+    if workers <= 1 or len(sources) <= 1:
+        return scan_shard(sources, query)
+    found = [None] * len(sources)
+    # messages in memory would have to be copied to reach another process
+    local = [
+        position
+        for position, source in enumerate(sources)
+        if pool == "process" and source[0] == "texts"
+    ]
+    remote = sorted(set(range(len(sources))).difference(local))
+    executor = get_pool(pool, workers)
+    futures = []
+    for start, stop in split([sizes[i] for i in remote], workers * SHARDS_PER_WORKER):
+        positions = remote[start:stop]
+        futures.append(
+            (positions, executor.submit(scan_shard, [sources[i] for i in positions], query))
+        )
+    for position, result in zip(local, scan_shard([sources[i] for i in local], query)):
+        found[position] = result
+    for positions, future in futures:
+        for position, result in zip(positions, future.result()):
+            found[position] = result
+    return found
@@ -0,0 +1,533 @@
+"""Message histories of channels and dms kept in segment files on disk.
+
+With the json backend the messages of each channel and dm are not part of the
+snapshot itself. Instead each group's messages are written to a segment file
+of their own in MESSAGES_FOLDER and the snapshot only refers to it, so the
+server starts without reading any messages. A group's segment is read the
+first time its messages are needed and dropped from memory again once it has
+not been used for a while, least recently used first, whenever more than
+MESSAGE_CACHE_LIMIT messages are in memory. A group whose messages a request
+is changing is pinned in memory until it is done, see Segments.pinned, so the
+records it holds are never dropped from under it.
+
+Each segment file starts with a fixed width index of where each message
+starts, so a page of messages is read straight from the file, which is
+memory mapped, with one seek and without reading any other message. Slicing a
+history whose messages are not in memory does exactly that, which keeps
+paging back through old messages from loading whole histories.
+
+Segment files are never changed once written. A snapshot writes a new segment
+for every group whose messages changed since its last one and the old files
+are deleted once the snapshot which replaces them is safely on disk, so a
+crash always leaves the segments the latest snapshot refers to. Changes made
+since then are in the journal as usual.
+
+    Typical usage example:
+
+    segments = Segments()
+    store = build_store(plain_store, segments.history)
+    segments.start(store)
+"""
+import mmap
+import os
+import struct
+import time
+from array import array
+from collections import OrderedDict
+from contextlib import contextmanager
+from itertools import accumulate
+from json import dumps, loads
+from operator import attrgetter
+from threading import Lock
+
+from src.backend import write_atomically
+from src.records import INDEXED_LISTS, ListMethods, MessageList, changes_lock, outer, release
+
+MESSAGES_FOLDER = "datastore.messages"
+# Most messages kept in memory before the least recently used groups' are
+# dropped, set with STREAMS_MESSAGE_CACHE
+MESSAGE_CACHE_LIMIT = int(os.environ.get("STREAMS_MESSAGE_CACHE", 200000))
+# Seconds a group's messages must go unused before they can be dropped, so
+# the groups in use stay in memory
+EVICT_AFTER = 5
+# Most segment files kept memory mapped at once
+OPEN_SEGMENTS = 256
+
+# A segment file is SEGMENT_MAGIC, the number of messages n, n + 1 offsets of
+# where each message starts relative to the first, and then the messages,
+# newest first, each encoded as json followed by a comma
+SEGMENT_MAGIC = b"STRMSEG1"
+OFFSET = struct.Struct("<Q")
+HEADER_SIZE = len(SEGMENT_MAGIC) + OFFSET.size
+
+
+def encode_segment(messages):
+    """Encode a list of plain messages as a segment file."""
+    records = [dumps(message, separators=(",", ":")).encode() + b"," for message in messages]
+    offsets = list(accumulate(map(len, records), initial=0))
+    return b"".join(
+        [
+            SEGMENT_MAGIC,
+            OFFSET.pack(len(records)),
+            struct.pack(f"<{len(offsets)}Q", *offsets),
+            *records,
+        ]
+    )
+
+
+def decode_records(data):
+    """Decode a run of messages read from a segment file into a list."""
+    if not data:
+        return []
+    return loads(b"[" + data[:-1] + b"]")
+
+
+class SegmentFile:
+    """Segment file mapped into memory, see encode_segment."""
+
+    def __init__(self, path):
+        with open(path, "rb") as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[: len(SEGMENT_MAGIC)] != SEGMENT_MAGIC:
+            self.map.close()
+            raise ValueError(f"{path} is not a segment file")
+        self.count = OFFSET.unpack_from(self.map, len(SEGMENT_MAGIC))[0]
+        self.start = HEADER_SIZE + OFFSET.size * (self.count + 1)
+
+    def read(self, start, stop):
+        """Get the encoded messages from position start up to stop."""
+        start, stop = min(start, self.count), min(stop, self.count)
+        if start >= stop:
+            return b""
+        begin = OFFSET.unpack_from(self.map, HEADER_SIZE + OFFSET.size * start)[0]
+        end = OFFSET.unpack_from(self.map, HEADER_SIZE + OFFSET.size * stop)[0]
+        return self.map[self.start + begin : self.start + end]
+
+    def close(self):
+        self.map.close()
+
+
+class MessageDirectory:
+    """Which channel or dm each message was sent in, by message_id.
+
+    Kept as an array of small ints, one per message_id, so that messages which
+    are not in memory can still be found from their id without holding every
+    message_id in a dictionary.
+    """
+
+    def __init__(self, groups=(), slots=()):
+        self.groups = [tuple(group) for group in groups]
+        self.numbers = {group: number for number, group in enumerate(self.groups)}
+        self.slots = array("i", slots)
+
+    def add(self, message_id, group):
+        """Record that a message is in group, a (kind, group_id) tuple."""
+        if not isinstance(message_id, int) or message_id < 0:
+            return
+        number = self.numbers.get(group)
+        if number is None:
+            number = self.numbers[group] = len(self.groups)
+            self.groups.append(group)
+        if message_id >= len(self.slots):
+            self.slots.extend(array("i", [-1]) * (message_id + 1 - len(self.slots)))
+        self.slots[message_id] = number
+
+    def remove(self, message_id):
+        """Forget the group of a message which has been removed."""
+        if isinstance(message_id, int) and 0 <= message_id < len(self.slots):
+            self.slots[message_id] = -1
+
+    def find(self, message_id):
+        """Get (kind, group_id) of the group a message is in or None."""
+        if not isinstance(message_id, int) or not 0 <= message_id < len(self.slots):
+            return None
+        number = self.slots[message_id]
+        return None if number < 0 else self.groups[number]
+
+    def copy(self):
+        return MessageDirectory(self.groups, self.slots)
+
+    def plain(self):
+        """Get the directory as json encodable lists, to save in a snapshot."""
+        return {"groups": [list(group) for group in self.groups], "slots": self.slots.tolist()}
+
+
+class SegmentHistory(ListMethods):
+    """Messages of a channel or dm, newest first, kept in a segment file.
+
+    Behaves like the list of messages it replaces. The messages are read into
+    a MessageList belonging to the channel or dm the first time they are
+    needed and every change is made to that list, so changes are reported
+    and indexed exactly as they would be without segments.
+    """
+
+    __slots__ = (
+        "segments",
+        "owner",
+        "key",
+        "loaded",
+        "segment",
+        "count",
+        "unsaved",
+        "changed",
+        "last_used",
+        "pins",
+    )
+
+    id_key = "message_id"
+
+    def __init__(self, segments, owner=None, key=None, segment=None, count=0):
+        self.segments = segments
+        self.owner = owner
+        self.key = key
+        # MessageList of the messages or None while they are only on disk
+        self.loaded = None
+        # name of the segment file and how many messages it holds
+        self.segment = segment
+        self.count = count
+        # sequence numbers of the first change made to the messages since the
+        # segment was written, 0 if there has been none or -1 if they have
+        # never been written, and of the latest change
+        self.unsaved = 0
+        self.changed = 0
+        self.last_used = time.monotonic()
+        # number of requests which have pinned the messages in memory
+        self.pins = 0
+
+    def group(self):
+        """Get (kind, group_id) of the channel or dm the messages belong to."""
+        kind = self.owner.owner.key
+        return kind, self.owner[INDEXED_LISTS[kind][0]]
+
+    def build(self, messages):
+        """Make the MessageList holding a list of plain messages."""
+        return MessageList(self.owner, self.key, messages)
+
+    def resident(self):
+        """Get the MessageList of messages, reading the segment if needed."""
+        self.last_used = time.monotonic()
+        loaded = self.loaded
+        if loaded is None:
+            with changes_lock:
+                if self.loaded is None:
+                    self.loaded = self.build(self.segments.read(self.segment))
+                    self.segments.loaded(self)
+                loaded = self.loaded
+        return loaded
+
+    def unload(self):
+        """Drop the messages from memory, they must all be in the segment and
+        must not be pinned."""
+        loaded, self.loaded = self.loaded, None
+        release(loaded)
+
+    def is_clean(self):
+        """Check whether the segment holds every change made to the messages."""
+        return not self.unsaved
+
+    def captured(self, capture):
+        """Get the reference to a segment holding the messages as they were
+        when capture started, writing a new segment if they had changed."""
+        with changes_lock:
+            # messages which changed before the capture started have been in
+            # memory ever since, so the capture has kept what they held then
+            changed = self.unsaved and self.unsaved <= capture.seq
+            loaded, segment, count = self.loaded, self.segment, self.count
+        if not changed:
+            return self.segments.keep(segment, count)
+        return self.segments.save(self, capture.copy(loaded), capture.seq)
+
+    def __len__(self):
+        loaded = self.loaded
+        return self.count if loaded is None else len(loaded)
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def __getitem__(self, position):
+        if isinstance(position, slice) and self.loaded is None:
+            # pages of messages which are not in memory are read from the
+            # segment as plain dicts, without loading the rest
+            data = None
+            with changes_lock:
+                start, stop, step = position.indices(len(self))
+                if self.loaded is None and self.segment is not None and step == 1:
+                    data = self.segments.read_range(self.segment, start, stop)
+            if data is not None:
+                return decode_records(data)
+        return self.resident()[position]
+
+    def __iter__(self):
+        return iter(self.resident())
+
+    def __contains__(self, item):
+        return item in self.resident()
+
+    def find(self, field, value, default=None):
+        """Get the message whose field is equal to value, see IndexMethods.find."""
+        return self.resident().find(field, value, default)
+
+    def index(self, item):
+        return self.resident().index(item)
+
+    def splice(self, start, stop, items):
+        with changes_lock:
+            self.resident().splice(start, stop, items)
+
+
+class Segments:
+    """Keeps track of the segment files of every channel and dm, which of
+    their messages are in memory and the MessageDirectory over them all."""
+
+    def __init__(self, folder=MESSAGES_FOLDER, limit=MESSAGE_CACHE_LIMIT):
+        self.folder = folder
+        self.limit = limit
+        self.directory = MessageDirectory()
+        os.makedirs(folder, exist_ok=True)
+        self.__resident = set()
+        self.__files = OrderedDict()
+        self.__files_lock = Lock()
+        # segments the snapshot being taken refers to and those it wrote
+        self.__referenced = set()
+        self.__written = []
+        self.__loads = 0
+        self.__evictions = 0
+
+    def history(self, owner, key, value):
+        """Make the container for the messages of a channel or dm.
+
+        Arguments:
+            owner (Record) - channel or dm
+            key (str) - field the messages are stored under
+            value (list or dict) - the messages, or a reference to their
+                segment as saved in a snapshot
+        """
+        if isinstance(value, dict):
+            return SegmentHistory(self, owner, key, value.get("segment"), value.get("count", 0))
+        history = SegmentHistory(self, owner, key)
+        history.loaded = history.build(value)
+        history.unsaved = -1 if value else 0
+        self.__resident.add(history)
+        return history
+
+    def start(self, store, directory=None):
+        """Start keeping track of the histories of a newly built store.
+
+        Arguments:
+            store (Store) - store built with history as its history factory
+            directory (dict) - MessageDirectory saved with its snapshot, if any
+        """
+        with changes_lock:
+            if directory is not None:
+                self.directory = MessageDirectory(directory["groups"], directory["slots"])
+            else:
+                self.directory = MessageDirectory()
+            self.__resident = set()
+            for kind in ("channels", "dms"):
+                for group in store.get(kind, ()):
+                    history = group.get("messages")
+                    if isinstance(history, SegmentHistory) and history.loaded is not None:
+                        self.__resident.add(history)
+                        if directory is None:
+                            self.add_messages(history)
+
+    def add_messages(self, history):
+        """Add every message of a history in memory to the directory."""
+        group = history.group()
+        for message in history.loaded:
+            self.directory.add(message.get("message_id"), group)
+
+    def note(self, change, container, removed, seq):
+        """Keep track of a change made to the store.
+
+        Arguments:
+            change (list) - change as it was reported by the store
+            container (Container) - container the change was made in
+            removed (any) - items a splice removed or the value a set replaced
+            seq (int) - sequence number the change was journaled with
+        """
+        operation, path = change[0], change[1]
+        if not path:
+            if operation != "reset" and change[2] in ("channels", "dms"):
+                self.start(container)
+            return
+        if path[0] not in ("channels", "dms"):
+            return
+        if len(path) == 1:
+            # channels or dms added with messages of their own
+            for group in change[4] if operation == "splice" else ():
+                history = group.get("messages")
+                if isinstance(history, SegmentHistory) and history.loaded is not None:
+                    self.add_messages(history)
+            return
+        if len(path) == 2:
+            if change[2] != "messages" or operation != "set":
+                return
+            history = container["messages"]
+            self.add_messages(history)
+        elif path[2] != "messages":
+            return
+        else:
+            history = outer(container, path, 2)["messages"]
+        history.changed = seq
+        if not history.unsaved:
+            history.unsaved = seq
+        if len(path) == 3 and operation == "splice":
+            group = history.group()
+            for message in removed:
+                self.directory.remove(message.get("message_id"))
+            for message in change[4]:
+                self.directory.add(message.get("message_id"), group)
+
+    def read(self, segment):
+        """Read every message in a segment file."""
+        if segment is None:
+            return []
+        return decode_records(self.read_range(segment, 0, float("inf")))
+
+    def read_range(self, segment, start, stop):
+        """Get the encoded messages of a segment from position start up to
+        stop, keeping the OPEN_SEGMENTS most recently read files mapped."""
+        with self.__files_lock:
+            file = self.__files.get(segment)
+            if file is None:
+                file = self.__files[segment] = SegmentFile(os.path.join(self.folder, segment))
+                if len(self.__files) > OPEN_SEGMENTS:
+                    self.__files.popitem(last=False)[1].close()
+            self.__files.move_to_end(segment)
+            return file.read(start, stop)
+
+    def source(self, history):
+        """Get where a search can read the messages of a history from without
+        loading them, see src/search_pool.py, or None if they are in memory."""
+        if not isinstance(history, SegmentHistory):
+            return None
+        with changes_lock:
+            if history.loaded is None and history.segment is not None:
+                return ("segment", os.path.join(self.folder, history.segment))
+        return None
+
+    def loaded(self, history):
+        """Keep track of a history whose segment has just been read."""
+        self.__resident.add(history)
+        self.__loads += 1
+
+    def keep(self, segment, count):
+        """Get the reference saved in a snapshot to an existing segment."""
+        if segment is not None:
+            self.__referenced.add(segment)
+        return {"segment": segment, "count": count}
+
+    def save(self, history, messages, seq):
+        """Write a new segment for a history as part of a snapshot.
+
+        Arguments:
+            history (SegmentHistory) - history the messages belong to
+            messages (list) - plain messages as they were at seq
+            seq (int) - sequence number the snapshot is taken at
+
+        Return Value:
+            Returns the reference to the new segment to save in the snapshot
+        """
+        segment = None
+        if messages:
+            kind, group_id = history.group()
+            segment = f"{kind}-{group_id}-{seq}.seg"
+            write_atomically(os.path.join(self.folder, segment), encode_segment(messages))
+        self.__written.append((history, segment, len(messages), seq))
+        return self.keep(segment, len(messages))
+
+    def commit(self):
+        """Switch histories over to the segments written for the snapshot
+        which has just been saved and delete the files it no longer needs."""
+        with changes_lock:
+            for history, segment, count, seq in self.__written:
+                history.segment, history.count = segment, count
+                history.unsaved = 0 if history.changed <= seq else seq + 1
+        referenced = self.__referenced
+        self.abort()
+        with self.__files_lock:
+            for name in set(self.__files) - referenced:
+                self.__files.pop(name).close()
+        for name in os.listdir(self.folder):
+            if name not in referenced:
+                os.remove(os.path.join(self.folder, name))
+
+    def abort(self):
+        """Forget the segments of a snapshot which was not saved."""
+        self.__referenced = set()
+        self.__written = []
+
+    def resident_messages(self):
+        """Get the number of messages in memory."""
+        with changes_lock:
+            return sum(len(history.loaded) for history in self.__resident)
+
+    def needs_snapshot(self):
+        """Check whether there are too many messages in memory and some could
+        be dropped once a snapshot has written their segments."""
+        with changes_lock:
+            idle = time.monotonic() - EVICT_AFTER
+            return self.resident_messages() > self.limit and any(
+                history.last_used <= idle and not history.is_clean()
+                for history in self.__resident
+            )
+
+    @contextmanager
+    def pinned(self, history):
+        """Keep the messages of a history in memory while a request which
+        may change them is working on them.
+
+        A message changed after its history was dropped from memory would
+        no longer be part of the store, so the change would be lost. While
+        pinned, the history is never dropped, so the records read from it
+        stay the ones in the store.
+
+            with segments.pinned(history):
+                ...
+
+        Arguments:
+            history (SegmentHistory) - messages of a channel or dm, anything
+                else is left alone
+        """
+        if not isinstance(history, SegmentHistory):
+            yield
+            return
+        with changes_lock:
+            history.pins += 1
+        try:
+            yield
+        finally:
+            with changes_lock:
+                history.pins -= 1
+
+    def evict(self):
+        """Drop the messages of the least recently used histories from
+        memory until at most limit messages are left, skipping any which
+        are pinned, were used in the last EVICT_AFTER seconds or have
+        changed since their segment was written."""
+        with changes_lock:
+            # histories of channels and dms which have been removed
+            self.__resident = {
+                history
+                for history in self.__resident
+                if history.loaded is not None and history.owner.owner is not None
+            }
+            total = self.resident_messages()
+            idle = time.monotonic() - EVICT_AFTER
+            for history in sorted(self.__resident, key=attrgetter("last_used")):
+                if total <= self.limit:
+                    break
+                if history.pins or history.last_used > idle or not history.is_clean():
+                    continue
+                total -= len(history.loaded)
+                history.unload()
+                self.__resident.discard(history)
+                self.__evictions += 1
+
+    def metrics(self):
+        return {
+            "resident_messages": self.resident_messages(),
+            "segment_loads": self.__loads,
+            "segment_evictions": self.__evictions,
+        }
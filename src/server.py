@@ -1,7 +1,12 @@
 import signal
 from json import dumps
 from src.standup import standup_start_v1, standup_active_v1, standup_send_v1
-from src.admin import admin_user_permission_change_v1, admin_user_remove_v1
+from src.admin import (
+    admin_user_permission_change_v1,
+    admin_user_remove_v1,
+    admin_users_import_v1,
+    rows_from_csv,
+)
 from src import config, auth, dm, message
 from src.channel import (
     channel_details_v2,
@@ -16,7 +21,7 @@ from src.channels import (
     channels_listall_v2,
     channels_list_v2,
 )
-from src.data_store import clear_v1, IMAGE_FOLDER
+from src.data_store import clear_v1, data_store, IMAGE_FOLDER
 from src.error import InputError
 from src.auth import extract_token
 from src.user import (
@@ -28,10 +33,11 @@ from src.user import (
     user_upload_photo,
 )
 from src.stats import user_stats, workspace_stats
-from src.search import search_v1
+from src.search import search_v1, search_v2
 from src.notifications import notifications_get_v1
 
-from flask import Flask, request, send_from_directory
+from contextlib import ExitStack
+from flask import Flask, g, request, send_from_directory
 from flask_cors import CORS
 
 
@@ -61,6 +67,22 @@ APP.config["TRAP_HTTP_EXCEPTIONS"] = True
 APP.register_error_handler(Exception, defaultHandler)
 
 
+@APP.before_request
+def synchronise():
+    """Catch up with changes made by other server processes, see
+    src/workers.py, and hold them off while this request makes changes."""
+    g.synchronised = ExitStack()
+    g.synchronised.enter_context(
+        data_store.synchronised(writes=request.method not in ("GET", "HEAD"))
+    )
+
+
+@APP.teardown_request
+def desynchronise(_):
+    if "synchronised" in g:
+        g.synchronised.close()
+
+
 @APP.route("/auth/login/v2", methods=["POST"])
 def auth_login():
     data = request.json
@@ -137,6 +159,21 @@ def dm_messages():
     return dumps(dm.dm_messages_v1(token, dm_id, start))
 
 
+@APP.route("/dm/messages/v2", methods=["GET"])
+def dm_messages_page():
+    token = request.args.get("token")
+    dm_id = int(request.args.get("dm_id"))
+    before_id, after_id, limit = page_args()
+    return dumps(dm.dm_messages_v2(token, dm_id, before_id, after_id, limit))
+
+
+@APP.route("/dm/messages/sync/v1", methods=["GET"])
+def dm_messages_sync():
+    token = request.args.get("token")
+    dm_id = int(request.args.get("dm_id"))
+    return dumps(dm.dm_messages_sync_v1(token, dm_id, since_arg()))
+
+
 @APP.route("/clear/v1", methods=["DELETE"])
 def clear():
     clear_v1()
@@ -266,6 +303,54 @@ def get_messages():
     return dumps(message.channel_messages_v1(user_id, int(channel_id), int(start)))
 
 
+@APP.route("/channel/messages/v3", methods=["GET"])
+def get_messages_page():
+    user_id = extract_token(request.args.get("token"))["u_id"]
+    channel_id = int(request.args.get("channel_id"))
+    before_id, after_id, limit = page_args()
+    return dumps(
+        message.channel_messages_v3(user_id, channel_id, before_id, after_id, limit)
+    )
+
+
+@APP.route("/channel/messages/sync/v1", methods=["GET"])
+def get_messages_sync():
+    user_id = extract_token(request.args.get("token"))["u_id"]
+    channel_id = int(request.args.get("channel_id"))
+    return dumps(message.channel_messages_sync_v1(user_id, channel_id, since_arg()))
+
+
+def page_args():
+    """Get before_id, after_id and limit of a page of messages, see
+    message.messages_page, from the query string."""
+    try:
+        before_id, after_id = (
+            None if request.args.get(arg, "") == "" else int(request.args[arg])
+            for arg in ("before_id", "after_id")
+        )
+        limit = int(request.args.get("limit", 50))
+    except ValueError as error:
+        raise InputError(description="before_id, after_id and limit must be integers") from error
+    return before_id, after_id, limit
+
+
+def since_arg():
+    """Get the version a client last saw, see message.messages_since, from
+    the query string."""
+    try:
+        return int(request.args.get("since") or 0)
+    except ValueError as error:
+        raise InputError(description="since must be an integer") from error
+
+
+def limit_arg():
+    """Get the most results a client asked for from the query string."""
+    try:
+        return int(request.args.get("limit", 50))
+    except ValueError as error:
+        raise InputError(description="limit must be an integer") from error
+
+
 @APP.route("/message/send/v1", methods=["POST"])
 def send_message():
     data = request.json
@@ -380,11 +465,32 @@ def do_admin_userpermission_change():
     return dumps(admin_user_permission_change_v1(token, u_id, permission_id))
 
 
+@APP.route("/admin/users/import/v1", methods=["POST"])
+def do_admin_users_import():
+    params = request.get_json()
+    token = params["token"]
+    # users as a list, or as CSV with a header row
+    users = rows_from_csv(params["csv"]) if "csv" in params else params.get("users")
+    return dumps(admin_users_import_v1(token, users))
+
+
 @APP.route("/search/v1", methods=["GET"])
 def search_the_messages():
     token = request.args.get("token")
     query_str = request.args.get("query_str")
-    return dumps(search_v1(token, query_str))
+    mode = request.args.get("mode", "substring")
+    return dumps(search_v1(token, query_str, mode))
+
+
+@APP.route("/search/v2", methods=["GET"])
+def search_messages_page():
+    token = request.args.get("token")
+    query_str = request.args.get("query_str")
+    limit = limit_arg()
+    cursor = request.args.get("cursor", "")
+    order = request.args.get("order", "recent")
+    mode = request.args.get("mode", "substring")
+    return dumps(search_v2(token, query_str, limit, cursor, order, mode))
 
 
 @APP.route("/notifications/get/v1", methods=["GET"])
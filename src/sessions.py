@@ -0,0 +1,131 @@
+"""Index of the sessions each user is logged in with.
+
+The session_ids of a user are kept in a list in the store, so checking a
+token means searching it, on every request, and users who log in often and
+never log out have long lists. This keeps a set of them alongside the list
+of each user who has made a request, and the highest session_id they have
+been given so logging in does not search the list for it either.
+
+Like Memberships it follows the changes made to the store, see Datastore, so
+logging in and out, resetting a password and removing a user all keep it up
+to date without the handlers knowing about it, in every server process
+sharing the store. Only the sets of the users a change is made to are
+updated, or made again if the change is not known in enough detail.
+
+    Typical usage example:
+
+    sessions = Sessions(changes_lock)
+    sessions.has_session(user, session_id)
+"""
+
+
+class Sessions:
+    """Sets of the session_ids of users, see the module docstring."""
+
+    def __init__(self, lock):
+        """
+        Arguments:
+            lock (RLock) - lock held while the store is changed, which
+                changes are followed under
+        """
+        self.__lock = lock
+        # u_id to [list of session_ids the set was made from, set of them,
+        # highest session_id given out]
+        self.__sessions = {}
+
+    def note(self, change, removed=None):
+        """Follow a change made to the store.
+
+        Arguments:
+            change (list) - change as it was reported by the store, after it
+                was made
+            removed (any) - what the change took out of the store, None if
+                not known, e.g. for changes made by another process
+        """
+        operation, path, *args = change
+        with self.__lock:
+            if operation == "reset" or not path:
+                if operation == "reset" or args[0] == "users":
+                    self.reset()
+                return
+            if path[0] != "users":
+                return
+            if len(path) == 1:
+                # users added or replaced have lists of their own, which
+                # has_session tells apart, so only the removed are dropped
+                if operation == "splice" and removed:
+                    for user in removed:
+                        self.__forget(user.get("u_id"))
+            elif len(path) == 2:
+                if args[0] == "session_ids":
+                    self.__forget(path[1])
+            elif path[2] == "session_ids":
+                entry = self.__sessions.get(path[1])
+                if entry is None:
+                    return
+                if len(path) == 3 and operation == "splice" and removed is not None:
+                    self.__update(entry, removed, args[2])
+                else:
+                    self.__forget(path[1])
+
+    def reset(self):
+        """Forget every set, to be made again from the store when next used."""
+        with self.__lock:
+            self.__sessions = {}
+
+    def has_session(self, user, session_id):
+        """Check whether a user is logged in with a session.
+
+        Arguments:
+            user (dictionary) - the user
+            session_id (int) - id of the session
+
+        Return Value:
+            Returns True if they are, otherwise False
+        """
+        with self.__lock:
+            try:
+                return session_id in self.__entry(user)[1]
+            except TypeError:
+                return False
+
+    def next_session_id(self, user):
+        """Get the session_id for a user's next login, higher than any they
+        are logged in with.
+
+        Arguments:
+            user (dictionary) - the user
+
+        Return Value:
+            Returns the session_id
+        """
+        with self.__lock:
+            return self.__entry(user)[2] + 1
+
+    def __entry(self, user):
+        """Get the entry of a user, made from their list if there is none or
+        theirs was made from a list they no longer have."""
+        entry = self.__sessions.get(user["u_id"])
+        if entry is None or entry[0] is not user["session_ids"]:
+            session_ids = user["session_ids"]
+            highest = max(
+                (session_id for session_id in session_ids if isinstance(session_id, int)),
+                default=-1,
+            )
+            entry = self.__sessions[user["u_id"]] = [session_ids, set(session_ids), highest]
+        return entry
+
+    def __forget(self, u_id):
+        try:
+            self.__sessions.pop(u_id, None)
+        except TypeError:
+            pass
+
+    @staticmethod
+    def __update(entry, removed, added):
+        # a session_id is only ever in the list once
+        entry[1].difference_update(removed)
+        entry[1].update(added)
+        for session_id in added:
+            if isinstance(session_id, int):
+                entry[2] = max(entry[2], session_id)
@@ -0,0 +1,989 @@
+"""SQLite backend for the Streams datastore.
+
+Keeps the datastore in an SQLite database with a table for each kind of
+record: users, channels, dms, memberships, messages, reacts, notifications and
+stats series. Users, channels, dms and the other small records are loaded
+into memory at startup as they are with the json backend, but the messages of
+each channel and dm stay in the database and are read a page at a time
+through a MessageHistory.
+
+Every change reported by the store is translated into statements on the rows
+it affects. A request which changed the store waits until its statements
+are committed before it is answered, see sync, and the first of those
+waiting at the same time commits for all of them. Changes nobody waits for
+are committed every COMMIT_INTERVAL seconds.
+
+A database can also be shared by several server processes, see
+src/workers.py. Each of them then also appends the changes it makes to the
+changes table, and before handling a request applies the ones the others
+appended since it last looked to its own store. Only one process changes the
+database at a time, holding an flock on LOCK_FILE while it does, and its
+changes are committed before it lets go.
+
+    Typical usage example:
+
+    STREAMS_BACKEND=sqlite python3 -m src.server
+"""
+import atexit
+import fcntl
+import json
+import sqlite3
+from contextlib import contextmanager
+from copy import deepcopy
+from threading import Event, RLock, Thread, local
+
+from src.backend import INITIAL_OBJECT, Backend
+from src.records import (
+    INDEXED_LISTS,
+    ListMethods,
+    build_store,
+    changes_lock,
+    locate,
+    outer,
+    report,
+    track,
+)
+
+COMMIT_INTERVAL = 0.05
+# Number of messages read from the database at a time when iterating
+PAGE_SIZE = 500
+# u_id the workspace's stats series are stored under
+WORKSPACE = -1
+# Number of changes kept in the changes table of a shared database for
+# processes which have not caught up with them yet. One which falls further
+# behind than that reloads the whole store instead.
+CHANGES_KEPT = 100000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS users (
+    u_id INTEGER PRIMARY KEY,
+    email TEXT,
+    password TEXT,
+    name_first TEXT,
+    name_last TEXT,
+    handle_str TEXT,
+    profile_img_url TEXT,
+    session_ids TEXT,
+    reset_codes TEXT,
+    extra TEXT NOT NULL,
+    removed INTEGER NOT NULL,
+    position INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS users_email ON users (email);
+CREATE INDEX IF NOT EXISTS users_handle ON users (handle_str);
+CREATE TABLE IF NOT EXISTS channels (
+    channel_id INTEGER PRIMARY KEY,
+    name TEXT,
+    is_public INTEGER,
+    extra TEXT NOT NULL,
+    position INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS dms (
+    dm_id INTEGER PRIMARY KEY,
+    name TEXT,
+    owner INTEGER,
+    extra TEXT NOT NULL,
+    position INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS memberships (
+    kind TEXT NOT NULL,
+    group_id INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    u_id INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS memberships_group
+    ON memberships (kind, group_id, role, position);
+CREATE INDEX IF NOT EXISTS memberships_user ON memberships (u_id);
+CREATE TABLE IF NOT EXISTS messages (
+    message_id INTEGER PRIMARY KEY,
+    u_id INTEGER,
+    message TEXT,
+    time_created INTEGER,
+    is_pinned INTEGER,
+    extra TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    group_id INTEGER NOT NULL,
+    position REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_group ON messages (kind, group_id, position);
+CREATE INDEX IF NOT EXISTS messages_user ON messages (u_id);
+CREATE TABLE IF NOT EXISTS reacts (
+    message_id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    react_id INTEGER NOT NULL,
+    u_id INTEGER
+);
+CREATE INDEX IF NOT EXISTS reacts_message ON reacts (message_id, position);
+CREATE TABLE IF NOT EXISTS notification_feeds (
+    u_id INTEGER PRIMARY KEY,
+    position INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS notifications (
+    channel_id INTEGER,
+    dm_id INTEGER,
+    notification_message TEXT,
+    extra TEXT NOT NULL,
+    u_id INTEGER NOT NULL,
+    position INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS notifications_user ON notifications (u_id, position);
+CREATE TABLE IF NOT EXISTS stats (
+    u_id INTEGER NOT NULL,
+    series TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    value INTEGER,
+    time_stamp INTEGER
+);
+CREATE INDEX IF NOT EXISTS stats_series ON stats (u_id, series, position);
+CREATE TABLE IF NOT EXISTS changes (
+    seq INTEGER PRIMARY KEY,
+    change TEXT NOT NULL,
+    removed TEXT
+);
+"""
+TABLES = (
+    "meta",
+    "users",
+    "channels",
+    "dms",
+    "memberships",
+    "messages",
+    "reacts",
+    "notification_feeds",
+    "notifications",
+    "stats",
+)
+
+# Columns holding the fields of the records kept in each table, the first
+# being the record's id if it has one. Any other field which is not kept in a
+# table of its own, see SEPARATE_FIELDS, goes in the table's extra column.
+COLUMNS = {
+    "users": (
+        "u_id",
+        "email",
+        "password",
+        "name_first",
+        "name_last",
+        "handle_str",
+        "profile_img_url",
+        "session_ids",
+        "reset_codes",
+    ),
+    "channels": ("channel_id", "name", "is_public"),
+    "dms": ("dm_id", "name", "owner"),
+    "messages": ("message_id", "u_id", "message", "time_created", "is_pinned"),
+    "notifications": ("channel_id", "dm_id", "notification_message"),
+}
+SEPARATE_FIELDS = {
+    "users": ("user_stats",),
+    "channels": ("messages", "owner_members", "all_members"),
+    "dms": ("messages", "members"),
+    "messages": ("reacts",),
+    "notifications": (),
+}
+JSON_COLUMNS = ("session_ids", "reset_codes")
+BOOLEAN_COLUMNS = ("is_public", "is_pinned")
+# Fields of channels and dms holding the ids of their members
+MEMBER_FIELDS = {"channels": ("owner_members", "all_members"), "dms": ("members",)}
+
+
+def encode(table, record):
+    """Get the values of a table's columns for a record, extra column last."""
+    values = []
+    for column in COLUMNS[table]:
+        value = record.get(column)
+        values.append(json.dumps(value) if column in JSON_COLUMNS else value)
+    separate = (*COLUMNS[table], *SEPARATE_FIELDS[table])
+    extra = {field: value for field, value in record.items() if field not in separate}
+    values.append(json.dumps(extra))
+    return values
+
+
+def decode(table, row):
+    """Rebuild a record from the values of its table's columns."""
+    record = {}
+    for column, value in zip(COLUMNS[table], row):
+        if column in JSON_COLUMNS:
+            value = json.loads(value)
+        elif column in BOOLEAN_COLUMNS and value is not None:
+            value = bool(value)
+        record[column] = value
+    record.update(json.loads(row[len(COLUMNS[table])]))
+    return record
+
+
+def selected(table):
+    """Get the list of columns to select to decode a table's records."""
+    return ", ".join((*COLUMNS[table], "extra"))
+
+
+def between(before, after, count):
+    """Get count ascending positions between two positions, either may be None."""
+    if before is None and after is None:
+        return [float(i) for i in range(count)]
+    if before is None:
+        return [after - count + i for i in range(count)]
+    if after is None:
+        return [before + 1 + i for i in range(count)]
+    step = (after - before) / (count + 1)
+    return [before + step * (i + 1) for i in range(count)]
+
+
+def removed_ids(change, removed):
+    """Get the message_ids of the messages a change removed from a channel
+    or dm as json, or None if it removed none, for the changes table.
+
+    Other processes catching up with the change read the messages from the
+    database, which by then no longer has them, see Versions.note_applied.
+    """
+    operation, path, *args = change
+    if operation != "splice" or len(path) != 3 or path[2] != "messages" or args[1] <= args[0]:
+        return None
+    return json.dumps([message.get("message_id") for message in removed])
+
+
+class MessageHistory(ListMethods):
+    """Messages of a channel or dm, newest first, kept in the database.
+
+    Behaves like the list of messages it replaces but only reads the messages
+    it is asked for, so slicing out a page of messages or finding one by id
+    does not load the rest. Every message read is a new Record, changes made
+    to it are written back through the backend.
+    """
+
+    __slots__ = ("backend", "owner", "key")
+
+    id_key = "message_id"
+
+    def __init__(self, backend, owner=None, key=None):
+        self.backend = backend
+        self.owner = owner
+        self.key = key
+
+    def group(self):
+        """Get (kind, group_id) of the channel or dm the messages belong to."""
+        kind = self.owner.owner.key
+        return kind, self.owner[INDEXED_LISTS[kind][0]]
+
+    def __len__(self):
+        return self.backend.count_messages(*self.group())
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            start, stop, step = position.indices(len(self))
+            if step != 1:
+                return list(self)[position]
+            rows = self.backend.read_messages(*self.group(), start, stop - start)
+            return [track(row, self) for row in rows]
+        position = self._position(position)
+        return self[position : position + 1][0]
+
+    def __iter__(self):
+        after = None
+        while True:
+            rows, after = self.backend.read_messages_after(*self.group(), after)
+            for row in rows:
+                yield track(row, self)
+            if len(rows) < PAGE_SIZE:
+                return
+
+    def find(self, field, value, default=None):
+        """Get the message whose field is equal to value.
+
+        Messages are only looked up in the database by message_id, finding
+        one by any other field reads the messages until one matches.
+        """
+        if field != self.id_key:
+            return next((item for item in self if item.get(field) == value), default)
+        if not isinstance(value, int):
+            return default
+        row = self.backend.read_message(*self.group(), value)
+        return default if row is None else track(row, self)
+
+    def index(self, item):
+        position = None
+        if isinstance(item, dict) and isinstance(item.get(self.id_key), int):
+            position = self.backend.message_offset(*self.group(), item[self.id_key])
+        if position is None:
+            raise ValueError("message is not in the list")
+        return position
+
+    def next_to(self, item, limit, after=True):
+        if not isinstance(item, dict) or not isinstance(item.get(self.id_key), int):
+            raise ValueError("message is not in the list")
+        found = self.backend.read_messages_next_to(
+            *self.group(), item[self.id_key], limit, after
+        )
+        if found is None:
+            raise ValueError("message is not in the list")
+        rows, has_more = found
+        return [track(row, self) for row in rows], has_more
+
+    def splice(self, start, stop, items):
+        with changes_lock:
+            root, path = locate(self)
+            items = [track(item, self) for item in items]
+            removed = self[start:stop]
+            report(root, ["splice", path, start, stop, items], self, removed)
+
+
+class SqliteBackend(Backend):
+    """Keeps the store in an SQLite database, see the module docstring."""
+
+    def __init__(self, path, commit_interval=COMMIT_INTERVAL, shared=False):
+        self.path = path
+        self.commit_interval = commit_interval
+        self.shared = shared
+        self.__lock = RLock()
+        self.__stopped = Event()
+        self.__positions = {}
+        self.__counts = {}
+        # (offset, position) of the end of the last page read of each group
+        self.__pages = {}
+        # last change in the changes table this process has applied
+        self.__seq = 0
+        # changes recorded and committed by this process, and the number it
+        # had recorded after each thread's last change
+        self.__recorded = 0
+        self.__committed = 0
+        self.__mine = local()
+        self.__data_version = None
+        # closed in close, the file only exists to be locked
+        # pylint: disable-next=consider-using-with
+        self.__lock_file = open(path + ".lock", "a", encoding="utf-8") if shared else None
+        self.__held = 0
+        self.__db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self.lock():
+            self.__db.execute("PRAGMA journal_mode = WAL")
+            self.__db.execute("PRAGMA synchronous = FULL")
+            self.__db.executescript(SCHEMA)
+            # databases shared before the message_ids removed were kept
+            columns = [row[1] for row in self.__db.execute("PRAGMA table_info(changes)")]
+            if "removed" not in columns:
+                self.__db.execute("ALTER TABLE changes ADD COLUMN removed TEXT")
+
+    def history(self, owner, key, value):
+        """Make the container for the messages of a channel or dm. The
+        messages themselves are inserted into the database as it is recorded."""
+        return MessageHistory(self, owner, key)
+
+    def load(self):
+        with self.lock(), self.__lock:
+            if self.__db.execute("SELECT COUNT(*) FROM meta").fetchone()[0]:
+                store = self.__read_all()
+            else:
+                store = deepcopy(INITIAL_OBJECT)
+                self.__write_all(store)
+                self.__db.commit()
+            self.__seq = self.__last_change()
+            self.__data_version = self.__version()
+        thread = Thread(target=self.__commit_loop)
+        thread.daemon = True
+        thread.start()
+        atexit.register(self.close)
+        return build_store(store, self.history)
+
+    def record(self, change, container=None, removed=()):
+        operation, path = change[0], change[1]
+        with self.__lock:
+            self.__recorded += 1
+            self.__mine.recorded = self.__recorded
+            if self.shared:
+                self.__seq = self.__db.execute(
+                    "INSERT INTO changes (change, removed) VALUES (?, ?)",
+                    (json.dumps(change, default=list), removed_ids(change, removed)),
+                ).lastrowid
+            if operation == "reset":
+                self.__write_all(change[2])
+            elif not path:
+                self.__clear_field(change[2])
+                if change[2] in container:
+                    self.__write_field(change[2], container[change[2]])
+            elif path[0] in ("users", "removed_users"):
+                self.__record_user(change, container, removed)
+            elif path[0] in MEMBER_FIELDS:
+                self.__record_group(change, container, removed)
+            elif path[0] == "all_notifications":
+                self.__record_notifications(change, container, removed)
+            elif path[0] == "workspace_stats":
+                self.__record_stats(WORKSPACE, change, container, 1)
+            else:
+                self.__write_field(path[0], outer(container, path, 1))
+
+    def message_group(self, message_id):
+        with self.__lock:
+            row = self.__db.execute(
+                "SELECT kind, group_id FROM messages WHERE message_id = ?",
+                (message_id,),
+            ).fetchone()
+        return None if row is None else tuple(row)
+
+    def scan_source(self, history):
+        if not isinstance(history, MessageHistory):
+            return None
+        # other connections only see what has been committed, which in a
+        # shared database every finished request's changes already are
+        if not self.shared:
+            self.commit()
+        return ("sqlite", self.path, *history.group())
+
+    @contextmanager
+    def lock(self):
+        """Hold the lock on changing a shared database, which other processes
+        wait for, and commit what was changed before letting go of it. Only
+        one thread may use it at a time, see Datastore.synchronised.
+        """
+        self.__held += 1
+        if self.__held == 1 and self.shared:
+            fcntl.flock(self.__lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            self.__held -= 1
+            if self.__held == 0 and self.shared:
+                try:
+                    self.commit()
+                finally:
+                    fcntl.flock(self.__lock_file, fcntl.LOCK_UN)
+
+    def changes(self):
+        """Get the changes other processes sharing the database made since
+        this one last caught up with them.
+
+        Return Value:
+            Returns a list of (change, removed) in the order they were made,
+            or just a "reset" change to the whole store if some have been
+            dropped, see Backend.changes
+        """
+        if not self.shared:
+            return []
+        with self.__lock:
+            version = self.__version()
+            if version == self.__data_version:
+                return []
+            self.__data_version = version
+            rows = self.__db.execute(
+                "SELECT seq, change, removed FROM changes WHERE seq > ? ORDER BY seq",
+                (self.__seq,),
+            ).fetchall()
+            if not rows:
+                return []
+            # the other processes may have written anywhere
+            self.__positions.clear()
+            self.__counts.clear()
+            self.__pages.clear()
+            if rows[0][0] != self.__seq + 1:
+                self.__seq = self.__last_change()
+                return [(["reset", [], self.__read_all()], None)]
+            self.__seq = rows[-1][0]
+            return [
+                (json.loads(change), None if removed is None else json.loads(removed))
+                for _, change, removed in rows
+            ]
+
+    def snapshot(self, store):
+        """Commit every change recorded so far."""
+        self.commit()
+
+    def compact(self, store):
+        """Commit and, in a shared database, drop changes older than the
+        last CHANGES_KEPT."""
+        with self.__lock:
+            if self.shared:
+                self.__db.execute(
+                    "DELETE FROM changes WHERE seq <= ?",
+                    (self.__last_change() - CHANGES_KEPT,),
+                )
+        self.commit()
+
+    def commit(self):
+        """Commit the changes recorded since the last commit."""
+        with self.__lock:
+            if self.__db.in_transaction:
+                self.__db.commit()
+            self.__committed = self.__recorded
+
+    def sync(self):
+        """Commit unless the changes the calling thread recorded already
+        have been, see the module docstring."""
+        if getattr(self.__mine, "recorded", 0) > self.__committed:
+            self.commit()
+
+    def close(self):
+        """Commit outstanding changes, stop committing in the background and
+        close the lock file."""
+        self.__stopped.set()
+        self.commit()
+        if self.__lock_file is not None:
+            self.__lock_file.close()
+
+    def count_messages(self, kind, group_id):
+        """Get the number of messages in a channel or dm."""
+        with self.__lock:
+            return self.__count(kind, group_id)
+
+    def read_messages(self, kind, group_id, offset, limit):
+        """Read up to limit messages of a group, newest first, from offset.
+
+        A page starting where the last page of the group read ended is read
+        on from the position of that page's last message, so reading the
+        pages in turn does not step over the messages before each again.
+        """
+        if limit <= 0:
+            return []
+        with self.__lock:
+            last = self.__pages.get((kind, group_id))
+            if last is not None and last[0] == offset:
+                rows = self.__db.execute(
+                    f"SELECT {selected('messages')}, position FROM messages "
+                    "WHERE kind = ? AND group_id = ? AND position > ? "
+                    "ORDER BY position LIMIT ?",
+                    (kind, group_id, last[1], limit),
+                ).fetchall()
+            else:
+                rows = self.__db.execute(
+                    f"SELECT {selected('messages')}, position FROM messages "
+                    "WHERE kind = ? AND group_id = ? ORDER BY position LIMIT ? OFFSET ?",
+                    (kind, group_id, limit, offset),
+                ).fetchall()
+            if rows:
+                self.__pages[kind, group_id] = (offset + len(rows), rows[-1][-1])
+            return self.__decode_messages([row[:-1] for row in rows])
+
+    def read_messages_next_to(self, kind, group_id, message_id, limit, after):
+        """Read up to limit messages of a group next to one of its messages,
+        by position on the messages_group index.
+
+        Return Value:
+            Returns (messages, has_more), the messages newest first and
+            whether there are more past them, or None if the message is not
+            in the group
+        """
+        with self.__lock:
+            row = self.__db.execute(
+                "SELECT position FROM messages "
+                "WHERE message_id = ? AND kind = ? AND group_id = ?",
+                (message_id, kind, group_id),
+            ).fetchone()
+            if row is None:
+                return None
+            # newest first is ascending position, so the older messages
+            # after it are the greater positions
+            seek = "position > ? ORDER BY position"
+            if not after:
+                seek = "position < ? ORDER BY position DESC"
+            rows = self.__db.execute(
+                f"SELECT {selected('messages')} FROM messages "
+                f"WHERE kind = ? AND group_id = ? AND {seek} LIMIT ?",
+                (kind, group_id, row[0], limit + 1),
+            ).fetchall()
+            messages = self.__decode_messages(rows[:limit])
+        if not after:
+            messages.reverse()
+        return messages, len(rows) > limit
+
+    def read_messages_after(self, kind, group_id, after):
+        """Read the next PAGE_SIZE messages of a group after position after.
+
+        Return Value:
+            Returns (messages, position) where position is where the next
+            page starts from
+        """
+        with self.__lock:
+            rows = self.__db.execute(
+                f"SELECT {selected('messages')}, position FROM messages "
+                "WHERE kind = ? AND group_id = ? AND position > ? "
+                "ORDER BY position LIMIT ?",
+                (kind, group_id, float("-inf") if after is None else after, PAGE_SIZE),
+            ).fetchall()
+            messages = self.__decode_messages([row[:-1] for row in rows])
+        return messages, rows[-1][-1] if rows else after
+
+    def read_message(self, kind, group_id, message_id):
+        """Read one message of a group or None if it is not there."""
+        with self.__lock:
+            rows = self.__db.execute(
+                f"SELECT {selected('messages')} FROM messages "
+                "WHERE message_id = ? AND kind = ? AND group_id = ?",
+                (message_id, kind, group_id),
+            ).fetchall()
+            return next(iter(self.__decode_messages(rows)), None)
+
+    def message_offset(self, kind, group_id, message_id):
+        """Get where a message is in its group, newest first, or None."""
+        with self.__lock:
+            row = self.__db.execute(
+                "SELECT position FROM messages "
+                "WHERE message_id = ? AND kind = ? AND group_id = ?",
+                (message_id, kind, group_id),
+            ).fetchone()
+            if row is None:
+                return None
+            return self.__db.execute(
+                "SELECT COUNT(*) FROM messages "
+                "WHERE kind = ? AND group_id = ? AND position < ?",
+                (kind, group_id, row[0]),
+            ).fetchone()[0]
+
+    def __version(self):
+        return self.__db.execute("PRAGMA data_version").fetchone()[0]
+
+    def __last_change(self):
+        return self.__db.execute("SELECT COALESCE(MAX(seq), 0) FROM changes").fetchone()[0]
+
+    def __commit_loop(self):
+        while not self.__stopped.wait(self.commit_interval):
+            self.commit()
+
+    def __next_position(self, table):
+        if table not in self.__positions:
+            self.__positions[table] = self.__db.execute(
+                f"SELECT COALESCE(MAX(position), 0) FROM {table}"
+            ).fetchone()[0]
+        self.__positions[table] += 1
+        return self.__positions[table]
+
+    def __count(self, kind, group_id):
+        if (kind, group_id) not in self.__counts:
+            self.__counts[kind, group_id] = self.__db.execute(
+                "SELECT COUNT(*) FROM messages WHERE kind = ? AND group_id = ?",
+                (kind, group_id),
+            ).fetchone()[0]
+        return self.__counts[kind, group_id]
+
+    def __insert(self, table, record, **fixed):
+        columns = (*COLUMNS[table], "extra", *fixed)
+        self.__db.execute(
+            f"INSERT OR REPLACE INTO {table} ({', '.join(columns)}) "
+            f"VALUES ({', '.join('?' * len(columns))})",
+            (*encode(table, record), *fixed.values()),
+        )
+
+    def __update(self, table, record):
+        key, *columns = (*COLUMNS[table], "extra")
+        key_value, *values = encode(table, record)
+        self.__db.execute(
+            f"UPDATE {table} SET {', '.join(f'{column} = ?' for column in columns)} "
+            f"WHERE {key} = ?",
+            (*values, key_value),
+        )
+
+    def __read_all(self):
+        db = self.__db
+        store = {key: json.loads(value) for key, value in db.execute("SELECT * FROM meta")}
+        stats = {}
+        for u_id, series, value, time_stamp in db.execute(
+            "SELECT u_id, series, value, time_stamp FROM stats ORDER BY u_id, series, position"
+        ):
+            entry = {f"num_{series}": value, "time_stamp": time_stamp}
+            stats.setdefault(u_id, {}).setdefault(series, []).append(entry)
+        for field, removed in (("users", 0), ("removed_users", 1)):
+            store[field] = []
+            for row in db.execute(
+                f"SELECT {selected('users')} FROM users WHERE removed = ? ORDER BY position",
+                (removed,),
+            ):
+                user = decode("users", row)
+                user["user_stats"] = stats.get(user["u_id"], {})
+                store[field].append(user)
+        members = {}
+        for kind, group_id, role, u_id in db.execute(
+            "SELECT kind, group_id, role, u_id FROM memberships "
+            "ORDER BY kind, group_id, role, position"
+        ):
+            members.setdefault((kind, group_id, role), []).append(u_id)
+        for kind, roles in MEMBER_FIELDS.items():
+            store[kind] = []
+            for row in db.execute(f"SELECT {selected(kind)} FROM {kind} ORDER BY position"):
+                group = decode(kind, row)
+                for role in roles:
+                    group[role] = members.get((kind, row[0], role), [])
+                group["messages"] = []
+                store[kind].append(group)
+        store["workspace_stats"] = stats.get(WORKSPACE, {})
+        notifications = {}
+        for row in db.execute(
+            f"SELECT {selected('notifications')}, u_id FROM notifications "
+            "ORDER BY u_id, position"
+        ):
+            notifications.setdefault(row[-1], []).append(decode("notifications", row))
+        store["all_notifications"] = [
+            {"u_id": u_id, "notifications": notifications.get(u_id, [])}
+            for u_id, in db.execute("SELECT u_id FROM notification_feeds ORDER BY position")
+        ]
+        return store
+
+    def __write_all(self, store):
+        for table in TABLES:
+            self.__db.execute(f"DELETE FROM {table}")
+        self.__positions.clear()
+        self.__counts.clear()
+        self.__pages.clear()
+        for field, value in store.items():
+            self.__write_field(field, value)
+
+    def __clear_field(self, field):
+        db = self.__db
+        if field in ("users", "removed_users"):
+            removed = int(field == "removed_users")
+            db.execute(
+                "DELETE FROM stats WHERE u_id IN (SELECT u_id FROM users WHERE removed = ?)",
+                (removed,),
+            )
+            db.execute("DELETE FROM users WHERE removed = ?", (removed,))
+        elif field in MEMBER_FIELDS:
+            db.execute(
+                "DELETE FROM reacts WHERE message_id IN "
+                "(SELECT message_id FROM messages WHERE kind = ?)",
+                (field,),
+            )
+            db.execute("DELETE FROM messages WHERE kind = ?", (field,))
+            db.execute("DELETE FROM memberships WHERE kind = ?", (field,))
+            db.execute(f"DELETE FROM {field}")
+            self.__counts.clear()
+            self.__pages.clear()
+        elif field == "all_notifications":
+            db.execute("DELETE FROM notifications")
+            db.execute("DELETE FROM notification_feeds")
+        elif field == "workspace_stats":
+            db.execute("DELETE FROM stats WHERE u_id = ?", (WORKSPACE,))
+        else:
+            db.execute("DELETE FROM meta WHERE key = ?", (field,))
+
+    def __write_field(self, field, value):
+        if field in ("users", "removed_users"):
+            for user in value:
+                self.__insert_user(user, field == "removed_users")
+        elif field in MEMBER_FIELDS:
+            for group in value:
+                self.__insert_group(field, group)
+        elif field == "all_notifications":
+            for entry in value:
+                self.__insert_notifications(entry)
+        elif field == "workspace_stats":
+            self.__write_stats(WORKSPACE, value)
+        else:
+            self.__db.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                (field, json.dumps(value)),
+            )
+
+    def __record_user(self, change, container, removed):
+        path = change[1]
+        if len(path) == 1:
+            for user in removed:
+                self.__delete_user(user["u_id"])
+            for user in change[4]:
+                self.__insert_user(user, path[0] == "removed_users")
+            return
+        field = path[2] if len(path) > 2 else change[2]
+        if field == "user_stats":
+            self.__record_stats(path[1], change, container, 3)
+        else:
+            self.__update("users", outer(container, path, 2))
+
+    def __insert_user(self, user, removed):
+        position = self.__next_position("users")
+        self.__insert("users", user, removed=int(removed), position=position)
+        self.__write_stats(user["u_id"], user.get("user_stats", {}))
+
+    def __delete_user(self, u_id):
+        self.__db.execute("DELETE FROM users WHERE u_id = ?", (u_id,))
+        self.__db.execute("DELETE FROM stats WHERE u_id = ?", (u_id,))
+
+    def __record_stats(self, u_id, change, container, depth):
+        # depth is how far along the change's path the stats dictionary is
+        path = change[1]
+        if len(path) == depth + 1 and change[0] == "splice":
+            start, stop, items = change[2:]
+            if start == stop == len(container) - len(items):
+                self.__insert_stats(u_id, path[depth], start, items)
+                return
+        if len(path) >= depth:
+            stats = outer(container, path, depth)
+        else:
+            stats = container.get(change[2], {})
+        self.__write_stats(u_id, stats)
+
+    def __write_stats(self, u_id, stats):
+        self.__db.execute("DELETE FROM stats WHERE u_id = ?", (u_id,))
+        for series, entries in stats.items():
+            self.__insert_stats(u_id, series, 0, entries)
+
+    def __insert_stats(self, u_id, series, start, entries):
+        self.__db.executemany(
+            "INSERT INTO stats (u_id, series, position, value, time_stamp) "
+            "VALUES (?, ?, ?, ?, ?)",
+            [
+                (u_id, series, start + i, entry.get(f"num_{series}"), entry.get("time_stamp"))
+                for i, entry in enumerate(entries)
+            ],
+        )
+
+    def __record_group(self, change, container, removed):
+        path = change[1]
+        kind = path[0]
+        if len(path) == 1:
+            for group in removed:
+                self.__delete_group(kind, group[INDEXED_LISTS[kind][0]])
+            for group in change[4]:
+                self.__insert_group(kind, group)
+            return
+        field = path[2] if len(path) > 2 else change[2]
+        if field == "messages" and len(path) == 3:
+            self.__splice_messages(kind, path[1], change, removed)
+        elif field == "messages" and len(path) > 3:
+            message = outer(container, path, 4)
+            self.__update("messages", message)
+            self.__write_reacts(message)
+        elif field == "messages":
+            self.__delete_messages(kind, path[1])
+        elif field in MEMBER_FIELDS[kind]:
+            group = outer(container, path, 2)
+            self.__write_members(kind, path[1], field, group.get(field, []))
+        else:
+            self.__update(kind, outer(container, path, 2))
+
+    def __insert_group(self, kind, group):
+        self.__insert(kind, group, position=self.__next_position(kind))
+        group_id = group[INDEXED_LISTS[kind][0]]
+        for role in MEMBER_FIELDS[kind]:
+            self.__write_members(kind, group_id, role, group.get(role, []))
+        messages = group.get("messages")
+        if isinstance(messages, list) and messages:
+            for message, position in zip(messages, between(None, None, len(messages))):
+                self.__insert_message(kind, group_id, message, position)
+            self.__counts.pop((kind, group_id), None)
+            self.__pages.pop((kind, group_id), None)
+
+    def __delete_group(self, kind, group_id):
+        self.__delete_messages(kind, group_id)
+        self.__db.execute(
+            "DELETE FROM memberships WHERE kind = ? AND group_id = ?", (kind, group_id)
+        )
+        self.__db.execute(
+            f"DELETE FROM {kind} WHERE {INDEXED_LISTS[kind][0]} = ?", (group_id,)
+        )
+
+    def __write_members(self, kind, group_id, role, members):
+        self.__db.execute(
+            "DELETE FROM memberships WHERE kind = ? AND group_id = ? AND role = ?",
+            (kind, group_id, role),
+        )
+        self.__db.executemany(
+            "INSERT INTO memberships (kind, group_id, role, position, u_id) "
+            "VALUES (?, ?, ?, ?, ?)",
+            [(kind, group_id, role, i, u_id) for i, u_id in enumerate(members)],
+        )
+
+    def __splice_messages(self, kind, group_id, change, removed):
+        start, _, items = change[2:]
+        ids = [(message["message_id"],) for message in removed]
+        self.__db.executemany("DELETE FROM reacts WHERE message_id = ?", ids)
+        self.__db.executemany("DELETE FROM messages WHERE message_id = ?", ids)
+        count = self.__count(kind, group_id) - len(ids)
+        if items:
+            before = after = None
+            if start > 0:
+                before = self.__message_position(kind, group_id, start - 1)
+            if start < count:
+                after = self.__message_position(kind, group_id, start)
+            for message, position in zip(items, between(before, after, len(items))):
+                self.__insert_message(kind, group_id, message, position)
+        self.__counts[kind, group_id] = count + len(items)
+        self.__pages.pop((kind, group_id), None)
+
+    def __message_position(self, kind, group_id, offset):
+        return self.__db.execute(
+            "SELECT position FROM messages WHERE kind = ? AND group_id = ? "
+            "ORDER BY position LIMIT 1 OFFSET ?",
+            (kind, group_id, offset),
+        ).fetchone()[0]
+
+    def __insert_message(self, kind, group_id, message, position):
+        self.__insert("messages", message, kind=kind, group_id=group_id, position=position)
+        self.__write_reacts(message)
+
+    def __delete_messages(self, kind, group_id):
+        self.__db.execute(
+            "DELETE FROM reacts WHERE message_id IN "
+            "(SELECT message_id FROM messages WHERE kind = ? AND group_id = ?)",
+            (kind, group_id),
+        )
+        self.__db.execute(
+            "DELETE FROM messages WHERE kind = ? AND group_id = ?", (kind, group_id)
+        )
+        self.__counts.pop((kind, group_id), None)
+        self.__pages.pop((kind, group_id), None)
+
+    def __write_reacts(self, message):
+        message_id = message["message_id"]
+        self.__db.execute("DELETE FROM reacts WHERE message_id = ?", (message_id,))
+        rows = []
+        for position, react in enumerate(message.get("reacts", [])):
+            # a react nobody has used yet is kept as a row without a u_id
+            for u_id in react["u_ids"] or [None]:
+                rows.append((message_id, position, react["react_id"], u_id))
+        self.__db.executemany(
+            "INSERT INTO reacts (message_id, position, react_id, u_id) VALUES (?, ?, ?, ?)",
+            rows,
+        )
+
+    def __decode_messages(self, rows):
+        messages = [decode("messages", row) for row in rows]
+        reacts = {}
+        if messages:
+            ids = [message["message_id"] for message in messages]
+            for message_id, position, react_id, u_id in self.__db.execute(
+                "SELECT message_id, position, react_id, u_id FROM reacts "
+                f"WHERE message_id IN ({', '.join('?' * len(ids))}) "
+                "ORDER BY message_id, position, rowid",
+                ids,
+            ):
+                message_reacts = reacts.setdefault(message_id, {})
+                react = message_reacts.setdefault(
+                    position, {"react_id": react_id, "u_ids": []}
+                )
+                if u_id is not None:
+                    react["u_ids"].append(u_id)
+        for message in messages:
+            message["reacts"] = list(reacts.get(message["message_id"], {}).values())
+        return messages
+
+    def __record_notifications(self, change, container, removed):
+        path = change[1]
+        if len(path) == 1:
+            for entry in removed:
+                self.__delete_notifications(entry["u_id"])
+            for entry in change[4]:
+                self.__insert_notifications(entry)
+            return
+        entry = outer(container, path, 2)
+        self.__db.execute("DELETE FROM notifications WHERE u_id = ?", (entry["u_id"],))
+        self.__write_notifications(entry)
+
+    def __insert_notifications(self, entry):
+        self.__db.execute(
+            "INSERT OR REPLACE INTO notification_feeds (u_id, position) VALUES (?, ?)",
+            (entry["u_id"], self.__next_position("notification_feeds")),
+        )
+        self.__write_notifications(entry)
+
+    def __write_notifications(self, entry):
+        for position, notification in enumerate(entry.get("notifications", [])):
+            self.__insert(
+                "notifications", notification, u_id=entry["u_id"], position=position
+            )
+
+    def __delete_notifications(self, u_id):
+        self.__db.execute("DELETE FROM notifications WHERE u_id = ?", (u_id,))
+        self.__db.execute("DELETE FROM notification_feeds WHERE u_id = ?", (u_id,))
+
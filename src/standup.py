@@ -14,43 +14,42 @@ from src.message import (
 
 
 def is_valid_channel(channels, channel_id):
-    for channel in channels:
-        if channel["channel_id"] == channel_id:
-            return True
-    return False
+    return data_store.get_channel(channel_id) is not None
 
 
 def auth_not_member(channels, channel_id, auth_user_id):
-    for channel in channels:
-        if channel["channel_id"] == channel_id:
-            standup_channel = channel
-    return auth_user_id not in standup_channel["all_members"]
+    standup_channel = data_store.get_channel(channel_id)
+    return not data_store.is_member(standup_channel, auth_user_id)
 
 
-def end_standup(auth_user_id, channel, standup):
+def end_standup(auth_user_id, channel):
     print(f"{auth_user_id} is ending standup")
-    data = data_store.get()
-
-    message_id = data["max_ids"]["message"] + 1
-    data["max_ids"]["message"] += 1
-    standup["message_queue"] = standup["message_queue"][:-1]
-    message = create_message(standup["message_queue"], message_id, auth_user_id)
-    # message = {
-    #     "message": standup["message_queue"],
-    #     "message_id": message_id,
-    #     "time_created": math.floor(time.time()),
-    #     "u_id": auth_user_id,
-    # }
-    channel["messages"].insert(0, message)
-    for standups in data["standups"]:
-        if standups == standup:
-            data["standups"].remove(standup)
-    # Increments the workspace stats, as well as the user stats for the user
-    # who initiated the standup
-    increment_workspace_messages()
-    increment_user_messages(auth_user_id)
-
-    data_store.set(data)
+    channel_id = channel["channel_id"]
+    # runs on a timer rather than in a request, see Datastore.synchronised
+    with data_store.synchronised(writes=True), data_store.locked(("channel", channel_id)):
+        data = data_store.get()
+        # the standup and channel are looked up again as the store holds its
+        # own copy of them, which may have been replaced since
+        standup = data["standups"].find("channel_id", channel_id)
+        channel = data_store.get_channel(channel_id)
+        if standup is None or channel is None:
+            return
+
+        message_id = data_store.next_id("message")
+        standup["message_queue"] = standup["message_queue"][:-1]
+        message = create_message(standup["message_queue"], message_id, auth_user_id)
+        # message = {
+        #     "message": standup["message_queue"],
+        #     "message_id": message_id,
+        #     "time_created": math.floor(time.time()),
+        #     "u_id": auth_user_id,
+        # }
+        channel["messages"].insert(0, message)
+        data["standups"].remove(standup)
+        # Increments the workspace stats, as well as the user stats for the user
+        # who initiated the standup
+        increment_workspace_messages()
+        increment_user_messages(auth_user_id)
 
 
 def standup_start_v1(token, channel_id, length):
@@ -70,30 +69,27 @@ def standup_start_v1(token, channel_id, length):
     if not length >= 0:
         raise InputError("length is a negative integer")
 
-    if standup_active_v1(token, channel_id)["is_active"]:
-        raise InputError(
-            "an active standup is currently running \
-            in the channel"
-        )
-
-    for channel in channels:
-        if channel["channel_id"] == channel_id:
-            standup_channel = channel
-
-    standups = store["standups"]
-    dt = datetime.datetime.now()
-    timestamp = dt.replace(tzinfo=timezone.utc).timestamp()
-    timestamp += length
-    new_standup = {
-        "channel_id": channel_id,
-        "time_finish": timestamp,
-        "message_queue": "",
-    }
-    standups.append(new_standup)
-
-    data_store.set(store)
+    with data_store.locked(("channel", channel_id)):
+        if standup_active_v1(token, channel_id)["is_active"]:
+            raise InputError(
+                "an active standup is currently running \
+                in the channel"
+            )
+
+        standup_channel = data_store.get_channel(channel_id)
+
+        standups = store["standups"]
+        dt = datetime.datetime.now()
+        timestamp = dt.replace(tzinfo=timezone.utc).timestamp()
+        timestamp += length
+        new_standup = {
+            "channel_id": channel_id,
+            "time_finish": timestamp,
+            "message_queue": "",
+        }
+        standups.append(new_standup)
     threading.Timer(
-        length, end_standup, [auth_user_id, standup_channel, new_standup]
+        length, end_standup, [auth_user_id, standup_channel]
     ).start()
     return {"time_finish": timestamp}
 
@@ -144,12 +140,11 @@ def standup_send_v1(token, channel_id, message):
 
     if len(message) > 1000:
         raise InputError("length of message is over 1000 characters")
-    for standups in store["standups"]:
-        if standups["channel_id"] == channel_id:
-            standup = standups
-    for users in store["users"]:
-        if users["u_id"] == auth_user_id:
-            name = users["handle_str"]
-    standup["message_queue"] += f"{name}: {message}\n"
-    data_store.set(store)
+    name = data_store.get_user(auth_user_id)["handle_str"]
+    with data_store.locked(("channel", channel_id)):
+        # the standup may have ended since it was checked
+        standup = store["standups"].find("channel_id", channel_id)
+        if standup is None:
+            raise InputError("an active standup is not currently running in the channel")
+        standup["message_queue"] += f"{name}: {message}\n"
     return {}
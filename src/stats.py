@@ -22,10 +22,9 @@ def user_stats(token):
     # Fetching the data_store
     store = data_store.get()
     workspace = store["workspace_stats"]
-    users = store["users"]
 
     # Finding the given user
-    found_user = [user for user in users if token_data["u_id"] == user["u_id"]][0]
+    found_user = data_store.get_user(token_data["u_id"])
 
     # Finds the total number of channels, dms, and messages
     total_channels = workspace["channels_exist"][-1]["num_channels_exist"]
@@ -58,27 +58,20 @@ def user_profile(token, u_id):
         Returns {name_first, name_last, email, handle_str}
 
     """
-    # Loading the data store
-    store = data_store.get()
-    users = store["users"]
-    removed = store["removed_users"]
     u_id = int(u_id)
     # Validating the input token
     extract_token(token)
 
-    # Finding the correct user
-    found_user = [user for user in users if user["u_id"] == u_id]
+    # Finding the correct user, who may have been removed
+    found_user = data_store.get_user(u_id) or data_store.get_removed_user(u_id)
 
     # Check to ensure a valid user has been found
-    if len(found_user) == 0:
-        found_user = [user for user in removed if user["u_id"] == u_id]
-
-    if len(found_user) == 0:
+    if not found_user:
         raise InputError(description="User Not Found")
 
     user = {
         key: value
-        for key, value in found_user[0].items()
+        for key, value in found_user.items()
         if key not in ("session_ids", "password", "user_stats", "reset_codes")
     }
     return {"user": user}
@@ -100,10 +93,6 @@ def user_set_name(token, name_first, name_last):
     Return Value:
         Returns {}
     """
-    # Loading the data store
-    store = data_store.get()
-    users = store["users"]
-
     # Validating the token
     u_information = extract_token(token)
 
@@ -113,9 +102,10 @@ def user_set_name(token, name_first, name_last):
             raise InputError(description="Invalid Length of Name")
 
     # Changes the values in the dictionary
-    found_user = [user for user in users if user["u_id"] == u_information["u_id"]][0]
-    found_user["name_first"] = name_first
-    found_user["name_last"] = name_last
+    found_user = data_store.get_user(u_information["u_id"])
+    with data_store.locked(("user", u_information["u_id"])):
+        found_user["name_first"] = name_first
+        found_user["name_last"] = name_last
 
     return {}
 
@@ -137,10 +127,6 @@ def user_set_email(token, email):
         Returns {}
 
     """
-    # Loading the data store
-    store = data_store.get()
-    users = store["users"]
-
     # Validating the token
     u_information = extract_token(token)
 
@@ -148,14 +134,14 @@ def user_set_email(token, email):
     if not re.fullmatch(r"^[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}$", email):
         raise InputError(description="invalid email")
 
-    # Checks if the email address is being used
-    invalid = any(True for user in users if user["email"] == email)
-    if invalid:
-        raise InputError(description="Email already in use")
+    with data_store.locked(("emails",), ("user", u_information["u_id"])):
+        # Checks if the email address is being used
+        if data_store.get_user_by_email(email):
+            raise InputError(description="Email already in use")
 
-    # Changes the values in the dictionary
-    found_user = [user for user in users if user["u_id"] == u_information["u_id"]][0]
-    found_user["email"] = email
+        # Changes the values in the dictionary
+        found_user = data_store.get_user(u_information["u_id"])
+        found_user["email"] = email
     return {}
 
 
@@ -177,10 +163,6 @@ def user_set_handle(token, handle_str):
         Returns {}
 
     """
-    # Loading the data store
-    store = data_store.get()
-    users = store["users"]
-
     # Validating the token
     u_information = extract_token(token)
 
@@ -192,14 +174,14 @@ def user_set_handle(token, handle_str):
     if not handle_str.isalnum():
         raise InputError(description="Handle contains non alphanumeric characters")
 
-    # Checks if the handle is being used
-    invalid = any(True for user in users if user["handle_str"] == handle_str)
-    if invalid:
-        raise InputError(description="Handle already in use")
+    with data_store.locked(("handles",), ("user", u_information["u_id"])):
+        # Checks if the handle is being used
+        if data_store.get_user_by_handle(handle_str):
+            raise InputError(description="Handle already in use")
 
-    # Changes the values in the dictionary
-    found_user = [user for user in users if user["u_id"] == u_information["u_id"]][0]
-    found_user["handle_str"] = handle_str
+        # Changes the values in the dictionary
+        found_user = data_store.get_user(u_information["u_id"])
+        found_user["handle_str"] = handle_str
     return {}
 
 
@@ -237,7 +219,6 @@ def user_upload_photo(token, img_url, x_start, y_start, x_end, y_end):
 
     u_information = extract_token(token)
     store = data_store.get()
-    users = store["users"]
 
     # fetch image
     img_file = f"{IMAGE_FOLDER}/{u_information['u_id']}img.jpg"
@@ -258,10 +239,7 @@ def user_upload_photo(token, img_url, x_start, y_start, x_end, y_end):
     cropped.save(img_file)
 
     # serve image
-    for user in users:
-        if user["u_id"] == u_information["u_id"]:
-            user[
-                "profile_img_url"
-            ] = f"{url}imgfolder/{str(u_information['u_id'])}img.jpg"
+    user = data_store.get_user(u_information["u_id"])
+    user["profile_img_url"] = f"{url}imgfolder/{str(u_information['u_id'])}img.jpg"
 
     data_store.set(store)
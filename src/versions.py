@@ -0,0 +1,188 @@
+"""Versions of the messages of each channel and dm, for syncing clients.
+
+Clients which keep the messages of a channel or dm on screen poll for what
+changed since they last asked. Each channel and dm has a version which goes
+up whenever one of its messages is sent, shared, edited, removed, reacted to
+or pinned, and each message the version it last changed at, so a client
+passing the version it last saw is told about those messages alone, and
+about nothing at all if the version has not moved.
+
+Like Memberships it follows the changes made to the store, see Datastore, so
+the handlers do not know about it. Versions are the time of the change in
+microseconds, made to go up by at least one each change, so that they keep
+going up when the server restarts and mean the same to every server process
+sharing the store on one machine, see src/workers.py. Only the latest
+KEPT_CHANGES changes of each channel or dm are remembered. Changes made
+before those, or before the process started, cannot be told apart, and a
+client asking about them has to fetch the messages again.
+
+    Typical usage example:
+
+    versions = Versions(changes_lock)
+    version, changed, removed = versions.since(("channels", 0), last_version)
+"""
+import time
+from collections import OrderedDict
+
+from src.memberships import ID_KEYS
+
+# Changes remembered per channel or dm
+KEPT_CHANGES = 1000
+
+
+class GroupVersions:
+    """Versions of the messages of one channel or dm."""
+
+    __slots__ = ("version", "horizon", "changes")
+
+    def __init__(self, horizon):
+        self.version = horizon
+        # versions before this are not known
+        self.horizon = horizon
+        # message_id to (version, removed), oldest change first
+        self.changes = OrderedDict()
+
+    def change(self, message_id, version, removed=False):
+        """Note that a message changed or was removed at version."""
+        self.changes[message_id] = (version, removed)
+        self.changes.move_to_end(message_id)
+        self.version = version
+        if len(self.changes) > KEPT_CHANGES:
+            _, (forgotten, _) = self.changes.popitem(last=False)
+            self.horizon = forgotten
+
+
+class Versions:
+    """Versions of the messages of each channel and dm, see the module
+    docstring."""
+
+    def __init__(self, lock):
+        """
+        Arguments:
+            lock (RLock) - lock held while the store is changed, which
+                changes are followed under
+        """
+        self.__lock = lock
+        self.__clock = 0
+        self.__started = self.__tick()
+        # (kind, group_id) to GroupVersions
+        self.__groups = {}
+
+    def __tick(self):
+        """Get the version of a change made now."""
+        self.__clock = max(self.__clock + 1, time.time_ns() // 1000)
+        return self.__clock
+
+    def __group(self, group):
+        versions = self.__groups.get(group)
+        if versions is None:
+            versions = self.__groups[group] = GroupVersions(self.__started)
+        return versions
+
+    def note(self, change, container=None, removed=()):  # pylint: disable=unused-argument
+        """Follow a change made to the store, which passes it on as its
+        observer, see Store.
+
+        Arguments:
+            change (list) - change as it was reported by the store, after it
+                was made
+            container (any) - Record or list changed
+            removed (any) - items a splice removed
+        """
+        self.__note(change, removed, True)
+
+    def note_applied(
+        self, change, container=None, removed=(), removed_ids=None
+    ):  # pylint: disable=unused-argument
+        """Follow a change another process made to the store, see note.
+
+        The messages it removed are read from where the backend keeps them,
+        which is already ahead of the change, so which they were is passed
+        as removed_ids instead, as the process which made it recorded them.
+        Without them a channel or dm messages are removed from is treated as
+        if every message in it was replaced.
+        """
+        if removed_ids is not None:
+            removed = [{"message_id": message_id} for message_id in removed_ids]
+        self.__note(change, removed, removed_ids is not None)
+
+    def __note(self, change, removed, removed_known):
+        operation, path, *args = change
+        with self.__lock:
+            if operation == "reset" or not path:
+                if operation == "reset" or args[0] in ID_KEYS:
+                    self.reset()
+                return
+            kind = path[0]
+            if kind not in ID_KEYS:
+                return
+            if len(path) == 1:
+                if operation == "splice":
+                    # channels or dms removed
+                    for group in removed:
+                        self.__groups.pop((kind, group.get(ID_KEYS[kind])), None)
+                return
+            group = (kind, path[1])
+            if len(path) == 2:
+                if operation != "splice" and args[0] == "messages":
+                    # every message replaced at once
+                    self.__forget(group)
+                return
+            if path[2] != "messages":
+                return
+            removing = len(path) == 3 and operation == "splice" and args[1] > args[0]
+            if removing and not removed_known:
+                self.__forget(group)
+                return
+            version = self.__tick()
+            versions = self.__group(group)
+            if len(path) > 3:
+                versions.change(path[3], version)
+            elif operation == "splice":
+                added = {message.get("message_id") for message in args[2]}
+                for message in removed:
+                    if message.get("message_id") not in added:
+                        versions.change(message.get("message_id"), version, removed=True)
+                for message_id in added:
+                    versions.change(message_id, version)
+
+    def __forget(self, group):
+        """Forget the changes of a channel or dm, so clients fetch its
+        messages again."""
+        versions = self.__group(group)
+        versions.version = versions.horizon = self.__tick()
+        versions.changes.clear()
+
+    def reset(self):
+        """Forget every change, for when the whole store is replaced."""
+        with self.__lock:
+            self.__started = self.__tick()
+            self.__groups = {}
+
+    def since(self, group, version):
+        """Get the messages of a channel or dm which changed after a version.
+
+        Arguments:
+            group (tuple) - (kind, group_id) of the channel or dm
+            version (int) - version the caller last saw
+
+        Return Value:
+            Returns (latest, changed, removed) where latest is the version of
+            the channel or dm, changed the message_ids of the messages
+            changed since, newest change first, and removed those of the
+            messages removed since, or (latest, None, None) if the changes
+            since version are not known
+        """
+        with self.__lock:
+            versions = self.__groups.get(group)
+            latest = self.__started if versions is None else versions.version
+            if version >= latest:
+                return latest, [], []
+            if versions is None or version < versions.horizon:
+                return latest, None, None
+            changed, removed = [], []
+            for message_id, (changed_at, gone) in reversed(versions.changes.items()):
+                if changed_at <= version:
+                    break
+                (removed if gone else changed).append(message_id)
+            return latest, changed, removed
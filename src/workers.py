@@ -0,0 +1,130 @@
+"""Runs the Streams server as several worker processes sharing one port.
+
+A single server process only ever uses one core. This starts a number of
+them, all accepting connections on the same listening socket, which share
+the SQLite database (see src/sqlite_backend.py) rather than each keeping a
+store of their own. Every worker applies the changes the others made before
+handling a request, and requests which change the store are made one at a
+time across all the workers, see Datastore.synchronised. The workers also
+share the secret tokens are signed with, so a token issued by one is valid
+for all of them.
+
+Ids come from blocks each worker leases from the shared store (see
+src/ids.py) and notifications are kept in the store, so both are the same
+whichever worker handles a request. Standups and messages sent later are
+finished by the worker which started them, once it has caught up with the
+others. A worker which dies is restarted, but the standups and messages it
+was waiting on are lost with it.
+
+The same can be done with any pre-forking server, as long as the workers
+are given the same environment, e.g. with gunicorn
+
+    STREAMS_BACKEND=sqlite STREAMS_SHARED=1 STREAMS_JWT_SECRET=... \\
+        gunicorn --workers 4 --bind 127.0.0.1:8080 src.server:APP
+
+without --preload, so each worker opens the database itself.
+
+    Typical usage example:
+
+    python3 -m src.workers --workers 4
+"""
+import argparse
+import os
+import secrets
+import signal
+import socket
+import sys
+
+from src import config
+
+
+def run_worker(listener, host, port):
+    """Serve requests accepted from a listening socket until terminated.
+
+    The server is only imported here, after forking, so each worker opens
+    the database and starts its background threads itself.
+    """
+    from werkzeug.serving import make_server
+
+    from src.server import APP
+
+    # exiting normally lets the backend commit what it has on the way out
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    signal.signal(signal.SIGINT, lambda *_: sys.exit(0))
+    server = make_server(host, port, APP, threaded=True, fd=listener.fileno())
+    server.serve_forever()
+
+
+def start(listener, host, port):
+    """Fork a worker process.
+
+    Return Value:
+        Returns its pid
+    """
+    pid = os.fork()
+    if pid == 0:
+        status = 0
+        try:
+            run_worker(listener, host, port)
+        except SystemExit as exit_:
+            status = exit_.code or 0
+        finally:
+            os._exit(status)  # pylint: disable=protected-access
+    return pid
+
+
+def serve(workers, host="127.0.0.1", port=config.port):
+    """Run workers until interrupted, restarting any which die.
+
+    Arguments:
+        workers (int) - number of worker processes
+        host (str) - address to listen on
+        port (int) - port to listen on
+    """
+    os.environ["STREAMS_BACKEND"] = "sqlite"
+    os.environ["STREAMS_SHARED"] = "1"
+    os.environ.setdefault("STREAMS_JWT_SECRET", secrets.token_urlsafe(32))
+    listener = socket.create_server((host, port), backlog=128)
+    listener.set_inheritable(True)
+
+    stopping = False
+
+    def stop(*_):
+        nonlocal stopping
+        stopping = True
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    pids = set()
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for _ in range(workers):
+        pids.add(start(listener, host, port))
+    while pids:
+        try:
+            pid, _ = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        pids.discard(pid)
+        if not stopping:
+            print(f"worker {pid} died, starting another", file=sys.stderr)
+            pids.add(start(listener, host, port))
+    listener.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=config.port)
+    args = parser.parse_args()
+    serve(args.workers, args.host, args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -278,3 +278,83 @@ def test_userpermission_auth_not_globalowner(setup_public):
         json={"token": token, "u_id": u_id, "permission_id": 2},
     )
     assert r.status_code == AccessError.code
+
+
+def test_users_import(setup_public):
+    data = setup_public
+    users = [
+        {"email": "a.b@gmail.com", "password": "secret", "name_first": "Jon", "name_last": "Doe"},
+        {"email": "jon.doe@gmail.com", "password": "secret", "name_first": "A", "name_last": "B"},
+        {"email": "c.d@gmail.com", "password": "short", "name_first": "C", "name_last": "D"},
+        {"email": "a.b@gmail.com", "password": "secret", "name_first": "A", "name_last": "B"},
+        {"email": "e.f@gmail.com", "password": "secret", "name_first": "Jon", "name_last": "Doe"},
+        {"email": "g.h@gmail.com"},
+    ]
+    r = requests.post(
+        f"{config.url}admin/users/import/v1",
+        json={"token": data["token"], "users": users},
+    )
+    assert r.status_code == 200
+    imported = r.json()["users"]
+    assert [(user["row"], user["handle_str"]) for user in imported] == [
+        (0, "jondoe0"),
+        (4, "jondoe1"),
+    ]
+    assert [error["row"] for error in r.json()["errors"]] == [1, 2, 3, 5]
+
+    r = requests.post(
+        f"{config.url}auth/login/v2",
+        json={"email": "e.f@gmail.com", "password": "secret"},
+    )
+    assert r.status_code == 200
+    assert r.json()["auth_user_id"] == imported[1]["auth_user_id"]
+    r = requests.get(f"{config.url}users/all/v1", params={"token": data["token"]})
+    assert len(r.json()["users"]) == 4
+
+
+def test_users_import_csv(setup_public):
+    data = setup_public
+    r = requests.post(
+        f"{config.url}admin/users/import/v1",
+        json={
+            "token": data["token"],
+            "csv": "email,password,name_first,name_last\n"
+            "x.y@gmail.com,secret,Xavier,Young\n"
+            "bad,secret,Bad,Email\n",
+        },
+    )
+    assert r.status_code == 200
+    assert [user["handle_str"] for user in r.json()["users"]] == ["xavieryoung"]
+    assert [error["row"] for error in r.json()["errors"]] == [1]
+
+    r = requests.post(
+        f"{config.url}admin/users/import/v1",
+        json={"token": data["token"], "csv": "email,password\nx@y.com,secret\n"},
+    )
+    assert r.status_code == InputError.code
+
+
+def test_users_import_not_globalowner(setup_public):
+    data = setup_public
+    r = requests.post(
+        f"{config.url}admin/users/import/v1",
+        json={"token": data["user_token"], "users": []},
+    )
+    assert r.status_code == AccessError.code
+
+
+def test_users_import_limit(setup_public):
+    data = setup_public
+    # one more than src.admin.IMPORT_LIMIT, which is refused before any
+    # password is hashed
+    users = [
+        {"email": f"user{row}@gmail.com", "password": "secret", "name_first": "A", "name_last": "B"}
+        for row in range(1001)
+    ]
+    r = requests.post(
+        f"{config.url}admin/users/import/v1",
+        json={"token": data["token"], "users": users},
+    )
+    assert r.status_code == InputError.code
+    r = requests.get(f"{config.url}users/all/v1", params={"token": data["token"]})
+    assert len(r.json()["users"]) == 2
@@ -1,4 +1,6 @@
 """Tests for functions from src/auth.py"""
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
 from src import config
 from src.error import AccessError, InputError
@@ -526,6 +528,65 @@ def test_logout_2x():
     assert r.status_code == AccessError.code
 
 
+def test_logout_same_token_at_once():
+    requests.delete(f"{config.url}clear/v1")
+
+    r = requests.post(
+        f"{config.url}auth/register/v2",
+        json={
+            "email": "wow@wow.com",
+            "password": "awesome",
+            "name_first": "first",
+            "name_last": "last",
+        },
+    )
+    assert r.status_code == 200
+    token = r.json()["token"]
+
+    def logout(_):
+        return requests.post(f"{config.url}auth/logout/v1", json={"token": token}).status_code
+
+    with ThreadPoolExecutor(8) as pool:
+        codes = sorted(pool.map(logout, range(8)))
+    # only one of them ends the session, the rest find it already ended
+    assert codes == [200] + [AccessError.code] * 7
+
+
+def test_logout_used_token():
+    requests.delete(f"{config.url}clear/v1")
+
+    r = requests.post(
+        f"{config.url}auth/register/v2",
+        json={
+            "email": "wow@wow.com",
+            "password": "awesome",
+            "name_first": "first",
+            "name_last": "last",
+        },
+    )
+    token = r.json()["token"]
+    r = requests.post(
+        f"{config.url}auth/login/v2",
+        json={"email": "wow@wow.com", "password": "awesome"},
+    )
+    other_token = r.json()["token"]
+
+    for used in (token, other_token):
+        r = requests.get(f"{config.url}channels/list/v2", params={"token": used})
+        assert r.status_code == 200
+
+    r = requests.post(
+        f"{config.url}auth/logout/v1",
+        json={"token": token},
+    )
+    assert r.status_code == 200
+
+    r = requests.get(f"{config.url}channels/list/v2", params={"token": token})
+    assert r.status_code == AccessError.code
+    r = requests.get(f"{config.url}channels/list/v2", params={"token": other_token})
+    assert r.status_code == 200
+
+
 def test_logout_removed_user():
     requests.delete(f"{config.url}clear/v1")
 
@@ -624,3 +685,52 @@ def test_reset_invalid_email():
         },
     )
     assert r.status_code == 200
+
+
+def register_first_last(count, start=0):
+    return [
+        requests.post(
+            f"{config.url}auth/register/v2",
+            json={
+                "email": f"wow{number}@wow.com",
+                "password": "awesome",
+                "name_first": "first",
+                "name_last": "last",
+            },
+        ).json()
+        for number in range(start, start + count)
+    ]
+
+
+def handle_of(user):
+    return requests.get(
+        f"{config.url}user/profile/v1",
+        params={"token": user["token"], "u_id": user["auth_user_id"]},
+    ).json()["user"]["handle_str"]
+
+
+def test_handle_freed_by_rename():
+    requests.delete(f"{config.url}clear/v1")
+    users = register_first_last(4)
+    assert [handle_of(user) for user in users] == [
+        "firstlast", "firstlast0", "firstlast1", "firstlast2",
+    ]
+    requests.put(
+        f"{config.url}user/profile/sethandle/v1",
+        json={"token": users[2]["token"], "handle_str": "renamed"},
+    )
+    # the lowest number free again is given out before the next one
+    later = register_first_last(2, 4)
+    assert [handle_of(user) for user in later] == ["firstlast1", "firstlast3"]
+
+
+def test_handle_freed_by_removal():
+    requests.delete(f"{config.url}clear/v1")
+    users = register_first_last(4)
+    r = requests.delete(
+        f"{config.url}admin/user/remove/v1",
+        json={"token": users[0]["token"], "u_id": users[1]["auth_user_id"]},
+    )
+    assert r.status_code == 200
+    later = register_first_last(2, 4)
+    assert [handle_of(user) for user in later] == ["firstlast0", "firstlast3"]
@@ -0,0 +1,54 @@
+import json
+
+import pytest
+
+from src.columnar import convert, decode, encode, is_columnar
+
+STORE = {
+    "users": [
+        {"u_id": 0, "email": "a@example.com", "name_first": "Jon", "session_ids": [0, 1]},
+        {"u_id": 1, "email": "b@example.com", "name_first": "Jon", "session_ids": []},
+        # a record with other fields than the rest
+        {"u_id": 2, "email": "c@example.com", "permission_id": 1},
+    ],
+    "channels": [
+        {
+            "channel_id": 0,
+            "is_public": True,
+            "messages": [
+                {"message_id": 1, "message": "héllo 👋", "reacts": [{"react_id": 1, "u_ids": [0, 1]}]},
+                {"message_id": 0, "message": "", "reacts": [], "is_pinned": False},
+            ],
+        }
+    ],
+    "max_ids": {"user": 2, "message": 2 ** 40},
+    "mixed": [None, 1, 2.5, "three", [4], {"five": 5}, True, -(2 ** 70)],
+    "empty": [],
+}
+
+
+@pytest.mark.parametrize("value", [STORE, [], {}, None, 0, "text", [[[]]], [2 ** 63, -1]])
+def test_round_trip(value):
+    data = encode(value)
+    assert is_columnar(data)
+    decoded = decode(data)
+    assert decoded == value
+    # bools stay bools rather than becoming ints
+    assert json.dumps(decoded) == json.dumps(value)
+
+
+def test_not_columnar():
+    assert not is_columnar(b'{"users": []}')
+    with pytest.raises(ValueError):
+        decode(b'{"users": []}')
+    with pytest.raises(TypeError):
+        encode({"bytes": b"nope"})
+
+
+def test_convert(tmp_path):
+    source = tmp_path / "datastore.json"
+    source.write_text(json.dumps(STORE))
+    convert(source, tmp_path / "datastore.columns", True)
+    assert is_columnar((tmp_path / "datastore.columns").read_bytes())
+    convert(tmp_path / "datastore.columns", tmp_path / "back.json", False)
+    assert json.loads((tmp_path / "back.json").read_text()) == STORE
@@ -0,0 +1,41 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def isolated(tmp_path):
+    """Run code in new server processes working in a temporary directory,
+    away from the datastore of the server the other tests use.
+
+    The fixture is a function taking the code, the backend and the names to
+    define for it, which returns what the code printed last, as json.
+    """
+    # the datastore downloads the default profile picture unless it is there
+    image = os.path.join(ROOT, "imgfolder", "DEFAULT_IMG.jpg")
+    if os.path.isfile(image):
+        os.mkdir(tmp_path / "imgfolder")
+        shutil.copy(image, tmp_path / "imgfolder")
+
+    def run(code, backend="json", env=None, **names):
+        prelude = "import json\n" + "".join(f"{name} = {value!r}\n" for name, value in names.items())
+        result = subprocess.run(
+            [sys.executable, "-c", prelude + textwrap.dedent(code)],
+            cwd=tmp_path,
+            env=dict(os.environ, PYTHONPATH=ROOT, STREAMS_BACKEND=backend, **(env or {})),
+            capture_output=True,
+            text=True,
+            check=False,
+            timeout=60,
+        )
+        assert result.returncode == 0, result.stderr
+        return json.loads(result.stdout.splitlines()[-1])
+
+    return run
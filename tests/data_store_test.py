@@ -0,0 +1,313 @@
+import textwrap
+
+import pytest
+
+WRITE = """
+    from src.auth import auth_register_v2
+    from src.channels import channels_create_v2
+    from src.data_store import data_store
+    from src.dm import dm_create_v1
+    from src.message import (
+        message_edit_v1,
+        message_react_v1,
+        message_remove_v1,
+        message_send_v1,
+        message_senddm_v1,
+    )
+
+    owner = auth_register_v2("owner@example.com", "password", "Owner", "One")
+    member = auth_register_v2("member@example.com", "password", "Owner", "One")
+    owner_id, member_id = owner["auth_user_id"], member["auth_user_id"]
+    channel_id = channels_create_v2(owner["token"], "general", True)["channel_id"]
+    ids = [message_send_v1(owner_id, channel_id, f"message {n}")["message_id"] for n in range(5)]
+    if SNAPSHOT:
+        data_store.snapshot()
+    message_edit_v1(owner_id, ids[1], "edited")
+    message_remove_v1(owner_id, ids[2])
+    message_react_v1(owner_id, ids[0], 1)
+    dm_id = dm_create_v1(owner["token"], [member_id])["dm_id"]
+    ids.append(message_senddm_v1(member_id, dm_id, "hello")["message_id"])
+    print(json.dumps({"owner_id": owner_id, "channel_id": channel_id, "dm_id": dm_id, "ids": ids}))
+"""
+
+READ = """
+    from src.data_store import data_store
+
+    member = data_store.get_user_by_email("member@example.com")
+    channel = data_store.get_channel(CHANNEL_ID)
+    print(json.dumps({
+        "handles": [user["handle_str"] for user in data_store.get()["users"]],
+        "member_id": member and member["u_id"],
+        "member_by_handle": data_store.get_user_by_handle("ownerone0")["u_id"],
+        "channel": [message["message"] for message in channel["messages"]],
+        "reacts": data_store.get_message(IDS[0])[0]["reacts"][0]["u_ids"],
+        "removed": data_store.get_message(IDS[2]),
+        "dm": [message["message"] for message in data_store.get_dm(DM_ID)["messages"]],
+        "dm_message": data_store.get_message(IDS[5])[1]["dm_id"],
+        "next_message_id": data_store.next_id("message"),
+    }))
+"""
+
+
+@pytest.mark.parametrize("backend", ["json", "sqlite"])
+@pytest.mark.parametrize("snapshot", [False, True])
+def test_reload(isolated, backend, snapshot):
+    written = isolated(WRITE, backend, SNAPSHOT=snapshot)
+    names = {"CHANNEL_ID": written["channel_id"], "DM_ID": written["dm_id"], "IDS": written["ids"]}
+    for _ in range(2):
+        read = isolated(READ, backend, **names)
+        assert read["handles"] == ["ownerone", "ownerone0"]
+        assert read["member_id"] == read["member_by_handle"]
+        # newest first
+        assert read["channel"] == ["message 4", "message 3", "edited", "message 0"]
+        assert read["reacts"] == [written["owner_id"]]
+        assert read["removed"] is None
+        assert read["dm"] == ["hello"]
+        assert read["dm_message"] == written["dm_id"]
+        assert read["next_message_id"] > max(written["ids"])
+
+
+def test_sqlite_backend_imported_first(isolated):
+    imported = isolated(
+        """
+        import src.sqlite_backend
+        from src.data_store import data_store
+
+        print(json.dumps(type(data_store.get()["users"]).__name__))
+        """,
+        "sqlite",
+    )
+    assert imported == "IndexedList"
+
+
+STORE = """
+    from copy import deepcopy
+
+    from src.data_store import INITIAL_OBJECT, data_store
+
+    store = deepcopy(INITIAL_OBJECT)
+    store["users"] = [
+        {"u_id": u_id, "email": f"user{u_id}@example.com", "handle_str": f"user{u_id}"}
+        for u_id in range(3)
+    ]
+    store["channels"] = [
+        {"channel_id": channel_id, "messages": [{"message_id": channel_id * 10, "message": "hi"}]}
+        for channel_id in range(2)
+    ]
+    data_store.set(store)
+    store = data_store.get()
+"""
+
+
+def with_store(isolated, code):
+    return isolated(textwrap.dedent(STORE) + textwrap.dedent(code))
+
+
+def test_find_by_id(isolated):
+    found = with_store(
+        isolated,
+        """
+        print(json.dumps([
+            data_store.get_user(1)["u_id"],
+            data_store.get_user_by_email("user2@example.com")["u_id"],
+            data_store.get_user_by_handle("user0")["u_id"],
+            data_store.get_user(5),
+            data_store.get_user([1]),
+            data_store.get_channel(1)["channel_id"],
+            data_store.get_message(10)[1]["channel_id"],
+            data_store.get_message("10"),
+        ]))
+        """
+    )
+    assert found == [1, 2, 0, None, None, 1, 1, None]
+
+
+def test_index_follows_changes(isolated):
+    found = with_store(
+        isolated,
+        """
+        user = data_store.get_user(1)
+        user["email"] = "changed@example.com"
+        found = [
+            data_store.get_user_by_email("changed@example.com")["u_id"],
+            data_store.get_user_by_email("user1@example.com"),
+        ]
+        store["users"].remove(user)
+        store["users"].append({"u_id": 3, "email": "user3@example.com", "handle_str": "user3"})
+        found += [data_store.get_user(1), data_store.get_user_by_handle("user3")["u_id"]]
+
+        first, second = store["channels"]
+        second["messages"].insert(0, {"message_id": 11, "message": "new"})
+        found.append(data_store.get_message(11)[0]["message"])
+        store["channels"].remove(second)
+        found += [data_store.get_message(11), data_store.get_message(0)[0]["message"]]
+        print(json.dumps(found))
+        """
+    )
+    assert found == [1, None, None, 3, "new", None, "hi"]
+
+
+MESSAGES = """
+    from src.data_store import build_store
+
+    def channel_messages(count):
+        store = build_store({
+            "channels": [{
+                "channel_id": 0,
+                # newest first, as stored
+                "messages": [{"message_id": number} for number in reversed(range(count))],
+            }],
+        })
+        return store["channels"][0]["messages"]
+
+    def ids(messages):
+        return [message["message_id"] for message in messages]
+"""
+
+
+def with_messages(isolated, code, **names):
+    return isolated(textwrap.dedent(MESSAGES) + textwrap.dedent(code), **names)
+
+
+def test_message_list_order(isolated):
+    found = with_messages(
+        isolated,
+        """
+        messages = channel_messages(5)
+        found = [type(messages).__name__, ids(messages), ids(reversed(messages))]
+        messages.insert(0, {"message_id": 5})
+        found += [ids(messages[0:3]), messages[-1]["message_id"]]
+        del messages[2]
+        found += [ids(messages), messages.index(messages.find("message_id", 2))]
+        messages[1:3] = [{"message_id": 6}]
+        found.append(ids(messages))
+        print(json.dumps(found))
+        """,
+    )
+    assert found == [
+        "MessageList",
+        [4, 3, 2, 1, 0],
+        [0, 1, 2, 3, 4],
+        [5, 4, 3],
+        0,
+        [5, 4, 2, 1, 0],
+        2,
+        [5, 6, 1, 0],
+    ]
+
+
+def test_message_list_like_a_list(isolated):
+    # the same changes made to a plain list, checked after every one
+    mismatches = with_messages(
+        isolated,
+        """
+        import random
+
+        rng = random.Random(0)
+        messages = channel_messages(50)
+        expected = list(reversed(range(50)))
+        next_id = 50
+        mismatches = []
+        for step in range(2000):
+            choice = rng.random()
+            if choice < 0.4:
+                messages.insert(0, {"message_id": next_id})
+                expected.insert(0, next_id)
+                next_id += 1
+            elif choice < 0.8 and expected:
+                # removing leaves gaps, which have to be skipped
+                position = rng.randrange(len(expected))
+                del messages[position]
+                del expected[position]
+            elif choice < 0.85 and expected:
+                start = rng.randrange(len(expected))
+                stop = rng.randrange(start, len(expected) + 1)
+                items = [{"message_id": next_id + number} for number in range(rng.randrange(3))]
+                messages[start:stop] = items
+                expected[start:stop] = [item["message_id"] for item in items]
+                next_id += len(items)
+            start = rng.randrange(len(expected) + 1)
+            stop = rng.randrange(start, len(expected) + 2)
+            if ids(messages[start:stop]) != expected[start:stop] or len(messages) != len(expected):
+                mismatches.append(step)
+            if expected:
+                position = rng.randrange(len(expected))
+                record = messages.find("message_id", expected[position])
+                if messages.index(record) != position or messages[position] is not record:
+                    mismatches.append(step)
+        if ids(messages) != expected:
+            mismatches.append("end")
+        print(json.dumps(mismatches))
+        """,
+    )
+    assert mismatches == []
+
+
+def test_message_list_remove_newest(isolated):
+    # removing the newest message leaves no gap, so no tree is built for it
+    found = with_messages(
+        isolated,
+        """
+        messages = channel_messages(1000)
+        MessageList = type(messages)
+        build_tree = MessageList._MessageList__build_tree
+        builds = []
+
+        def counted(self):
+            builds.append(len(self.slots))
+            build_tree(self)
+
+        MessageList._MessageList__build_tree = counted
+        for number in range(1000, 1100):
+            messages.insert(0, {"message_id": number})
+            del messages[0]
+        found = [len(builds), ids(messages[:2]), len(messages)]
+        del messages[500]
+        found.append(len(builds))
+        for _ in range(10):
+            del messages[0]
+        found += [len(builds), ids(messages[:2]), ids(messages[489:491]), len(messages)]
+        print(json.dumps(found))
+        """,
+    )
+    assert found == [0, [999, 998], 1000, 1, 1, [989, 988], [500, 498], 989]
+
+
+PAGES = """
+    from src.auth import auth_register_v2
+    from src.channels import channels_create_v2
+    from src.message import (
+        channel_messages_v1,
+        channel_messages_v3,
+        message_remove_v1,
+        message_send_v1,
+    )
+
+    owner = auth_register_v2("owner@example.com", "password", "Owner", "One")
+    owner_id = owner["auth_user_id"]
+    channel_id = channels_create_v2(owner["token"], "general", True)["channel_id"]
+    ids = [message_send_v1(owner_id, channel_id, f"message {n}")["message_id"] for n in range(120)]
+
+    def texts(page):
+        return [int(message["message"].split()[1]) for message in page["messages"]]
+
+    # read in turn, each page going on from where the last one ended
+    found = [texts(channel_messages_v1(owner_id, channel_id, start)) for start in (0, 50, 100)]
+    message_remove_v1(owner_id, ids[60])
+    found.append(texts(channel_messages_v1(owner_id, channel_id, 50)))
+    before = channel_messages_v3(owner_id, channel_id, before_id=ids[62], limit=3)
+    after = channel_messages_v3(owner_id, channel_id, after_id=ids[1], limit=100)
+    oldest = channel_messages_v3(owner_id, channel_id, before_id=ids[2], limit=5)
+    found += [texts(before), before["has_more"], texts(after)[-3:], after["has_more"]]
+    found += [texts(oldest), oldest["has_more"]]
+    print(json.dumps(found))
+"""
+
+
+@pytest.mark.parametrize("backend", ["json", "sqlite"])
+def test_message_pages(isolated, backend):
+    found = isolated(PAGES, backend)
+    newest_first = list(reversed(range(120)))
+    assert found[:3] == [newest_first[0:50], newest_first[50:100], newest_first[100:]]
+    assert found[3] == [number for number in newest_first if number != 60][50:100]
+    assert found[4:] == [[61, 59, 58], True, [4, 3, 2], True, [1, 0], False]
@@ -182,6 +182,78 @@ def test_messages(dm_create):
     assert r.json() == {"messages": [], "start": 0, "end": -1}
 
 
+def test_messages_cursor(dm_create):
+    dm_id, dm_users = dm_create
+    msg_ids = [
+        requests.post(
+            f"{config.url}message/senddm/v1",
+            json={"token": dm_users[0]["token"], "dm_id": dm_id, "message": f"hi {i}"},
+        ).json()["message_id"]
+        for i in range(5)
+    ]
+
+    def page(**params):
+        r = requests.get(
+            f"{config.url}dm/messages/v2",
+            params={"token": dm_users[1]["token"], "dm_id": dm_id, "limit": 2, **params},
+        )
+        assert r.status_code == 200
+        response = r.json()
+        return [msg["message_id"] for msg in response["messages"]], response["has_more"]
+
+    assert page() == ([msg_ids[4], msg_ids[3]], True)
+    assert page(before_id=msg_ids[3]) == ([msg_ids[2], msg_ids[1]], True)
+    assert page(before_id=msg_ids[1]) == ([msg_ids[0]], False)
+    assert page(after_id=msg_ids[0]) == ([msg_ids[2], msg_ids[1]], True)
+    assert page(after_id=msg_ids[2]) == ([msg_ids[4], msg_ids[3]], False)
+    assert page(after_id=msg_ids[4]) == ([], False)
+
+
+def test_messages_cursor_errors(dm_create):
+    dm_id, dm_users = dm_create
+    msg_id = requests.post(
+        f"{config.url}message/senddm/v1",
+        json={"token": dm_users[0]["token"], "dm_id": dm_id, "message": "hi"},
+    ).json()["message_id"]
+    for params in (
+        {"limit": 0},
+        {"limit": 1000},
+        {"before_id": msg_id, "after_id": msg_id},
+        {"before_id": msg_id + 1},
+        {"after_id": "abc"},
+    ):
+        r = requests.get(
+            f"{config.url}dm/messages/v2",
+            params={"token": dm_users[0]["token"], "dm_id": dm_id, **params},
+        )
+        assert r.status_code == InputError.code
+
+
+def test_messages_sync(dm_create):
+    dm_id, dm_users = dm_create
+    params = {"token": dm_users[1]["token"], "dm_id": dm_id}
+    r = requests.get(f"{config.url}dm/messages/sync/v1", params=params)
+    assert r.status_code == 200
+    assert r.json()["reset"] is True
+    assert r.json()["messages"] == []
+
+    msg_id = requests.post(
+        f"{config.url}message/senddm/v1",
+        json={"token": dm_users[0]["token"], "dm_id": dm_id, "message": "hi"},
+    ).json()["message_id"]
+    r = requests.get(
+        f"{config.url}dm/messages/sync/v1", params={**params, "since": r.json()["version"]}
+    )
+    assert r.status_code == 200
+    assert [msg["message_id"] for msg in r.json()["messages"]] == [msg_id]
+
+    r = requests.get(
+        f"{config.url}dm/messages/sync/v1",
+        params={"token": dm_users[1]["token"], "dm_id": dm_id + 1},
+    )
+    assert r.status_code == InputError.code
+
+
 def test_messages_bad_index(dm_create):
     dm_id, dm_users = dm_create
 
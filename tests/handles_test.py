@@ -0,0 +1,48 @@
+from threading import RLock
+
+from src.handles import Handles
+
+
+def registry(*bases):
+    handles = Handles(RLock())
+    taken = set()
+    lookups = []
+
+    def is_taken(handle):
+        lookups.append(handle)
+        return handle in taken
+
+    def allocate(base):
+        handle = handles.allocate(base, is_taken)
+        taken.add(handle)
+        return handle
+
+    for base in bases:
+        allocate(base)
+    return handles, taken, lookups, allocate
+
+
+def test_rename_frees_only_its_base():
+    handles, taken, lookups, allocate = registry(*["johnsmith"] * 4, *["jane"] * 3)
+    taken.remove("johnsmith1")
+    handles.note(["set", ["users", 2], "handle_str", "renamed"], "johnsmith1")
+    lookups.clear()
+    assert allocate("johnsmith") == "johnsmith1"
+    assert allocate("jane") == "jane2"
+    # jane0 was not looked up again
+    assert lookups == ["johnsmith", "johnsmith1", "jane", "jane1", "jane2"]
+
+
+def test_removal_frees_number():
+    handles, taken, _, allocate = registry(*["ab"] * 13)
+    taken.remove("ab10")
+    handles.note(["splice", ["users"], 11, 12, []], [{"u_id": 11, "handle_str": "ab10"}])
+    assert allocate("ab") == "ab10"
+    assert allocate("ab") == "ab12"
+
+
+def test_unknown_change_forgets():
+    handles, taken, _, allocate = registry(*["ab"] * 3)
+    taken.remove("ab0")
+    handles.note(["splice", ["users"], 1, 2, []])
+    assert allocate("ab") == "ab0"
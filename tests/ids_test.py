@@ -0,0 +1,54 @@
+from threading import Thread
+
+from src.ids import IdAllocator
+
+
+def store_lease():
+    """Lease the way Datastore does, from a max_ids kept per kind."""
+    max_ids = {}
+    leases = []
+
+    def lease(kind, number):
+        leases.append((kind, number))
+        start = max_ids.get(kind, -1) + 1
+        max_ids[kind] = start + number - 1
+        return start
+
+    return lease, leases, max_ids
+
+
+def test_ids_from_blocks():
+    lease, leases, max_ids = store_lease()
+    ids = IdAllocator(lease, block=4)
+    assert [ids.next_id("message") for _ in range(6)] == list(range(6))
+    assert ids.next_id("user") == 0
+    # one lease per block, not per id
+    assert leases == [("message", 4), ("message", 4), ("user", 4)]
+    assert max_ids == {"message": 7, "user": 3}
+
+
+def test_reset_leaves_gap():
+    lease, _, _ = store_lease()
+    ids = IdAllocator(lease, block=4)
+    ids.next_id("dm")
+    ids.reset()
+    # the rest of the block is never handed out, so no id is used twice
+    assert ids.next_id("dm") == 4
+
+
+def test_unique_across_threads():
+    lease, _, _ = store_lease()
+    ids = IdAllocator(lease, block=8)
+    handed_out = [[] for _ in range(8)]
+
+    def take(taken):
+        for _ in range(500):
+            taken.append(ids.next_id("message"))
+
+    threads = [Thread(target=take, args=(taken,)) for taken in handed_out]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    every = [new_id for taken in handed_out for new_id in taken]
+    assert sorted(every) == list(range(4000))
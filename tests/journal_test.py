@@ -0,0 +1,90 @@
+from threading import Thread
+
+from src.journal import Journal
+
+
+def changes(count, start=0):
+    return [["set", ["max_ids"], "message", number] for number in range(start, start + count)]
+
+
+def opened(path):
+    # never flushed in the background, so only sync writes
+    journal = Journal(str(path), flush_interval=3600)
+    replayed = list(journal.replay(0))
+    journal.open()
+    return journal, replayed
+
+
+def test_replay(tmp_path):
+    journal, replayed = opened(tmp_path / "journal")
+    assert not replayed
+    for change in changes(5):
+        journal.record(change)
+    journal.sync()
+
+    journal, replayed = opened(tmp_path / "journal")
+    assert replayed == changes(5)
+    assert journal.seq == 5
+    assert list(Journal(str(tmp_path / "journal")).replay(3)) == changes(2, 3)
+
+
+def test_sync(tmp_path):
+    journal, _ = opened(tmp_path / "journal")
+    journal.record(changes(1)[0])
+    # recorded but not yet on disk
+    assert (tmp_path / "journal").read_bytes() == b""
+    journal.sync()
+    assert journal.durable == 1
+    assert (tmp_path / "journal").read_bytes().count(b"\n") == 1
+
+
+def test_sync_group(tmp_path):
+    journal, _ = opened(tmp_path / "journal")
+
+    def record(number):
+        journal.record(changes(1, number)[0])
+        journal.sync()
+
+    threads = [Thread(target=record, args=(number,)) for number in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert journal.durable == 20
+    _, replayed = opened(tmp_path / "journal")
+    assert sorted(change[3] for change in replayed) == list(range(20))
+
+
+def test_torn_tail(tmp_path):
+    journal, _ = opened(tmp_path / "journal")
+    for change in changes(3):
+        journal.record(change)
+    journal.sync()
+    # a crash part way through writing a line
+    with open(tmp_path / "journal", "ab") as file:
+        file.write(b'4 ["set",["max_ids"],"mess')
+
+    journal, replayed = opened(tmp_path / "journal")
+    assert replayed == changes(3)
+    assert journal.seq == 3
+    journal.record(changes(1, 3)[0])
+    journal.sync()
+
+    _, replayed = opened(tmp_path / "journal")
+    assert replayed == changes(4)
+
+
+def test_rotate(tmp_path):
+    journal, _ = opened(tmp_path / "journal")
+    for change in changes(3):
+        journal.record(change)
+    assert journal.rotate() == 3
+    for change in changes(2, 3):
+        journal.record(change)
+    journal.sync()
+
+    _, replayed = opened(tmp_path / "journal")
+    assert replayed == changes(5)
+    journal.drop(3)
+    assert journal.segments() == []
+    assert list(Journal(str(tmp_path / "journal")).replay(3)) == changes(2, 3)
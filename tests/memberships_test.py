@@ -0,0 +1,83 @@
+import textwrap
+
+# build_store lives with the datastore, which opens a datastore in the working
+# directory, so the member sets are tried out in processes of their own
+GROUPS = """
+    from threading import RLock
+
+    from src.data_store import build_store
+    from src.memberships import Memberships
+
+    store = build_store({
+        "channels": [
+            {"channel_id": 0, "all_members": [0, 1], "owner_members": [0]},
+            {"channel_id": 1, "all_members": [1], "owner_members": [1]},
+        ],
+        "dms": [{"dm_id": 0, "members": [0, 2]}],
+    })
+    memberships = Memberships(lambda: store, RLock())
+    store.observer = lambda change, container, removed: memberships.note(change)
+"""
+
+
+def with_groups(isolated, code):
+    return isolated(textwrap.dedent(GROUPS) + textwrap.dedent(code))
+
+
+def test_is_member(isolated):
+    found = with_groups(
+        isolated,
+        """
+        print(json.dumps([
+            memberships.is_member(("channels", 0), "all_members", 1),
+            memberships.is_member(("channels", 0), "owner_members", 0),
+            memberships.is_member(("channels", 0), "owner_members", 1),
+            memberships.is_member(("dms", 0), "members", 2),
+            memberships.is_member(("channels", 5), "all_members", 0),
+            memberships.is_member(("channels", 0), "all_members", [0]),
+        ]))
+        """,
+    )
+    assert found == [True, True, False, True, False, False]
+
+
+def test_groups_of(isolated):
+    found = with_groups(
+        isolated,
+        """
+        print(json.dumps([memberships.groups_of(u_id) for u_id in (0, 1, 3)]))
+        """,
+    )
+    assert found == [[["channels", 0], ["dms", 0]], [["channels", 0], ["channels", 1]], []]
+
+
+def test_follows_changes(isolated):
+    found = with_groups(
+        isolated,
+        """
+        found = [memberships.groups_of(2)]
+        channel = store["channels"][1]
+        channel["all_members"].append(2)
+        channel["owner_members"].append(2)
+        found.append(memberships.is_member(("channels", 1), "owner_members", 2))
+        store["channels"][0]["all_members"].remove(1)
+        found.append(memberships.groups_of(1))
+        store["dms"].append({"dm_id": 1, "members": [2]})
+        found.append(memberships.groups_of(2))
+        store["dms"].remove(store["dms"][0])
+        found.append(memberships.groups_of(2))
+        found.append(memberships.is_member(("dms", 0), "members", 0))
+        channel["all_members"] = [0]
+        found.append(memberships.groups_of(0))
+        print(json.dumps(found))
+        """,
+    )
+    assert found == [
+        [["dms", 0]],
+        True,
+        [["channels", 1]],
+        [["channels", 1], ["dms", 0], ["dms", 1]],
+        [["channels", 1], ["dms", 1]],
+        False,
+        [["channels", 0], ["channels", 1]],
+    ]
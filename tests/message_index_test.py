@@ -0,0 +1,107 @@
+import time
+from threading import Event, Thread
+
+from src.message_index import MessageIndex, SharedLock, TrigramIndex
+
+def channel_store():
+    messages = [
+        {"message_id": message_id, "message": f"message {message_id}", "time_created": message_id}
+        for message_id in reversed(range(10))
+    ]
+    messages[-1]["message"] = "message hello there"
+    messages[-2]["message"] = "message hello world"
+    return {"channels": [{"channel_id": 0, "messages": messages}], "dms": []}
+
+
+def store_index(store):
+    def lookup(message_id):
+        channel = store["channels"][0]
+        for message in channel["messages"]:
+            if message["message_id"] == message_id:
+                return message, channel
+        return None
+
+    return MessageIndex(lookup)
+
+
+def built(index, store):
+    deadline = time.monotonic() + 5
+    while index.find(["x"], [], store) is None:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_find():
+    store = channel_store()
+    index = store_index(store)
+    # built in the background the first time
+    assert index.find(["hello"], [("channels", 0)], store) is None
+    built(index, store)
+    assert index.find(["hello"], [("channels", 0)], store) == [
+        (1, "message hello world", 1),
+        (0, "message hello there", 0),
+    ]
+    # too short or too common for the index to narrow down
+    assert index.find(["he"], [("channels", 0)], store) is None
+    assert index.find(["message"], [("channels", 0)], store) is None
+    messages = store["channels"][0]["messages"]
+    messages.insert(0, {"message_id": 10, "message": "hello again", "time_created": 10})
+    index.note(["splice", ["channels", 0, "messages"], 0, 0, [messages[0]]])
+    messages[-1]["message"] = "goodbye"
+    index.note(["set", ["channels", 0, "messages", 0], "message", "goodbye"], "message hello there")
+    assert [found[0] for found in index.find(["hello"], [("channels", 0)], store)] == [10, 1]
+    assert index.find(["hello"], [("dms", 0)], store) == []
+    # removed from the store since it was indexed
+    del messages[0]
+    assert [found[0] for found in index.find(["hello"], [("channels", 0)], store)] == [1]
+
+
+def test_edit():
+    index = TrigramIndex()
+    for message_id, text in enumerate(["hello", "yellow", "bellow"]):
+        index.add(message_id, text, ("channels", 0))
+    index.edit(0, "help", "hello")
+    assert list(index.postings["hel"]) == [0]
+    assert list(index.postings["llo"]) == [1, 2]
+    assert "ell" in index.postings
+    index.edit(1, "bell", "yellow")
+    index.edit(2, "bell", "bellow")
+    assert "llo" not in index.postings
+    assert list(index.postings["ell"]) == [1, 2]
+    # without the old text nothing is taken out
+    index.edit(1, "yell")
+    assert list(index.postings["ell"]) == [1, 2]
+    assert list(index.postings["yel"]) == [1]
+
+
+def test_searches_share_the_index():
+    lock = SharedLock()
+    entered = Event()
+
+    def read():
+        with lock.read():
+            entered.set()
+
+    with lock.read():
+        thread = Thread(target=read)
+        thread.start()
+        # not held up by the search already running
+        assert entered.wait(5)
+    thread.join()
+
+
+def test_changes_wait_for_searches():
+    lock = SharedLock()
+    order = []
+
+    def write():
+        with lock.write():
+            order.append("write")
+
+    with lock.read():
+        thread = Thread(target=write)
+        thread.start()
+        time.sleep(0.1)
+        order.append("read")
+    thread.join()
+    assert order == ["read", "write"]
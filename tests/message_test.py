@@ -210,6 +210,118 @@ def test_message_correct_end(create_public_channel):
     assert messages["end"] == end
 
 
+def test_message_get_cursor(create_public_channel, register_bob):
+    _, token, channel_id = create_public_channel
+    bob_token, _ = register_bob
+    msg_ids = [
+        requests.post(
+            f"{url}message/send/v1",
+            json={"token": token, "channel_id": channel_id, "message": f"hi {i}"},
+        ).json()["message_id"]
+        for i in range(3)
+    ]
+    r = requests.get(
+        f"{url}channel/messages/v3",
+        params={"token": token, "channel_id": channel_id, "before_id": msg_ids[2]},
+    )
+    assert r.status_code == 200
+    assert [msg["message_id"] for msg in r.json()["messages"]] == [msg_ids[1], msg_ids[0]]
+    assert r.json()["has_more"] is False
+    r = requests.get(
+        f"{url}channel/messages/v3",
+        params={"token": token, "channel_id": channel_id, "after_id": msg_ids[0], "limit": 1},
+    )
+    assert r.status_code == 200
+    assert [msg["message_id"] for msg in r.json()["messages"]] == [msg_ids[1]]
+    assert r.json()["has_more"] is True
+    r = requests.get(
+        f"{url}channel/messages/v3",
+        params={"token": bob_token, "channel_id": channel_id},
+    )
+    assert r.status_code == AccessError.code
+
+
+def sync_messages(token, channel_id, cache, version):
+    """Bring a client's cache of messages up to date the way a polling
+    client would, returning the response."""
+    r = requests.get(
+        f"{url}channel/messages/sync/v1",
+        params={"token": token, "channel_id": channel_id, "since": version},
+    )
+    assert r.status_code == 200
+    if r.json()["reset"]:
+        cache.clear()
+    for msg in r.json()["messages"]:
+        cache[msg["message_id"]] = msg
+    for msg_id in r.json()["removed_ids"]:
+        cache.pop(msg_id, None)
+    return r.json()
+
+
+def test_message_sync(create_public_channel):
+    _, token, channel_id = create_public_channel
+    msg_ids = [
+        requests.post(
+            f"{url}message/send/v1",
+            json={"token": token, "channel_id": channel_id, "message": f"hi {i}"},
+        ).json()["message_id"]
+        for i in range(3)
+    ]
+    cache = {}
+    synced = sync_messages(token, channel_id, cache, 0)
+    assert synced["reset"] is True
+    assert sorted(cache) == msg_ids
+
+    requests.put(
+        f"{url}message/edit/v1",
+        json={"token": token, "message_id": msg_ids[0], "message": "edited"},
+    )
+    requests.delete(f"{url}message/remove/v1", json={"token": token, "message_id": msg_ids[1]})
+    requests.post(
+        f"{url}message/react/v1",
+        json={"token": token, "message_id": msg_ids[2], "react_id": 1},
+    )
+    new_id = requests.post(
+        f"{url}message/send/v1",
+        json={"token": token, "channel_id": channel_id, "message": "new"},
+    ).json()["message_id"]
+    version = synced["version"]
+    synced = sync_messages(token, channel_id, cache, version)
+    assert synced["version"] > version
+    assert synced["reset"] is False
+    # only the messages which changed, newest first
+    assert [msg["message_id"] for msg in synced["messages"]] == [new_id, msg_ids[2], msg_ids[0]]
+    assert synced["removed_ids"] == [msg_ids[1]]
+    assert sorted(cache) == [msg_ids[0], msg_ids[2], new_id]
+    assert cache[msg_ids[0]]["message"] == "edited"
+    assert cache[msg_ids[2]]["reacts"][0]["is_this_user_reacted"] is True
+
+    before = dict(cache)
+    unchanged = sync_messages(token, channel_id, cache, synced["version"])
+    assert unchanged["version"] >= synced["version"]
+    assert cache == before
+
+
+def test_message_sync_errors(create_public_channel, register_bob):
+    _, token, channel_id = create_public_channel
+    bob_token, _ = register_bob
+    r = requests.get(
+        f"{url}channel/messages/sync/v1",
+        params={"token": bob_token, "channel_id": channel_id},
+    )
+    assert r.status_code == AccessError.code
+    r = requests.get(
+        f"{url}channel/messages/sync/v1",
+        params={"token": token, "channel_id": channel_id + 1},
+    )
+    assert r.status_code == InputError.code
+    r = requests.get(
+        f"{url}channel/messages/sync/v1",
+        params={"token": token, "channel_id": channel_id, "since": "abc"},
+    )
+    assert r.status_code == InputError.code
+
+
 def test_message_send_invalid_channel_id(register_joe):
     token, _ = register_joe
     r = requests.post(
@@ -1449,6 +1561,31 @@ def test_message_unreact_get_react(create_public_channel):
     ]
 
 
+def test_message_react_get_react_dm(create_dm):
+    joe_token, joe_user_id, bob_token, _, dm_id = create_dm
+    r = requests.post(
+        f"{url}message/senddm/v1",
+        json={"token": joe_token, "dm_id": dm_id, "message": "hi"},
+    )
+    assert r.status_code == 200
+    message_id = r.json()["message_id"]
+    r = requests.post(
+        f"{url}message/react/v1",
+        json={"token": joe_token, "message_id": message_id, "react_id": 1},
+    )
+    assert r.status_code == 200
+    for token, reacted in ((joe_token, True), (bob_token, False), (joe_token, True)):
+        r = requests.get(
+            f"{url}dm/messages/v1",
+            params={"token": token, "dm_id": dm_id, "start": 0},
+        )
+        assert r.status_code == 200
+        message = r.json()["messages"][0]
+        assert message["reacts"] == [
+            {"react_id": 1, "u_ids": [joe_user_id], "is_this_user_reacted": reacted}
+        ]
+
+
 def test_message_sendlater_invalid_channel(register_joe):
     token, _ = register_joe
     message_text = "hi there"
@@ -1777,6 +1914,34 @@ def test_message_sendlaterdm_user_deleted(create_dm):
     assert abs(message["time_created"] - send_time) < 2
 
 
+def test_message_sendlaterdm_dm_removed(create_dm):
+    token, _, _, _, dm_id = create_dm
+    delay = 2
+    send_time = math.ceil(time.time()) + delay
+    r = requests.post(
+        f"{url}message/sendlaterdm/v1",
+        json={
+            "token": token,
+            "dm_id": dm_id,
+            "message": "hi there",
+            "time_sent": send_time,
+        },
+    )
+    assert r.status_code == 200
+    message_id = r.json()["message_id"]
+    r = requests.delete(f"{url}dm/remove/v1", json={"token": token, "dm_id": dm_id})
+    assert r.status_code == 200
+    time.sleep(delay + 1)
+    r = requests.put(
+        f"{url}message/edit/v1",
+        json={"token": token, "message_id": message_id, "message": "edited"},
+    )
+    assert r.status_code == InputError.code
+    r = requests.get(f"{url}user/stats/v1", params={"token": token})
+    assert r.status_code == 200
+    assert r.json()["user_stats"]["messages_sent"][-1]["num_messages_sent"] == 0
+
+
 def test_message_share_no_dm_or_channel(create_public_channel):
     user_id, token, channel_id = create_public_channel
     r = requests.post(
@@ -0,0 +1,86 @@
+import mailbox
+import time
+
+from src import outbox as outbox_module
+from src.outbox import FileTransport, Outbox
+
+
+class Transport:
+    """Records the emails sent, failing those to addresses in failing the
+    number of times given."""
+
+    def __init__(self, failing=None, delay=0):
+        self.failing = dict(failing or {})
+        self.delay = delay
+        self.sent = []
+        self.tried = []
+
+    def send(self, message):
+        time.sleep(self.delay)
+        self.tried.append(message["To"])
+        if self.failing.get(message["To"], 0) > 0:
+            self.failing[message["To"]] -= 1
+            raise OSError("connection refused")
+        self.sent.append(message["To"])
+
+    def close(self):
+        pass
+
+
+def test_delivery(tmp_path):
+    path = str(tmp_path / "outbox.mbox")
+    outbox = Outbox(FileTransport(path))
+    for number in range(3):
+        assert outbox.send(f"user{number}@example.com", f"Subject {number}", "text")
+    assert outbox.join(5) == 0
+    box = mailbox.mbox(path)
+    assert [message["Subject"] for message in box] == ["Subject 0", "Subject 1", "Subject 2"]
+    assert box[0]["To"] == "user0@example.com"
+    assert box[0].get_payload().strip() == "text"
+
+
+def test_retry_does_not_hold_up_others(monkeypatch):
+    monkeypatch.setattr(outbox_module, "RETRY_DELAY", 0.1)
+    transport = Transport({"a@example.com": 2})
+    outbox = Outbox(transport)
+    for to in ("a@example.com", "b@example.com", "c@example.com"):
+        outbox.send(to, "Subject", "text")
+    assert outbox.join(5) == 0
+    assert transport.sent == ["b@example.com", "c@example.com", "a@example.com"]
+    assert transport.tried.count("a@example.com") == 3
+
+
+def test_give_up(monkeypatch):
+    monkeypatch.setattr(outbox_module, "RETRY_DELAY", 0.01)
+    monkeypatch.setattr(outbox_module, "MAX_ATTEMPTS", 3)
+    transport = Transport({"a@example.com": 10})
+    outbox = Outbox(transport)
+    outbox.send("a@example.com", "Subject", "text")
+    outbox.send("b@example.com", "Subject", "text")
+    assert outbox.join(5) == 0
+    assert transport.sent == ["b@example.com"]
+    assert transport.tried.count("a@example.com") == 3
+
+
+def test_close_drains():
+    transport = Transport(delay=0.01)
+    outbox = Outbox(transport)
+    for number in range(20):
+        outbox.send(f"user{number}@example.com", "Subject", "text")
+    assert outbox.close(5) == 0
+    assert transport.sent == [f"user{number}@example.com" for number in range(20)]
+
+
+def test_close_timeout(monkeypatch):
+    monkeypatch.setattr(outbox_module, "RETRY_DELAY", 10)
+    outbox = Outbox(Transport({"a@example.com": 1}))
+    outbox.send("a@example.com", "Subject", "text")
+    assert outbox.close(0.2) == 1
+
+
+def test_full():
+    transport = Transport(delay=0.5)
+    outbox = Outbox(transport, size=1)
+    results = [outbox.send(f"user{number}@example.com", "Subject", "text") for number in range(4)]
+    assert results[0] is True
+    assert results[-1] is False
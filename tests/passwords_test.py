@@ -0,0 +1,119 @@
+import hashlib
+
+import pytest
+
+from src import passwords
+from src.passwords import check_password, hash_password, hash_passwords
+
+
+@pytest.fixture(autouse=True)
+def cheap(monkeypatch):
+    # low costs so the tests run quickly, and nothing remembered between them
+    monkeypatch.setattr(passwords, "SCRYPT_COST", 10)
+    monkeypatch.setattr(passwords, "PBKDF2_ITERATIONS", 1000)
+    monkeypatch.setattr(passwords, "checked", type(passwords.checked)())
+
+
+def count_calls(monkeypatch, name):
+    calls = []
+    kdf = getattr(passwords, name)
+
+    def counted(*args):
+        calls.append(args)
+        return kdf(*args)
+
+    monkeypatch.setattr(passwords, name, counted)
+    return calls
+
+
+@pytest.mark.parametrize("kdf, prefix", [("scrypt", "scrypt$10$8$1$"), ("pbkdf2", "pbkdf2_sha256$1000$")])
+def test_hash(monkeypatch, kdf, prefix):
+    monkeypatch.setattr(passwords, "PASSWORD_KDF", kdf)
+    first, second = hash_password("password"), hash_password("password")
+    assert first.startswith(prefix)
+    # salted
+    assert first != second
+    assert check_password("password", first) == (True, False)
+    assert check_password("password", second) == (True, False)
+    assert check_password("passwore", first) == (False, False)
+
+
+def test_outdated(monkeypatch):
+    stored = hash_password("password")
+    monkeypatch.setattr(passwords, "SCRYPT_COST", 11)
+    assert check_password("password", stored) == (True, True)
+    monkeypatch.setattr(passwords, "SCRYPT_COST", 10)
+    monkeypatch.setattr(passwords, "PASSWORD_KDF", "pbkdf2")
+    assert check_password("password", stored) == (True, True)
+
+
+def test_legacy_sha256():
+    stored = hashlib.sha256(b"password").hexdigest()
+    assert check_password("password", stored) == (True, True)
+    assert check_password("passwore", stored) == (False, True)
+
+
+def test_remembered(monkeypatch):
+    stored = hash_password("password")
+    calls = count_calls(monkeypatch, "scrypt")
+    assert check_password("passwore", stored)[0] is False
+    assert check_password("passwore", stored)[0] is False
+    # wrong passwords are never remembered
+    assert len(calls) == 2
+    assert check_password("password", stored)[0] is True
+    assert check_password("password", stored)[0] is True
+    assert len(calls) == 3
+    # nor is a password against another hash of it
+    assert check_password("password", hash_password("password"))[0] is True
+    assert len(calls) == 5
+
+
+def test_remembered_limit(monkeypatch):
+    monkeypatch.setattr(passwords, "PASSWORD_CACHE_SIZE", 2)
+    stored = [hash_password(f"password{number}") for number in range(3)]
+    for number in range(3):
+        check_password(f"password{number}", stored[number])
+    calls = count_calls(monkeypatch, "scrypt")
+    # the least recently checked was forgotten
+    check_password("password0", stored[0])
+    check_password("password2", stored[2])
+    assert len(calls) == 1
+
+
+def test_not_remembered(monkeypatch):
+    monkeypatch.setattr(passwords, "PASSWORD_CACHE_SIZE", 0)
+    stored = hash_password("password")
+    calls = count_calls(monkeypatch, "scrypt")
+    check_password("password", stored)
+    check_password("password", stored)
+    assert len(calls) == 2
+
+
+@pytest.mark.parametrize("workers", [0, 2])
+def test_hash_passwords(monkeypatch, workers):
+    monkeypatch.setattr(passwords, "PASSWORD_WORKERS", workers)
+    monkeypatch.setattr(passwords, "pool", None)
+    hashed = hash_passwords([f"password{number}" for number in range(4)])
+    assert [check_password(f"password{number}", hashed[number])[0] for number in range(4)] == [True] * 4
+
+
+def test_rehash_on_login(isolated):
+    login = """
+        import hashlib
+        from src.auth import auth_login_v2, auth_register_v2
+        from src.data_store import data_store
+
+        if REGISTER:
+            auth_register_v2("jon.doe@gmail.com", "password", "Jon", "Doe")
+            user = data_store.get_user_by_email("jon.doe@gmail.com")
+            # as hashed before passwords were salted
+            user["password"] = hashlib.sha256(b"password").hexdigest()
+        auth_login_v2("jon.doe@gmail.com", "password")
+        print(json.dumps(data_store.get_user_by_email("jon.doe@gmail.com")["password"]))
+    """
+    stored = isolated(login, env={"STREAMS_SCRYPT_COST": "10"}, REGISTER=True)
+    assert stored.startswith("scrypt$10$")
+    assert isolated(login, env={"STREAMS_SCRYPT_COST": "10"}, REGISTER=False) == stored
+    # hashed again once the cost goes up
+    stored = isolated(login, env={"STREAMS_SCRYPT_COST": "11"}, REGISTER=False)
+    assert stored.startswith("scrypt$11$")
@@ -0,0 +1,44 @@
+import re
+
+import pytest
+
+from src import patterns
+from src.error import InputError
+
+
+@pytest.mark.parametrize(
+    "query, literals",
+    [
+        (r"TICKET-\d+-open", ["TICKET-", "-open"]),
+        (r"(?<!\w)build\s+is(?!\w)", ["build", "is"]),
+        (r"colou?r [a-z]+s", ["colo", "r ", "s"]),
+        (r"ab+c{2,}d{0,3}e", ["ab", "c", "e"]),
+        (r"a\.b[]x(]c(d|e)f", ["a.b", "c", "f"]),
+        (r"cat|dog", []),
+        (r"(?i)hello", []),
+        (r"x{y", []),
+    ],
+)
+def test_required_literals(query, literals):
+    assert patterns.required_literals(re.compile(query)) == literals
+
+
+def test_run_with_time_limit():
+    pattern = re.compile(r"\d+")
+    found = patterns.run_with_time_limit(
+        5, patterns.pattern_matches, pattern, ["a1b22", "none", "3"], True
+    )
+    assert found == [(0, 2), (2, 1)]
+    # the worker is kept for the next search
+    assert len(patterns.idle_workers) == 1
+    worker = patterns.idle_workers[0]
+    patterns.run_with_time_limit(5, patterns.pattern_matches, pattern, ["4"])
+    assert patterns.idle_workers == [worker]
+
+
+def test_run_with_time_limit_gives_up():
+    slow = re.compile(r"(a+)+b")
+    with pytest.raises(InputError):
+        patterns.run_with_time_limit(0.5, patterns.pattern_matches, slow, ["a" * 40])
+    # the worker stuck on it is not given another search
+    assert patterns.run_with_time_limit(5, patterns.pattern_matches, slow, ["aab"]) == [(0, 1)]
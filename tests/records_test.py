@@ -0,0 +1,30 @@
+from src.records import MemberList, build_store
+
+
+def reacts_store(u_ids):
+    return build_store({
+        "channels": [{
+            "channel_id": 0,
+            "messages": [{"message_id": 0, "reacts": [{"react_id": 1, "u_ids": u_ids}]}],
+        }],
+    })
+
+
+def test_member_list():
+    store = reacts_store([3, 4])
+    changes = []
+    store.observer = lambda change, container, removed: changes.append(change)
+    u_ids = store["channels"][0]["messages"][0]["reacts"][0]["u_ids"]
+    assert isinstance(u_ids, MemberList)
+    assert 3 in u_ids and 5 not in u_ids
+
+    u_ids.append(5)
+    u_ids.remove(3)
+    assert 5 in u_ids and 3 not in u_ids
+    assert u_ids == [4, 5]
+    u_ids[0:1] = [4, 4]
+    del u_ids[0]
+    assert 4 in u_ids
+    u_ids.clear()
+    assert 4 not in u_ids and 5 not in u_ids
+    assert [change[0] for change in changes] == ["splice"] * 5
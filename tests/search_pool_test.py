@@ -0,0 +1,80 @@
+import sqlite3
+
+import pytest
+
+from src.search_pool import scan, scan_source, split
+
+TEXTS = ["hello world", "goodbye", "say hello", "nothing here", "HELLO"]
+
+
+def texts_source(first_id):
+    # newest first, as stored
+    return ("texts", [(first_id + number, text) for number, text in enumerate(TEXTS)])
+
+
+def sqlite_source(tmp_path, first_id):
+    path = tmp_path / "datastore.db"
+    db = sqlite3.connect(path)
+    db.execute(
+        "CREATE TABLE IF NOT EXISTS messages "
+        "(message_id INTEGER, kind TEXT, group_id INTEGER, position INTEGER, message TEXT)"
+    )
+    db.executemany(
+        "INSERT INTO messages VALUES (?, 'channels', ?, ?, ?)",
+        [(first_id + number, first_id, number, text) for number, text in enumerate(TEXTS)],
+    )
+    db.commit()
+    db.close()
+    return ("sqlite", str(path), "channels", first_id)
+
+
+def test_scan_source(tmp_path):
+    for source in (texts_source(0), sqlite_source(tmp_path, 0)):
+        assert scan_source(source, "hello") == [0, 2]
+    with pytest.raises(ValueError):
+        scan_source(("unknown",), "hello")
+
+
+def test_split():
+    assert split([5, 5, 5, 5], 2) == [(0, 2), (2, 4)]
+    assert split([100, 1, 1, 1], 2) == [(0, 1), (1, 4)]
+    assert split([1, 1], 8) == [(0, 1), (1, 2)]
+    assert split([], 4) == []
+
+
+@pytest.mark.parametrize("workers, pool", [(1, None), (3, "thread"), (3, "process")])
+def test_scan(tmp_path, workers, pool):
+    sources = [texts_source(0), sqlite_source(tmp_path, 10), texts_source(20)]
+    found = scan(sources, [len(TEXTS)] * 3, "hello", workers, pool)
+    # in the order of the sources
+    assert found == [[0, 2], [10, 12], [20, 22]]
+
+
+@pytest.mark.parametrize("workers, pool", [(1, None), (3, "thread"), (3, "process")])
+def test_scan_segments(isolated, workers, pool):
+    # src.segments needs the datastore imported first, which opens a datastore
+    # in the working directory, so segments are scanned in a process of its own
+    found = isolated(
+        """
+        import src.data_store
+        from src.search_pool import scan, scan_source
+        from src.segments import encode_segment
+
+        sources = []
+        for first_id in (0, 10):
+            with open(f"channels-{first_id}-1.seg", "wb") as file:
+                file.write(encode_segment([
+                    {"message_id": first_id + number, "message": text}
+                    for number, text in enumerate(TEXTS)
+                ]))
+            sources.append(("segment", f"channels-{first_id}-1.seg"))
+        sources.append(("segment", "missing.seg"))
+        found = scan_source(sources[0], "hello")
+        print(json.dumps([found, scan(sources, [len(TEXTS)] * 2 + [0], "hello", WORKERS, POOL)]))
+        """,
+        TEXTS=TEXTS,
+        WORKERS=workers,
+        POOL=pool,
+    )
+    # in the order of the sources, None for one which could not be read
+    assert found == [[0, 2], [[0, 2], [10, 12], None]]
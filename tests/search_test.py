@@ -288,3 +288,193 @@ def test_mixed(search_dataset):
     assert msg[1]["message_id"] == msg_id1
     assert msg[1]["u_id"] == search_dataset["id"][1]
     assert msg[1]["message"] == "goodstring"
+
+
+def test_search_v2_pages(search_dataset):
+    chan_id0 = requests.post(
+        config.url + "/channels/create/v2",
+        json={
+            "token": search_dataset["t"][0],
+            "name": "first_chan",
+            "is_public": True,
+        },
+    ).json()["channel_id"]
+    msg_ids = [
+        requests.post(
+            config.url + "message/send/v1",
+            json={
+                "token": search_dataset["t"][0],
+                "channel_id": chan_id0,
+                "message": f"string {i}",
+            },
+        ).json()["message_id"]
+        for i in range(5)
+    ]
+    found = []
+    cursor = ""
+    for _ in range(3):
+        response = requests.get(
+            config.url + "search/v2",
+            params={
+                "token": search_dataset["t"][0],
+                "query_str": "string",
+                "limit": 2,
+                "cursor": cursor,
+            },
+        ).json()
+        found += [msg["message_id"] for msg in response["messages"]]
+        cursor = response["next_cursor"]
+    assert found == msg_ids[::-1]
+    assert cursor == ""
+
+
+def test_search_v2_relevance(search_dataset):
+    chan_id0 = requests.post(
+        config.url + "/channels/create/v2",
+        json={
+            "token": search_dataset["t"][0],
+            "name": "first_chan",
+            "is_public": True,
+        },
+    ).json()["channel_id"]
+    msg_ids = [
+        requests.post(
+            config.url + "message/send/v1",
+            json={
+                "token": search_dataset["t"][0],
+                "channel_id": chan_id0,
+                "message": message,
+            },
+        ).json()["message_id"]
+        for message in ("ab ab ab", "ab", "ab ab", "nomatch")
+    ]
+    response = requests.get(
+        config.url + "search/v2",
+        params={
+            "token": search_dataset["t"][0],
+            "query_str": "ab",
+            "order": "relevance",
+        },
+    ).json()
+    assert [msg["message_id"] for msg in response["messages"]] == [
+        msg_ids[0],
+        msg_ids[2],
+        msg_ids[1],
+    ]
+    assert response["next_cursor"] == ""
+
+
+def test_search_v2_input_err(search_dataset):
+    for params in (
+        {"query_str": ""},
+        {"query_str": "a", "limit": 0},
+        {"query_str": "a", "limit": 1000},
+        {"query_str": "a", "order": "oldest"},
+        {"query_str": "a", "cursor": "abc"},
+        {"query_str": "a", "cursor": "1.2", "order": "relevance"},
+    ):
+        response = requests.get(
+            config.url + "search/v2",
+            params={"token": search_dataset["t"][0], **params},
+        )
+        assert response.status_code == InputError.code
+
+
+def test_search_regex_and_phrase(search_dataset):
+    chan_id0 = requests.post(
+        config.url + "/channels/create/v2",
+        json={
+            "token": search_dataset["t"][0],
+            "name": "first_chan",
+            "is_public": True,
+        },
+    ).json()["channel_id"]
+    msg_ids = [
+        requests.post(
+            config.url + "message/send/v1",
+            json={
+                "token": search_dataset["t"][0],
+                "channel_id": chan_id0,
+                "message": message,
+            },
+        ).json()["message_id"]
+        for message in (
+            "see TICKET-42 now",
+            "TICKET-x is not one",
+            "the build  is broken",
+            "the builds are broken",
+        )
+    ]
+    response = requests.get(
+        config.url + "search/v1",
+        params={
+            "token": search_dataset["t"][0],
+            "query_str": r"TICKET-\d+",
+            "mode": "regex",
+        },
+    ).json()
+    assert [msg["message_id"] for msg in response["messages"]] == [msg_ids[0]]
+    response = requests.get(
+        config.url + "search/v2",
+        params={
+            "token": search_dataset["t"][0],
+            "query_str": "build is",
+            "mode": "phrase",
+        },
+    ).json()
+    assert [msg["message_id"] for msg in response["messages"]] == [msg_ids[2]]
+
+
+def test_search_mode_input_err(search_dataset):
+    for url, params in (
+        ("search/v1", {"query_str": "a", "mode": "glob"}),
+        ("search/v1", {"query_str": "(a", "mode": "regex"}),
+        ("search/v2", {"query_str": "(a", "mode": "regex"}),
+        ("search/v2", {"query_str": "  ", "mode": "phrase"}),
+        ("search/v2", {"query_str": "a", "limit": "abc"}),
+    ):
+        response = requests.get(
+            config.url + url,
+            params={"token": search_dataset["t"][0], **params},
+        )
+        assert response.status_code == InputError.code
+
+
+def test_search_reacts_for_the_viewer(search_dataset):
+    chan_id0 = requests.post(
+        config.url + "/channels/create/v2",
+        json={
+            "token": search_dataset["t"][0],
+            "name": "first_chan",
+            "is_public": True,
+        },
+    ).json()["channel_id"]
+    requests.post(
+        config.url + "channel/join/v2",
+        json={"token": search_dataset["t"][1], "channel_id": chan_id0},
+    )
+    msg_id0 = requests.post(
+        config.url + "message/send/v1",
+        json={
+            "token": search_dataset["t"][0],
+            "channel_id": chan_id0,
+            "message": "string",
+        },
+    ).json()["message_id"]
+    requests.post(
+        config.url + "message/react/v1",
+        json={"token": search_dataset["t"][0], "message_id": msg_id0, "react_id": 1},
+    )
+    for token, reacted in ((search_dataset["t"][0], True), (search_dataset["t"][1], False)):
+        for url in ("search/v1", "search/v2"):
+            response = requests.get(
+                config.url + url,
+                params={"token": token, "query_str": "string"},
+            )
+            assert response.json()["messages"][0]["reacts"] == [
+                {
+                    "react_id": 1,
+                    "u_ids": [search_dataset["id"][0]],
+                    "is_this_user_reacted": reacted,
+                }
+            ]
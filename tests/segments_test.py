@@ -0,0 +1,147 @@
+import textwrap
+
+# build_store comes from the datastore, which opens a datastore in the working
+# directory, so the segments are tried out in processes of their own
+MESSAGES = """
+    from src.data_store import build_store
+    from src.segments import MessageDirectory, SegmentFile, Segments, decode_records, encode_segment
+
+    def messages(count):
+        # newest first, as stored
+        return [{"message_id": number, "message": f"message {number}"} for number in reversed(range(count))]
+
+    with open("channels-0-1.seg", "wb") as file:
+        file.write(encode_segment(messages(100)))
+"""
+
+
+def with_segment(isolated, code):
+    return isolated(textwrap.dedent(MESSAGES) + textwrap.dedent(code))
+
+
+def test_segment_file(isolated):
+    read = with_segment(
+        isolated,
+        """
+        segment = SegmentFile("channels-0-1.seg")
+        read = [
+            segment.count,
+            decode_records(segment.read(0, 3)) == messages(100)[:3],
+            decode_records(segment.read(98, 200)) == messages(100)[98:],
+            segment.read(100, 200) == b"",
+        ]
+        segment.close()
+
+        with open("other", "wb") as file:
+            file.write(b"not a segment")
+        try:
+            SegmentFile("other")
+        except ValueError:
+            read.append("ValueError")
+        print(json.dumps(read))
+        """,
+    )
+    assert read == [100, True, True, True, "ValueError"]
+
+
+def test_pages_read_without_loading(isolated):
+    read = with_segment(
+        isolated,
+        """
+        segments = Segments(".")
+        store = build_store(
+            {"channels": [{"channel_id": 0, "messages": {"segment": "channels-0-1.seg", "count": 100}}]},
+            segments.history,
+        )
+        segments.start(store)
+        history = store["channels"][0]["messages"]
+        read = [
+            len(history),
+            history[10:20] == messages(100)[10:20],
+            history.loaded is None,
+            segments.metrics()["segment_loads"],
+        ]
+
+        # anything but a page reads the whole segment
+        read += [
+            history.find("message_id", 5)["message"],
+            history.loaded is not None,
+            segments.metrics()["segment_loads"],
+        ]
+        history.insert(0, {"message_id": 100, "message": "new"})
+        read.append(history[0:2] == [{"message_id": 100, "message": "new"}, messages(100)[0]])
+        print(json.dumps(read))
+        """,
+    )
+    assert read == [100, True, True, 0, "message 5", True, 1, True]
+
+
+def test_directory(isolated):
+    found = with_segment(
+        isolated,
+        """
+        directory = MessageDirectory()
+        directory.add(3, ("channels", 0))
+        directory.add(7, ("dms", 1))
+        found = [directory.find(3), directory.find(7), directory.find(5), directory.find("3")]
+        directory.remove(3)
+        found.append(directory.find(3))
+        found.append(MessageDirectory(**directory.plain()).find(7))
+        print(json.dumps(found))
+        """,
+    )
+    assert found == [["channels", 0], ["dms", 1], None, None, None, ["dms", 1]]
+
+
+def test_import_alone(isolated):
+    imported = isolated(
+        """
+        import sys
+        import src.segments
+
+        print(json.dumps("src.data_store" in sys.modules))
+        """
+    )
+    assert imported is False
+
+
+EDIT = """
+    import src.segments
+    from src.auth import auth_register_v2
+    from src.channels import channels_create_v2
+    from src.data_store import data_store
+    from src.message import message_send_v1
+
+    # drop every group's messages as soon as their segment is written
+    src.segments.EVICT_AFTER = 0
+    owner = auth_register_v2("owner@example.com", "password", "Owner", "One")
+    channel_id = channels_create_v2(owner["token"], "general", True)["channel_id"]
+    message_id = message_send_v1(owner["auth_user_id"], channel_id, "before")["message_id"]
+    data_store.snapshot()
+    with data_store.locked(("channel", channel_id)):
+        message, _ = data_store.get_message(message_id)
+        data_store.compact()
+        message["message"] = "after"
+        pinned = data_store.metrics()["segment_evictions"]
+    data_store.compact()
+    print(json.dumps([
+        pinned,
+        data_store.metrics()["segment_evictions"],
+        data_store.get_message(message_id)[0]["message"],
+    ]))
+"""
+
+
+def test_edit_after_eviction(isolated):
+    env = {"STREAMS_MESSAGE_CACHE": "0"}
+    # the channel's messages are kept while it is locked and dropped after
+    assert isolated(EDIT, env=env) == [0, 1, "after"]
+    read = isolated(
+        """
+        from src.data_store import data_store
+
+        print(json.dumps(data_store.get()["channels"][0]["messages"][0]["message"]))
+        """,
+        env=env,
+    )
+    assert read == "after"
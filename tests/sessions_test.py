@@ -0,0 +1,53 @@
+from threading import RLock
+
+from src.records import build_store
+from src.sessions import Sessions
+
+
+def users_store(*session_ids):
+    store = build_store({
+        "users": [{"u_id": u_id, "session_ids": list(ids)} for u_id, ids in enumerate(session_ids)]
+    })
+    sessions = Sessions(RLock())
+    store.observer = lambda change, container, removed: sessions.note(change, removed)
+    return store, sessions
+
+
+def test_has_session():
+    store, sessions = users_store([0, 1], [0])
+    first, second = store["users"]
+    assert sessions.has_session(first, 1)
+    first["session_ids"].append(2)
+    first["session_ids"].remove(0)
+    assert sessions.has_session(first, 2)
+    assert not sessions.has_session(first, 0)
+    assert sessions.has_session(second, 0)
+    assert not sessions.has_session(second, [0])
+
+
+def test_only_changed_user_made_again():
+    store, sessions = users_store([0], [0])
+    first, second = store["users"]
+    sessions.has_session(first, 0)
+    sessions.has_session(second, 0)
+    # a change known only by what it did, as from another process
+    list.append(second["session_ids"], 1)
+    sessions.note(["splice", ["users", 1, "session_ids"], 1, 1, [1]])
+    assert sessions.has_session(second, 1)
+
+    first["session_ids"] = [5]
+    assert sessions.has_session(first, 5)
+    del store["users"][1]
+    assert sessions.has_session(first, 5)
+
+
+def test_next_session_id():
+    store, sessions = users_store([], [3, 7])
+    first, second = store["users"]
+    assert sessions.next_session_id(first) == 0
+    assert sessions.next_session_id(second) == 8
+    second["session_ids"].append(8)
+    assert sessions.next_session_id(second) == 9
+    # logging out of the newest session does not give its id out again
+    second["session_ids"].remove(8)
+    assert sessions.next_session_id(second) == 9